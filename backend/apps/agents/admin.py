@@ -7,7 +7,10 @@ from django.utils import timezone
 from django.db import transaction
 import logging
 
-from .models import AgentProfile, WithdrawalRequest, CommissionStatement, AgentTree, AgentStats
+from .models import (
+    AgentProfile, WithdrawalRequest, CommissionStatement, AgentTree, AgentStats, AgentLevelRate,
+    AgentTeamRollup, AgentBalanceEntry
+)
 from .services.balance import refund_balance_for_withdrawal, complete_withdrawal
 
 logger = logging.getLogger(__name__)
@@ -213,7 +216,8 @@ class WithdrawalRequestAdmin(admin.ModelAdmin):
                     refund_balance_for_withdrawal(
                         withdrawal.agent_profile,
                         withdrawal.amount_usd,
-                        reason='withdrawal_rejected'
+                        reason='withdrawal_rejected',
+                        reference_id=withdrawal.request_id
                     )
                     
                     # 更新状态
@@ -323,12 +327,58 @@ class CommissionStatementAdmin(admin.ModelAdmin):
 
 @admin.register(AgentTree)
 class AgentTreeAdmin(admin.ModelAdmin):
-    """代理树管理"""
+    """
+    代理树管理
+    
+    ⚠️ 结构变更经 services/tree_paths.py（维护物化路径 / 深度 / 团队汇总）：
+    - 新增：add_agent_to_tree；修改上级：reparent_agent；停用 / 删除：deactivate_agent（整棵子树）
+    """
     
     list_display = ['agent', 'parent', 'depth', 'path_short', 'active', 'created_at']
     list_filter = ['depth', 'active', 'created_at']
     search_fields = ['agent', 'parent', 'path']
-    readonly_fields = ['tree_id', 'created_at', 'updated_at']
+    readonly_fields = ['tree_id', 'depth', 'path', 'created_at', 'updated_at']
+    actions = ['deactivate_selected']
+    
+    def get_readonly_fields(self, request, obj=None):
+        readonly = list(self.readonly_fields)
+        if obj is not None:
+            readonly += ['site_id', 'agent']
+        return readonly
+    
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # 物理删除会绕过子树 / 汇总维护
+        actions.pop('delete_selected', None)
+        return actions
+    
+    def save_model(self, request, obj, form, change):
+        from .services.tree_paths import add_agent_to_tree, deactivate_agent, reparent_agent
+        
+        if not change:
+            add_agent_to_tree(obj.site_id, obj.agent, obj.parent)
+            return
+        
+        if 'parent' in form.changed_data:
+            reparent_agent(obj.site_id, obj.agent, obj.parent)
+        if 'active' in form.changed_data and not obj.active:
+            deactivate_agent(obj.site_id, obj.agent)
+        elif 'active' in form.changed_data:
+            # 恢复节点：按当前上级重新挂载
+            add_agent_to_tree(obj.site_id, obj.agent, obj.parent)
+    
+    def delete_model(self, request, obj):
+        from .services.tree_paths import deactivate_agent
+        
+        deactivate_agent(obj.site_id, obj.agent)
+    
+    def deactivate_selected(self, request, queryset):
+        """批量停用（含整棵子树）"""
+        from .services.tree_paths import deactivate_agent
+        
+        for site_id, agent in queryset.filter(active=True).values_list('site_id', 'agent'):
+            deactivate_agent(site_id, agent)
+    deactivate_selected.short_description = '停用所选代理（含整棵子树）'
     
     def path_short(self, obj):
         if len(obj.path) > 50:
@@ -367,3 +417,49 @@ class AgentStatsAdmin(admin.ModelAdmin):
     total_commissions_display.short_description = 'Total Commissions'
     total_commissions_display.admin_order_field = 'total_commissions'
 
+
+@admin.register(AgentTeamRollup)
+class AgentTeamRollupAdmin(admin.ModelAdmin):
+    """代理团队汇总（只读，由事件增量维护 / rebuild_agent_rollups 重建）"""
+    
+    list_display = ['agent', 'site_id', 'team_size', 'team_customers', 'team_sales_display', 'updated_at']
+    search_fields = ['agent']
+    readonly_fields = (
+        'rollup_id', 'site_id', 'agent', 'team_size', 'team_customers',
+        'team_sales', 'depth_histogram', 'updated_at'
+    )
+    
+    def team_sales_display(self, obj):
+        return f"${obj.team_sales:.2f}"
+    team_sales_display.short_description = 'Team Sales'
+    team_sales_display.admin_order_field = 'team_sales'
+
+
+@admin.register(AgentBalanceEntry)
+class AgentBalanceEntryAdmin(admin.ModelAdmin):
+    """余额流水（只读审计）"""
+    
+    list_display = ['agent_profile', 'seq', 'entry_type', 'amount_usd', 'balance_after', 'reference_id', 'created_at']
+    list_filter = ['entry_type', 'created_at']
+    search_fields = ['agent_profile__user__email', 'reference_id']
+    readonly_fields = [
+        'entry_id', 'agent_profile', 'seq', 'entry_type', 'amount_usd',
+        'balance_after', 'reference_id', 'reason', 'created_at'
+    ]
+    
+    def has_add_permission(self, request):
+        """禁止手动添加（由余额服务追加）"""
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        """禁止删除（审计记录）"""
+        return False
+
+
+@admin.register(AgentLevelRate)
+class AgentLevelRateAdmin(admin.ModelAdmin):
+    """等级费率管理（Solar Diff）"""
+    
+    list_display = ['site', 'agent_level', 'rate_percent', 'updated_at']
+    list_filter = ['site', 'agent_level']
+    readonly_fields = ['rate_id', 'created_at', 'updated_at']
@@ -5,6 +5,10 @@ class AgentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.agents'
     verbose_name = '代理管理'
+    
+    def ready(self):
+        """Import signals when app is ready"""
+        import apps.agents.signals  # noqa: F401
 
 
 
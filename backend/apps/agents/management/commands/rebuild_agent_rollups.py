@@ -0,0 +1,51 @@
+"""
+全量重建代理团队汇总（AgentTeamRollup）
+
+⭐ 每个站点自底向上一次遍历（子节点先于父节点），单事务替换该站点汇总行
+⚠️ 重建期间的增量事件会被覆盖，建议低峰执行
+
+用法：
+    python manage.py rebuild_agent_rollups
+    python manage.py rebuild_agent_rollups --site <site_id>
+"""
+from django.core.management.base import BaseCommand
+
+from apps.agents.models import AgentStats, AgentTree
+from apps.agents.services.rollups import rebuild_site_rollups
+
+
+class Command(BaseCommand):
+    help = '全量重建代理团队汇总（团队销售额 / 客户数 / 层级分布）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--site',
+            dest='site_ids',
+            action='append',
+            help='仅重建指定站点（site_id，可重复）'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='bulk_create 批大小（默认 1000）'
+        )
+
+    def handle(self, *args, **options):
+        site_ids = options['site_ids']
+        if not site_ids:
+            site_ids = sorted(
+                set(AgentTree.objects.values_list('site_id', flat=True).distinct())
+                | set(AgentStats.objects.values_list('site_id', flat=True).distinct()),
+                key=str
+            )
+
+        total = 0
+        for site_id in site_ids:
+            count = rebuild_site_rollups(site_id, batch_size=options['batch_size'])
+            total += count
+            self.stdout.write(f"  site {site_id}: {count} rollups")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Rebuilt {total} agent team rollups across {len(site_ids)} site(s)"
+        ))
@@ -0,0 +1,43 @@
+"""
+Solar Diff 等级费率表
+站点级代理等级 → 费率配置（替代代码内硬编码费率）
+"""
+import uuid
+from decimal import Decimal
+from django.core.validators import MinValueValidator
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0003_statement_balance_fields'),
+        ('sites', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgentLevelRate',
+            fields=[
+                ('rate_id', models.UUIDField(default=uuid.uuid4, editable=False, help_text='费率记录ID', primary_key=True, serialize=False)),
+                ('agent_level', models.CharField(choices=[('bronze', 'Bronze'), ('silver', 'Silver'), ('gold', 'Gold'), ('platinum', 'Platinum')], help_text='代理等级', max_length=20)),
+                ('rate_percent', models.DecimalField(decimal_places=2, help_text='等级费率（%）', max_digits=5, validators=[MinValueValidator(Decimal('0'))])),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('site', models.ForeignKey(help_text='所属站点', on_delete=models.deletion.CASCADE, related_name='agent_level_rates', to='sites.site')),
+            ],
+            options={
+                'verbose_name': 'Agent Level Rate',
+                'verbose_name_plural': 'Agent Level Rates',
+                'db_table': 'agent_level_rates',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='agentlevelrate',
+            constraint=models.UniqueConstraint(fields=('site', 'agent_level'), name='uq_agent_level_rate_site_level'),
+        ),
+        migrations.AddConstraint(
+            model_name='agentlevelrate',
+            constraint=models.CheckConstraint(check=models.Q(('rate_percent__gte', 0), ('rate_percent__lte', 100)), name='chk_agent_level_rate_range'),
+        ),
+    ]
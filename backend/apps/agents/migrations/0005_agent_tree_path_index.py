@@ -0,0 +1,19 @@
+"""
+AgentTree 物化路径索引
+(site_id, path text_pattern_ops) 支持 LIKE 前缀查询，整条下线一次索引范围扫描
+"""
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0004_agent_level_rates'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='agenttree',
+            index=models.Index(fields=['site_id', 'path'], name='agent_trees_site_path_idx', opclasses=['uuid_ops', 'text_pattern_ops']),
+        ),
+    ]
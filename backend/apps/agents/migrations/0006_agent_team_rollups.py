@@ -0,0 +1,38 @@
+"""
+代理团队汇总表
+每个代理一行整条下线预聚合（团队销售额 / 客户数 / 层级分布），由事件沿祖先路径增量维护
+"""
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0005_agent_tree_path_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgentTeamRollup',
+            fields=[
+                ('rollup_id', models.UUIDField(default=uuid.uuid4, editable=False, help_text='汇总记录ID', primary_key=True, serialize=False)),
+                ('site_id', models.UUIDField(help_text='站点ID（RLS隔离）')),
+                ('agent', models.UUIDField(help_text='代理用户ID')),
+                ('team_size', models.IntegerField(default=0, help_text='下线节点数（不含自身）')),
+                ('team_customers', models.IntegerField(default=0, help_text='团队客户数')),
+                ('team_sales', models.DecimalField(decimal_places=6, default=0, help_text='团队销售额（USD）', max_digits=18)),
+                ('depth_histogram', models.JSONField(blank=True, default=dict, help_text='各相对层级下线数 {"1": n, "2": m}')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Agent Team Rollup',
+                'verbose_name_plural': 'Agent Team Rollups',
+                'db_table': 'agent_team_rollups',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='agentteamrollup',
+            constraint=models.UniqueConstraint(fields=('site_id', 'agent'), name='uq_agent_team_rollup_site_agent'),
+        ),
+    ]
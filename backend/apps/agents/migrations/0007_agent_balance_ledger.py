@@ -0,0 +1,85 @@
+"""
+代理余额流水 + 检查点
+余额变动只追加流水（含变动后余额），历史余额 / 对账单期初期末余额一次索引范围读取；
+为现有代理写入期初流水（当前余额）
+"""
+import uuid
+import django.utils.timezone
+from django.db import migrations, models
+
+
+OPENING_ENTRIES_SQL = """
+    INSERT INTO agent_balance_entries (
+        entry_id, agent_profile_id, seq, entry_type, amount_usd,
+        balance_after, reference_id, reason, created_at
+    )
+    SELECT gen_random_uuid(), profile_id, 1, 'opening', balance_usd,
+           balance_usd, NULL, 'ledger opening balance', NOW()
+    FROM agent_profiles
+    WHERE balance_usd <> 0
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0006_agent_team_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgentBalanceEntry',
+            fields=[
+                ('entry_id', models.UUIDField(default=uuid.uuid4, editable=False, help_text='流水ID', primary_key=True, serialize=False)),
+                ('seq', models.PositiveBigIntegerField(help_text='代理内序号（单调递增）')),
+                ('entry_type', models.CharField(choices=[('opening', 'Opening Balance'), ('commission_paid', 'Commission Paid'), ('withdrawal', 'Withdrawal'), ('withdrawal_refund', 'Withdrawal Refund'), ('chargeback', 'Chargeback'), ('adjustment', 'Adjustment')], help_text='变动类型', max_length=20)),
+                ('amount_usd', models.DecimalField(decimal_places=6, help_text='变动金额（带符号）', max_digits=18)),
+                ('balance_after', models.DecimalField(decimal_places=6, help_text='变动后余额', max_digits=18)),
+                ('reference_id', models.UUIDField(blank=True, help_text='关联记录ID（佣金 / 提现申请）', null=True)),
+                ('reason', models.CharField(blank=True, default='', help_text='备注', max_length=100)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, help_text='记账时间')),
+                ('agent_profile', models.ForeignKey(help_text='代理资料', on_delete=models.deletion.PROTECT, related_name='balance_entries', to='agents.agentprofile')),
+            ],
+            options={
+                'verbose_name': 'Agent Balance Entry',
+                'verbose_name_plural': 'Agent Balance Entries',
+                'db_table': 'agent_balance_entries',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='agentbalanceentry',
+            constraint=models.UniqueConstraint(fields=('agent_profile', 'seq'), name='uq_balance_entry_profile_seq'),
+        ),
+        migrations.AddIndex(
+            model_name='agentbalanceentry',
+            index=models.Index(fields=['agent_profile', 'created_at', 'seq'], name='balance_entry_profile_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='agentbalanceentry',
+            index=models.Index(fields=['reference_id'], name='balance_entry_reference_idx'),
+        ),
+        migrations.CreateModel(
+            name='AgentBalanceCheckpoint',
+            fields=[
+                ('checkpoint_id', models.UUIDField(default=uuid.uuid4, editable=False, help_text='检查点ID', primary_key=True, serialize=False)),
+                ('as_of', models.DateTimeField(help_text='快照时点')),
+                ('balance_usd', models.DecimalField(decimal_places=6, help_text='快照时点余额', max_digits=18)),
+                ('last_seq', models.PositiveBigIntegerField(default=0, help_text='快照包含的最后流水序号')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('agent_profile', models.ForeignKey(help_text='代理资料', on_delete=models.deletion.PROTECT, related_name='balance_checkpoints', to='agents.agentprofile')),
+            ],
+            options={
+                'verbose_name': 'Agent Balance Checkpoint',
+                'verbose_name_plural': 'Agent Balance Checkpoints',
+                'db_table': 'agent_balance_checkpoints',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='agentbalancecheckpoint',
+            constraint=models.UniqueConstraint(fields=('agent_profile', 'as_of'), name='uq_balance_checkpoint_profile_as_of'),
+        ),
+        migrations.RunSQL(
+            sql=OPENING_ENTRIES_SQL,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
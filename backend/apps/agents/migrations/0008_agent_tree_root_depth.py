@@ -0,0 +1,29 @@
+"""
+AgentTree 深度以根节点为 0（与物化路径一致：depth = path 段数 - 1）
+存量节点按 path 重算 depth
+"""
+from django.db import migrations, models
+
+
+RECOMPUTE_DEPTH_SQL = """
+    UPDATE agent_trees
+    SET depth = length(path) - length(replace(path, '/', '')) - 2
+    WHERE path LIKE '/%/'
+      AND depth <> length(path) - length(replace(path, '/', '')) - 2
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0007_agent_balance_ledger'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='agenttree',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, help_text='深度（0=根节点，1=直接下级）'),
+        ),
+        migrations.RunSQL(RECOMPUTE_DEPTH_SQL, reverse_sql=migrations.RunSQL.noop),
+    ]
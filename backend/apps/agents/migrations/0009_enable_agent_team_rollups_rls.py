@@ -0,0 +1,47 @@
+# Generated manually for Agent Team Rollup RLS
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    为团队汇总表启用 RLS (Row Level Security)
+    
+    ⚠️ 重要：
+    - 确保多站点数据隔离（agent_team_rollups 含 site_id）
+    - Admin 角色可以查看所有站点数据（使用 admin 连接）
+    - 跨站点维护（树结构变更 / 订单事件）须在对应站点上下文或可绕过 RLS 的连接中执行
+    """
+
+    dependencies = [
+        ('agents', '0008_agent_tree_root_depth'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                -- ========== AgentTeamRollup 表 RLS ==========
+                
+                -- 1. 启用 RLS（强制执行）
+                ALTER TABLE agent_team_rollups ENABLE ROW LEVEL SECURITY;
+                ALTER TABLE agent_team_rollups FORCE ROW LEVEL SECURITY;
+                
+                -- 2. 创建策略：站点隔离（普通用户）
+                CREATE POLICY rls_agent_team_rollups_site_isolation ON agent_team_rollups
+                    FOR ALL
+                    USING (site_id = current_setting('app.current_site_id', true)::uuid)
+                    WITH CHECK (site_id = current_setting('app.current_site_id', true)::uuid);
+                
+                -- 3. 创建策略：Admin 只读（使用 admin 连接）
+                CREATE POLICY rls_agent_team_rollups_admin_read ON agent_team_rollups
+                    FOR SELECT
+                    USING (current_user = 'posx_admin');
+            """,
+            reverse_sql="""
+                -- 回滚：禁用 RLS 并删除策略
+                DROP POLICY IF EXISTS rls_agent_team_rollups_admin_read ON agent_team_rollups;
+                DROP POLICY IF EXISTS rls_agent_team_rollups_site_isolation ON agent_team_rollups;
+                ALTER TABLE agent_team_rollups DISABLE ROW LEVEL SECURITY;
+            """
+        ),
+    ]
@@ -0,0 +1,41 @@
+"""
+AgentTree 每个 (site_id, agent) 仅一个有效节点（部分唯一索引）
+存量重复有效节点：保留最早创建的一个，其余停用
+（停用不调整团队汇总：迁移后执行 rebuild_agent_rollups 重建）
+"""
+from django.db import migrations, models
+
+
+DEACTIVATE_DUPLICATES_SQL = """
+    UPDATE agent_trees t
+    SET active = false, updated_at = NOW()
+    FROM (
+        SELECT tree_id,
+               ROW_NUMBER() OVER (
+                   PARTITION BY site_id, agent ORDER BY created_at, tree_id
+               ) AS rn
+        FROM agent_trees
+        WHERE active = true
+    ) d
+    WHERE t.tree_id = d.tree_id
+      AND d.rn > 1
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0009_enable_agent_team_rollups_rls'),
+    ]
+
+    operations = [
+        migrations.RunSQL(DEACTIVATE_DUPLICATES_SQL, reverse_sql=migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name='agenttree',
+            constraint=models.UniqueConstraint(
+                condition=models.Q(('active', True)),
+                fields=('site_id', 'agent'),
+                name='uq_agent_tree_active_agent'
+            ),
+        ),
+    ]
@@ -14,6 +14,7 @@ import uuid
 from decimal import Decimal
 from django.db import models
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 
 
 class AgentTree(models.Model):
@@ -23,9 +24,14 @@ class AgentTree(models.Model):
     字段说明：
     - agent: 代理用户（User）
     - parent: 上级代理（自关联）
-    - depth: 深度（1=直接推荐，2=二级...）
+    - depth: 深度（0=根节点，1=直接下级，2=二级...）
     - path: 路径（便于快速查询上下线）格式：/root_id/parent_id/agent_id/
     - active: 激活状态
+    
+    ⭐ 物化路径：
+    - (site_id, path text_pattern_ops) 索引支持前缀查询
+    - 整条下线 = path LIKE '{agent_path}%'（一次索引范围扫描）
+    - 由 services/tree_paths.py 在插入 / 改挂 / 停用时维护（path / depth 不直接写入）
     """
     
     tree_id = models.UUIDField(
@@ -49,8 +55,8 @@ class AgentTree(models.Model):
         help_text="上级代理ID（NULL=根节点）"
     )
     depth = models.PositiveSmallIntegerField(
-        default=1,
-        help_text="深度（1=直接推荐）"
+        default=0,
+        help_text="深度（0=根节点，1=直接下级）"
     )
     path = models.TextField(
         help_text="路径（/root/parent/agent/）"
@@ -71,12 +77,23 @@ class AgentTree(models.Model):
             models.Index(fields=['site_id', 'active']),
             models.Index(fields=['depth']),
             models.Index(fields=['created_at']),
+            models.Index(
+                fields=['site_id', 'path'],
+                name='agent_trees_site_path_idx',
+                opclasses=['uuid_ops', 'text_pattern_ops']
+            ),
         ]
         constraints = [
             models.UniqueConstraint(
                 fields=['site_id', 'agent', 'parent'],
                 name='unique_site_agent_parent'
             ),
+            # 每个代理在站点内仅一个有效节点
+            models.UniqueConstraint(
+                fields=['site_id', 'agent'],
+                condition=models.Q(active=True),
+                name='uq_agent_tree_active_agent'
+            ),
         ]
         verbose_name = 'Agent Tree'
         verbose_name_plural = 'Agent Trees'
@@ -157,6 +174,78 @@ class AgentStats(models.Model):
         return f"Stats for Agent {self.agent}"
 
 
+class AgentTeamRollup(models.Model):
+    """
+    代理团队汇总表（整条下线预聚合）
+    
+    字段说明：
+    - team_size: 下线节点数（不含自身，active）
+    - team_customers: 团队客户数（自身 + 全部下线 AgentStats.total_customers 之和）
+    - team_sales: 团队销售额（自身 + 全部下线 AgentStats.total_sales 之和）
+    - depth_histogram: 各相对层级下线数 {"1": 直接下级数, "2": ..., ...}
+    
+    ⭐ 维护（services/rollups.py）：
+    - 订单支付 / 回退：沿祖先路径增量更新 team_sales / team_customers
+    - 插入 / 改挂 / 停用节点：沿祖先路径增量更新 team_size / depth_histogram
+    - rebuild_agent_rollups 命令自底向上一次遍历全量重建
+    
+    ⚠️ 增量字段可能为负（丢失事件），以重建命令修复
+    """
+    
+    rollup_id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False,
+        help_text="汇总记录ID"
+    )
+    site_id = models.UUIDField(
+        help_text="站点ID（RLS隔离）"
+    )
+    agent = models.UUIDField(
+        help_text="代理用户ID"
+    )
+    team_size = models.IntegerField(
+        default=0,
+        help_text="下线节点数（不含自身）"
+    )
+    team_customers = models.IntegerField(
+        default=0,
+        help_text="团队客户数"
+    )
+    team_sales = models.DecimalField(
+        max_digits=18,
+        decimal_places=6,
+        default=0,
+        help_text="团队销售额（USD）"
+    )
+    depth_histogram = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="各相对层级下线数 {\"1\": n, \"2\": m}"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'agent_team_rollups'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['site_id', 'agent'],
+                name='uq_agent_team_rollup_site_agent'
+            ),
+        ]
+        verbose_name = 'Agent Team Rollup'
+        verbose_name_plural = 'Agent Team Rollups'
+    
+    def __str__(self):
+        return f"Team rollup for Agent {self.agent}"
+    
+    @property
+    def max_depth(self) -> int:
+        """最大相对层级（无下线为 0）"""
+        levels = [int(level) for level, count in self.depth_histogram.items() if count > 0]
+        return max(levels) if levels else 0
+
+
 class AgentProfile(models.Model):
     """
     代理扩展资料（Phase F）
@@ -287,6 +376,69 @@ class AgentProfile(models.Model):
         return f"{self.user.email} - {self.agent_level} (${self.balance_usd})"
 
 
+class AgentLevelRate(models.Model):
+    """
+    站点代理等级费率表（Solar Diff 模式）
+    
+    ⭐ 每个站点可单独配置等级 → 费率
+    ⭐ 未配置的等级回退到 DEFAULT_RATES
+    
+    ⚠️ 变更后自动失效进程内缓存（见 apps/agents/signals.py）
+    """
+    
+    # 默认等级费率（%）
+    DEFAULT_RATES = {
+        AgentProfile.LEVEL_BRONZE: Decimal('10.00'),
+        AgentProfile.LEVEL_SILVER: Decimal('15.00'),
+        AgentProfile.LEVEL_GOLD: Decimal('20.00'),
+        AgentProfile.LEVEL_PLATINUM: Decimal('25.00'),
+    }
+    
+    rate_id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False,
+        help_text="费率记录ID"
+    )
+    site = models.ForeignKey(
+        'sites.Site',
+        on_delete=models.CASCADE,
+        related_name='agent_level_rates',
+        help_text="所属站点"
+    )
+    agent_level = models.CharField(
+        max_length=20,
+        choices=AgentProfile.LEVEL_CHOICES,
+        help_text="代理等级"
+    )
+    rate_percent = models.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        validators=[MinValueValidator(Decimal('0'))],
+        help_text="等级费率（%）"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'agent_level_rates'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['site', 'agent_level'],
+                name='uq_agent_level_rate_site_level'
+            ),
+            models.CheckConstraint(
+                check=models.Q(rate_percent__gte=0) & models.Q(rate_percent__lte=100),
+                name='chk_agent_level_rate_range'
+            ),
+        ]
+        verbose_name = 'Agent Level Rate'
+        verbose_name_plural = 'Agent Level Rates'
+    
+    def __str__(self):
+        return f"{self.site_id} - {self.agent_level}: {self.rate_percent}%"
+
+
 class WithdrawalRequest(models.Model):
     """
     提现申请（Phase F）
@@ -510,4 +662,146 @@ class CommissionStatement(models.Model):
         return f"{self.agent_profile.user.email} - {self.period_start} to {self.period_end}"
 
 
+class AgentBalanceEntry(models.Model):
+    """
+    代理余额流水（只追加）
+    
+    ⭐ 每次余额变动在同一事务内追加一行（services/ledger.py）：
+    - amount_usd: 带符号变动金额（入账为正，扣减为负）
+    - balance_after: 变动后余额（任意时点余额 = 该时点前最后一行）
+    - seq: 每个代理单调递增（持有 AgentProfile 行锁时分配）
+    
+    ⚠️ 禁止更新 / 删除；更正以新的 adjustment 行记录
+    """
+    
+    TYPE_OPENING = 'opening'
+    TYPE_COMMISSION_PAID = 'commission_paid'
+    TYPE_WITHDRAWAL = 'withdrawal'
+    TYPE_WITHDRAWAL_REFUND = 'withdrawal_refund'
+    TYPE_CHARGEBACK = 'chargeback'
+    TYPE_ADJUSTMENT = 'adjustment'
+    
+    TYPE_CHOICES = [
+        (TYPE_OPENING, 'Opening Balance'),
+        (TYPE_COMMISSION_PAID, 'Commission Paid'),
+        (TYPE_WITHDRAWAL, 'Withdrawal'),
+        (TYPE_WITHDRAWAL_REFUND, 'Withdrawal Refund'),
+        (TYPE_CHARGEBACK, 'Chargeback'),
+        (TYPE_ADJUSTMENT, 'Adjustment'),
+    ]
+    
+    entry_id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False,
+        help_text="流水ID"
+    )
+    agent_profile = models.ForeignKey(
+        AgentProfile,
+        on_delete=models.PROTECT,
+        related_name='balance_entries',
+        help_text="代理资料"
+    )
+    seq = models.PositiveBigIntegerField(
+        help_text="代理内序号（单调递增）"
+    )
+    entry_type = models.CharField(
+        max_length=20,
+        choices=TYPE_CHOICES,
+        help_text="变动类型"
+    )
+    amount_usd = models.DecimalField(
+        max_digits=18,
+        decimal_places=6,
+        help_text="变动金额（带符号）"
+    )
+    balance_after = models.DecimalField(
+        max_digits=18,
+        decimal_places=6,
+        help_text="变动后余额"
+    )
+    reference_id = models.UUIDField(
+        null=True,
+        blank=True,
+        help_text="关联记录ID（佣金 / 提现申请）"
+    )
+    reason = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        help_text="备注"
+    )
+    created_at = models.DateTimeField(
+        default=timezone.now,
+        help_text="记账时间"
+    )
+    
+    class Meta:
+        db_table = 'agent_balance_entries'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['agent_profile', 'seq'],
+                name='uq_balance_entry_profile_seq'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['agent_profile', 'created_at', 'seq'],
+                name='balance_entry_profile_time_idx'
+            ),
+            models.Index(fields=['reference_id'], name='balance_entry_reference_idx'),
+        ]
+        verbose_name = 'Agent Balance Entry'
+        verbose_name_plural = 'Agent Balance Entries'
+    
+    def __str__(self):
+        return f"#{self.seq} {self.entry_type} {self.amount_usd} → {self.balance_after}"
+
 
+class AgentBalanceCheckpoint(models.Model):
+    """
+    代理余额检查点（定期快照）
+    
+    ⭐ 每月初为全部代理写入上月末余额（单条 INSERT ... SELECT）
+    ⭐ 对账单 / 历史余额查询优先读取检查点，流水只需读取检查点之后的部分
+    """
+    
+    checkpoint_id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False,
+        help_text="检查点ID"
+    )
+    agent_profile = models.ForeignKey(
+        AgentProfile,
+        on_delete=models.PROTECT,
+        related_name='balance_checkpoints',
+        help_text="代理资料"
+    )
+    as_of = models.DateTimeField(
+        help_text="快照时点"
+    )
+    balance_usd = models.DecimalField(
+        max_digits=18,
+        decimal_places=6,
+        help_text="快照时点余额"
+    )
+    last_seq = models.PositiveBigIntegerField(
+        default=0,
+        help_text="快照包含的最后流水序号"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'agent_balance_checkpoints'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['agent_profile', 'as_of'],
+                name='uq_balance_checkpoint_profile_as_of'
+            ),
+        ]
+        verbose_name = 'Agent Balance Checkpoint'
+        verbose_name_plural = 'Agent Balance Checkpoints'
+    
+    def __str__(self):
+        return f"{self.agent_profile_id} @ {self.as_of}: {self.balance_usd}"
@@ -216,4 +216,13 @@ class AgentCustomerListSerializer(serializers.Serializer):
     page = serializers.IntegerField()
     page_size = serializers.IntegerField()
     total_pages = serializers.IntegerField()
-    customers = AgentCustomerSerializer(many=True)
\ No newline at end of file
+    customers = AgentCustomerSerializer(many=True)
+
+
+class AgentCustomerCursorListSerializer(serializers.Serializer):
+    """代理客户列表序列化器（游标分页）"""
+    
+    total = serializers.IntegerField(allow_null=True)
+    page_size = serializers.IntegerField()
+    next_cursor = serializers.CharField(allow_null=True)
+    customers = AgentCustomerSerializer(many=True)
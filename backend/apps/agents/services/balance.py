@@ -5,13 +5,15 @@ Agent 余额管理服务（Phase F）
 - 余额更新使用悲观锁（select_for_update）
 - 所有金额操作验证非负
 - 完整审计日志
+- 每次余额变动在同一事务内追加余额流水（services/ledger.py）
 """
 from decimal import Decimal, ROUND_HALF_UP
 from django.db import transaction
 from django.utils import timezone
 import logging
 
-from apps.agents.models import AgentProfile
+from apps.agents.models import AgentBalanceEntry, AgentProfile
+from apps.agents.services.ledger import append_balance_entry
 
 logger = logging.getLogger(__name__)
 
@@ -93,6 +95,12 @@ def update_balance_on_commission_paid(commission):
         profile.balance_usd += amount
         profile.total_earned_usd += amount
         profile.save(update_fields=['balance_usd', 'total_earned_usd', 'updated_at'])
+        append_balance_entry(
+            profile,
+            AgentBalanceEntry.TYPE_COMMISSION_PAID,
+            amount,
+            reference_id=commission.commission_id
+        )
         
         logger.info(
             f"Updated agent balance: +${amount}",
@@ -108,7 +116,7 @@ def update_balance_on_commission_paid(commission):
     return profile
 
 
-def deduct_balance_for_withdrawal(agent_profile, amount_usd):
+def deduct_balance_for_withdrawal(agent_profile, amount_usd, reference_id=None):
     """
     提现申请时扣减余额
     
@@ -117,6 +125,7 @@ def deduct_balance_for_withdrawal(agent_profile, amount_usd):
     参数:
         agent_profile: AgentProfile 实例
         amount_usd: Decimal 提现金额
+        reference_id: 提现申请ID（可选，记入流水）
     
     返回:
         True: 扣减成功
@@ -152,6 +161,12 @@ def deduct_balance_for_withdrawal(agent_profile, amount_usd):
         # 扣减余额
         profile.balance_usd -= amount
         profile.save(update_fields=['balance_usd', 'updated_at'])
+        append_balance_entry(
+            profile,
+            AgentBalanceEntry.TYPE_WITHDRAWAL,
+            -amount,
+            reference_id=reference_id
+        )
         
         logger.info(
             f"Deducted balance for withdrawal: -${amount}",
@@ -166,7 +181,7 @@ def deduct_balance_for_withdrawal(agent_profile, amount_usd):
     return True
 
 
-def refund_balance_for_withdrawal(agent_profile, amount_usd, reason='withdrawal_rejected'):
+def refund_balance_for_withdrawal(agent_profile, amount_usd, reason='withdrawal_rejected', reference_id=None):
     """
     提现拒绝/取消后返还余额
     
@@ -176,6 +191,7 @@ def refund_balance_for_withdrawal(agent_profile, amount_usd, reason='withdrawal_
         agent_profile: AgentProfile 实例
         amount_usd: Decimal 返还金额
         reason: str 返还原因
+        reference_id: 提现申请ID（可选，记入流水）
     
     返回:
         AgentProfile 实例（更新后）
@@ -191,6 +207,13 @@ def refund_balance_for_withdrawal(agent_profile, amount_usd, reason='withdrawal_
         # 返还余额
         profile.balance_usd += amount
         profile.save(update_fields=['balance_usd', 'updated_at'])
+        append_balance_entry(
+            profile,
+            AgentBalanceEntry.TYPE_WITHDRAWAL_REFUND,
+            amount,
+            reference_id=reference_id,
+            reason=reason
+        )
         
         logger.info(
             f"Refunded balance: +${amount} (reason: {reason})",
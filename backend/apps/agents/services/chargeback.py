@@ -136,7 +136,9 @@ def deduct_balance_for_chargeback(user, site, amount_usd, commission):
             'new_balance': Decimal
         }
     """
+    from apps.agents.models import AgentBalanceEntry
     from apps.agents.services.balance import get_or_create_agent_profile
+    from apps.agents.services.ledger import append_balance_entry
     
     # 获取 Profile
     profile = get_or_create_agent_profile(user, site)
@@ -159,6 +161,13 @@ def deduct_balance_for_chargeback(user, site, amount_usd, commission):
         insufficient = old_balance < amount
         
         profile.save(update_fields=['balance_usd', 'updated_at'])
+        append_balance_entry(
+            profile,
+            AgentBalanceEntry.TYPE_CHARGEBACK,
+            -amount,
+            reference_id=commission.commission_id,
+            reason='chargeback'
+        )
         
         logger.warning(
             f"Chargeback deducted balance: -${amount}",
@@ -0,0 +1,127 @@
+"""
+代理客户总数缓存
+
+⭐ 客户列表分页不再每页 COUNT 整条下线：
+- 总数按 (site_id, agent, scope, level) 缓存
+- 超过软过期（AGENT_CUSTOMER_COUNT_TTL）仍返回旧值，异步任务刷新
+- 冷启动（无缓存）同步计算一次并写入
+
+⚠️ 注意：
+- 带 search 的总数不缓存（组合过多）
+- 返回的总数可能滞后至多一个软过期周期
+"""
+import logging
+import time
+import uuid
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from apps.agents.services.tree_paths import get_subtree_root
+from apps.core.utils.redis import redis_key
+
+logger = logging.getLogger(__name__)
+
+# 硬过期：超过后视为冷启动
+COUNT_HARD_TTL = 24 * 3600
+
+
+def _count_key(site_id, agent_id, scope: str, level: Optional[int]) -> str:
+    return redis_key('agents', 'customer_count', site_id, agent_id, scope, level or 0)
+
+
+def count_downline_customers(
+    agent_id: uuid.UUID,
+    site_id: uuid.UUID,
+    scope: str = 'all',
+    level: Optional[int] = None
+) -> int:
+    """
+    精确统计代理客户数（无搜索条件）
+
+    ⭐ scope='all' 为 (site_id, path) 前缀索引范围扫描
+    """
+    if scope == 'direct':
+        where_clause = "WHERE parent = %s AND site_id = %s AND active = true"
+        params = [str(agent_id), str(site_id)]
+    else:
+        root = get_subtree_root(site_id, agent_id)
+        if root is None:
+            return 0
+
+        root_path, root_depth = root
+        where_clause = """
+            WHERE site_id = %s
+              AND path LIKE %s
+              AND path <> %s
+              AND active = true
+        """
+        params = [str(site_id), root_path + '%', root_path]
+
+        if level:
+            where_clause += " AND depth = %s"
+            params.append(root_depth + level)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*) FROM agent_trees {where_clause}", params)
+        return cursor.fetchone()[0]
+
+
+def refresh_downline_customer_count(
+    agent_id: uuid.UUID,
+    site_id: uuid.UUID,
+    scope: str = 'all',
+    level: Optional[int] = None
+) -> int:
+    """重新计算并写入缓存"""
+    total = count_downline_customers(agent_id, site_id, scope, level)
+    cache.set(
+        _count_key(site_id, agent_id, scope, level),
+        {'total': total, 'computed_at': time.time()},
+        timeout=COUNT_HARD_TTL
+    )
+    return total
+
+
+def get_downline_customer_count(
+    agent_id: uuid.UUID,
+    site_id: uuid.UUID,
+    scope: str = 'all',
+    level: Optional[int] = None
+) -> int:
+    """
+    获取代理客户总数（缓存，stale-while-revalidate）
+
+    Returns:
+        int: 客户总数（可能滞后一个软过期周期）
+    """
+    entry = cache.get(_count_key(site_id, agent_id, scope, level))
+    if entry is None:
+        return refresh_downline_customer_count(agent_id, site_id, scope, level)
+
+    ttl = getattr(settings, 'AGENT_CUSTOMER_COUNT_TTL', 300)
+    if time.time() - entry['computed_at'] > ttl:
+        _schedule_refresh(agent_id, site_id, scope, level, ttl)
+
+    return entry['total']
+
+
+def _schedule_refresh(agent_id, site_id, scope: str, level: Optional[int], ttl: int) -> None:
+    """投递异步刷新（同一 key 在一个软过期周期内仅投递一次）"""
+    lock_key = _count_key(site_id, agent_id, scope, level) + ':refreshing'
+    if not cache.add(lock_key, 1, timeout=ttl):
+        return
+
+    from apps.agents.tasks import refresh_customer_count
+
+    try:
+        refresh_customer_count.delay(str(agent_id), str(site_id), scope, level)
+    except Exception as e:
+        # 投递失败不影响读取（下个周期重试）
+        cache.delete(lock_key)
+        logger.warning(
+            f"Failed to schedule customer count refresh: {e}",
+            extra={'agent_id': str(agent_id), 'site_id': str(site_id), 'scope': scope}
+        )
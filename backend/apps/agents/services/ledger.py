@@ -0,0 +1,165 @@
+"""
+代理余额流水服务
+
+⭐ 只追加流水（AgentBalanceEntry）：
+- 余额变动函数（balance.py / chargeback.py）持有 AgentProfile 行锁时追加，同一事务提交
+- 每行记录 balance_after，任意时点余额 = 该时点前最后一行（一次索引范围读取）
+
+⭐ 检查点（AgentBalanceCheckpoint）：
+- 每月初单条 INSERT ... SELECT 写入全部代理上月末余额
+- 历史余额读取：最近检查点 + 检查点之后的最后一条流水（流水读取以检查点为下界）
+
+⚠️ 关键：
+- 历史 / 对账 / 审计读取不再读取 AgentProfile 热点行
+- 引入流水前的历史余额以迁移写入的 opening 行为起点
+"""
+import logging
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from typing import Dict, Iterable, Optional
+
+from django.db import connection
+from django.db.models import DateTimeField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from apps.agents.models import AgentBalanceCheckpoint, AgentBalanceEntry, AgentProfile
+
+logger = logging.getLogger(__name__)
+
+# 无检查点时流水读取的下界（早于任何流水）
+LEDGER_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def append_balance_entry(
+    profile,
+    entry_type: str,
+    amount_usd: Decimal,
+    reference_id: Optional[uuid.UUID] = None,
+    reason: str = ''
+) -> AgentBalanceEntry:
+    """
+    追加余额流水
+
+    ⚠️ 调用方须已 select_for_update 锁定 profile 并更新 balance_usd（同一事务内）
+
+    Args:
+        profile: 已锁定、已更新余额的 AgentProfile
+        entry_type: AgentBalanceEntry.TYPE_*
+        amount_usd: 带符号变动金额
+        reference_id: 关联佣金 / 提现申请ID
+        reason: 备注
+
+    Returns:
+        AgentBalanceEntry
+    """
+    last_seq = AgentBalanceEntry.objects.filter(
+        agent_profile_id=profile.profile_id
+    ).order_by('-seq').values_list('seq', flat=True).first() or 0
+
+    return AgentBalanceEntry.objects.create(
+        agent_profile_id=profile.profile_id,
+        seq=last_seq + 1,
+        entry_type=entry_type,
+        amount_usd=amount_usd,
+        balance_after=profile.balance_usd,
+        reference_id=reference_id,
+        reason=reason[:100],
+    )
+
+
+def get_balances_as_of(profile_ids: Iterable, as_of: datetime) -> Dict[uuid.UUID, Decimal]:
+    """
+    批量查询时点余额（含该时点）
+
+    ⭐ 每个代理两次 ORDER BY ... LIMIT 1 相关子查询（均走索引）：
+      最近检查点 → 检查点之后、时点之前的最后一条流水（流水读取以检查点为下界）
+    ⭐ profile_ids 可为 QuerySet（作为子查询）
+
+    Returns:
+        {profile_id: balance}（无流水、无检查点的代理不在结果中，余额视为 0）
+    """
+    checkpoints = AgentBalanceCheckpoint.objects.filter(
+        agent_profile_id=OuterRef('profile_id'),
+        as_of__lte=as_of
+    ).order_by('-as_of')
+
+    latest_entries = AgentBalanceEntry.objects.filter(
+        agent_profile_id=OuterRef('profile_id'),
+        created_at__gt=OuterRef('checkpoint_as_of'),
+        created_at__lte=as_of
+    ).order_by('-created_at', '-seq')
+
+    rows = AgentProfile.objects.filter(profile_id__in=profile_ids).annotate(
+        checkpoint_as_of=Coalesce(
+            Subquery(checkpoints.values('as_of')[:1]),
+            Value(LEDGER_EPOCH, output_field=DateTimeField())
+        ),
+        checkpoint_balance=Subquery(checkpoints.values('balance_usd')[:1]),
+        entry_balance=Subquery(latest_entries.values('balance_after')[:1]),
+    ).values_list('profile_id', 'checkpoint_balance', 'entry_balance')
+
+    balances = {}
+    for profile_id, checkpoint_balance, entry_balance in rows:
+        balance = entry_balance if entry_balance is not None else checkpoint_balance
+        if balance is not None:
+            balances[profile_id] = balance
+
+    return balances
+
+
+def get_balance_as_of(profile_id: uuid.UUID, as_of: datetime) -> Decimal:
+    """查询单个代理时点余额（含该时点）"""
+    return get_balances_as_of([profile_id], as_of).get(profile_id, Decimal('0'))
+
+
+CREATE_CHECKPOINTS_SQL = """
+    INSERT INTO agent_balance_checkpoints (
+        checkpoint_id, agent_profile_id, as_of, balance_usd, last_seq, created_at
+    )
+    SELECT gen_random_uuid(), p.profile_id, %s,
+           COALESCE(e.balance_after, c.balance_usd), COALESCE(e.seq, c.last_seq), NOW()
+    FROM agent_profiles p
+    LEFT JOIN LATERAL (
+        SELECT c.as_of, c.balance_usd, c.last_seq
+        FROM agent_balance_checkpoints c
+        WHERE c.agent_profile_id = p.profile_id AND c.as_of < %s
+        ORDER BY c.as_of DESC
+        LIMIT 1
+    ) c ON true
+    LEFT JOIN LATERAL (
+        SELECT e.balance_after, e.seq
+        FROM agent_balance_entries e
+        WHERE e.agent_profile_id = p.profile_id
+          AND e.created_at > COALESCE(c.as_of, %s)
+          AND e.created_at <= %s
+        ORDER BY e.created_at DESC, e.seq DESC
+        LIMIT 1
+    ) e ON true
+    WHERE e.seq IS NOT NULL OR c.as_of IS NOT NULL
+    ON CONFLICT (agent_profile_id, as_of) DO NOTHING
+"""
+
+
+def create_balance_checkpoints(as_of: datetime) -> int:
+    """
+    为全部代理写入时点余额检查点（单条 SQL，幂等）
+
+    ⭐ 以上一检查点为起点：每个代理只读取上一检查点之后、时点之前的最后一条流水
+      （走 (agent_profile, created_at, seq) 索引，不随流水历史增长）
+    ⭐ 上一检查点之后无流水的代理沿用上一检查点余额 / 序号
+    ⚠️ 无检查点的代理从 LEDGER_EPOCH 起读取（首次写入）
+
+    Returns:
+        int: 新写入的检查点数
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(CREATE_CHECKPOINTS_SQL, [as_of, as_of, LEDGER_EPOCH, as_of])
+        created = cursor.rowcount
+
+    logger.info(
+        f"Created {created} balance checkpoints",
+        extra={'as_of': as_of.isoformat(), 'created': created}
+    )
+
+    return created
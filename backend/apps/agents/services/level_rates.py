@@ -0,0 +1,81 @@
+"""
+代理等级费率服务（Solar Diff 模式）
+
+⭐ 核心功能：
+- 站点级等级费率表（AgentLevelRate），未配置等级回退默认费率
+- 进程内版本化缓存：计算佣金时不查费率表
+- 费率表变更时失效缓存（signals.py，事务提交后）
+"""
+import logging
+from decimal import Decimal
+from typing import Dict, Optional
+from uuid import UUID
+
+from apps.agents.models import AgentLevelRate, AgentProfile
+from apps.core.utils.local_cache import VersionedLocalCache
+
+logger = logging.getLogger(__name__)
+
+
+def _load_site_level_rates(site_id: UUID) -> Dict[str, Decimal]:
+    """从数据库加载站点费率表（合并默认费率）"""
+    rates = dict(AgentLevelRate.DEFAULT_RATES)
+    rates.update(
+        AgentLevelRate.objects.filter(site_id=site_id).values_list(
+            'agent_level', 'rate_percent'
+        )
+    )
+
+    logger.debug(
+        f"Agent level rates loaded for site {site_id}",
+        extra={'site_id': str(site_id), 'rates': {k: str(v) for k, v in rates.items()}}
+    )
+
+    return rates
+
+
+_level_rates_cache = VersionedLocalCache('agent_level_rates', loader=_load_site_level_rates)
+
+
+def get_site_level_rates(site_id: UUID) -> Dict[str, Decimal]:
+    """
+    获取站点等级费率表
+
+    ⭐ 进程内缓存命中时零 DB 查询
+
+    Args:
+        site_id: 站点ID
+
+    Returns:
+        Dict[str, Decimal]: {agent_level: rate_percent}
+    """
+    return _level_rates_cache.get(str(site_id))
+
+
+def invalidate_site_level_rates(site_id: UUID) -> None:
+    """失效站点费率缓存（所有进程）"""
+    _level_rates_cache.invalidate(str(site_id))
+
+
+def get_level_rate(site_id: UUID, profile: Optional[AgentProfile]) -> Decimal:
+    """
+    根据已加载的 AgentProfile 获取等级费率
+
+    规则：
+    - 无 AgentProfile：按最低等级（bronze）
+    - 未知等级：0
+
+    Args:
+        site_id: 站点ID
+        profile: AgentProfile 实例（None 表示无代理档案）
+
+    Returns:
+        Decimal: 等级对应的费率（%）
+    """
+    rates = get_site_level_rates(site_id)
+
+    if profile is None:
+        # 如果没有 AgentProfile，默认为最低等级
+        return rates[AgentProfile.LEVEL_BRONZE]
+
+    return rates.get(profile.agent_level, Decimal('0'))
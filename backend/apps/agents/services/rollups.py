@@ -0,0 +1,333 @@
+"""
+代理团队汇总增量维护
+
+⭐ 每个代理一行 AgentTeamRollup（整条下线预聚合），读取 O(1)
+⭐ 事件沿祖先路径增量更新（祖先 = 物化路径中的各段）：
+- 订单支付 / 回退：referrer 自身及其全部祖先的 team_sales / team_customers
+- 插入节点：全部祖先 team_size +1，depth_histogram[相对层级] +1
+- 改挂 / 停用：子树整体从旧祖先扣减、向新祖先累加（按相对层级平移分布）
+- 停用：子树内节点仅保留自身客户数 / 销售额（与全量重建一致）
+
+⚠️ 关键：
+- 单条 INSERT ... ON CONFLICT 批量应用所有祖先的增量（按 agent 排序，避免死锁）
+- 须在触发事件的同一事务内调用
+- 漂移由 rebuild_agent_rollups 命令自底向上全量重建修复
+"""
+import json
+import logging
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from django.db import connection, transaction
+
+from apps.agents.models import AgentStats, AgentTeamRollup, AgentTree
+
+logger = logging.getLogger(__name__)
+
+
+APPLY_ROLLUP_DELTAS_SQL = """
+    INSERT INTO agent_team_rollups (
+        rollup_id, site_id, agent, team_size, team_customers,
+        team_sales, depth_histogram, updated_at
+    )
+    SELECT gen_random_uuid(), %s, d.agent, d.team_size, d.team_customers,
+           d.team_sales, d.depth_histogram, NOW()
+    FROM unnest(%s::uuid[], %s::int[], %s::int[], %s::numeric[], %s::jsonb[])
+         AS d(agent, team_size, team_customers, team_sales, depth_histogram)
+    ORDER BY d.agent
+    ON CONFLICT (site_id, agent) DO UPDATE SET
+        team_size = agent_team_rollups.team_size + EXCLUDED.team_size,
+        team_customers = agent_team_rollups.team_customers + EXCLUDED.team_customers,
+        team_sales = agent_team_rollups.team_sales + EXCLUDED.team_sales,
+        depth_histogram = (
+            SELECT COALESCE(jsonb_object_agg(h.level, h.total), '{}'::jsonb)
+            FROM (
+                SELECT level, SUM(value::int) AS total
+                FROM (
+                    SELECT key AS level, value FROM jsonb_each_text(agent_team_rollups.depth_histogram)
+                    UNION ALL
+                    SELECT key AS level, value FROM jsonb_each_text(EXCLUDED.depth_histogram)
+                ) merged
+                GROUP BY level
+                HAVING SUM(value::int) <> 0
+            ) h
+        ),
+        updated_at = EXCLUDED.updated_at
+"""
+
+
+class _Delta:
+    """单个代理的汇总增量"""
+
+    __slots__ = ('team_size', 'team_customers', 'team_sales', 'depth_histogram')
+
+    def __init__(self):
+        self.team_size = 0
+        self.team_customers = 0
+        self.team_sales = Decimal('0')
+        self.depth_histogram = defaultdict(int)
+
+
+def path_agents(path: str) -> List[str]:
+    """
+    解析路径中的代理ID（根在前）
+
+    Examples:
+        >>> path_agents('/a/b/c/')
+        ['a', 'b', 'c']
+    """
+    return [segment for segment in path.strip('/').split('/') if segment]
+
+
+def _apply_deltas(site_id, deltas: Dict[str, _Delta]) -> None:
+    """批量应用增量（单条 SQL）"""
+    rows = [
+        (agent, delta) for agent, delta in sorted(deltas.items())
+        if delta.team_size or delta.team_customers or delta.team_sales
+        or any(delta.depth_histogram.values())
+    ]
+    if not rows:
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(APPLY_ROLLUP_DELTAS_SQL, [
+            str(site_id),
+            [agent for agent, _ in rows],
+            [delta.team_size for _, delta in rows],
+            [delta.team_customers for _, delta in rows],
+            [delta.team_sales for _, delta in rows],
+            [
+                json.dumps({str(level): n for level, n in delta.depth_histogram.items() if n})
+                for _, delta in rows
+            ],
+        ])
+
+
+def _get_rollup(site_id, agent_id) -> Optional[AgentTeamRollup]:
+    return AgentTeamRollup.objects.filter(site_id=site_id, agent=agent_id).first()
+
+
+def _subtree_deltas(
+    ancestors: List[str],
+    rollup: Optional[AgentTeamRollup],
+    sign: int,
+    deltas: Dict[str, _Delta]
+) -> None:
+    """
+    子树（含根）对各祖先的增量
+
+    ⭐ 距子树根 k 层的祖先：根计入层级 k，子树层级 i 计入层级 k + i
+    """
+    team_size = rollup.team_size if rollup else 0
+    team_customers = rollup.team_customers if rollup else 0
+    team_sales = rollup.team_sales if rollup else Decimal('0')
+    histogram = rollup.depth_histogram if rollup else {}
+
+    for offset, ancestor in enumerate(reversed(ancestors), start=1):
+        delta = deltas.setdefault(ancestor, _Delta())
+        delta.team_size += sign * (1 + team_size)
+        delta.team_customers += sign * team_customers
+        delta.team_sales += sign * team_sales
+        delta.depth_histogram[offset] += sign
+        for level, count in histogram.items():
+            delta.depth_histogram[offset + int(level)] += sign * count
+
+
+def record_node_added(site_id: uuid.UUID, path: str) -> None:
+    """
+    节点插入：全部祖先 team_size +1，对应相对层级 +1
+
+    ⭐ 恢复的节点可能已有汇总行（自身订单），一并计入祖先
+    """
+    *ancestors, agent = path_agents(path)
+    if not ancestors:
+        return
+
+    deltas: Dict[str, _Delta] = {}
+    _subtree_deltas(ancestors, _get_rollup(site_id, agent), +1, deltas)
+    _apply_deltas(site_id, deltas)
+
+
+def record_subtree_moved(site_id: uuid.UUID, old_path: str, new_path: str) -> None:
+    """
+    子树改挂：从旧祖先扣减、向新祖先累加
+
+    ⚠️ 须在路径 UPDATE 之前或之后均可调用（仅依赖子树根汇总行）
+    """
+    *old_ancestors, agent = path_agents(old_path)
+    *new_ancestors, _ = path_agents(new_path)
+
+    rollup = _get_rollup(site_id, agent)
+    deltas: Dict[str, _Delta] = {}
+    _subtree_deltas(old_ancestors, rollup, -1, deltas)
+    _subtree_deltas(new_ancestors, rollup, +1, deltas)
+    _apply_deltas(site_id, deltas)
+
+
+RESET_REMOVED_ROLLUPS_SQL = """
+    DELETE FROM agent_team_rollups r
+    USING agent_trees t
+    WHERE t.site_id = %s
+      AND t.path LIKE %s
+      AND r.site_id = t.site_id
+      AND r.agent = t.agent
+      AND NOT EXISTS (
+          SELECT 1 FROM agent_trees a
+          WHERE a.site_id = t.site_id AND a.agent = t.agent AND a.active = true
+      )
+"""
+
+# 与 rebuild_site_rollups 一致：不在树中的代理保留自身客户数 / 销售额（AgentStats）
+INSERT_OWN_ROLLUPS_SQL = """
+    INSERT INTO agent_team_rollups (
+        rollup_id, site_id, agent, team_size, team_customers,
+        team_sales, depth_histogram, updated_at
+    )
+    SELECT DISTINCT ON (s.agent)
+        gen_random_uuid(), t.site_id, s.agent, 0, s.total_customers,
+        s.total_sales, '{}'::jsonb, NOW()
+    FROM agent_trees t
+    INNER JOIN agent_stats s ON s.agent = t.agent AND s.site_id = t.site_id
+    WHERE t.site_id = %s
+      AND t.path LIKE %s
+      AND NOT EXISTS (
+          SELECT 1 FROM agent_trees a
+          WHERE a.site_id = t.site_id AND a.agent = t.agent AND a.active = true
+      )
+    ON CONFLICT (site_id, agent) DO NOTHING
+"""
+
+
+def record_subtree_removed(site_id: uuid.UUID, path: str) -> None:
+    """
+    子树停用：从全部祖先扣减，子树内节点的汇总行重置为仅含自身客户数 / 销售额
+
+    ⭐ 与 rebuild_site_rollups 一致（不在树中但有销售的代理保留自身 AgentStats 合计）
+    ⭐ 重新加入时 record_node_added 把自身合计累加到新祖先
+    ⚠️ 须在子树节点停用之后调用（跳过在其他位置仍有效的代理）
+    """
+    *ancestors, agent = path_agents(path)
+
+    deltas: Dict[str, _Delta] = {}
+    _subtree_deltas(ancestors, _get_rollup(site_id, agent), -1, deltas)
+    _apply_deltas(site_id, deltas)
+
+    with connection.cursor() as cursor:
+        cursor.execute(RESET_REMOVED_ROLLUPS_SQL, [str(site_id), path + '%'])
+        cursor.execute(INSERT_OWN_ROLLUPS_SQL, [str(site_id), path + '%'])
+
+
+def record_sales_delta(
+    site_id: uuid.UUID,
+    agent_id: uuid.UUID,
+    sales_delta: Decimal,
+    customers_delta: int
+) -> None:
+    """
+    订单支付 / 回退：代理自身及全部祖先累加销售额 / 客户数
+
+    ⭐ 代理不在树中时仅更新自身行
+    """
+    if not sales_delta and not customers_delta:
+        return
+
+    path = AgentTree.objects.filter(
+        site_id=site_id, agent=agent_id, active=True
+    ).values_list('path', flat=True).first()
+    agents = path_agents(path) if path else [str(agent_id)]
+
+    deltas: Dict[str, _Delta] = {}
+    for agent in agents:
+        delta = deltas.setdefault(agent, _Delta())
+        delta.team_sales += sales_delta
+        delta.team_customers += customers_delta
+    _apply_deltas(site_id, deltas)
+
+
+def _build_site_rollups(site_id, nodes: List[Tuple[str, Optional[str], int]], own: Dict) -> List[AgentTeamRollup]:
+    """
+    自底向上一次遍历（按深度降序，子节点先于父节点）
+
+    Args:
+        nodes: [(agent, parent, depth)]
+        own: {agent: (total_customers, total_sales)}
+    """
+    rollups: Dict[str, _Delta] = {}
+
+    for agent, parent, _ in sorted(nodes, key=lambda node: node[2], reverse=True):
+        delta = rollups.setdefault(agent, _Delta())
+        customers, sales = own.get(agent, (0, Decimal('0')))
+        delta.team_customers += customers
+        delta.team_sales += sales
+
+        if parent is None:
+            continue
+
+        parent_delta = rollups.setdefault(parent, _Delta())
+        parent_delta.team_size += 1 + delta.team_size
+        parent_delta.team_customers += delta.team_customers
+        parent_delta.team_sales += delta.team_sales
+        parent_delta.depth_histogram[1] += 1
+        for level, count in delta.depth_histogram.items():
+            parent_delta.depth_histogram[level + 1] += count
+
+    # 不在树中但有销售的代理
+    for agent, (customers, sales) in own.items():
+        if agent not in rollups:
+            delta = rollups.setdefault(agent, _Delta())
+            delta.team_customers = customers
+            delta.team_sales = sales
+
+    return [
+        AgentTeamRollup(
+            site_id=site_id,
+            agent=agent,
+            team_size=delta.team_size,
+            team_customers=delta.team_customers,
+            team_sales=delta.team_sales,
+            depth_histogram={str(level): n for level, n in sorted(delta.depth_histogram.items())},
+        )
+        for agent, delta in rollups.items()
+    ]
+
+
+def rebuild_site_rollups(site_id: uuid.UUID, batch_size: int = 1000) -> int:
+    """
+    全量重建站点汇总（自底向上一次遍历）
+
+    ⚠️ 重建期间的增量事件会被覆盖，建议低峰执行
+
+    Returns:
+        int: 写入的汇总行数
+    """
+    nodes = list(
+        AgentTree.objects.filter(site_id=site_id, active=True).values_list(
+            'agent', 'parent', 'depth'
+        )
+    )
+    nodes = [
+        (str(agent), str(parent) if parent else None, depth)
+        for agent, parent, depth in nodes
+    ]
+
+    own = {
+        str(agent): (customers, sales)
+        for agent, customers, sales in AgentStats.objects.filter(site_id=site_id).values_list(
+            'agent', 'total_customers', 'total_sales'
+        )
+    }
+
+    rollups = _build_site_rollups(site_id, nodes, own)
+
+    with transaction.atomic():
+        AgentTeamRollup.objects.filter(site_id=site_id).delete()
+        AgentTeamRollup.objects.bulk_create(rollups, batch_size=batch_size)
+
+    logger.info(
+        f"Rebuilt {len(rollups)} agent team rollups",
+        extra={'site_id': str(site_id), 'nodes': len(nodes), 'rollups': len(rollups)}
+    )
+
+    return len(rollups)
@@ -0,0 +1,325 @@
+"""
+Agent 统计增量维护服务
+
+⭐ 事件驱动（替代每小时全量重算）：
+- 订单支付：total_sales / total_customers / last_order_at
+- 订单回退（paid → 退款/取消）：反向扣减
+- 佣金创建：total_commissions
+- 订单支付 / 回退同时沿祖先路径更新团队汇总（services/rollups.py）
+
+⚠️ 关键：
+- 所有增量使用 F() 原子更新（无读-改-写竞争）
+- 统计行不存在时创建（并发创建冲突回退为更新）
+- 漂移由 reconcile_agent_stats 分组 SQL 以差值修复（不覆盖对账期间的增量）
+
+口径（与对账 SQL 一致）：
+- total_sales / total_customers / last_order_at：以该代理为 referrer 的已支付订单
+- total_commissions：该代理全部佣金（不区分状态）
+- direct_customers：AgentTree 中该代理的直接下级（parent 为该代理、depth = 上级 depth + 1、
+  双方 active；仅对账维护）
+"""
+import logging
+from collections import defaultdict
+from decimal import Decimal
+from typing import Iterable
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from apps.agents.models import AgentStats
+from apps.agents.services.rollups import record_sales_delta
+
+logger = logging.getLogger(__name__)
+
+
+def _apply_stats_delta(
+    agent_id,
+    site_id,
+    sales_delta: Decimal = Decimal('0'),
+    customers_delta: int = 0,
+    commissions_delta: Decimal = Decimal('0'),
+    last_order_at=None
+) -> None:
+    """
+    原子应用统计增量
+
+    ⭐ UPDATE ... SET x = x + delta（负增量下限为 0）
+    ⭐ 行不存在且为正增量时创建
+    """
+    updates = {'updated_at': timezone.now()}
+
+    if sales_delta:
+        updates['total_sales'] = Greatest(F('total_sales') + sales_delta, Value(Decimal('0')))
+    if customers_delta:
+        updates['total_customers'] = Greatest(F('total_customers') + customers_delta, Value(0))
+    if commissions_delta:
+        updates['total_commissions'] = Greatest(
+            F('total_commissions') + commissions_delta, Value(Decimal('0'))
+        )
+    if last_order_at is not None:
+        # PostgreSQL GREATEST 忽略 NULL
+        updates['last_order_at'] = Greatest(F('last_order_at'), Value(last_order_at))
+
+    if len(updates) == 1:
+        return
+
+    if AgentStats.objects.filter(agent=agent_id).update(**updates):
+        return
+
+    # 负增量且无统计行：无需创建（由对账修复）
+    if sales_delta < 0 or customers_delta < 0 or commissions_delta < 0:
+        return
+
+    try:
+        with transaction.atomic():
+            AgentStats.objects.create(
+                site_id=site_id,
+                agent=agent_id,
+                total_sales=sales_delta,
+                total_customers=customers_delta,
+                total_commissions=commissions_delta,
+                last_order_at=last_order_at,
+            )
+    except IntegrityError:
+        # 并发创建：对方已插入，改为增量更新
+        AgentStats.objects.filter(agent=agent_id).update(**updates)
+
+
+def _has_other_paid_order(order) -> bool:
+    """同一 referrer 下该买家是否还有其他已支付订单"""
+    from apps.orders.models import Order
+
+    return Order.objects.filter(
+        referrer_id=order.referrer_id,
+        buyer_id=order.buyer_id,
+        status=Order.STATUS_PAID
+    ).exclude(order_id=order.order_id).exists()
+
+
+def record_order_paid(order) -> None:
+    """
+    订单支付：累加 referrer 的销售额 / 客户数 / 最后订单时间
+
+    ⚠️ 须在订单状态更新为 paid 的同一事务内调用
+
+    Args:
+        order: Order 实例
+    """
+    if not order.referrer_id:
+        return
+
+    new_customer = not _has_other_paid_order(order)
+
+    _apply_stats_delta(
+        order.referrer_id,
+        order.site_id,
+        sales_delta=order.final_price_usd,
+        customers_delta=1 if new_customer else 0,
+        last_order_at=order.created_at,
+    )
+    record_sales_delta(
+        order.site_id,
+        order.referrer_id,
+        order.final_price_usd,
+        1 if new_customer else 0,
+    )
+
+    logger.debug(
+        f"Agent stats incremented for paid order {order.order_id}",
+        extra={
+            'order_id': str(order.order_id),
+            'agent_id': str(order.referrer_id),
+            'sales_delta': str(order.final_price_usd),
+            'new_customer': new_customer
+        }
+    )
+
+
+def record_order_reversed(order) -> None:
+    """
+    订单回退（paid → 退款/取消）：反向扣减 referrer 的销售额 / 客户数
+
+    ⚠️ 须在订单状态离开 paid 的同一事务内调用（状态已更新后）
+    ⚠️ last_order_at 不回退（由对账修复）
+
+    Args:
+        order: Order 实例
+    """
+    if not order.referrer_id:
+        return
+
+    lost_customer = not _has_other_paid_order(order)
+
+    _apply_stats_delta(
+        order.referrer_id,
+        order.site_id,
+        sales_delta=-order.final_price_usd,
+        customers_delta=-1 if lost_customer else 0,
+    )
+    record_sales_delta(
+        order.site_id,
+        order.referrer_id,
+        -order.final_price_usd,
+        -1 if lost_customer else 0,
+    )
+
+
+def record_commissions_created(commissions: Iterable) -> None:
+    """
+    佣金创建：按代理汇总累加 total_commissions
+
+    ⭐ 每个代理一次 F() 更新（批量计算时同一代理只更新一次）
+
+    Args:
+        commissions: 已写入的 Commission 实例（需已关联 order）
+    """
+    totals = defaultdict(Decimal)
+    sites = {}
+
+    for commission in commissions:
+        totals[commission.agent_id] += commission.commission_amount_usd
+        sites[commission.agent_id] = commission.order.site_id
+
+    for agent_id, amount in totals.items():
+        _apply_stats_delta(agent_id, sites[agent_id], commissions_delta=amount)
+
+
+_RECONCILE_AGGREGATES_SQL = """
+    sales AS (
+        SELECT
+            o.referrer_id AS agent,
+            SUM(o.final_price_usd) AS total_sales,
+            COUNT(DISTINCT o.buyer_id) AS total_customers,
+            MAX(o.created_at) AS last_order_at,
+            (ARRAY_AGG(o.site_id ORDER BY o.created_at))[1] AS site_id
+        FROM orders o
+        WHERE o.status = 'paid'
+          AND o.referrer_id IS NOT NULL
+        GROUP BY o.referrer_id
+    ),
+    comm AS (
+        SELECT
+            c.agent_id AS agent,
+            SUM(c.commission_amount_usd) AS total_commissions,
+            (ARRAY_AGG(o.site_id ORDER BY c.created_at))[1] AS site_id
+        FROM commissions c
+        INNER JOIN orders o ON o.order_id = c.order_id
+        GROUP BY c.agent_id
+    ),
+    direct AS (
+        SELECT t.parent AS agent, COUNT(*) AS direct_customers
+        FROM agent_trees t
+        INNER JOIN agent_trees p
+            ON p.site_id = t.site_id
+           AND p.agent = t.parent
+           AND p.active = true
+        WHERE t.active = true
+          AND t.depth = p.depth + 1
+        GROUP BY t.parent
+    )
+"""
+
+# ⚠️ 以差值修正（不覆盖）：SET 表达式基于行的最新版本计算，
+# 对账期间 record_order_paid 等已提交的增量得以保留
+RECONCILE_AGENT_STATS_SQL = """
+    WITH """ + _RECONCILE_AGGREGATES_SQL + """,
+    snap AS (
+        SELECT
+            s.agent,
+            s.total_customers,
+            s.total_sales,
+            s.total_commissions,
+            s.last_order_at,
+            COALESCE(sales.total_customers, 0) AS expected_customers,
+            COALESCE(direct.direct_customers, 0) AS expected_direct,
+            COALESCE(sales.total_sales, 0) AS expected_sales,
+            COALESCE(comm.total_commissions, 0) AS expected_commissions,
+            sales.last_order_at AS expected_last_order_at
+        FROM agent_stats s
+        LEFT JOIN sales ON sales.agent = s.agent
+        LEFT JOIN comm ON comm.agent = s.agent
+        LEFT JOIN direct ON direct.agent = s.agent
+        WHERE (
+            s.total_customers,
+            s.direct_customers,
+            s.total_sales,
+            s.total_commissions,
+            s.last_order_at
+        ) IS DISTINCT FROM (
+            COALESCE(sales.total_customers, 0),
+            COALESCE(direct.direct_customers, 0),
+            COALESCE(sales.total_sales, 0),
+            COALESCE(comm.total_commissions, 0),
+            sales.last_order_at
+        )
+    )
+    UPDATE agent_stats t SET
+        total_customers = GREATEST(t.total_customers + (snap.expected_customers - snap.total_customers), 0),
+        direct_customers = snap.expected_direct,
+        total_sales = GREATEST(t.total_sales + (snap.expected_sales - snap.total_sales), 0),
+        total_commissions = GREATEST(
+            t.total_commissions + (snap.expected_commissions - snap.total_commissions), 0
+        ),
+        last_order_at = CASE
+            WHEN t.last_order_at IS NOT DISTINCT FROM snap.last_order_at
+                THEN snap.expected_last_order_at
+            ELSE GREATEST(t.last_order_at, snap.expected_last_order_at)
+        END,
+        updated_at = NOW()
+    FROM snap
+    WHERE t.agent = snap.agent
+"""
+
+# 缺失的统计行（并发创建冲突时以事件增量为准）
+INSERT_MISSING_AGENT_STATS_SQL = """
+    WITH """ + _RECONCILE_AGGREGATES_SQL + """,
+    agents AS (
+        SELECT agent FROM sales
+        UNION
+        SELECT agent FROM comm
+    )
+    INSERT INTO agent_stats (
+        stat_id, site_id, agent, total_customers, direct_customers,
+        total_sales, total_commissions, last_order_at, updated_at
+    )
+    SELECT
+        gen_random_uuid(),
+        COALESCE(comm.site_id, sales.site_id),
+        a.agent,
+        COALESCE(sales.total_customers, 0),
+        COALESCE(direct.direct_customers, 0),
+        COALESCE(sales.total_sales, 0),
+        COALESCE(comm.total_commissions, 0),
+        sales.last_order_at,
+        NOW()
+    FROM agents a
+    LEFT JOIN sales ON sales.agent = a.agent
+    LEFT JOIN comm ON comm.agent = a.agent
+    LEFT JOIN direct ON direct.agent = a.agent
+    WHERE NOT EXISTS (SELECT 1 FROM agent_stats s WHERE s.agent = a.agent)
+    ON CONFLICT (agent) DO NOTHING
+"""
+
+
+def reconcile_agent_stats() -> int:
+    """
+    对账修复 AgentStats（全部代理，分组聚合 SQL）
+
+    ⭐ 已有行：UPDATE 以差值修正（期望值 - 快照值），仅写入有差异的行
+    ⭐ 缺失行：INSERT ... ON CONFLICT (agent) DO NOTHING
+
+    ⚠️ 不锁定统计行（不阻塞支付回调）：
+    - 聚合快照之后提交的增量不会被覆盖（差值叠加在最新行版本上）
+    - last_order_at 在对账期间被更新时取两者较大值
+
+    Returns:
+        int: 新建或修复的行数
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(RECONCILE_AGENT_STATS_SQL)
+            repaired = cursor.rowcount
+            cursor.execute(INSERT_MISSING_AGENT_STATS_SQL)
+            return repaired + cursor.rowcount
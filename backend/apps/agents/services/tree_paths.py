@@ -0,0 +1,316 @@
+"""
+代理树物化路径维护
+
+⭐ 约定：
+- 每个 (site_id, agent) 一行有效节点，parent 为直接上级
+  （部分唯一索引 uq_agent_tree_active_agent 保证，并发插入冲突转为 AgentTreeError）
+- path = 上级 path + '{agent}/'，根节点 path = '/{agent}/'
+- depth = 根节点 0，直接下级 1，依次递增
+- 整条下线 = path LIKE '{节点 path}%'（(site_id, path) 索引范围扫描）
+
+⭐ 写入入口：
+- 新用户注册绑定推荐人：add_referral_to_tree（users/views_auth.py）
+- 管理后台新增 / 改挂 / 停用 / 删除：AgentTreeAdmin（agents/admin.py）
+
+⚠️ 关键：
+- 改挂 / 停用以单条 UPDATE 作用于整棵子树（前缀范围）
+- 停用节点时整棵子树一并停用（与原递归 CTE 的可达性一致：
+  停用节点之下的下线本就不可达）
+- 每次结构变更同一事务内沿祖先路径更新团队汇总（services/rollups.py）
+"""
+import logging
+import uuid
+from typing import Optional, Tuple
+
+from django.db import IntegrityError, connection, transaction
+
+from apps.agents.models import AgentTree
+from apps.agents.services.rollups import (
+    record_node_added,
+    record_subtree_moved,
+    record_subtree_removed,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AgentTreeError(Exception):
+    """代理树维护异常"""
+    pass
+
+
+def build_path(parent_path: Optional[str], agent_id: uuid.UUID) -> str:
+    """
+    生成节点路径
+
+    Examples:
+        >>> build_path(None, 'a')
+        '/a/'
+        >>> build_path('/a/', 'b')
+        '/a/b/'
+    """
+    return f"{parent_path or '/'}{agent_id}/"
+
+
+def path_depth(path: str) -> int:
+    """根据路径计算深度（根节点为 0）"""
+    return path.strip('/').count('/')
+
+
+def get_subtree_root(site_id: uuid.UUID, agent_id: uuid.UUID) -> Optional[Tuple[str, int]]:
+    """
+    获取代理子树前缀与深度
+
+    ⭐ 优先读取代理自身节点；历史数据缺少自身节点时从任一直接下级路径截取
+
+    Returns:
+        (path_prefix, depth) 或 None（无下线）
+    """
+    node = AgentTree.objects.filter(
+        site_id=site_id, agent=agent_id, active=True
+    ).values_list('path', 'depth').first()
+    if node:
+        return node
+
+    child_path = AgentTree.objects.filter(
+        site_id=site_id, parent=agent_id, active=True
+    ).values_list('path', flat=True).first()
+    if not child_path:
+        return None
+
+    marker = f"/{agent_id}/"
+    index = child_path.rfind(marker)
+    if index < 0:
+        return None
+    prefix = child_path[:index + len(marker)]
+    return prefix, path_depth(prefix)
+
+
+@transaction.atomic
+def add_agent_to_tree(
+    site_id: uuid.UUID,
+    agent_id: uuid.UUID,
+    parent_id: Optional[uuid.UUID] = None
+) -> AgentTree:
+    """
+    插入代理节点
+
+    Args:
+        site_id: 站点ID
+        agent_id: 代理用户ID
+        parent_id: 上级代理ID（None=根节点；上级无节点时自动创建为根）
+
+    Returns:
+        AgentTree 实例
+
+    Raises:
+        AgentTreeError: 代理已在树中
+    """
+    if AgentTree.objects.filter(site_id=site_id, agent=agent_id, active=True).exists():
+        raise AgentTreeError(f"Agent {agent_id} already in tree for site {site_id}")
+
+    parent_path = None
+    if parent_id is not None:
+        parent = AgentTree.objects.select_for_update().filter(
+            site_id=site_id, agent=parent_id, active=True
+        ).first()
+        if parent is None:
+            try:
+                parent = add_agent_to_tree(site_id, parent_id)
+            except AgentTreeError:
+                # 并发插入了同一上级：使用已提交的节点
+                parent = AgentTree.objects.select_for_update().get(
+                    site_id=site_id, agent=parent_id, active=True
+                )
+        parent_path = parent.path
+
+    path = build_path(parent_path, agent_id)
+
+    # 曾被停用的同一关系直接恢复（unique: site_id + agent + parent）
+    # ⚠️ 部分唯一索引（site_id, agent WHERE active）兜底并发插入
+    try:
+        with transaction.atomic():
+            node, _ = AgentTree.objects.update_or_create(
+                site_id=site_id,
+                agent=agent_id,
+                parent=parent_id,
+                defaults={
+                    'depth': path_depth(path),
+                    'path': path,
+                    'active': True,
+                }
+            )
+    except IntegrityError as e:
+        raise AgentTreeError(f"Agent {agent_id} already in tree for site {site_id}") from e
+
+    record_node_added(site_id, path)
+
+    logger.info(
+        f"Agent {agent_id} added to tree",
+        extra={'site_id': str(site_id), 'agent_id': str(agent_id), 'path': path}
+    )
+
+    return node
+
+
+@transaction.atomic
+def add_referral_to_tree(site_id: uuid.UUID, user) -> Optional[AgentTree]:
+    """
+    用户绑定推荐人后插入代理树节点
+
+    ⭐ 推荐人尚无节点时沿 User.referrer 向上补齐（链顶无推荐人的用户为根节点）
+
+    Args:
+        site_id: 站点ID
+        user: 已绑定 referrer 的 User
+
+    Returns:
+        AgentTree 实例 / None（无推荐人）
+    """
+    from apps.users.models import User
+
+    if user.referrer_id is None:
+        return None
+
+    # 向上查找第一个已在树中的祖先，记录缺失节点（环路时在环上截断为根）
+    missing = []
+    seen = {user.user_id}
+    ancestor = user.referrer_id
+    while ancestor is not None and ancestor not in seen:
+        if AgentTree.objects.filter(site_id=site_id, agent=ancestor, active=True).exists():
+            break
+        seen.add(ancestor)
+        missing.append(ancestor)
+        ancestor = User.objects.filter(user_id=ancestor).values_list('referrer_id', flat=True).first()
+    else:
+        ancestor = None
+
+    for agent_id in reversed(missing):
+        try:
+            add_agent_to_tree(site_id, agent_id, ancestor)
+        except AgentTreeError:
+            # 并发注册已补齐该祖先
+            pass
+        ancestor = agent_id
+
+    return add_agent_to_tree(site_id, user.user_id, user.referrer_id)
+
+
+@transaction.atomic
+def reparent_agent(
+    site_id: uuid.UUID,
+    agent_id: uuid.UUID,
+    new_parent_id: Optional[uuid.UUID]
+) -> int:
+    """
+    改挂代理（整棵子树随之移动）
+
+    ⭐ 单条 UPDATE：替换子树路径前缀并平移深度
+
+    Returns:
+        int: 更新的节点数（含自身）
+
+    Raises:
+        AgentTreeError: 节点不存在 / 改挂到自身子树
+    """
+    node = AgentTree.objects.select_for_update().filter(
+        site_id=site_id, agent=agent_id, active=True
+    ).first()
+    if node is None:
+        raise AgentTreeError(f"Agent {agent_id} not in tree for site {site_id}")
+
+    new_parent_path = None
+    if new_parent_id is not None:
+        new_parent = AgentTree.objects.filter(
+            site_id=site_id, agent=new_parent_id, active=True
+        ).first()
+        if new_parent is None:
+            raise AgentTreeError(f"Parent {new_parent_id} not in tree for site {site_id}")
+        if new_parent.path.startswith(node.path):
+            raise AgentTreeError(
+                f"Cannot move agent {agent_id} under its own downline {new_parent_id}"
+            )
+        new_parent_path = new_parent.path
+
+    old_prefix = node.path
+    new_prefix = build_path(new_parent_path, agent_id)
+    depth_delta = path_depth(new_prefix) - path_depth(old_prefix)
+
+    if new_parent_id is not None:
+        # 曾在新上级下被停用的旧关系：删除（unique: site_id + agent + parent）
+        AgentTree.objects.filter(
+            site_id=site_id, agent=agent_id, parent=new_parent_id, active=False
+        ).delete()
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            UPDATE agent_trees
+            SET path = %s || substr(path, %s),
+                depth = depth + %s,
+                parent = CASE WHEN agent = %s THEN %s::uuid ELSE parent END,
+                updated_at = NOW()
+            WHERE site_id = %s
+              AND path LIKE %s
+              AND active = true
+            """,
+            [
+                new_prefix, len(old_prefix) + 1,
+                depth_delta,
+                str(agent_id), str(new_parent_id) if new_parent_id else None,
+                str(site_id),
+                old_prefix + '%',
+            ]
+        )
+        moved = cursor.rowcount
+
+    record_subtree_moved(site_id, old_prefix, new_prefix)
+
+    logger.info(
+        f"Agent {agent_id} re-parented: {old_prefix} → {new_prefix}",
+        extra={
+            'site_id': str(site_id),
+            'agent_id': str(agent_id),
+            'new_parent_id': str(new_parent_id) if new_parent_id else None,
+            'moved': moved
+        }
+    )
+
+    return moved
+
+
+@transaction.atomic
+def deactivate_agent(site_id: uuid.UUID, agent_id: uuid.UUID) -> int:
+    """
+    停用代理节点及其整棵子树
+
+    Returns:
+        int: 停用的节点数
+    """
+    root = get_subtree_root(site_id, agent_id)
+    if root is None:
+        return 0
+
+    prefix, _ = root
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            UPDATE agent_trees
+            SET active = false, updated_at = NOW()
+            WHERE site_id = %s
+              AND path LIKE %s
+              AND active = true
+            """,
+            [str(site_id), prefix + '%']
+        )
+        deactivated = cursor.rowcount
+
+    record_subtree_removed(site_id, prefix)
+
+    logger.info(
+        f"Agent {agent_id} subtree deactivated",
+        extra={'site_id': str(site_id), 'agent_id': str(agent_id), 'deactivated': deactivated}
+    )
+
+    return deactivated
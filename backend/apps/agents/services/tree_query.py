@@ -2,7 +2,8 @@
 代理树查询服务
 
 ⭐ 功能：
-- 递归查询下线结构（使用 PostgreSQL CTE）
+- 下线结构查询（物化路径前缀，一次索引范围扫描，见 tree_paths.py）
+- 节点团队客户数读取预聚合汇总（见 rollups.py）
 - 支持深度限制
 - 分页支持
 
@@ -10,11 +11,66 @@
 - 所有查询自动受 RLS 保护（site_id 隔离）
 - 仅返回当前用户为根的下线
 """
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from django.db import connection
+from django.utils.dateparse import parse_datetime
 from decimal import Decimal
+import base64
+import json
 import uuid
 
+from apps.agents.services.tree_paths import get_subtree_root
+
+
+# 客户列表排序键（NULL 视为最早，保证行值比较可用于 seek）
+CUSTOMER_SORT_KEY = "COALESCE(ast.last_order_at, '-infinity'::timestamptz), at.created_at, at.agent"
+CUSTOMER_SORT_ORDER = (
+    "COALESCE(ast.last_order_at, '-infinity'::timestamptz) DESC, at.created_at DESC, at.agent DESC"
+)
+
+
+class InvalidCursorError(ValueError):
+    """客户列表游标无效"""
+    pass
+
+
+def encode_customer_cursor(last_order_at, created_at, agent_id) -> str:
+    """
+    编码客户列表游标（不透明 base64 字符串）
+
+    ⭐ 内容为最后一行的排序键
+    """
+    payload = [
+        last_order_at.isoformat() if last_order_at else None,
+        created_at.isoformat(),
+        str(agent_id),
+    ]
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_customer_cursor(cursor: str) -> Tuple[str, str, str]:
+    """
+    解码客户列表游标
+
+    Returns:
+        (last_order_at | '-infinity', created_at, agent_id)：可直接作为 SQL 参数
+
+    Raises:
+        InvalidCursorError: 格式错误
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        last_order_at, created_at, agent_id = json.loads(raw)
+        uuid.UUID(agent_id)
+        for value in (created_at, last_order_at or created_at):
+            if parse_datetime(value) is None:
+                raise ValueError(value)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursorError(f"Invalid cursor: {cursor}") from e
+
+    return last_order_at or '-infinity', created_at, agent_id
+
 
 class AgentTreeService:
     """代理树查询服务"""
@@ -26,7 +82,9 @@ class AgentTreeService:
         max_depth: int = 10
     ) -> List[Dict[str, Any]]:
         """
-        获取代理下线结构（递归 CTE）
+        获取代理下线结构（物化路径前缀查询）
+        
+        ⭐ path LIKE '{agent_path}%'：O(子树) 索引范围扫描，与树深度无关
         
         Args:
             agent_id: 代理用户ID
@@ -40,59 +98,44 @@ class AgentTreeService:
                     "parent_id": "...",
                     "depth": 1,
                     "path": "/root/agent/",
-                    "total_customers": 10,  # 占位，后续接入统计
+                    "total_customers": 10,  # 团队客户数（AgentTeamRollup）
                 },
                 ...
             ]
         """
+        root = get_subtree_root(site_id, agent_id)
+        if root is None:
+            return []
+        
+        root_path, root_depth = root
+        
         with connection.cursor() as cursor:
-            # 递归 CTE 查询下线
             query = """
-                WITH RECURSIVE downline AS (
-                    -- 基础查询：直接下线
-                    SELECT
-                        tree_id,
-                        site_id,
-                        agent,
-                        parent,
-                        depth,
-                        path,
-                        active,
-                        1 as level
-                    FROM agent_trees
-                    WHERE parent = %s
-                      AND site_id = %s
-                      AND active = true
-                    
-                    UNION ALL
-                    
-                    -- 递归查询：下线的下线
-                    SELECT
-                        at.tree_id,
-                        at.site_id,
-                        at.agent,
-                        at.parent,
-                        at.depth,
-                        at.path,
-                        at.active,
-                        d.level + 1 as level
-                    FROM agent_trees at
-                    INNER JOIN downline d ON at.parent = d.agent
-                    WHERE at.site_id = %s
-                      AND at.active = true
-                      AND d.level < %s
-                )
                 SELECT
-                    agent::text as agent_id,
-                    parent::text as parent_id,
-                    depth,
-                    path,
-                    level
-                FROM downline
-                ORDER BY level, depth, agent;
+                    at.agent::text as agent_id,
+                    at.parent::text as parent_id,
+                    at.depth,
+                    at.path,
+                    at.depth - %s as level,
+                    COALESCE(r.team_customers, 0) as total_customers
+                FROM agent_trees at
+                LEFT JOIN agent_team_rollups r
+                  ON r.site_id = at.site_id AND r.agent = at.agent
+                WHERE at.site_id = %s
+                  AND at.path LIKE %s
+                  AND at.path <> %s
+                  AND at.active = true
+                  AND at.depth <= %s
+                ORDER BY at.depth, at.agent;
             """
             
-            cursor.execute(query, [str(agent_id), str(site_id), str(site_id), max_depth])
+            cursor.execute(query, [
+                root_depth,
+                str(site_id),
+                root_path + '%',
+                root_path,
+                root_depth + max_depth,
+            ])
             rows = cursor.fetchall()
             
             # 格式化结果
@@ -104,7 +147,7 @@ class AgentTreeService:
                     'depth': row[2],
                     'path': row[3],
                     'level': row[4],
-                    'total_customers': 0,  # 占位，后续接入统计
+                    'total_customers': row[5],
                 })
             
             return results
@@ -117,21 +160,31 @@ class AgentTreeService:
         level: Optional[int] = None,
         search: Optional[str] = None,
         page: int = 1,
-        page_size: int = 20
+        page_size: int = 20,
+        cursor: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         获取代理客户列表
         
+        ⭐ 两种分页模式：
+        - page（cursor=None）：LIMIT/OFFSET，兼容旧客户端
+        - cursor（cursor='' 为首页）：按排序键 seek，深分页与首页同成本
+        
+        ⭐ 排序键：(last_order_at DESC NULLS LAST, created_at DESC, agent DESC)
+        ⭐ 总数（无 search 时）走缓存，异步刷新（见 customer_counts.py）
+        
         Args:
             agent_id: 代理用户ID
             site_id: 站点ID
             scope: 范围（'direct'=直接下线，'all'=整条线）
-            level: 指定层级（仅当 scope='all' 时有效）
+            level: 指定层级（相对代理，1=直接下线；仅当 scope='all' 时有效）
             search: 搜索关键词（邮箱/钱包地址）
-            page: 页码
+            page: 页码（page 模式）
             page_size: 每页大小
+            cursor: 上一页返回的 next_cursor（cursor 模式）
         
         Returns:
+            page 模式：
             {
                 "total": 100,
                 "page": 1,
@@ -143,107 +196,156 @@ class AgentTreeService:
                         "email": "...",
                         "referral_code": "...",
                         "depth": 1,
-                        "total_sales": "1000.00",  # 占位
-                        "last_order_at": null,      # 占位
+                        "total_sales": "1000.00",
+                        "last_order_at": null,
                     },
                     ...
                 ]
             }
+            
+            cursor 模式：
+            {
+                "total": 100,          # 缓存值；带 search 时为 null
+                "page_size": 20,
+                "next_cursor": "...",  # 无下一页时为 null
+                "customers": [...]
+            }
+        
+        Raises:
+            InvalidCursorError: cursor 无法解析
         """
-        offset = (page - 1) * page_size
+        from apps.agents.services.customer_counts import get_downline_customer_count
         
-        with connection.cursor() as cursor:
-            # 构建查询
-            if scope == 'direct':
-                # 仅直接下线
-                where_clause = "WHERE at.parent = %s AND at.site_id = %s AND at.active = true"
-                params = [str(agent_id), str(site_id)]
-            else:
-                # 整条线（递归）
-                where_clause = """
-                    WHERE at.agent IN (
-                        WITH RECURSIVE downline AS (
-                            SELECT agent FROM agent_trees
-                            WHERE parent = %s AND site_id = %s AND active = true
-                            
-                            UNION ALL
-                            
-                            SELECT at2.agent FROM agent_trees at2
-                            INNER JOIN downline d ON at2.parent = d.agent
-                            WHERE at2.site_id = %s AND at2.active = true
-                        )
-                        SELECT agent FROM downline
-                    )
-                """
-                params = [str(agent_id), str(site_id), str(site_id)]
-                
-                # 层级过滤
-                if level:
-                    where_clause += " AND at.depth = %s"
-                    params.append(level)
+        keyset = cursor is not None
+        seek = decode_customer_cursor(cursor) if cursor else None
+        
+        def _empty():
+            if keyset:
+                return {'total': 0, 'page_size': page_size, 'next_cursor': None, 'customers': []}
+            return {'total': 0, 'page': page, 'page_size': page_size, 'total_pages': 0, 'customers': []}
+        
+        # 构建查询
+        if scope == 'direct':
+            # 仅直接下线
+            where_clause = "WHERE at.parent = %s AND at.site_id = %s AND at.active = true"
+            params = [str(agent_id), str(site_id)]
+        else:
+            # 整条线（物化路径前缀，索引范围扫描）
+            root = get_subtree_root(site_id, agent_id)
+            if root is None:
+                return _empty()
             
-            # 搜索条件
-            if search:
-                where_clause += " AND (u.email ILIKE %s OR w.address ILIKE %s)"
-                search_pattern = f"%{search}%"
-                params.extend([search_pattern, search_pattern])
+            root_path, root_depth = root
+            where_clause = """
+                WHERE at.site_id = %s
+                  AND at.path LIKE %s
+                  AND at.path <> %s
+                  AND at.active = true
+            """
+            params = [str(site_id), root_path + '%', root_path]
             
-            # 总数查询
-            count_query = f"""
-                SELECT COUNT(DISTINCT at.agent)
-                FROM agent_trees at
-                LEFT JOIN users u ON u.user_id = at.agent
-                LEFT JOIN wallets w ON w.user_id = at.agent AND w.is_primary = true
-                {where_clause}
+            # 层级过滤
+            if level:
+                where_clause += " AND at.depth = %s"
+                params.append(root_depth + level)
+        
+        # 搜索条件（EXISTS 避免 JOIN 产生重复行）
+        if search:
+            where_clause += """
+                AND (
+                    u.email ILIKE %s
+                    OR EXISTS (
+                        SELECT 1 FROM wallets w
+                        WHERE w.user_id = at.agent
+                          AND w.is_primary = true
+                          AND w.address ILIKE %s
+                    )
+                )
             """
+            search_pattern = f"%{search}%"
+            params.extend([search_pattern, search_pattern])
+        
+        from_clause = """
+            FROM agent_trees at
+            LEFT JOIN users u ON u.user_id = at.agent
+            LEFT JOIN agent_stats ast ON ast.agent = at.agent AND ast.site_id = at.site_id
+        """
+        
+        with connection.cursor() as db_cursor:
+            # 总数：无搜索走缓存；搜索时 page 模式精确计数，cursor 模式不计数
+            if not search:
+                total = get_downline_customer_count(agent_id, site_id, scope, level)
+            elif not keyset:
+                db_cursor.execute(f"SELECT COUNT(*) {from_clause} {where_clause}", params)
+                total = db_cursor.fetchone()[0]
+            else:
+                total = None
             
-            cursor.execute(count_query, params)
-            total = cursor.fetchone()[0]
+            data_params = list(params)
+            seek_clause = ""
+            if seek is not None:
+                seek_clause = f"""
+                    AND ({CUSTOMER_SORT_KEY}) < (%s::timestamptz, %s::timestamptz, %s::uuid)
+                """
+                data_params.extend(seek)
             
-            # 数据查询
+            # 多取一行判断是否有下一页
+            fetch_size = page_size + 1 if keyset else page_size
             data_query = f"""
-                SELECT DISTINCT
+                SELECT
                     u.user_id::text,
                     u.email,
                     u.referral_code,
                     at.depth,
                     COALESCE(ast.total_sales, 0) as total_sales,
-                    ast.last_order_at
-                FROM agent_trees at
-                LEFT JOIN users u ON u.user_id = at.agent
-                LEFT JOIN wallets w ON w.user_id = at.agent AND w.is_primary = true
-                LEFT JOIN agent_stats ast ON ast.agent = at.agent AND ast.site_id = at.site_id
+                    ast.last_order_at,
+                    at.created_at,
+                    at.agent::text
+                {from_clause}
                 {where_clause}
-                ORDER BY ast.last_order_at DESC NULLS LAST, at.created_at DESC
-                LIMIT %s OFFSET %s
+                {seek_clause}
+                ORDER BY {CUSTOMER_SORT_ORDER}
+                LIMIT %s
             """
+            data_params.append(fetch_size)
+            if not keyset:
+                data_query += " OFFSET %s"
+                data_params.append((page - 1) * page_size)
             
-            params.extend([page_size, offset])
-            cursor.execute(data_query, params)
-            rows = cursor.fetchall()
-            
-            # 格式化结果
-            customers = []
-            for row in rows:
-                customers.append({
-                    'user_id': row[0],
-                    'email': row[1] or '',
-                    'referral_code': row[2] or '',
-                    'depth': row[3],
-                    'total_sales': str(row[4]) if row[4] else '0.00',
-                    'last_order_at': row[5].isoformat() if row[5] else None,
-                })
-            
-            # 分页信息
-            total_pages = (total + page_size - 1) // page_size
-            
+            db_cursor.execute(data_query, data_params)
+            rows = db_cursor.fetchall()
+        
+        has_more = keyset and len(rows) > page_size
+        rows = rows[:page_size]
+        
+        # 格式化结果
+        customers = []
+        for row in rows:
+            customers.append({
+                'user_id': row[0],
+                'email': row[1] or '',
+                'referral_code': row[2] or '',
+                'depth': row[3],
+                'total_sales': str(row[4]) if row[4] else '0.00',
+                'last_order_at': row[5].isoformat() if row[5] else None,
+            })
+        
+        if keyset:
+            last = rows[-1] if rows else None
             return {
                 'total': total,
-                'page': page,
                 'page_size': page_size,
-                'total_pages': total_pages,
+                'next_cursor': encode_customer_cursor(last[5], last[6], last[7]) if has_more else None,
                 'customers': customers,
             }
-
-
-
+        
+        # 分页信息
+        total_pages = (total + page_size - 1) // page_size
+        
+        return {
+            'total': total,
+            'page': page,
+            'page_size': page_size,
+            'total_pages': total_pages,
+            'customers': customers,
+        }
@@ -0,0 +1,19 @@
+"""
+Agent 信号处理
+
+⭐ 等级费率表变更 → 事务提交后失效进程内费率缓存
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.agents.models import AgentLevelRate
+
+
+@receiver([post_save, post_delete], sender=AgentLevelRate)
+def invalidate_level_rates_on_change(sender, instance, **kwargs):
+    """费率变更后失效对应站点缓存（提交后执行，避免其他进程读到旧数据并缓存为新版本）"""
+    from apps.agents.services.level_rates import invalidate_site_level_rates
+    
+    site_id = instance.site_id
+    transaction.on_commit(lambda: invalidate_site_level_rates(site_id))
@@ -2,21 +2,13 @@
 Agent Celery 任务（Phase F）
 
 定时任务：
+- 月度余额检查点
 - 月度对账单生成
-- Agent 统计更新
+- Agent 统计对账（日常由事件增量维护）
 """
-from decimal import Decimal
-from datetime import datetime, timedelta
-from django.db import models
-from django.db.models import Sum, Count, Q, Max
-from django.utils import timezone
 from celery import shared_task
 import logging
 
-from apps.agents.models import AgentProfile, CommissionStatement, AgentStats, AgentTree
-from apps.commissions.models import Commission
-from apps.orders.models import Order
-
 logger = logging.getLogger(__name__)
 
 
@@ -27,218 +19,136 @@ def generate_monthly_statements():
     
     触发时间：每月 1 号凌晨 2 点
     
-    逻辑：
-    1. 查询所有活跃 Agent
-    2. 统计上月佣金数据
-    3. 生成 CommissionStatement 记录
-    4. 发送邮件通知（可选）
+    ⭐ 集合化生成（services/statements.py）：每个分片固定几条 GROUP BY 查询 + bulk_create
+    
+    ⭐ AGENT_STATEMENT_SHARDS：
+    - 0（默认）：本任务内一次生成全部对账单
+    - N > 0：按 (有活跃代理的站点 × 代理ID区间 N 段) 分发 generate_statement_shard 并行生成
+    
+    ⚠️ 站点取自活跃 AgentProfile（与不分片模式覆盖范围一致，不按 Site.is_active 过滤）
     """
-    now = timezone.now()
+    from django.conf import settings
+    from apps.agents.services.statements import generate_statements, previous_month_period
     
-    # 计算上月范围
-    first_day_this_month = datetime(now.year, now.month, 1, tzinfo=now.tzinfo)
-    last_day_last_month = first_day_this_month - timedelta(days=1)
+    period_start, period_end = previous_month_period()
+    period = f"{period_start.date()} ~ {period_end.date()}"
     
-    period_start = datetime(
-        last_day_last_month.year,
-        last_day_last_month.month,
-        1,
-        tzinfo=now.tzinfo
-    )
-    period_end = last_day_last_month.replace(hour=23, minute=59, second=59)
+    logger.info(f"Generating statements for period: {period}")
     
-    logger.info(
-        f"Generating statements for period: {period_start.date()} ~ {period_end.date()}"
-    )
+    shard_count = getattr(settings, 'AGENT_STATEMENT_SHARDS', 0)
+    if shard_count > 0:
+        from apps.agents.models import AgentProfile
+        
+        site_ids = (
+            AgentProfile.objects.filter(is_active=True)
+            .order_by('site_id')
+            .values_list('site_id', flat=True)
+            .distinct()
+        )
+        
+        dispatched = 0
+        for site_id in site_ids:
+            for shard_index in range(shard_count):
+                generate_statement_shard.delay(
+                    period_start.isoformat(),
+                    period_end.isoformat(),
+                    str(site_id),
+                    shard_index,
+                    shard_count
+                )
+                dispatched += 1
+        
+        logger.info(f"Dispatched {dispatched} statement shards", extra={'period': period})
+        return {'dispatched': dispatched, 'period': period}
     
-    # 查询所有活跃 Agent
-    active_agents = AgentProfile.objects.filter(is_active=True)
-    
-    generated_count = 0
-    skipped_count = 0
-    
-    for profile in active_agents:
-        try:
-            # 检查是否已生成
-            existing = CommissionStatement.objects.filter(
-                agent_profile=profile,
-                period_start=period_start.date(),
-                period_end=period_end.date()
-            ).exists()
-            
-            if existing:
-                skipped_count += 1
-                continue
-            
-            # 统计佣金数据
-            commissions = Commission.objects.filter(
-                agent=profile.user,
-                created_at__gte=period_start,
-                created_at__lte=period_end
-            )
-            
-            commission_stats = commissions.aggregate(
-                total=Sum('commission_amount_usd'),
-                paid=Sum('commission_amount_usd', filter=Q(status='paid')),
-                pending=Sum('commission_amount_usd', filter=Q(status__in=['hold', 'ready'])),
-            )
-            
-            # 统计订单数据
-            orders = Order.objects.filter(
-                referrer=profile.user,
-                status='paid',
-                created_at__gte=period_start,
-                created_at__lte=period_end
-            )
-            
-            order_count = orders.count()
-            customer_count = orders.values('buyer').distinct().count()
-            
-            # ⭐ Phase F 补充：计算期初/期末余额
-            # 方法：查询历史变更记录（简化：从当前余额反推）
-            
-            # 查询本期提现总额
-            from apps.agents.models import WithdrawalRequest
-            withdrawals_in_period = WithdrawalRequest.objects.filter(
-                agent_profile=profile,
-                status='completed',
-                completed_at__gte=period_start,
-                completed_at__lte=period_end
-            ).aggregate(
-                total=Sum('amount_usd')
-            )['total'] or Decimal('0')
-            
-            # 查询本期已结算佣金（入账金额）
-            paid_in_period = commission_stats['paid'] or Decimal('0')
-            
-            # 计算余额变动
-            # 期末余额 = 当前余额
-            balance_end = profile.balance_usd
-            
-            # 期初余额 = 期末余额 - 本期入账 + 本期提现
-            balance_start = balance_end - paid_in_period + withdrawals_in_period
-            
-            # 创建对账单
-            statement = CommissionStatement.objects.create(
-                agent_profile=profile,
-                period_start=period_start.date(),
-                period_end=period_end.date(),
-                balance_start_of_period=balance_start,
-                balance_end_of_period=balance_end,
-                total_commissions_usd=commission_stats['total'] or Decimal('0'),
-                paid_commissions_usd=paid_in_period,
-                pending_commissions_usd=commission_stats['pending'] or Decimal('0'),
-                withdrawals_in_period=withdrawals_in_period,
-                order_count=order_count,
-                customer_count=customer_count
-            )
-            
-            generated_count += 1
-            
-            logger.info(
-                f"Generated statement for {profile.user.email}",
-                extra={
-                    'statement_id': str(statement.statement_id),
-                    'agent_id': str(profile.user.user_id),
-                    'total_commissions': str(statement.total_commissions_usd)
-                }
-            )
-            
-            # TODO: 发送邮件通知
-            
-        except Exception as e:
-            logger.error(
-                f"Failed to generate statement for {profile.user.email}: {e}",
-                exc_info=True
-            )
+    result = generate_statements(period_start, period_end)
     
     logger.info(
-        f"Statement generation completed: generated={generated_count}, skipped={skipped_count}"
+        f"Statement generation completed: generated={result['generated']}, skipped={result['skipped']}"
     )
     
-    return {
-        'generated': generated_count,
-        'skipped': skipped_count,
-        'period': f"{period_start.date()} ~ {period_end.date()}"
-    }
+    return {**result, 'period': period}
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def generate_statement_shard(self, period_start, period_end, site_id=None, shard_index=0, shard_count=1):
+    """
+    生成一个分片的对账单（站点 + 代理ID区间）
+    
+    ⭐ 幂等：已存在的对账单跳过，唯一约束兜底（可安全重试）
+    """
+    from django.utils.dateparse import parse_datetime
+    from apps.agents.services.statements import generate_statements
+    
+    try:
+        return generate_statements(
+            parse_datetime(period_start),
+            parse_datetime(period_end),
+            site_id=site_id,
+            shard_index=shard_index,
+            shard_count=shard_count
+        )
+    except Exception as exc:
+        logger.error(
+            f"Statement shard {shard_index}/{shard_count} failed: {exc}",
+            extra={'site_id': site_id},
+            exc_info=True
+        )
+        raise self.retry(exc=exc)
+
+
+@shared_task
+def checkpoint_agent_balances():
+    """
+    写入上月末余额检查点
+    
+    触发时间：每月 1 号凌晨 1:30（早于对账单生成）
+    
+    ⭐ 单条 INSERT ... SELECT（以上一检查点为起点），幂等（已存在跳过）
+    """
+    from datetime import datetime, timedelta
+    from django.utils import timezone
+    from apps.agents.services.ledger import create_balance_checkpoints
+    
+    now = timezone.now()
+    as_of = datetime(now.year, now.month, 1, tzinfo=now.tzinfo) - timedelta(microseconds=1)
+    
+    return {'created': create_balance_checkpoints(as_of), 'as_of': as_of.isoformat()}
 
 
 @shared_task
 def update_agent_stats():
     """
-    更新 Agent 统计数据
+    对账修复 Agent 统计数据
     
-    触发时间：每小时
+    触发时间：每天凌晨 4:30（低频兜底）
     
-    逻辑：
-    1. 查询所有 Agent（有佣金记录的用户）
-    2. 更新 AgentStats 表
-    3. 计算：total_customers, direct_customers, total_sales, total_commissions
+    ⭐ 日常统计由事件增量维护（apps/agents/services/stats.py）：
+    - 订单支付 / 回退 → total_sales, total_customers, last_order_at
+    - 佣金创建 → total_commissions
+    
+    ⭐ 本任务以分组 SQL 重算全部代理并以差值修复有差异的行
+    （含 direct_customers：AgentTree 直接下级，depth = 上级 depth + 1 且 active）
     """
-    from apps.agents.models import AgentStats, AgentTree
+    from apps.agents.services.stats import reconcile_agent_stats
     
-    # 查询所有有佣金的 Agent
-    agents_with_commissions = Commission.objects.values('agent').distinct()
+    repaired_count = reconcile_agent_stats()
     
-    updated_count = 0
+    logger.info(
+        f"Reconciled agent stats: {repaired_count} rows repaired",
+        extra={'repaired': repaired_count}
+    )
     
-    for item in agents_with_commissions:
-        agent_id = item['agent']
-        
-        try:
-            # 统计佣金
-            commission_stats = Commission.objects.filter(
-                agent_id=agent_id
-            ).aggregate(
-                total_commissions=Sum('commission_amount_usd'),
-            )
-            
-            # 统计订单
-            order_stats = Order.objects.filter(
-                referrer_id=agent_id,
-                status='paid'
-            ).aggregate(
-                total_sales=Sum('final_price_usd'),
-                total_customers=Count('buyer', distinct=True),
-                last_order_at=models.Max('created_at')
-            )
-            
-            # 统计直接客户
-            direct_customers = AgentTree.objects.filter(
-                parent=agent_id,
-                depth=1,
-                active=True
-            ).count()
-            
-            # 获取 site_id（从第一个佣金）
-            first_commission = Commission.objects.filter(
-                agent_id=agent_id
-            ).select_related('order__site').first()
-            
-            if not first_commission:
-                continue
-            
-            site_id = first_commission.order.site_id
-            
-            # 更新或创建统计
-            AgentStats.objects.update_or_create(
-                site_id=site_id,
-                agent=agent_id,
-                defaults={
-                    'total_customers': order_stats['total_customers'] or 0,
-                    'direct_customers': direct_customers,
-                    'total_sales': order_stats['total_sales'] or Decimal('0'),
-                    'total_commissions': commission_stats['total_commissions'] or Decimal('0'),
-                    'last_order_at': order_stats['last_order_at'],
-                }
-            )
-            
-            updated_count += 1
-            
-        except Exception as e:
-            logger.error(f"Failed to update stats for agent {agent_id}: {e}")
-    
-    logger.info(f"Updated stats for {updated_count} agents")
-    
-    return {'updated': updated_count}
+    return {'updated': repaired_count}
+
+
+@shared_task
+def refresh_customer_count(agent_id, site_id, scope='all', level=None):
+    """
+    刷新代理客户总数缓存
 
+    触发：客户列表读取到软过期的总数时投递（见 services/customer_counts.py）
+    """
+    from apps.agents.services.customer_counts import refresh_downline_customer_count
+    
+    return refresh_downline_customer_count(agent_id, site_id, scope, level)
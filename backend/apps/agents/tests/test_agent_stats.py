@@ -0,0 +1,157 @@
+"""
+Agent Stats 增量维护测试
+
+测试范围：
+1. 订单支付增量（销售额 / 客户数 / 最后订单时间）
+2. 佣金创建增量（重复计算不重复累加）
+3. 对账 SQL 修复漂移（含直接下级口径）
+"""
+import pytest
+from decimal import Decimal
+from uuid import uuid4
+
+from apps.agents.models import AgentStats, AgentTree
+from apps.agents.services.stats import record_order_paid, record_order_reversed
+from apps.agents.tasks import update_agent_stats
+from apps.commissions.tasks import calculate_commission_for_order
+from apps.orders.models import Order
+from apps.orders_snapshots.models import OrderCommissionPolicySnapshot
+from apps.sites.models import Site
+from apps.users.models import User
+
+
+@pytest.mark.django_db
+class TestAgentStatsIncrements:
+    """测试 AgentStats 增量维护"""
+
+    def setup_method(self):
+        self.site = Site.objects.create(
+            code='STATS',
+            name='Stats Site',
+            domain='stats.local',
+            is_active=True
+        )
+        self.agent = User.objects.create(
+            email='stats_agent@test.com',
+            referral_code='STATS-AGENT',
+            is_active=True
+        )
+
+    def _buyer(self, suffix):
+        return User.objects.create(
+            email=f'stats_buyer_{suffix}@test.com',
+            referral_code=f'STATS-BUYER-{suffix}',
+            referrer=self.agent,
+            is_active=True
+        )
+
+    def _paid_order(self, buyer, amount='100.00'):
+        order = Order.objects.create(
+            site=self.site,
+            buyer=buyer,
+            referrer=self.agent,
+            wallet_address='0xSTATS',
+            list_price_usd=Decimal(amount),
+            discount_usd=Decimal('0'),
+            final_price_usd=Decimal(amount),
+            status=Order.STATUS_PAID
+        )
+        record_order_paid(order)
+        return order
+
+    def test_order_paid_increments(self):
+        """同一买家重复购买只计一次客户"""
+        buyer_a = self._buyer('a')
+        buyer_b = self._buyer('b')
+
+        self._paid_order(buyer_a, '100.00')
+        self._paid_order(buyer_a, '50.00')
+        last = self._paid_order(buyer_b, '25.00')
+
+        stats = AgentStats.objects.get(agent=self.agent.user_id)
+        assert stats.site_id == self.site.site_id
+        assert stats.total_sales == Decimal('175.00')
+        assert stats.total_customers == 2
+        assert stats.last_order_at == last.created_at
+
+    def test_order_reversed_decrements(self):
+        """回退订单扣减销售额，无其他已支付订单时扣减客户数"""
+        buyer = self._buyer('r')
+        order = self._paid_order(buyer, '100.00')
+
+        Order.objects.filter(order_id=order.order_id).update(status=Order.STATUS_CANCELLED)
+        record_order_reversed(order)
+
+        stats = AgentStats.objects.get(agent=self.agent.user_id)
+        assert stats.total_sales == Decimal('0')
+        assert stats.total_customers == 0
+
+    def test_commission_created_increments_once(self):
+        """佣金写入累加 total_commissions，重复计算不重复累加"""
+        buyer = self._buyer('c')
+        order = self._paid_order(buyer, '1000.00')
+        OrderCommissionPolicySnapshot.objects.create(
+            order_id=order.order_id,
+            plan_id=uuid4(),
+            plan_name='Stats Plan',
+            plan_version=1,
+            plan_mode='level',
+            diff_reward_enabled=False,
+            tiers_json=[{'level': 1, 'rate_percent': '10.00', 'min_sales': '0', 'hold_days': 7}]
+        )
+
+        calculate_commission_for_order(str(order.order_id))
+        calculate_commission_for_order(str(order.order_id))
+
+        stats = AgentStats.objects.get(agent=self.agent.user_id)
+        assert stats.total_commissions == Decimal('100.00')
+
+    def test_reconcile_repairs_drift(self):
+        """对账 SQL 修复漂移"""
+        buyer = self._buyer('d')
+        self._paid_order(buyer, '80.00')
+
+        AgentStats.objects.filter(agent=self.agent.user_id).update(
+            total_sales=Decimal('999.00'),
+            total_customers=7
+        )
+
+        result = update_agent_stats()
+
+        stats = AgentStats.objects.get(agent=self.agent.user_id)
+        assert result['updated'] == 1
+        assert stats.total_sales == Decimal('80.00')
+        assert stats.total_customers == 1
+
+        # 无漂移时不写入
+        assert update_agent_stats()['updated'] == 0
+
+    def test_reconcile_counts_only_direct_children(self):
+        """direct_customers 仅统计直接下级（depth = 上级 depth + 1）"""
+        child = self._buyer('f')
+        grandchild = User.objects.create(
+            email='stats_grandchild@test.com',
+            referral_code='STATS-GRANDCHILD',
+            referrer=child,
+            is_active=True
+        )
+        root_path = f"/{self.agent.user_id}/"
+        child_path = f"{root_path}{child.user_id}/"
+        AgentTree.objects.create(
+            site_id=self.site.site_id, agent=self.agent.user_id,
+            parent=None, depth=0, path=root_path
+        )
+        AgentTree.objects.create(
+            site_id=self.site.site_id, agent=child.user_id,
+            parent=self.agent.user_id, depth=1, path=child_path
+        )
+        AgentTree.objects.create(
+            site_id=self.site.site_id, agent=grandchild.user_id,
+            parent=child.user_id, depth=2, path=f"{child_path}{grandchild.user_id}/"
+        )
+        self._paid_order(child, '10.00')
+
+        update_agent_stats()
+
+        stats = AgentStats.objects.get(agent=self.agent.user_id)
+        assert stats.direct_customers == 1
@@ -0,0 +1,130 @@
+"""
+余额流水 + 检查点测试
+
+测试范围：
+1. 余额变动同一事务追加流水（序号 / 变动后余额）
+2. 时点余额查询（流水 / 检查点取较新者）
+3. 检查点幂等写入（以上一检查点为起点）
+"""
+import pytest
+from datetime import timedelta
+from decimal import Decimal
+
+from django.utils import timezone
+
+from apps.agents.models import AgentBalanceCheckpoint, AgentBalanceEntry
+from apps.agents.services.balance import (
+    deduct_balance_for_withdrawal,
+    get_or_create_agent_profile,
+    refund_balance_for_withdrawal,
+)
+from apps.agents.services.ledger import (
+    append_balance_entry,
+    create_balance_checkpoints,
+    get_balance_as_of,
+)
+from apps.sites.models import Site
+from apps.users.models import User
+
+
+@pytest.mark.django_db
+class TestBalanceLedger:
+    """测试余额流水"""
+
+    def setup_method(self):
+        self.site = Site.objects.create(
+            code='LEDG',
+            name='Ledger Site',
+            domain='ledger.local',
+            is_active=True
+        )
+        self.user = User.objects.create(
+            email='ledger_agent@test.com',
+            referral_code='LEDGER-AGENT',
+            is_active=True
+        )
+        self.profile = get_or_create_agent_profile(self.user, self.site)
+
+    def _credit(self, amount):
+        self.profile.balance_usd += Decimal(amount)
+        self.profile.save()
+        return append_balance_entry(self.profile, AgentBalanceEntry.TYPE_ADJUSTMENT, Decimal(amount))
+
+    def test_balance_changes_append_entries(self):
+        self._credit('100.00')
+
+        assert deduct_balance_for_withdrawal(self.profile, Decimal('30.00'))
+        refund_balance_for_withdrawal(self.profile, Decimal('30.00'))
+        # 余额不足：不扣减、不记流水
+        assert not deduct_balance_for_withdrawal(self.profile, Decimal('500.00'))
+
+        entries = list(
+            AgentBalanceEntry.objects.filter(agent_profile=self.profile).order_by('seq')
+            .values_list('seq', 'entry_type', 'amount_usd', 'balance_after')
+        )
+        assert entries == [
+            (1, 'adjustment', Decimal('100.00'), Decimal('100.00')),
+            (2, 'withdrawal', Decimal('-30.00'), Decimal('70.00')),
+            (3, 'withdrawal_refund', Decimal('30.00'), Decimal('100.00')),
+        ]
+
+    def test_balance_as_of(self):
+        first = self._credit('100.00')
+        second = self._credit('50.00')
+        AgentBalanceEntry.objects.filter(pk=first.pk).update(
+            created_at=timezone.now() - timedelta(days=10)
+        )
+
+        assert get_balance_as_of(self.profile.profile_id, timezone.now() - timedelta(days=20)) == Decimal('0')
+        assert get_balance_as_of(self.profile.profile_id, timezone.now() - timedelta(days=5)) == Decimal('100.00')
+        assert get_balance_as_of(self.profile.profile_id, second.created_at) == Decimal('150.00')
+
+    def test_checkpoints_idempotent_and_used(self):
+        self._credit('100.00')
+        as_of = timezone.now()
+
+        assert create_balance_checkpoints(as_of) == 1
+        assert create_balance_checkpoints(as_of) == 0
+
+        checkpoint = AgentBalanceCheckpoint.objects.get(agent_profile=self.profile)
+        assert (checkpoint.balance_usd, checkpoint.last_seq) == (Decimal('100.00'), 1)
+
+        # 流水被归档后仍可由检查点回答
+        AgentBalanceEntry.objects.filter(agent_profile=self.profile).delete()
+        assert get_balance_as_of(self.profile.profile_id, as_of + timedelta(days=1)) == Decimal('100.00')
+
+    def test_entries_read_only_after_checkpoint(self):
+        first = self._credit('100.00')
+        AgentBalanceEntry.objects.filter(pk=first.pk).update(
+            created_at=timezone.now() - timedelta(days=10)
+        )
+        as_of = timezone.now() - timedelta(days=5)
+        create_balance_checkpoints(as_of)
+
+        # 检查点之前的流水不再参与读取
+        AgentBalanceEntry.objects.filter(pk=first.pk).update(balance_after=Decimal('999.00'))
+        assert get_balance_as_of(self.profile.profile_id, timezone.now()) == Decimal('100.00')
+
+        self._credit('50.00')
+        assert get_balance_as_of(self.profile.profile_id, timezone.now()) == Decimal('150.00')
+
+    def test_checkpoints_seed_from_previous(self):
+        first = self._credit('100.00')
+        AgentBalanceEntry.objects.filter(pk=first.pk).update(
+            created_at=timezone.now() - timedelta(days=10)
+        )
+        previous = timezone.now() - timedelta(days=5)
+        create_balance_checkpoints(previous)
+
+        # 上一检查点之前的流水不再读取；无新流水的代理沿用上一检查点
+        AgentBalanceEntry.objects.filter(pk=first.pk).update(balance_after=Decimal('999.00'))
+        as_of = timezone.now()
+        assert create_balance_checkpoints(as_of) == 1
+        checkpoint = AgentBalanceCheckpoint.objects.get(agent_profile=self.profile, as_of=as_of)
+        assert (checkpoint.balance_usd, checkpoint.last_seq) == (Decimal('100.00'), 1)
+
+        self._credit('50.00')
+        later = timezone.now()
+        create_balance_checkpoints(later)
+        checkpoint = AgentBalanceCheckpoint.objects.get(agent_profile=self.profile, as_of=later)
+        assert (checkpoint.balance_usd, checkpoint.last_seq) == (Decimal('150.00'), 2)
@@ -0,0 +1,135 @@
+"""
+月度对账单集合化生成测试
+
+测试范围：
+1. GROUP BY 汇总与逐代理口径一致
+2. 重复生成跳过（幂等）
+3. 代理ID区间分片覆盖全部代理且不重叠
+"""
+import pytest
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from uuid import UUID
+
+from apps.agents.models import AgentBalanceEntry, CommissionStatement
+from apps.agents.services.balance import get_or_create_agent_profile
+from apps.agents.services.statements import agent_id_range, generate_statements
+from apps.commissions.models import Commission
+from apps.orders.models import Order
+from apps.sites.models import Site
+from apps.users.models import User
+
+
+PERIOD_START = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+PERIOD_END = datetime(2025, 1, 31, 23, 59, 59, tzinfo=dt_timezone.utc)
+IN_PERIOD = datetime(2025, 1, 15, tzinfo=dt_timezone.utc)
+
+
+def test_agent_id_ranges_cover_uuid_space():
+    ranges = [agent_id_range(i, 4) for i in range(4)]
+
+    assert ranges[0][0] == UUID(int=0)
+    assert ranges[-1][1] is None
+    for (_, upper), (lower, _) in zip(ranges, ranges[1:]):
+        assert upper == lower
+
+    with pytest.raises(ValueError):
+        agent_id_range(4, 4)
+
+
+@pytest.mark.django_db
+class TestGenerateStatements:
+    """测试集合化对账单生成"""
+
+    def setup_method(self):
+        self.site = Site.objects.create(
+            code='STMT',
+            name='Statement Site',
+            domain='stmt.local',
+            is_active=True
+        )
+        self.agents = [
+            User.objects.create(
+                email=f'stmt_agent_{i}@test.com',
+                referral_code=f'STMT-AGENT-{i}',
+                is_active=True
+            )
+            for i in range(3)
+        ]
+        self.profiles = [get_or_create_agent_profile(agent, self.site) for agent in self.agents]
+
+    def _paid_order(self, agent, buyer, amount):
+        order = Order.objects.create(
+            site=self.site,
+            buyer=buyer,
+            referrer=agent,
+            wallet_address='0xSTMT',
+            list_price_usd=Decimal(amount),
+            discount_usd=Decimal('0'),
+            final_price_usd=Decimal(amount),
+            status=Order.STATUS_PAID
+        )
+        Order.objects.filter(order_id=order.order_id).update(created_at=IN_PERIOD)
+        return order
+
+    def test_aggregates_per_agent(self):
+        agent = self.agents[0]
+        buyer = User.objects.create(email='stmt_buyer@test.com', referral_code='STMT-BUYER')
+        first = self._paid_order(agent, buyer, '100.00')
+        self._paid_order(agent, buyer, '50.00')
+
+        for status, amount in (('paid', '10.00'), ('hold', '5.00')):
+            commission = Commission.objects.create(
+                order=first,
+                agent=agent,
+                level=1 if status == 'paid' else 2,
+                rate_percent=Decimal('10.00'),
+                commission_amount_usd=Decimal(amount),
+                status=status
+            )
+            Commission.objects.filter(pk=commission.pk).update(created_at=IN_PERIOD)
+
+        # 余额流水：期初前 20，期内 +10
+        for seq, (amount, balance_after, created_at) in enumerate((
+            ('20.00', '20.00', datetime(2024, 12, 20, tzinfo=dt_timezone.utc)),
+            ('10.00', '30.00', IN_PERIOD),
+        ), start=1):
+            AgentBalanceEntry.objects.create(
+                agent_profile=self.profiles[0],
+                seq=seq,
+                entry_type=AgentBalanceEntry.TYPE_COMMISSION_PAID,
+                amount_usd=Decimal(amount),
+                balance_after=Decimal(balance_after),
+                created_at=created_at
+            )
+
+        result = generate_statements(PERIOD_START, PERIOD_END, site_id=self.site.site_id)
+
+        assert result == {'generated': 3, 'skipped': 0}
+        statement = CommissionStatement.objects.get(agent_profile=self.profiles[0])
+        assert statement.total_commissions_usd == Decimal('15.00')
+        assert statement.paid_commissions_usd == Decimal('10.00')
+        assert statement.pending_commissions_usd == Decimal('5.00')
+        assert statement.order_count == 2
+        assert statement.customer_count == 1
+        assert statement.balance_end_of_period == Decimal('30.00')
+        assert statement.balance_start_of_period == Decimal('20.00')
+
+        empty = CommissionStatement.objects.get(agent_profile=self.profiles[1])
+        assert empty.total_commissions_usd == Decimal('0')
+        assert empty.order_count == 0
+
+    def test_rerun_skips_existing(self):
+        generate_statements(PERIOD_START, PERIOD_END)
+
+        assert generate_statements(PERIOD_START, PERIOD_END) == {'generated': 0, 'skipped': 3}
+        assert CommissionStatement.objects.count() == 3
+
+    def test_shards_partition_agents(self):
+        generated = sum(
+            generate_statements(PERIOD_START, PERIOD_END, shard_index=i, shard_count=3)['generated']
+            for i in range(3)
+        )
+
+        assert generated == 3
+        assert CommissionStatement.objects.count() == 3
@@ -0,0 +1,120 @@
+"""
+代理团队汇总测试
+
+测试范围：
+1. 插入节点沿祖先累加团队规模 / 层级分布
+2. 订单销售沿祖先累加
+3. 改挂 / 停用子树增量
+4. 全量重建与增量结果一致（含停用 / 重新加入）
+"""
+import pytest
+from decimal import Decimal
+from uuid import uuid4
+
+from django.core.management import call_command
+
+from apps.agents.models import AgentStats, AgentTeamRollup
+from apps.agents.services.rollups import record_sales_delta
+from apps.agents.services.tree_paths import add_agent_to_tree, deactivate_agent, reparent_agent
+
+
+@pytest.mark.django_db
+class TestAgentTeamRollups:
+    """测试团队汇总增量维护"""
+
+    def setup_method(self):
+        self.site_id = uuid4()
+        # root -> a -> b -> c ; root -> d
+        self.root, self.a, self.b, self.c, self.d = (uuid4() for _ in range(5))
+        add_agent_to_tree(self.site_id, self.root)
+        add_agent_to_tree(self.site_id, self.a, self.root)
+        add_agent_to_tree(self.site_id, self.b, self.a)
+        add_agent_to_tree(self.site_id, self.c, self.b)
+        add_agent_to_tree(self.site_id, self.d, self.root)
+
+    def _rollup(self, agent):
+        return AgentTeamRollup.objects.filter(site_id=self.site_id, agent=agent).first()
+
+    def _snapshot(self):
+        return {
+            str(r.agent): (r.team_size, r.team_customers, r.team_sales, r.depth_histogram)
+            for r in AgentTeamRollup.objects.filter(site_id=self.site_id)
+            if r.team_size or r.team_customers or r.team_sales
+        }
+
+    def test_node_inserts_roll_up(self):
+        root = self._rollup(self.root)
+        assert root.team_size == 4
+        assert root.depth_histogram == {'1': 2, '2': 1, '3': 1}
+        assert root.max_depth == 3
+        assert self._rollup(self.b).depth_histogram == {'1': 1}
+        assert self._rollup(self.c) is None
+
+    def test_sales_roll_up_to_ancestors(self):
+        record_sales_delta(self.site_id, self.c, Decimal('100.00'), 1)
+
+        for agent in (self.root, self.a, self.b, self.c):
+            rollup = self._rollup(agent)
+            assert rollup.team_sales == Decimal('100.00')
+            assert rollup.team_customers == 1
+        assert self._rollup(self.d) is None
+
+    def test_reparent_moves_totals(self):
+        record_sales_delta(self.site_id, self.c, Decimal('100.00'), 1)
+
+        reparent_agent(self.site_id, self.b, self.d)
+
+        a = self._rollup(self.a)
+        assert (a.team_size, a.team_sales, a.depth_histogram) == (0, Decimal('0'), {})
+        d = self._rollup(self.d)
+        assert (d.team_size, d.team_sales, d.depth_histogram) == (2, Decimal('100.00'), {'1': 1, '2': 1})
+        # 共同祖先总量不变
+        root = self._rollup(self.root)
+        assert root.team_size == 4
+        assert root.team_sales == Decimal('100.00')
+
+    def test_deactivate_removes_subtree(self):
+        deactivate_agent(self.site_id, self.a)
+
+        root = self._rollup(self.root)
+        assert root.team_size == 1
+        assert root.depth_histogram == {'1': 1}
+        assert self._rollup(self.a) is None
+
+    def test_rebuild_matches_incremental(self):
+        AgentStats.objects.create(
+            site_id=self.site_id, agent=self.c, total_customers=1, total_sales=Decimal('100.00')
+        )
+        record_sales_delta(self.site_id, self.c, Decimal('100.00'), 1)
+        reparent_agent(self.site_id, self.b, self.d)
+        incremental = self._snapshot()
+
+        AgentTeamRollup.objects.filter(site_id=self.site_id).update(team_size=99)
+        call_command('rebuild_agent_rollups', site_ids=[str(self.site_id)])
+
+        assert self._snapshot() == incremental
+
+    def test_rebuild_matches_incremental_after_deactivate(self):
+        """停用子树后节点保留自身销售；重新加入后累加到新祖先"""
+        AgentStats.objects.create(
+            site_id=self.site_id, agent=self.c, total_customers=1, total_sales=Decimal('100.00')
+        )
+        record_sales_delta(self.site_id, self.c, Decimal('100.00'), 1)
+
+        deactivate_agent(self.site_id, self.b)
+        c = self._rollup(self.c)
+        assert (c.team_size, c.team_customers, c.team_sales) == (0, 1, Decimal('100.00'))
+        assert self._rollup(self.b) is None
+        assert self._rollup(self.root).team_sales == Decimal('0')
+
+        incremental = self._snapshot()
+        call_command('rebuild_agent_rollups', site_ids=[str(self.site_id)])
+        assert self._snapshot() == incremental
+
+        add_agent_to_tree(self.site_id, self.c, self.d)
+        assert self._rollup(self.root).team_sales == Decimal('100.00')
+        assert self._rollup(self.d).team_customers == 1
+
+        incremental = self._snapshot()
+        call_command('rebuild_agent_rollups', site_ids=[str(self.site_id)])
+        assert self._snapshot() == incremental
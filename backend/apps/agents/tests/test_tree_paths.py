@@ -0,0 +1,204 @@
+"""
+AgentTree 物化路径测试
+
+测试范围：
+1. 插入节点路径 / 深度
+2. 前缀查询下线结构与客户列表
+3. 改挂 / 停用整棵子树；注册绑定推荐人补齐祖先节点
+4. 客户列表游标分页 + 总数缓存
+"""
+import pytest
+from uuid import uuid4
+
+from apps.agents.models import AgentTree
+from apps.agents.services.tree_paths import (
+    AgentTreeError,
+    add_agent_to_tree,
+    add_referral_to_tree,
+    deactivate_agent,
+    reparent_agent,
+)
+from apps.agents.services.customer_counts import refresh_downline_customer_count
+from apps.agents.services.tree_query import AgentTreeService, InvalidCursorError
+from apps.users.models import User
+
+
+@pytest.mark.django_db
+class TestAgentTreePaths:
+    """测试物化路径维护与查询"""
+
+    def setup_method(self):
+        self.site_id = uuid4()
+        # root -> a -> b -> c ; root -> d
+        self.root, self.a, self.b, self.c, self.d = (uuid4() for _ in range(5))
+        add_agent_to_tree(self.site_id, self.root)
+        add_agent_to_tree(self.site_id, self.a, self.root)
+        add_agent_to_tree(self.site_id, self.b, self.a)
+        add_agent_to_tree(self.site_id, self.c, self.b)
+        add_agent_to_tree(self.site_id, self.d, self.root)
+
+    def _node(self, agent):
+        return AgentTree.objects.get(site_id=self.site_id, agent=agent, active=True)
+
+    def test_paths_and_depths(self):
+        node = self._node(self.c)
+        assert node.path == f"/{self.root}/{self.a}/{self.b}/{self.c}/"
+        assert node.depth == 3
+        assert node.parent == self.b
+        assert self._node(self.root).depth == 0
+
+    def test_duplicate_insert_rejected(self):
+        with pytest.raises(AgentTreeError):
+            add_agent_to_tree(self.site_id, self.a, self.root)
+
+    def test_downline_structure(self):
+        structure = AgentTreeService.get_downline_structure(self.a, self.site_id)
+
+        assert [(row['agent_id'], row['level']) for row in structure] == [
+            (str(self.b), 1),
+            (str(self.c), 2),
+        ]
+
+        limited = AgentTreeService.get_downline_structure(self.root, self.site_id, max_depth=1)
+        assert {row['agent_id'] for row in limited} == {str(self.a), str(self.d)}
+
+    def test_downline_customers_level_filter(self):
+        result = AgentTreeService.get_downline_customers(
+            self.root, self.site_id, scope='all', level=2
+        )
+
+        assert result['total'] == 1
+        assert result['customers'][0]['depth'] == 2
+
+    def test_reparent_moves_subtree(self):
+        moved = reparent_agent(self.site_id, self.b, self.d)
+
+        assert moved == 2
+        node_c = self._node(self.c)
+        assert node_c.path == f"/{self.root}/{self.d}/{self.b}/{self.c}/"
+        assert node_c.depth == 3
+        assert self._node(self.b).parent == self.d
+        assert AgentTreeService.get_downline_structure(self.a, self.site_id) == []
+
+    def test_reparent_under_own_downline_rejected(self):
+        with pytest.raises(AgentTreeError):
+            reparent_agent(self.site_id, self.a, self.c)
+
+    def test_second_active_node_rejected_by_index(self):
+        """部分唯一索引：绕过 exists() 检查也不能插入第二个有效节点"""
+        from django.db import IntegrityError, transaction
+
+        with pytest.raises(IntegrityError), transaction.atomic():
+            AgentTree.objects.create(
+                site_id=self.site_id, agent=self.c, parent=self.d,
+                depth=2, path=f"/{self.root}/{self.d}/{self.c}/"
+            )
+
+    def test_reparent_back_to_previous_parent(self):
+        """改挂回曾停用关系的上级：旧的停用行不触发唯一约束"""
+        deactivate_agent(self.site_id, self.c)
+        add_agent_to_tree(self.site_id, self.c, self.d)
+
+        moved = reparent_agent(self.site_id, self.c, self.b)
+
+        assert moved == 1
+        node_c = self._node(self.c)
+        assert node_c.parent == self.b
+        assert node_c.path == f"/{self.root}/{self.a}/{self.b}/{self.c}/"
+        assert AgentTree.objects.filter(site_id=self.site_id, agent=self.c).count() == 1
+
+    def test_deactivate_hides_subtree(self):
+        deactivated = deactivate_agent(self.site_id, self.a)
+
+        assert deactivated == 3
+        structure = AgentTreeService.get_downline_structure(self.root, self.site_id)
+        assert [row['agent_id'] for row in structure] == [str(self.d)]
+
+    def test_referral_fills_missing_ancestors(self):
+        top = User.objects.create(email='tree_top@test.com', referral_code='TREE-TOP', is_active=True)
+        middle = User.objects.create(
+            email='tree_mid@test.com', referral_code='TREE-MID', referrer=top, is_active=True
+        )
+        buyer = User.objects.create(
+            email='tree_buyer@test.com', referral_code='TREE-BUY', referrer=middle, is_active=True
+        )
+
+        node = add_referral_to_tree(self.site_id, buyer)
+
+        assert node.path == f"/{top.user_id}/{middle.user_id}/{buyer.user_id}/"
+        assert node.depth == 2
+        assert self._node(top.user_id).depth == 0
+        assert add_referral_to_tree(self.site_id, top) is None
+
+
+@pytest.mark.django_db
+class TestCustomerCursorPagination:
+    """测试客户列表游标分页"""
+
+    def setup_method(self):
+        from django.core.cache import cache
+        cache.clear()
+
+        self.site_id = uuid4()
+        self.root = uuid4()
+        add_agent_to_tree(self.site_id, self.root)
+
+        self.customers = []
+        for i in range(5):
+            user = User.objects.create(
+                email=f'cursor_{i}@test.com',
+                referral_code=f'CURSOR-{i}',
+                is_active=True
+            )
+            add_agent_to_tree(self.site_id, user.user_id, self.root)
+            self.customers.append(str(user.user_id))
+
+    def _all_pages(self, **kwargs):
+        seen, cursor = [], ''
+        while cursor is not None:
+            result = AgentTreeService.get_downline_customers(
+                self.root, self.site_id, page_size=2, cursor=cursor, **kwargs
+            )
+            seen.extend(row['user_id'] for row in result['customers'])
+            cursor = result['next_cursor']
+        return seen
+
+    def test_cursor_walks_every_customer_once(self):
+        seen = self._all_pages(scope='all')
+
+        assert sorted(seen) == sorted(self.customers)
+
+        # 与 page 模式顺序一致
+        paged = AgentTreeService.get_downline_customers(
+            self.root, self.site_id, scope='all', page=1, page_size=5
+        )
+        assert [row['user_id'] for row in paged['customers']] == seen
+
+    def test_cursor_with_search_has_no_total(self):
+        result = AgentTreeService.get_downline_customers(
+            self.root, self.site_id, scope='direct', search='cursor_3', cursor=''
+        )
+
+        assert result['total'] is None
+        assert [row['user_id'] for row in result['customers']] == [self.customers[3]]
+        assert result['next_cursor'] is None
+
+    def test_invalid_cursor_rejected(self):
+        with pytest.raises(InvalidCursorError):
+            AgentTreeService.get_downline_customers(
+                self.root, self.site_id, cursor='not-a-cursor'
+            )
+
+    def test_total_served_from_cache(self):
+        first = AgentTreeService.get_downline_customers(self.root, self.site_id, cursor='')
+        assert first['total'] == 5
+
+        add_agent_to_tree(self.site_id, uuid4(), self.root)
+
+        # 缓存期内返回旧值，刷新后更新
+        cached = AgentTreeService.get_downline_customers(self.root, self.site_id, cursor='')
+        assert cached['total'] == 5
+
+        assert refresh_downline_customer_count(self.root, self.site_id, 'all') == 6
+        refreshed = AgentTreeService.get_downline_customers(self.root, self.site_id, cursor='')
+        assert refreshed['total'] == 6
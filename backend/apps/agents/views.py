@@ -9,6 +9,7 @@
 - 通过 request.site 自动隔离
 - RLS 策略提供二次保障
 """
+import uuid
 from decimal import Decimal
 from django.db.models import Sum, Q, Count
 from django.utils import timezone
@@ -18,7 +19,7 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 import logging
 
-from .services.tree_query import AgentTreeService
+from .services.tree_query import AgentTreeService, InvalidCursorError
 from .services.balance import (
     get_or_create_agent_profile,
     deduct_balance_for_withdrawal,
@@ -27,6 +28,7 @@ from .models import AgentProfile, WithdrawalRequest, CommissionStatement
 from .serializers import (
     AgentStructureNodeSerializer,
     AgentCustomerListSerializer,
+    AgentCustomerCursorListSerializer,
     AgentProfileSerializer,
     WithdrawalRequestSerializer,
     CommissionStatementSerializer,
@@ -109,16 +111,20 @@ class AgentViewSet(viewsets.ViewSet):
         - search: 搜索关键词（邮箱/钱包）
         - page: 页码（默认1）
         - size: 每页大小（默认20，最大100）
+        - cursor: 游标分页（首页传空值 ?cursor=，之后传上一页的 next_cursor）
         
         ⚠️ scope='all' 必须分页（防止大结果集）
+        ⭐ 大下线推荐 cursor 模式：按排序键 seek，total 为缓存值（带 search 时为 null）
         """
         # 参数
         scope = request.query_params.get('scope', 'all')
         if scope not in ['direct', 'all']:
             scope = 'all'
         
-        # ⚠️ scope='all' 强制分页
-        if scope == 'all':
+        cursor = request.query_params.get('cursor')
+        
+        # ⚠️ scope='all' 强制分页（cursor 模式本身即分页）
+        if scope == 'all' and cursor is None:
             page = request.query_params.get('page')
             size = request.query_params.get('size')
             
@@ -152,18 +158,28 @@ class AgentViewSet(viewsets.ViewSet):
         agent_id = request.user.user_id
         site_id = request.site.site_id
         
-        result = AgentTreeService.get_downline_customers(
-            agent_id=agent_id,
-            site_id=site_id,
-            scope=scope,
-            level=level,
-            search=search,
-            page=page,
-            page_size=page_size
-        )
+        try:
+            result = AgentTreeService.get_downline_customers(
+                agent_id=agent_id,
+                site_id=site_id,
+                scope=scope,
+                level=level,
+                search=search,
+                page=page,
+                page_size=page_size,
+                cursor=cursor
+            )
+        except InvalidCursorError:
+            return Response({
+                'code': 'VALIDATION.INVALID_CURSOR',
+                'message': 'cursor 无效，请从首页重新获取（?cursor=）'
+            }, status=status.HTTP_400_BAD_REQUEST)
         
         # 序列化
-        serializer = AgentCustomerListSerializer(result)
+        if cursor is not None:
+            serializer = AgentCustomerCursorListSerializer(result)
+        else:
+            serializer = AgentCustomerListSerializer(result)
         
         return Response(serializer.data)
     
@@ -238,15 +254,16 @@ class AgentViewSet(viewsets.ViewSet):
         profile = serializer.validated_data['agent_profile']
         amount = serializer.validated_data['amount_usd']
         
-        # 扣减余额（悲观锁）
-        if not deduct_balance_for_withdrawal(profile, amount):
+        # 扣减余额（悲观锁；预分配申请ID记入余额流水）
+        request_id = uuid.uuid4()
+        if not deduct_balance_for_withdrawal(profile, amount, reference_id=request_id):
             return Response({
                 'code': 'WITHDRAWAL.INSUFFICIENT_BALANCE',
                 'message': f'余额不足。可用余额：${profile.balance_usd}'
             }, status=status.HTTP_400_BAD_REQUEST)
         
         # 创建申请
-        withdrawal = serializer.save(status='submitted')
+        withdrawal = serializer.save(status='submitted', request_id=request_id)
         
         logger.info(
             f"Withdrawal request created",
@@ -403,21 +420,27 @@ class AgentViewSet(viewsets.ViewSet):
         }
     
     def _get_team_stats(self, user, site):
-        """查询团队统计"""
-        from apps.agents.models import AgentTree
+        """查询团队统计（读取预聚合汇总行，O(1)）"""
+        from apps.agents.models import AgentTeamRollup
         
-        # 查询下线数量
-        downlines = AgentTree.objects.filter(
+        rollup = AgentTeamRollup.objects.filter(
             site_id=site.site_id,
-            parent=user.user_id,
-            active=True
-        ).aggregate(
-            total=Count('tree_id'),
-            max_depth=models.Max('depth')
-        )
+            agent=user.user_id
+        ).first()
+        if rollup is None:
+            return {
+                'total_downlines': 0,
+                'max_depth': 0,
+                'team_customers': 0,
+                'team_sales_usd': '0.00',
+                'depth_histogram': {},
+            }
         
         return {
-            'total_downlines': downlines['total'] or 0,
-            'max_depth': downlines['max_depth'] or 0,
+            'total_downlines': rollup.team_size,
+            'max_depth': rollup.max_depth,
+            'team_customers': rollup.team_customers,
+            'team_sales_usd': f"{rollup.team_sales:.2f}",
+            'depth_histogram': rollup.depth_histogram,
         }
 
@@ -8,12 +8,14 @@
 - 销售额门槛验证
 - 金额精度统一（ROUND_HALF_UP）
 - 原子性创建佣金记录
+- 批量模式：合并突发支付订单，集合查询 + 单次 bulk_create
 """
 import logging
+import time
+from collections import defaultdict
 from decimal import Decimal, ROUND_HALF_UP
-from typing import List, Set, Tuple
+from typing import List, Optional, Tuple
 from uuid import UUID
-from datetime import timedelta
 
 from celery import shared_task
 from django.db import transaction
@@ -24,10 +26,18 @@ from apps.orders.models import Order
 from apps.users.models import User
 from apps.commissions.models import Commission
 from apps.orders_snapshots.models import OrderCommissionPolicySnapshot
+from apps.orders_snapshots.compiled import CompiledPlan, PlanValidationError, compile_snapshot
 from apps.agents.models import AgentStats, AgentProfile
+from apps.core.utils.redis import get_redis_client, redis_key
 
 logger = logging.getLogger(__name__)
 
+# 批量佣金计算：合并窗口（秒）与单批最大订单数
+COMMISSION_BATCH_WINDOW_SECONDS = getattr(settings, 'COMMISSION_BATCH_WINDOW_SECONDS', 5)
+COMMISSION_BATCH_SIZE = getattr(settings, 'COMMISSION_BATCH_SIZE', 500)
+# 已投递未确认的订单超过该秒数视为批量任务失败，重新入队（须大于批量任务重试总时长）
+COMMISSION_PROCESSING_TIMEOUT_SECONDS = getattr(settings, 'COMMISSION_PROCESSING_TIMEOUT_SECONDS', 900)
+
 
 def quantize_commission(amount: Decimal) -> Decimal:
     """
@@ -40,13 +50,30 @@ def quantize_commission(amount: Decimal) -> Decimal:
     return amount.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
 
 
+def get_profile_level_rate(profile: Optional[AgentProfile], site_id: UUID) -> Decimal:
+    """
+    根据已加载的 AgentProfile 获取等级费率（不查库）
+    
+    ⭐ 费率来自站点费率表（AgentLevelRate，进程内缓存）
+    
+    Args:
+        profile: AgentProfile 实例（None 表示无代理档案）
+        site_id: 站点ID
+    
+    Returns:
+        Decimal: 等级对应的费率（%）
+    """
+    from apps.agents.services.level_rates import get_level_rate
+    return get_level_rate(site_id, profile)
+
+
 def get_agent_level_rate(user: User, site_id: UUID) -> Decimal:
     """
     获取代理等级对应的费率
     
     ⭐ Solar Diff 模式使用
     
-    代理等级费率表：
+    代理等级费率表：站点级配置（AgentLevelRate），默认：
     - bronze（青铜）：10%
     - silver（白银）：15%
     - gold（黄金）：20%
@@ -59,22 +86,20 @@ def get_agent_level_rate(user: User, site_id: UUID) -> Decimal:
     Returns:
         Decimal: 等级对应的费率（%）
     """
-    try:
-        profile = AgentProfile.objects.get(user=user, site__site_id=site_id)
-        
-        # 代理等级费率映射
-        level_rates = {
-            AgentProfile.LEVEL_BRONZE: Decimal('10.00'),
-            AgentProfile.LEVEL_SILVER: Decimal('15.00'),
-            AgentProfile.LEVEL_GOLD: Decimal('20.00'),
-            AgentProfile.LEVEL_PLATINUM: Decimal('25.00'),
+    profile = AgentProfile.objects.filter(user=user, site__site_id=site_id).first()
+    return get_profile_level_rate(profile, site_id)
+
+
+def _log_circular_referral(user_id: UUID, resolved: dict) -> None:
+    """记录推荐链环路（截断处理，不中断佣金计算）"""
+    logger.error(
+        f"Circular referral detected: {user_id} → {resolved['cycle_user_id']}",
+        extra={
+            'user_id': str(user_id),
+            'referrer_id': str(resolved['cycle_user_id']),
+            'visited': [str(item['user_id']) for item in resolved['chain']]
         }
-        
-        return level_rates.get(profile.agent_level, Decimal('0'))
-    
-    except AgentProfile.DoesNotExist:
-        # 如果没有 AgentProfile，默认为最低等级
-        return Decimal('10.00')  # Bronze
+    )
 
 
 def get_referral_chain(user: User, max_levels: int = 2) -> List[dict]:
@@ -82,46 +107,73 @@ def get_referral_chain(user: User, max_levels: int = 2) -> List[dict]:
     获取推荐链路
     
     ⭐ Phase D P0: 环路检测
+    ⭐ 单条递归 CTE 查询（不再逐级懒加载 referrer）
     
     Args:
         user: 当前用户
         max_levels: 最大层级（默认2层）
         
     Returns:
-        list: 推荐链列表 [{'agent': User, 'level': 1}, ...]
+        list: 推荐链列表 [{'agent': User, 'level': 1, 'profile': ..., 'stats': ...}, ...]
     """
-    chain = []
-    visited: Set[UUID] = set()  # ⭐ 环路检测
-    current_user = user
+    from apps.users.utils.referral_chain import resolve_referral_chain
     
-    for level in range(1, max_levels + 1):
-        if not current_user.referrer:
-            break
-        
-        # ⭐ 环路检测
-        if current_user.referrer.user_id in visited:
-            logger.error(
-                f"Circular referral detected: {current_user.user_id} → "
-                f"{current_user.referrer.user_id}",
-                extra={
-                    'user_id': str(current_user.user_id),
-                    'referrer_id': str(current_user.referrer.user_id),
-                    'visited': [str(uid) for uid in visited]
-                }
-            )
-            break
-        
-        visited.add(current_user.referrer.user_id)
-        chain.append({
-            'agent': current_user.referrer,
-            'level': level
-        })
-        current_user = current_user.referrer
+    resolved = resolve_referral_chain(user.user_id, max_levels=max_levels)
+    
+    # ⭐ 环路检测：记录日志并截断
+    if resolved['cycle_detected']:
+        _log_circular_referral(user.user_id, resolved)
+    
+    return resolved['chain']
+
+
+def resolve_order_referral_chain(order: Order, max_levels: int) -> dict:
+    """
+    单查询解析订单买家及其推荐链路
+    
+    ⭐ 一次递归 CTE 返回：买家（level=0）+ 各级推荐人 + AgentProfile + AgentStats
+    ⭐ profile / stats 按订单站点过滤
+    
+    Args:
+        order: 订单实例
+        max_levels: 最大层级
     
-    return chain
+    Returns:
+        dict: resolve_referral_chain 结果（self 为买家节点）
+    """
+    from apps.users.utils.referral_chain import resolve_referral_chain
+    
+    resolved = resolve_referral_chain(
+        order.buyer_id,
+        max_levels=max_levels,
+        site_id=order.site_id,
+        include_self=True
+    )
+    
+    if resolved['cycle_detected']:
+        _log_circular_referral(order.buyer_id, resolved)
+    
+    return resolved
 
 
-def _calculate_level_commissions(order: Order, snapshot, referral_chain: List[dict]) -> Tuple[list, list]:
+def _chain_item_stats(order: Order, chain_item: dict):
+    """读取推荐链节点上的 AgentStats（旧格式节点回退查询）"""
+    if 'stats' in chain_item:
+        return chain_item['stats']
+    return AgentStats.objects.filter(
+        agent=chain_item['agent'].user_id,
+        site_id=order.site.site_id
+    ).first()
+
+
+def _chain_item_level_rate(order: Order, chain_item: dict) -> Decimal:
+    """读取推荐链节点上的代理等级费率（旧格式节点回退查询）"""
+    if 'profile' in chain_item:
+        return get_profile_level_rate(chain_item['profile'], order.site_id)
+    return get_agent_level_rate(chain_item['agent'], order.site.site_id)
+
+
+def _calculate_level_commissions(order: Order, plan: CompiledPlan, referral_chain: List[dict]) -> Tuple[list, list]:
     """
     Level 固定费率模式佣金计算
     
@@ -129,36 +181,32 @@ def _calculate_level_commissions(order: Order, snapshot, referral_chain: List[di
     
     Args:
         order: 订单实例
-        snapshot: 佣金快照
+        plan: 编译后的佣金计划（compile_snapshot）
         referral_chain: 推荐链
     
     Returns:
-        Tuple[list, list]: (创建的佣金列表, 跳过的佣金列表)
+        Tuple[list, list]: (待创建的佣金列表（未保存）, 跳过的佣金列表)
     """
     commissions_created = []
     commissions_skipped = []
+    now = timezone.now()
     
     for chain_item in referral_chain:
         agent = chain_item['agent']
         level = chain_item['level']
         
-        # 从快照读取层级配置
-        if level > len(snapshot.tiers_json):
+        # 从编译计划读取层级配置（已规范化，无需解析）
+        tier = plan.tier(level)
+        if tier is None:
             logger.warning(
-                f"Level {level} exceeds configured tiers count {len(snapshot.tiers_json)}",
+                f"Level {level} exceeds configured tiers count {plan.max_levels}",
                 extra={'order_id': str(order.order_id), 'level': level}
             )
             continue
         
-        tier_config = snapshot.tiers_json[level - 1]
-        rate_percent = Decimal(tier_config['rate_percent'])
-        
-        # 统一字段命名
-        min_sales = Decimal(
-            tier_config.get('min_sales') or 
-            tier_config.get('min_order_amount', '0')
-        )
-        hold_days = tier_config.get('hold_days', 7)
+        rate_percent = tier.rate_percent
+        min_sales = tier.min_sales
+        hold_days = tier.hold_days
         
         # 验证费率有效性
         if not rate_percent or rate_percent <= 0:
@@ -170,10 +218,7 @@ def _calculate_level_commissions(order: Order, snapshot, referral_chain: List[di
         
         # 检查销售额门槛
         if min_sales > 0:
-            agent_stats = AgentStats.objects.filter(
-                agent=agent.user_id,
-                site_id=order.site.site_id
-            ).first()
+            agent_stats = _chain_item_stats(order, chain_item)
             
             agent_total_sales = agent_stats.total_sales if agent_stats else Decimal('0')
             
@@ -199,14 +244,14 @@ def _calculate_level_commissions(order: Order, snapshot, referral_chain: List[di
                 continue
         
         # 计算佣金金额
-        raw_amount = order.final_price_usd * (rate_percent / Decimal('100'))
+        raw_amount = order.final_price_usd * tier.rate_fraction
         commission_amount = quantize_commission(raw_amount)
         
         # 计算锁定截止时间
-        hold_until = timezone.now() + timedelta(days=hold_days)
+        hold_until = now + tier.hold_delta
         
-        # 创建佣金记录
-        commission = Commission.objects.create(
+        # 构建佣金记录（由调用方 bulk_create 持久化）
+        commission = Commission(
             order=order,
             agent=agent,
             level=level,
@@ -234,7 +279,12 @@ def _calculate_level_commissions(order: Order, snapshot, referral_chain: List[di
     return commissions_created, commissions_skipped
 
 
-def _calculate_solar_diff_commissions(order: Order, snapshot, referral_chain: List[dict]) -> Tuple[list, list]:
+def _calculate_solar_diff_commissions(
+    order: Order,
+    plan: CompiledPlan,
+    referral_chain: List[dict],
+    buyer_node: Optional[dict] = None
+) -> Tuple[list, list]:
     """
     Solar Diff 太阳线差额模式佣金计算
     
@@ -254,17 +304,22 @@ def _calculate_solar_diff_commissions(order: Order, snapshot, referral_chain: Li
     
     Args:
         order: 订单实例
-        snapshot: 佣金快照
+        plan: 编译后的佣金计划（compile_snapshot）
         referral_chain: 推荐链
+        buyer_node: 买家节点（resolve_order_referral_chain 返回的 self，含 profile）
     
     Returns:
-        Tuple[list, list]: (创建的佣金列表, 跳过的佣金列表)
+        Tuple[list, list]: (待创建的佣金列表（未保存）, 跳过的佣金列表)
     """
     commissions_created = []
     commissions_skipped = []
+    now = timezone.now()
     
     # 获取买家等级费率（作为基准）
-    buyer_level_rate = get_agent_level_rate(order.buyer, order.site.site_id)
+    if buyer_node is not None:
+        buyer_level_rate = get_profile_level_rate(buyer_node['profile'], order.site_id)
+    else:
+        buyer_level_rate = get_agent_level_rate(order.buyer, order.site.site_id)
     
     logger.info(
         f"[Solar Diff Mode] Buyer level rate: {buyer_level_rate}%",
@@ -282,26 +337,17 @@ def _calculate_solar_diff_commissions(order: Order, snapshot, referral_chain: Li
         agent = chain_item['agent']
         level = chain_item['level']
         
-        # 从快照读取层级配置
-        if level > len(snapshot.tiers_json):
+        # 从编译计划读取层级配置（已规范化，无需解析）
+        tier = plan.tier(level)
+        if tier is None:
             continue
         
-        tier_config = snapshot.tiers_json[level - 1]
-        
-        # 统一字段命名
-        min_sales = Decimal(
-            tier_config.get('min_sales') or 
-            tier_config.get('min_order_amount', '0')
-        )
-        hold_days = tier_config.get('hold_days', 7)
-        diff_cap_percent = tier_config.get('diff_cap_percent')
+        min_sales = tier.min_sales
+        hold_days = tier.hold_days
         
         # 检查销售额门槛
         if min_sales > 0:
-            agent_stats = AgentStats.objects.filter(
-                agent=agent.user_id,
-                site_id=order.site.site_id
-            ).first()
+            agent_stats = _chain_item_stats(order, chain_item)
             
             agent_total_sales = agent_stats.total_sales if agent_stats else Decimal('0')
             
@@ -326,7 +372,7 @@ def _calculate_solar_diff_commissions(order: Order, snapshot, referral_chain: Li
                 continue
         
         # 获取代理等级费率
-        agent_level_rate = get_agent_level_rate(agent, order.site.site_id)
+        agent_level_rate = _chain_item_level_rate(order, chain_item)
         
         # ⭐ 计算差额费率
         diff_rate = agent_level_rate - current_base_rate
@@ -355,8 +401,8 @@ def _calculate_solar_diff_commissions(order: Order, snapshot, referral_chain: Li
             continue
         
         # ⭐ 差额封顶
-        if diff_cap_percent:
-            cap = Decimal(diff_cap_percent)
+        if tier.diff_cap_percent is not None:
+            cap = tier.diff_cap_percent
             if diff_rate > cap:
                 logger.info(
                     f"Diff rate {diff_rate}% capped to {cap}%",
@@ -375,10 +421,10 @@ def _calculate_solar_diff_commissions(order: Order, snapshot, referral_chain: Li
         commission_amount = quantize_commission(raw_amount)
         
         # 计算锁定截止时间
-        hold_until = timezone.now() + timedelta(days=hold_days)
+        hold_until = now + tier.hold_delta
         
-        # 创建佣金记录
-        commission = Commission.objects.create(
+        # 构建佣金记录（由调用方 bulk_create 持久化）
+        commission = Commission(
             order=order,
             agent=agent,
             level=level,
@@ -412,6 +458,56 @@ def _calculate_solar_diff_commissions(order: Order, snapshot, referral_chain: Li
     return commissions_created, commissions_skipped
 
 
+def _build_order_commissions(order: Order, plan: CompiledPlan, resolved: dict) -> Tuple[list, list]:
+    """
+    根据快照模式构建订单佣金（不写库）
+    
+    Args:
+        order: 订单实例
+        plan: 编译后的佣金计划
+        resolved: resolve_referral_chain(s) 结果（含买家节点 self）
+    
+    Returns:
+        Tuple[list, list]: (待创建的佣金列表, 跳过的佣金列表)
+    """
+    referral_chain = resolved['chain']
+    
+    if plan.plan_mode == 'solar_diff':
+        # ⭐ Solar Diff 差额模式
+        return _calculate_solar_diff_commissions(
+            order, plan, referral_chain, buyer_node=resolved['self']
+        )
+    
+    # 默认 Level 固定费率模式
+    return _calculate_level_commissions(order, plan, referral_chain)
+
+
+def _persist_commissions(commissions: List[Commission]) -> None:
+    """
+    单次 bulk_create 写入佣金
+    
+    ⭐ ignore_conflicts：(order, agent, level) 唯一约束保证任务重试/重复投递幂等
+    ⭐ 同一事务内按实际写入的行增量更新 AgentStats.total_commissions
+    """
+    from apps.agents.services.stats import record_commissions_created
+    
+    if not commissions:
+        return
+    
+    with transaction.atomic():
+        Commission.objects.bulk_create(commissions, ignore_conflicts=True)
+        
+        # 主键由客户端生成：查回本次实际插入的行（冲突被忽略的不计）
+        inserted_ids = set(
+            Commission.objects.filter(
+                commission_id__in=[c.commission_id for c in commissions]
+            ).values_list('commission_id', flat=True)
+        )
+        record_commissions_created(
+            c for c in commissions if c.commission_id in inserted_ids
+        )
+
+
 @shared_task(bind=True, max_retries=3, default_retry_delay=60)
 def calculate_commission_for_order(self, order_id: str):
     """
@@ -435,7 +531,7 @@ def calculate_commission_for_order(self, order_id: str):
     
     try:
         # 1. 获取订单
-        order = Order.objects.select_related('buyer__referrer', 'site').get(
+        order = Order.objects.select_related('buyer', 'site').get(
             order_id=UUID(order_id)
         )
         
@@ -457,15 +553,25 @@ def calculate_commission_for_order(self, order_id: str):
             )
             return
         
-        # 4. ⭐ 动态获取层级数（从快照的 tiers_json 读取）
-        if not snapshot.tiers_json or len(snapshot.tiers_json) == 0:
+        # 4. ⭐ 编译计划（按 plan_id + version 缓存），动态获取层级数
+        try:
+            plan = compile_snapshot(snapshot)
+        except PlanValidationError as e:
+            # 配置错误重试无意义
+            logger.error(
+                f"Invalid commission tiers in snapshot for order {order_id}: {e}",
+                extra={'order_id': order_id, 'plan_id': str(snapshot.plan_id)}
+            )
+            return
+        
+        if plan.max_levels == 0:
             logger.warning(
                 f"No commission tiers configured in snapshot for order {order_id}",
                 extra={'order_id': order_id}
             )
             return
         
-        max_levels = len(snapshot.tiers_json)
+        max_levels = plan.max_levels
         logger.info(
             f"Commission snapshot loaded: {max_levels} levels configured",
             extra={
@@ -476,10 +582,10 @@ def calculate_commission_for_order(self, order_id: str):
             }
         )
         
-        # 5. 获取推荐链（含环路检测）⭐ 动态层级数
-        referral_chain = get_referral_chain(order.buyer, max_levels=max_levels)
+        # 5. 获取推荐链（含环路检测）⭐ 动态层级数，单查询附带 profile / stats
+        resolved = resolve_order_referral_chain(order, max_levels=max_levels)
         
-        if not referral_chain:
+        if not resolved['chain']:
             logger.info(
                 f"No referral chain for order {order_id}, no commission to calculate",
                 extra={'order_id': order_id}
@@ -487,16 +593,10 @@ def calculate_commission_for_order(self, order_id: str):
             return
         
         # 6. 根据计算模式选择佣金计算方式
-        if snapshot.plan_mode == 'solar_diff':
-            # ⭐ Solar Diff 差额模式
-            commissions_created, commissions_skipped = _calculate_solar_diff_commissions(
-                order, snapshot, referral_chain
-            )
-        else:
-            # 默认 Level 固定费率模式
-            commissions_created, commissions_skipped = _calculate_level_commissions(
-                order, snapshot, referral_chain
-            )
+        commissions_created, commissions_skipped = _build_order_commissions(
+            order, plan, resolved
+        )
+        _persist_commissions(commissions_created)
         
         logger.info(
             f"Commission calculation completed for order {order_id}: "
@@ -526,6 +626,280 @@ def calculate_commission_for_order(self, order_id: str):
         raise self.retry(exc=e)
 
 
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def calculate_commissions_batch(self, order_ids: List[str]):
+    """
+    批量计算订单佣金（Celery 任务）
+    
+    ⭐ 突发支付场景（Tier 开售）：
+    - 订单 / 快照 / 已有佣金：各一次 IN 查询（快照编译结果按计划版本复用）
+    - 推荐链 + AgentProfile + AgentStats：每个站点一次递归 CTE
+    - 全部佣金：一次 bulk_create
+    
+    ⚠️ 已存在佣金的订单跳过（与单订单任务幂等一致）
+    ⚠️ 成功后确认（移出处理中集合）；重试用尽的订单由 flush_commission_queue 超时重新入队
+    
+    Args:
+        order_ids: 订单ID列表（字符串）
+    """
+    from apps.users.utils.referral_chain import resolve_referral_chains
+    
+    order_uuids = list({UUID(str(order_id)) for order_id in order_ids})
+    if not order_uuids:
+        return
+    
+    logger.info(
+        f"Starting batch commission calculation for {len(order_uuids)} orders",
+        extra={'order_count': len(order_uuids), 'task_id': self.request.id}
+    )
+    
+    try:
+        # 1. 订单（仅已支付）
+        orders = list(
+            Order.objects.select_related('buyer', 'site').filter(
+                order_id__in=order_uuids,
+                status=Order.STATUS_PAID
+            )
+        )
+        
+        # 2. 已计算过佣金的订单
+        computed_order_ids = set(
+            Commission.objects.filter(
+                order_id__in=[order.order_id for order in orders]
+            ).values_list('order_id', flat=True).distinct()
+        )
+        
+        # 3. 快照
+        snapshots = {
+            snapshot.order_id: snapshot
+            for snapshot in OrderCommissionPolicySnapshot.objects.filter(
+                order_id__in=[order.order_id for order in orders]
+            )
+        }
+        
+        orders_by_site = defaultdict(list)
+        for order in orders:
+            if order.order_id in computed_order_ids:
+                continue
+            snapshot = snapshots.get(order.order_id)
+            if snapshot is None:
+                logger.error(
+                    f"Commission snapshot not found for order {order.order_id}",
+                    extra={'order_id': str(order.order_id)}
+                )
+                continue
+            try:
+                plan = compile_snapshot(snapshot)
+            except PlanValidationError as e:
+                logger.error(
+                    f"Invalid commission tiers in snapshot for order {order.order_id}: {e}",
+                    extra={'order_id': str(order.order_id), 'plan_id': str(snapshot.plan_id)}
+                )
+                continue
+            if plan.max_levels == 0:
+                continue
+            orders_by_site[order.site_id].append((order, plan))
+        
+        # 4. 按站点批量解析推荐链（层级取该批最大值，逐单截断）
+        commissions_created = []
+        commissions_skipped = []
+        
+        for site_id, items in orders_by_site.items():
+            max_levels = max(plan.max_levels for _, plan in items)
+            chains = resolve_referral_chains(
+                [order.buyer_id for order, _ in items],
+                max_levels=max_levels,
+                site_id=site_id,
+                include_self=True
+            )
+            
+            for order, plan in items:
+                resolved = chains.get(order.buyer_id)
+                if resolved is None:
+                    continue
+                
+                order_levels = plan.max_levels
+                chain = [item for item in resolved['chain'] if item['level'] <= order_levels]
+                if not chain:
+                    continue
+                
+                # 环路出现在本订单层级范围内才记录
+                if resolved['cycle_detected'] and len(resolved['chain']) < order_levels:
+                    _log_circular_referral(order.buyer_id, resolved)
+                
+                created, skipped = _build_order_commissions(
+                    order, plan, dict(resolved, chain=chain)
+                )
+                commissions_created.extend(created)
+                commissions_skipped.extend(skipped)
+        
+        # 5. 单次写入
+        _persist_commissions(commissions_created)
+        _ack_processing(order_uuids)
+        
+        logger.info(
+            f"Batch commission calculation completed: {len(orders)} orders, "
+            f"{len(commissions_created)} commissions created, {len(commissions_skipped)} skipped",
+            extra={
+                'order_count': len(orders),
+                'commissions_count': len(commissions_created),
+                'commissions_skipped': len(commissions_skipped),
+                'total_amount': str(sum(c.commission_amount_usd for c in commissions_created))
+            }
+        )
+    
+    except Exception as e:
+        logger.error(
+            f"Batch commission calculation failed: {e}",
+            exc_info=True,
+            extra={'order_count': len(order_uuids)}
+        )
+        raise self.retry(exc=e)
+
+
+def _pending_queue_key() -> str:
+    return redis_key('commissions', 'pending')
+
+
+def _processing_key() -> str:
+    return redis_key('commissions', 'processing')
+
+
+def _flush_scheduled_key() -> str:
+    return redis_key('commissions', 'flush_scheduled')
+
+
+# 待计算队列 → 处理中集合（score = 投递时间），原子移交
+HANDOFF_LUA = """
+local ids = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #ids > 0 then
+    redis.call('LTRIM', KEYS[1], #ids, -1)
+    for _, id in ipairs(ids) do
+        redis.call('ZADD', KEYS[2], ARGV[2], id)
+    end
+end
+return ids
+"""
+
+# 处理超时（批量任务重试用尽 / worker 丢失）的订单重新入队
+REQUEUE_LUA = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, id in ipairs(ids) do
+    redis.call('ZREM', KEYS[1], id)
+    redis.call('RPUSH', KEYS[2], id)
+end
+return #ids
+"""
+
+
+def _ack_processing(order_ids) -> None:
+    """批量任务成功：移出处理中集合（失败时由超时重新入队兜底）"""
+    client = get_redis_client()
+    if client is None or not order_ids:
+        return
+    try:
+        client.zrem(_processing_key(), *[str(order_id) for order_id in order_ids])
+    except Exception as e:
+        logger.warning(
+            f"Commission processing ack failed: {e}",
+            extra={'order_count': len(order_ids)}
+        )
+
+
+def enqueue_commission_calculation(order_id: str) -> None:
+    """
+    合并调度佣金计算（Webhook 调用）
+    
+    ⭐ 合并窗口：
+    - 订单ID推入 Redis 队列
+    - 窗口内第一个订单（SET NX 抢到调度标记）负责延迟投递 flush 任务
+    - 窗口内其余订单只入队，由同一次 flush 批量计算
+    
+    ⚠️ Redis 不可用时降级为单订单任务
+    
+    Args:
+        order_id: 订单ID（字符串）
+    """
+    client = get_redis_client()
+    if client is None:
+        calculate_commission_for_order.delay(order_id)
+        return
+    
+    try:
+        pipe = client.pipeline()
+        pipe.rpush(_pending_queue_key(), order_id)
+        # 标记 TTL 兜底：flush 异常退出时不永久阻塞调度
+        pipe.set(
+            _flush_scheduled_key(), '1',
+            nx=True, ex=COMMISSION_BATCH_WINDOW_SECONDS * 10
+        )
+        _, scheduled = pipe.execute()
+    except Exception as e:
+        logger.warning(
+            f"Commission queue unavailable, dispatching single task: {e}",
+            extra={'order_id': order_id}
+        )
+        calculate_commission_for_order.delay(order_id)
+        return
+    
+    if scheduled:
+        flush_commission_queue.apply_async(countdown=COMMISSION_BATCH_WINDOW_SECONDS)
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=10)
+def flush_commission_queue(self):
+    """
+    取出待计算订单并投递批量任务
+    
+    ⭐ 每次最多取 COMMISSION_BATCH_SIZE 个订单
+    ⭐ Celery Beat 每分钟兜底运行一次（防止调度标记过期后队列滞留）
+    ⭐ 可靠移交：取出的订单进入处理中集合，批量任务成功后确认；
+      超过 COMMISSION_PROCESSING_TIMEOUT_SECONDS 未确认的订单重新入队
+    """
+    client = get_redis_client()
+    if client is None:
+        return
+    
+    queue_key = _pending_queue_key()
+    processing_key = _processing_key()
+    flag_key = _flush_scheduled_key()
+    now = time.time()
+    
+    requeued = client.register_script(REQUEUE_LUA)(
+        keys=[processing_key, queue_key],
+        args=[now - COMMISSION_PROCESSING_TIMEOUT_SECONDS, COMMISSION_BATCH_SIZE]
+    )
+    if requeued:
+        logger.warning(
+            f"Requeued {requeued} unacknowledged commission orders",
+            extra={'order_count': requeued}
+        )
+    
+    raw_ids = client.register_script(HANDOFF_LUA)(
+        keys=[queue_key, processing_key],
+        args=[COMMISSION_BATCH_SIZE, now]
+    )
+    
+    order_ids = list(dict.fromkeys(
+        raw.decode() if isinstance(raw, bytes) else str(raw)
+        for raw in raw_ids
+    ))
+    
+    # ⚠️ 先释放调度标记再检查剩余：之后入队的订单要么自己抢到标记，要么由这里重新调度
+    client.delete(flag_key)
+    if client.llen(queue_key) > 0 and client.set(
+        flag_key, '1', nx=True, ex=COMMISSION_BATCH_WINDOW_SECONDS * 10
+    ):
+        flush_commission_queue.apply_async(countdown=0)
+    
+    if order_ids:
+        calculate_commissions_batch.delay(order_ids)
+        logger.info(
+            f"Flushed {len(order_ids)} orders to batch commission calculation",
+            extra={'order_count': len(order_ids)}
+        )
+
+
 @shared_task(bind=True, max_retries=3)
 def release_held_commissions(self):
     """
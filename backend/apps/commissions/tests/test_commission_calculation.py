@@ -5,6 +5,8 @@ Commission Calculation Tests（P0 功能测试）
 1. 销售额门槛验证
 2. 动态层级数支持
 3. 字段命名兼容性
+4. 批量计算（calculate_commissions_batch）
+5. 合并调度队列可靠移交（flush_commission_queue）
 """
 import pytest
 from decimal import Decimal
@@ -14,7 +16,7 @@ from uuid import uuid4
 
 from apps.orders.models import Order
 from apps.commissions.models import Commission
-from apps.commissions.tasks import calculate_commission_for_order
+from apps.commissions.tasks import calculate_commission_for_order, calculate_commissions_batch
 from apps.agents.models import AgentStats
 from apps.orders_snapshots.models import OrderCommissionPolicySnapshot
 from apps.users.models import User
@@ -540,3 +542,116 @@ class TestEdgeCases:
         assert commissions.count() == 1, "应该只创建1条佣金（L1）"
         assert commissions.first().level == 1
 
+
+@pytest.mark.django_db
+class TestBatchCommissionCalculation:
+    """测试批量佣金计算"""
+    
+    def _create_paid_order(self, site, buyer, referrer):
+        order = Order.objects.create(
+            site=site,
+            buyer=buyer,
+            referrer=referrer,
+            wallet_address='0x1234567890abcdef',
+            list_price_usd=Decimal('1000.00'),
+            discount_usd=Decimal('0'),
+            final_price_usd=Decimal('1000.00'),
+            status=Order.STATUS_PAID
+        )
+        OrderCommissionPolicySnapshot.objects.create(
+            order_id=order.order_id,
+            plan_id=uuid4(),
+            plan_name='Batch Plan',
+            plan_version=1,
+            plan_mode='level',
+            diff_reward_enabled=False,
+            tiers_json=[
+                {'level': 1, 'rate_percent': '12.00', 'min_sales': '0.00', 'hold_days': 7},
+                {'level': 2, 'rate_percent': '4.00', 'min_sales': '0.00', 'hold_days': 7}
+            ]
+        )
+        return order
+    
+    def test_batch_matches_single_and_is_idempotent(self):
+        """
+        测试：批量计算结果与单订单一致，重复执行不重复创建
+        
+        场景：
+        - Agent A <- Agent B <- Buyer C / Buyer D
+        - C、D 各购买 $1000，批量计算
+        - 期望：每单 L1=B $120，L2=A $40；再次执行数量不变
+        """
+        site = Site.objects.create(
+            code='BATCH',
+            name='Batch Site',
+            domain='batch.local',
+            is_active=True
+        )
+        agent_a = User.objects.create(email='batch_a@test.com', referral_code='BATCH-A', is_active=True)
+        agent_b = User.objects.create(
+            email='batch_b@test.com', referral_code='BATCH-B', referrer=agent_a, is_active=True
+        )
+        buyer_c = User.objects.create(
+            email='batch_c@test.com', referral_code='BATCH-C', referrer=agent_b, is_active=True
+        )
+        buyer_d = User.objects.create(
+            email='batch_d@test.com', referral_code='BATCH-D', referrer=agent_b, is_active=True
+        )
+        
+        order_c = self._create_paid_order(site, buyer_c, agent_b)
+        order_d = self._create_paid_order(site, buyer_d, agent_b)
+        
+        calculate_commissions_batch([str(order_c.order_id), str(order_d.order_id)])
+        
+        for order in (order_c, order_d):
+            commissions = Commission.objects.filter(order=order)
+            assert commissions.count() == 2
+            assert commissions.get(level=1).agent == agent_b
+            assert commissions.get(level=1).commission_amount_usd == Decimal('120.00')
+            assert commissions.get(level=2).agent == agent_a
+            assert commissions.get(level=2).commission_amount_usd == Decimal('40.00')
+        
+        # 重复投递（批量 + 单订单）不重复创建
+        calculate_commissions_batch([str(order_c.order_id)])
+        calculate_commission_for_order(str(order_d.order_id))
+        assert Commission.objects.filter(order__in=[order_c, order_d]).count() == 4
+
+
+class TestCommissionQueueHandoff:
+    """测试合并调度队列的可靠移交（需要 Redis）"""
+    
+    def setup_method(self):
+        from apps.core.utils.redis import get_redis_client
+        from apps.commissions import tasks
+        
+        self.client = get_redis_client()
+        if self.client is None:
+            pytest.skip('Redis cache backend required')
+        self.tasks = tasks
+        self.client.delete(tasks._pending_queue_key(), tasks._processing_key(), tasks._flush_scheduled_key())
+    
+    def test_unacked_orders_requeued_after_timeout(self, monkeypatch):
+        """
+        测试：flush 取出的订单在确认前保留在处理中集合，超时后重新入队
+        """
+        dispatched = []
+        monkeypatch.setattr(self.tasks.calculate_commissions_batch, 'delay', dispatched.append)
+        monkeypatch.setattr(self.tasks.flush_commission_queue, 'apply_async', lambda **kwargs: None)
+        
+        order_ids = [str(uuid4()), str(uuid4())]
+        self.client.rpush(self.tasks._pending_queue_key(), *order_ids)
+        
+        self.tasks.flush_commission_queue()
+        assert dispatched == [order_ids]
+        assert self.client.llen(self.tasks._pending_queue_key()) == 0
+        assert self.client.zcard(self.tasks._processing_key()) == 2
+        
+        # 批量任务重试用尽（未确认）：超时后重新入队并再次投递
+        monkeypatch.setattr(self.tasks, 'COMMISSION_PROCESSING_TIMEOUT_SECONDS', -1)
+        self.tasks.flush_commission_queue()
+        assert dispatched[1] == order_ids
+        
+        # 确认后不再重新入队
+        self.tasks._ack_processing(order_ids)
+        self.tasks.flush_commission_queue()
+        assert len(dispatched) == 2
@@ -5,6 +5,7 @@ Solar Diff 模式测试
 1. 差额计算逻辑
 2. 差额封顶功能
 3. 等级不足跳过
+4. 站点级等级费率表（AgentLevelRate）+ 进程内缓存
 """
 import pytest
 from decimal import Decimal
@@ -13,7 +14,8 @@ from uuid import uuid4
 from apps.orders.models import Order
 from apps.commissions.models import Commission
 from apps.commissions.tasks import calculate_commission_for_order
-from apps.agents.models import AgentProfile
+from apps.agents.models import AgentProfile, AgentLevelRate
+from apps.agents.services.level_rates import get_site_level_rates
 from apps.orders_snapshots.models import OrderCommissionPolicySnapshot
 from apps.users.models import User
 from apps.sites.models import Site
@@ -344,3 +346,106 @@ class TestSolarDiffMode:
         assert commission.rate_percent == Decimal('8.00'), "差额应该被封顶到8%"
         assert commission.commission_amount_usd == Decimal('80.00'), "佣金应该是 $1000 × 8% = $80"
 
+
+@pytest.mark.django_db
+class TestSiteLevelRates:
+    """测试站点级等级费率表"""
+    
+    def test_site_rate_override_and_invalidation(
+        self, django_assert_num_queries, django_capture_on_commit_callbacks
+    ):
+        """
+        测试：站点费率覆盖默认值，缓存命中零查询，变更后失效
+        """
+        site = Site.objects.create(
+            code='RATES',
+            name='Rates Site',
+            domain='rates.local',
+            is_active=True
+        )
+        
+        with django_capture_on_commit_callbacks(execute=True):
+            rate = AgentLevelRate.objects.create(
+                site=site,
+                agent_level=AgentProfile.LEVEL_GOLD,
+                rate_percent=Decimal('18.00')
+            )
+        
+        rates = get_site_level_rates(site.site_id)
+        assert rates[AgentProfile.LEVEL_GOLD] == Decimal('18.00')
+        assert rates[AgentProfile.LEVEL_BRONZE] == Decimal('10.00')  # 默认值
+        
+        with django_assert_num_queries(0):
+            get_site_level_rates(site.site_id)
+        
+        with django_capture_on_commit_callbacks(execute=True):
+            rate.rate_percent = Decimal('22.00')
+            rate.save()
+        
+        assert get_site_level_rates(site.site_id)[AgentProfile.LEVEL_GOLD] == Decimal('22.00')
+    
+    def test_solar_diff_uses_site_rates(self, django_capture_on_commit_callbacks):
+        """
+        测试：Solar Diff 使用站点费率
+        
+        场景：
+        - 站点 Gold 费率配置为 18%
+        - 买家（Bronze 10%）购买 $1000，直推人 Gold
+        
+        期望：
+        - L1 佣金：(18% - 10%) × $1000 = $80
+        """
+        site = Site.objects.create(
+            code='RATES2',
+            name='Rates Site 2',
+            domain='rates2.local',
+            is_active=True
+        )
+        with django_capture_on_commit_callbacks(execute=True):
+            AgentLevelRate.objects.create(
+                site=site,
+                agent_level=AgentProfile.LEVEL_GOLD,
+                rate_percent=Decimal('18.00')
+            )
+        
+        agent_gold = User.objects.create(
+            email='rates_gold@test.com',
+            referral_code='RATES-GOLD',
+            is_active=True
+        )
+        buyer = User.objects.create(
+            email='rates_buyer@test.com',
+            referral_code='RATES-BUYER',
+            referrer=agent_gold,
+            is_active=True
+        )
+        AgentProfile.objects.create(user=agent_gold, site=site, agent_level=AgentProfile.LEVEL_GOLD)
+        AgentProfile.objects.create(user=buyer, site=site, agent_level=AgentProfile.LEVEL_BRONZE)
+        
+        order = Order.objects.create(
+            site=site,
+            buyer=buyer,
+            referrer=agent_gold,
+            wallet_address='0x1234567890abcdef',
+            list_price_usd=Decimal('1000.00'),
+            discount_usd=Decimal('0'),
+            final_price_usd=Decimal('1000.00'),
+            status=Order.STATUS_PAID
+        )
+        OrderCommissionPolicySnapshot.objects.create(
+            order_id=order.order_id,
+            plan_id=uuid4(),
+            plan_name='Solar Rates',
+            plan_version=1,
+            plan_mode='solar_diff',
+            diff_reward_enabled=True,
+            tiers_json=[
+                {'level': 1, 'rate_percent': '0', 'min_sales': '0', 'hold_days': 7}
+            ]
+        )
+        
+        calculate_commission_for_order(str(order.order_id))
+        
+        commission = Commission.objects.get(order=order)
+        assert commission.rate_percent == Decimal('8.00')
+        assert commission.commission_amount_usd == Decimal('80.00')
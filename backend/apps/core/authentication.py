@@ -6,7 +6,13 @@ Auth0 JWT 认证模块
 - 验证 JWKS 签名（RS256）
 - 验证 issuer、audience、expiration
 - 自动映射/创建本地用户（基于 auth0_sub）
-- JWKS 缓存（减少请求）
+
+⭐ 进程内缓存（每个请求不再 RS256 验签 + 查询用户）：
+- 已验证 token：SHA-256 摘要 → auth0_sub，LRU 有上限，按 token exp 过期
+- JWKS：解析后的公钥常驻内存，过期后后台线程刷新（期间继续使用旧公钥）；
+  未知 kid 同步刷新一次（AUTH0_JWKS_REFRESH_COOLDOWN 限频，防止伪造 kid 打满 Auth0）
+- 用户行：按 auth0_sub 缓存 AUTH_USER_CACHE_TTL 秒（本进程保存 / 删除用户时立即失效，
+  其他进程最长延迟 TTL 生效，如停用用户）
 
 环境变量：
 - AUTH0_DOMAIN: Auth0域名
@@ -14,19 +20,173 @@ Auth0 JWT 认证模块
 - AUTH0_ISSUER: 发行者URL
 """
 
+import hashlib
 import logging
-from typing import Optional, Tuple
+import threading
+import time
+from typing import Dict, Optional, Tuple
 from datetime import datetime, timedelta
 
 import jwt
 import requests
 from django.conf import settings
 from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from rest_framework import authentication, exceptions
+from apps.core.utils.local_cache import LocalLRUCache
 from apps.users.models import User
 
 logger = logging.getLogger(__name__)
 
+# 共享 JWKS 缓存 Key（多进程冷启动时避免同时请求 Auth0）
+JWKS_CACHE_KEY = "auth0_jwks"
+
+# 已验证 token 摘要 → auth0_sub（过期时间 = token exp）
+_verified_tokens = LocalLRUCache(max_entries=getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 10000))
+
+# auth0_sub → 用户字段值（User.from_db 重建，每个请求独立实例）
+_users = LocalLRUCache(
+    max_entries=getattr(settings, 'AUTH_USER_CACHE_SIZE', 10000),
+    default_ttl=getattr(settings, 'AUTH_USER_CACHE_TTL', 60)
+)
+
+
+def _fetch_jwks(use_shared_cache: bool) -> dict:
+    """
+    获取 JWKS（JSON Web Key Set）
+
+    ⚠️ 失败时抛出 requests.RequestException（调用方决定是否降级）
+    """
+    if use_shared_cache:
+        jwks = cache.get(JWKS_CACHE_KEY)
+        if jwks:
+            logger.debug("JWKS cache hit")
+            return jwks
+
+    jwks_url = f"https://{settings.AUTH0_DOMAIN}/.well-known/jwks.json"
+    response = requests.get(jwks_url, timeout=5)
+    response.raise_for_status()
+    jwks = response.json()
+
+    cache.set(JWKS_CACHE_KEY, jwks, settings.AUTH0_JWKS_CACHE_TTL)
+    logger.debug("JWKS cached")
+    return jwks
+
+
+class JWKSKeyStore:
+    """
+    进程内 JWKS 公钥（kid → 已解析公钥）
+
+    ⭐ 刷新策略：
+    - 首次：同步加载（共享缓存 → Auth0）
+    - 超过 AUTH0_JWKS_CACHE_TTL：后台线程刷新，当前请求继续使用旧公钥
+    - 未知 kid（密钥轮换）：同步刷新，间隔不小于 AUTH0_JWKS_REFRESH_COOLDOWN
+    """
+
+    def __init__(self):
+        self._keys: Optional[Dict[str, object]] = None
+        self._loaded_at = 0.0
+        self._forced_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def _load(self, use_shared_cache: bool) -> None:
+        jwks = _fetch_jwks(use_shared_cache)
+        keys = {
+            key["kid"]: jwt.algorithms.RSAAlgorithm.from_jwk(key)
+            for key in jwks.get("keys", [])
+            if key.get("kid")
+        }
+        with self._lock:
+            self._keys = keys
+            self._loaded_at = time.monotonic()
+
+    def _refresh_in_background(self) -> None:
+        try:
+            self._load(use_shared_cache=False)
+        except Exception as e:
+            logger.warning(f"AUTH.JWKS_REFRESH_FAILED: {e}")
+        finally:
+            self._refreshing = False
+
+    def _load_or_fail(self, use_shared_cache: bool) -> None:
+        try:
+            self._load(use_shared_cache)
+        except requests.RequestException as e:
+            # ⚠️ 快速失败，返回 401（不静默降级）
+            logger.error(
+                f"AUTH.JWKS_FETCH_FAILED: {e}. "
+                "请检查网络连接或 Auth0 配置。"
+            )
+            raise exceptions.AuthenticationFailed(
+                "Unable to verify token signature. Auth0 JWKS unavailable."
+            )
+
+    def get(self, kid: str):
+        """按 kid 返回公钥（不存在返回 None）"""
+        if self._keys is None:
+            self._load_or_fail(use_shared_cache=True)
+
+        now = time.monotonic()
+        if now - self._loaded_at > settings.AUTH0_JWKS_CACHE_TTL and not self._refreshing:
+            self._refreshing = True
+            threading.Thread(target=self._refresh_in_background, daemon=True).start()
+
+        key = self._keys.get(kid)
+        cooldown = getattr(settings, 'AUTH0_JWKS_REFRESH_COOLDOWN', 60)
+        if key is None and now - self._forced_at >= cooldown:
+            self._forced_at = now
+            self._load_or_fail(use_shared_cache=False)
+            key = self._keys.get(kid)
+
+        return key
+
+    def clear(self) -> None:
+        """清空（测试用）"""
+        with self._lock:
+            self._keys = None
+            self._loaded_at = 0.0
+            self._forced_at = 0.0
+
+
+_jwks_keys = JWKSKeyStore()
+
+
+def _cache_user(user: User) -> None:
+    _users.set(
+        user.auth0_sub,
+        tuple(getattr(user, field.attname) for field in User._meta.concrete_fields)
+    )
+
+
+def _get_cached_user(auth0_sub: str) -> Optional[User]:
+    """按 auth0_sub 读取激活用户（进程内缓存 → 数据库）"""
+    values = _users.get(auth0_sub)
+    if values is None:
+        user = User.objects.filter(auth0_sub=auth0_sub, is_active=True).first()
+        if user is None:
+            return None
+        _cache_user(user)
+        return user
+
+    return User.from_db(
+        'default',
+        [field.attname for field in User._meta.concrete_fields],
+        values
+    )
+
+
+@receiver([post_save, post_delete], sender=User)
+def _invalidate_cached_user(sender, instance, **kwargs):
+    """
+    用户变更后失效本进程缓存
+
+    ⚠️ 与缓存同模块注册：本模块未被导入时不存在缓存，无需失效
+    """
+    if instance.auth0_sub:
+        _users.delete(instance.auth0_sub)
+
 
 class Auth0JWTAuthentication(authentication.BaseAuthentication):
     """
@@ -55,6 +215,14 @@ class Auth0JWTAuthentication(authentication.BaseAuthentication):
         if not token:
             return None  # 无 token，允许其他认证机制
 
+        # 已验证 token：跳过验签
+        token_digest = hashlib.sha256(token.encode()).digest()
+        auth0_sub = _verified_tokens.get(token_digest)
+        if auth0_sub is not None:
+            user = _get_cached_user(auth0_sub)
+            if user is not None:
+                return (user, token)
+
         # 解码与验证
         try:
             payload = self._decode_and_verify_token(token)
@@ -67,6 +235,11 @@ class Auth0JWTAuthentication(authentication.BaseAuthentication):
         if not auth0_sub:
             raise exceptions.AuthenticationFailed("Token missing 'sub' claim")
 
+        # 记录已验证 token（到 exp 为止；无 exp 的 token 不缓存）
+        exp = payload.get("exp")
+        if isinstance(exp, (int, float)):
+            _verified_tokens.set(token_digest, auth0_sub, expires_at=exp)
+
         # 获取或创建用户
         user = self._get_or_create_user(auth0_sub, payload)
 
@@ -99,18 +272,6 @@ class Auth0JWTAuthentication(authentication.BaseAuthentication):
 
         # 解码
         try:
-            # 先解码查看 token 内容（用于调试）
-            unverified_payload = jwt.decode(token, options={"verify_signature": False})
-            token_issuer = unverified_payload.get("iss")
-            token_audience = unverified_payload.get("aud")
-
-            logger.debug(
-                f"Token issuer: {token_issuer}, Expected: {settings.AUTH0_ISSUER}"
-            )
-            logger.debug(
-                f"Token audience: {token_audience}, Expected: {settings.AUTH0_AUDIENCE}"
-            )
-
             payload = jwt.decode(
                 token,
                 signing_key,
@@ -122,11 +283,14 @@ class Auth0JWTAuthentication(authentication.BaseAuthentication):
         except jwt.ExpiredSignatureError:
             raise exceptions.AuthenticationFailed("Token has expired")
         except jwt.InvalidAudienceError as e:
+            # 仅失败时解码未验证声明（用于排查）
+            token_audience = jwt.decode(token, options={"verify_signature": False}).get("aud")
             logger.warning(
                 f"Invalid audience: token={token_audience}, expected={settings.AUTH0_AUDIENCE}"
             )
             raise exceptions.AuthenticationFailed("Invalid audience")
         except jwt.InvalidIssuerError as e:
+            token_issuer = jwt.decode(token, options={"verify_signature": False}).get("iss")
             logger.warning(
                 f"Invalid issuer: token={token_issuer}, expected={settings.AUTH0_ISSUER}"
             )
@@ -141,12 +305,11 @@ class Auth0JWTAuthentication(authentication.BaseAuthentication):
 
     def _get_signing_key(self, token: str) -> str:
         """
-        从 JWKS 端点获取签名公钥（带缓存）
+        获取签名公钥（进程内 JWKSKeyStore）
 
         流程：
         1. 解析 token header 获取 kid
-        2. 从缓存或远程获取 JWKS
-        3. 匹配 kid 返回公钥
+        2. 从进程内公钥（必要时刷新 JWKS）匹配 kid
         """
         # 解析 header（不验证）
         try:
@@ -158,57 +321,13 @@ class Auth0JWTAuthentication(authentication.BaseAuthentication):
         if not kid:
             raise exceptions.AuthenticationFailed("Token missing 'kid' in header")
 
-        # 获取 JWKS
-        jwks = self._get_jwks()
-
-        # 匹配 kid
-        for key in jwks.get("keys", []):
-            if key.get("kid") == kid:
-                # 构造 PyJWT 格式的公钥
-                return jwt.algorithms.RSAAlgorithm.from_jwk(key)
+        # 匹配 kid（进程内公钥）
+        signing_key = _jwks_keys.get(kid)
+        if signing_key is not None:
+            return signing_key
 
         raise exceptions.AuthenticationFailed(f"Public key not found for kid: {kid}")
 
-    def _get_jwks(self) -> dict:
-        """
-        获取 JWKS（JSON Web Key Set）
-
-        ⭐ 缓存策略：
-        - TTL: AUTH0_JWKS_CACHE_TTL（默认1小时）
-        - 失败时不缓存，快速返回 401
-        """
-        cache_key = "auth0_jwks"
-
-        # 尝试缓存
-        jwks = cache.get(cache_key)
-        if jwks:
-            logger.debug("JWKS cache hit")
-            return jwks
-
-        # 从 Auth0 获取
-        jwks_url = f"https://{settings.AUTH0_DOMAIN}/.well-known/jwks.json"
-
-        try:
-            response = requests.get(jwks_url, timeout=5)
-            response.raise_for_status()
-            jwks = response.json()
-        except requests.RequestException as e:
-            # ⚠️ 快速失败，返回 401（不静默降级）
-            logger.error(
-                f"AUTH.JWKS_FETCH_FAILED: {e}. "
-                f"URL={jwks_url}. "
-                "请检查网络连接或 Auth0 配置。"
-            )
-            raise exceptions.AuthenticationFailed(
-                "Unable to verify token signature. Auth0 JWKS unavailable."
-            )
-
-        # 缓存
-        cache.set(cache_key, jwks, settings.AUTH0_JWKS_CACHE_TTL)
-        logger.debug("JWKS cached")
-
-        return jwks
-
     def _get_or_create_user(self, auth0_sub: str, payload: dict) -> User:
         """
         根据 auth0_sub 获取或创建本地用户
@@ -220,12 +339,10 @@ class Auth0JWTAuthentication(authentication.BaseAuthentication):
         Returns:
             User 实例
         """
-        # 查询现有用户
-        try:
-            user = User.objects.get(auth0_sub=auth0_sub, is_active=True)
+        # 查询现有用户（进程内缓存）
+        user = _get_cached_user(auth0_sub)
+        if user is not None:
             return user
-        except User.DoesNotExist:
-            pass
 
         # 创建新用户
         email = payload.get("email")
@@ -249,6 +366,7 @@ class Auth0JWTAuthentication(authentication.BaseAuthentication):
                 is_active=True,
             )
             logger.info(f"Created new user from Auth0: {auth0_sub}")
+            _cache_user(user)
             return user
         except Exception as e:
             logger.error(f"Failed to create user: {e}", exc_info=True)
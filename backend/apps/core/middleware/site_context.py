@@ -5,11 +5,12 @@
 - 从 X-Site-Code 或 Host 解析站点
 - 在数据库会话中设置 app.current_site_id（触发 RLS）
 - 将 site 实例附加到 request.site
+- 站点解析走进程内注册表（apps/sites/services/site_registry.py），不查询数据库
 
 ⭐ RLS 集成：
-- 每个请求在 process_request 时执行：
-  SET LOCAL app.current_site_id = '<site_uuid>'
-- 所有后续 SQL 查询自动受 RLS 隔离
+- 请求处理期间安装 site_context（apps/core/utils/rls.py）：
+  每个事务的第一条语句携带 set_config('app.current_site_id', ..., true)，无额外往返
+- 所有后续 SQL 查询自动受 RLS 隔离（autocommit 与 atomic 均生效）
 
 ⚠️ 安全注意：
 - 无站点 = 400 Bad Request
@@ -18,8 +19,13 @@
 """
 import logging
 from django.http import JsonResponse
-from django.db import connection
+from apps.core.utils.rls import site_context
 from apps.sites.models import Site
+from apps.sites.services.site_registry import (
+    get_site_by_code,
+    get_site_by_domain,
+    warm_site_registry,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -36,6 +42,7 @@ class SiteContextMiddleware:
     
     def __init__(self, get_response):
         self.get_response = get_response
+        warm_site_registry()
     
     def __call__(self, request):
         """处理每个请求"""
@@ -62,11 +69,9 @@ class SiteContextMiddleware:
         # 附加到 request
         request.site = site
         
-        # 设置数据库上下文（RLS）
-        self._set_database_context(site)
-        
-        # 继续处理
-        response = self.get_response(request)
+        # 数据库上下文（RLS）：随查询发送，不单独往返
+        with site_context(site.site_id):
+            response = self.get_response(request)
         
         return response
     
@@ -84,13 +89,10 @@ class SiteContextMiddleware:
         # 方式1: X-Site-Code 头
         site_code = request.META.get('HTTP_X_SITE_CODE')
         if site_code:
-            try:
-                site = Site.objects.get(code=site_code, is_active=True)
-                logger.debug(f"Resolved site from X-Site-Code: {site_code}")
-                return site
-            except Site.DoesNotExist:
+            site = get_site_by_code(site_code)
+            if site is None:
                 logger.warning(f"Invalid X-Site-Code: {site_code}")
-                return None
+            return site
         
         # 方式2: Host 域名
         host = request.get_host()
@@ -98,33 +100,10 @@ class SiteContextMiddleware:
         if ':' in host:
             host = host.split(':')[0]
         
-        try:
-            site = Site.objects.get(domain=host, is_active=True)
-            logger.debug(f"Resolved site from host: {host}")
-            return site
-        except Site.DoesNotExist:
+        site = get_site_by_domain(host)
+        if site is None:
             logger.warning(f"No site found for host: {host}")
-            return None
-    
-    def _set_database_context(self, site: Site):
-        """
-        设置数据库会话变量（触发 RLS）
-        
-        ⭐ 关键：
-        - 使用 SET LOCAL（仅当前事务有效）
-        - 每个请求都重新设置
-        - UUID 类型转换确保 RLS 策略匹配
-        
-        SQL 示例：
-        SET LOCAL app.current_site_id = '550e8400-e29b-41d4-a716-446655440000';
-        """
-        with connection.cursor() as cursor:
-            cursor.execute(
-                "SET LOCAL app.current_site_id = %s",
-                [str(site.site_id)]
-            )
-        
-        logger.debug(f"Set database context for site: {site.code} ({site.site_id})")
+        return site
 
 
 class SiteContextMiddlewareExempt:
@@ -5,9 +5,10 @@ Celery Task Base Classes
 确保异步任务执行期间 RLS 策略生效
 """
 from celery import Task
-from django.db import connection
 import logging
 
+from apps.core.utils.rls import site_context
+
 logger = logging.getLogger(__name__)
 
 
@@ -16,7 +17,7 @@ class SiteContextTask(Task):
     支持站点上下文的 Celery 基础任务
     
     ⭐ 功能：
-    - 自动设置 app.current_site_id GUC 变量
+    - 自动设置 app.current_site_id GUC 变量（site_context：随每个事务首条语句发送）
     - 确保任务执行期间 RLS 策略生效
     - 支持从任务参数中提取 site_id
     
@@ -49,9 +50,7 @@ class SiteContextTask(Task):
         # 从任务参数中提取 site_id
         site_id = self._extract_site_id(args, kwargs)
         
-        if site_id:
-            self._set_site_context(site_id)
-        else:
+        if not site_id:
             logger.warning(
                 f"Task {self.name} executed without site_id",
                 extra={
@@ -60,12 +59,11 @@ class SiteContextTask(Task):
                     'kwargs': kwargs
                 }
             )
+            return super().__call__(*args, **kwargs)
         
-        try:
+        # ⚠️ site_id 非法时抛出（不在无隔离的情况下继续执行）
+        with site_context(site_id):
             return super().__call__(*args, **kwargs)
-        finally:
-            # 清理上下文（可选，connection pool 会自动处理）
-            pass
     
     def _extract_site_id(self, args, kwargs):
         """
@@ -96,39 +94,6 @@ class SiteContextTask(Task):
         
         return None
     
-    def _set_site_context(self, site_id):
-        """
-        设置站点上下文
-        
-        Args:
-            site_id: 站点 UUID（字符串或 UUID 对象）
-        """
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute(
-                    "SET LOCAL app.current_site_id = %s",
-                    [str(site_id)]
-                )
-            
-            logger.debug(
-                f"Task {self.name} set site context: {site_id}",
-                extra={
-                    'task_id': self.request.id,
-                    'site_id': str(site_id)
-                }
-            )
-        except Exception as e:
-            logger.error(
-                f"Failed to set site context for task {self.name}: {e}",
-                extra={
-                    'task_id': self.request.id,
-                    'site_id': str(site_id)
-                },
-                exc_info=True
-            )
-            # 不抛出异常，让任务继续执行（但可能违反 RLS）
-            # 在生产环境中，可以选择抛出异常强制失败
-    
     def on_failure(self, exc, task_id, args, kwargs, einfo):
         """
         任务失败处理
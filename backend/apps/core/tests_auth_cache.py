@@ -0,0 +1,120 @@
+"""
+JWT 认证缓存测试（apps/core/authentication.py）
+
+⭐ 测试重点：
+- 已验证 token 再次请求不验签、不查询数据库
+- token 缓存按 exp 过期；LRU 条目数有上限
+- 未知 kid 同步刷新 JWKS 受冷却时间限制
+- 用户保存后本进程缓存失效
+"""
+import json
+import time
+from unittest import mock
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.test import TestCase, override_settings
+from rest_framework.test import APIRequestFactory
+
+from apps.core import authentication
+from apps.core.authentication import Auth0JWTAuthentication
+from apps.core.utils.local_cache import LocalLRUCache
+from apps.users.models import User
+
+ISSUER = 'https://posx-test.auth0.com/'
+AUDIENCE = 'https://api.posx.test'
+
+
+@override_settings(
+    AUTH0_DOMAIN='posx-test.auth0.com',
+    AUTH0_ISSUER=ISSUER,
+    AUTH0_AUDIENCE=AUDIENCE,
+    AUTH0_JWKS_REFRESH_COOLDOWN=60,
+)
+class JWTAuthenticationCacheTestCase(TestCase):
+    """认证缓存测试"""
+
+    def setUp(self):
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(self.private_key.public_key()))
+        jwk['kid'] = 'test-kid'
+        self.jwks = {'keys': [jwk]}
+
+        authentication._verified_tokens.clear()
+        authentication._users.clear()
+        authentication._jwks_keys.clear()
+
+        self.fetch = mock.patch.object(authentication, '_fetch_jwks', return_value=self.jwks).start()
+        self.addCleanup(mock.patch.stopall)
+
+        self.user = User.objects.create(
+            auth0_sub='auth0|cached',
+            referral_code='G-CACHED01',
+            is_active=True
+        )
+        self.factory = APIRequestFactory()
+
+    def _token(self, kid='test-kid', exp_in=300):
+        return jwt.encode(
+            {'sub': 'auth0|cached', 'iss': ISSUER, 'aud': AUDIENCE, 'exp': int(time.time()) + exp_in},
+            self.private_key,
+            algorithm='RS256',
+            headers={'kid': kid}
+        )
+
+    def _authenticate(self, token):
+        request = self.factory.get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return Auth0JWTAuthentication().authenticate(request)
+
+    def test_verified_token_skips_signature_and_database(self):
+        """测试已验证 token 命中缓存：不验签、不查库"""
+        token = self._token()
+        user, _ = self._authenticate(token)
+        self.assertEqual(user.user_id, self.user.user_id)
+
+        with mock.patch.object(authentication.jwt, 'decode', side_effect=AssertionError('decoded')):
+            with self.assertNumQueries(0):
+                cached_user, _ = self._authenticate(token)
+
+        self.assertEqual(cached_user.user_id, self.user.user_id)
+        self.assertIsNot(cached_user, user)
+        self.assertEqual(self.fetch.call_count, 1)
+
+    def test_user_save_invalidates_cache(self):
+        """测试用户保存后缓存失效（下次请求重新查询）"""
+        token = self._token()
+        self._authenticate(token)
+
+        self.user.email = 'changed@posx.test'
+        self.user.save()
+
+        with self.assertNumQueries(1):
+            user, _ = self._authenticate(token)
+        self.assertEqual(user.email, 'changed@posx.test')
+
+    def test_unknown_kid_refresh_is_rate_limited(self):
+        """测试未知 kid 刷新 JWKS 受冷却时间限制"""
+        self._authenticate(self._token())
+        self.assertEqual(self.fetch.call_count, 1)
+
+        from rest_framework.exceptions import AuthenticationFailed
+
+        for _ in range(3):
+            with self.assertRaises(AuthenticationFailed):
+                self._authenticate(self._token(kid='rotated-kid'))
+
+        # 首次未知 kid 强制刷新一次，冷却期内不再请求
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_expired_token_not_served_from_cache(self):
+        """测试 token 缓存按 exp 过期"""
+        cache = LocalLRUCache(max_entries=2)
+        cache.set('expired', 'sub', expires_at=time.time() - 1)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.set('c', 3)
+
+        self.assertIsNone(cache.get('expired'))
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(len(cache), 2)
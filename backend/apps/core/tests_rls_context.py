@@ -0,0 +1,137 @@
+"""
+RLS 站点上下文测试（apps/core/utils/rls.py）
+
+⭐ 测试重点：
+- 上下文随语句发送（无额外往返），autocommit / atomic 均生效
+- 事务结束后不泄漏（兼容 pgbouncer transaction pooling）
+- 嵌套 / SAVEPOINT 回滚 / SET TRANSACTION 场景
+- 非绕过 RLS 的数据库角色下跨站数据不可见
+"""
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from apps.core.utils.rls import site_context
+from apps.sites.models import Site
+from apps.tiers.models import Tier
+
+
+def current_site_setting():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT current_setting('app.current_site_id', true)")
+        return cursor.fetchone()[0]
+
+
+class SiteContextTestCase(TransactionTestCase):
+    """站点上下文测试（TransactionTestCase：覆盖 autocommit 路径）"""
+
+    def setUp(self):
+        self.site_na = Site.objects.create(
+            code='NA',
+            name='North America',
+            domain='na.posx.test',
+            is_active=True
+        )
+        self.site_asia = Site.objects.create(
+            code='ASIA',
+            name='Asia Pacific',
+            domain='asia.posx.test',
+            is_active=True
+        )
+
+    def _create_tier(self, site, name):
+        with site_context(site.site_id):
+            return Tier.objects.create(
+                site=site,
+                name=name,
+                list_price_usd=Decimal('10.00'),
+                tokens_per_unit=Decimal('100.00'),
+                total_units=10,
+                is_active=True
+            )
+
+    def test_context_sent_with_statement(self):
+        """测试 autocommit 下每条语句携带上下文，且不增加往返"""
+        with site_context(self.site_na.site_id):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(current_site_setting(), str(self.site_na.site_id))
+            self.assertEqual(len(queries), 1)
+
+            # 下一条语句（新的隐式事务）仍然携带
+            self.assertEqual(current_site_setting(), str(self.site_na.site_id))
+
+    def test_context_does_not_leak(self):
+        """测试退出上下文后下一个事务看不到站点（连接归还连接池也安全）"""
+        with site_context(self.site_na.site_id):
+            current_site_setting()
+
+        self.assertIn(current_site_setting(), (None, ''))
+
+    def test_atomic_block_keeps_context(self):
+        """测试 atomic 块：首条语句设置后整个事务有效，SAVEPOINT 回滚不影响"""
+        with site_context(self.site_na.site_id), transaction.atomic():
+            self.assertEqual(current_site_setting(), str(self.site_na.site_id))
+
+            try:
+                with transaction.atomic():
+                    self.assertEqual(current_site_setting(), str(self.site_na.site_id))
+                    raise RuntimeError('rollback savepoint')
+            except RuntimeError:
+                pass
+
+            self.assertEqual(current_site_setting(), str(self.site_na.site_id))
+
+        self.assertIn(current_site_setting(), (None, ''))
+
+    def test_set_transaction_stays_first(self):
+        """测试 SET TRANSACTION 不被拼接（必须是事务首条语句）"""
+        with site_context(self.site_na.site_id), transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            self.assertEqual(current_site_setting(), str(self.site_na.site_id))
+
+    def test_nested_context_inner_wins(self):
+        """测试嵌套上下文：新事务以内层站点为准，退出后恢复外层"""
+        with site_context(self.site_na.site_id):
+            with site_context(self.site_asia.site_id):
+                self.assertEqual(current_site_setting(), str(self.site_asia.site_id))
+            self.assertEqual(current_site_setting(), str(self.site_na.site_id))
+
+    def test_invalid_site_id_rejected(self):
+        """测试非法 site_id 直接拒绝（不会内联到 SQL）"""
+        with self.assertRaises(ValueError):
+            with site_context("x'); DROP TABLE tiers; --"):
+                pass
+
+    def test_cross_site_rows_invisible(self):
+        """测试跨站数据不可见（需非 superuser / 非 BYPASSRLS 角色）"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT rolsuper OR rolbypassrls FROM pg_roles WHERE rolname = current_user"
+            )
+            if cursor.fetchone()[0]:
+                self.skipTest('Database role bypasses RLS')
+
+        tier_na = self._create_tier(self.site_na, 'NA Tier')
+        tier_asia = self._create_tier(self.site_asia, 'ASIA Tier')
+
+        with site_context(self.site_na.site_id):
+            self.assertEqual(
+                list(Tier.objects.values_list('tier_id', flat=True)),
+                [tier_na.tier_id]
+            )
+            self.assertFalse(Tier.objects.filter(tier_id=tier_asia.tier_id).exists())
+
+            # 跨站更新影响 0 行
+            self.assertEqual(
+                Tier.objects.filter(tier_id=tier_asia.tier_id).update(name='hijacked'),
+                0
+            )
+
+        with site_context(self.site_asia.site_id), transaction.atomic():
+            self.assertEqual(
+                list(Tier.objects.values_list('tier_id', flat=True)),
+                [tier_asia.tier_id]
+            )
@@ -0,0 +1,176 @@
+"""
+进程内版本化缓存
+
+⭐ 核心原则：
+- 数据缓存在进程内存（读取零 DB 往返）
+- 版本号（随机 token）存放在共享缓存（Django cache / Redis），所有进程可见
+- 写入方更换版本号 → 其他进程下次读取时发现版本变化并重新加载
+- 使用随机 token 而非递增计数：共享缓存淘汰后重建不会与旧版本号碰撞
+- 共享缓存不可用时退化为每次加载（不返回过期数据）
+
+使用示例：
+>>> rates_cache = VersionedLocalCache('agent_level_rates', loader=load_rates)
+>>> rates = rates_cache.get(site_id)      # 首次调用 loader，之后走内存
+>>> rates_cache.invalidate(site_id)       # 表变更时调用
+
+⭐ LocalLRUCache：纯进程内 LRU（条目数上限 + 每条目过期时间），
+  用于无需跨进程失效、可接受短暂过期的数据（如已验证的 JWT）
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# 版本号 Key 前缀
+VERSION_KEY_PREFIX = 'posx:local_cache_version'
+
+
+class VersionedLocalCache:
+    """
+    进程内缓存 + 共享版本号
+
+    Args:
+        namespace: 命名空间（用于共享版本号 Key）
+        loader: 缓存未命中时的加载函数 loader(key) -> value
+    """
+
+    def __init__(self, namespace: str, loader: Callable[[Hashable], Any]):
+        self.namespace = namespace
+        self.loader = loader
+        self._entries: Dict[Hashable, Tuple[Any, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _version_key(self, key: Hashable) -> str:
+        return f"{VERSION_KEY_PREFIX}:{self.namespace}:{key}"
+
+    def _current_version(self, key: Hashable):
+        """读取共享版本号（不存在时初始化）"""
+        version_key = self._version_key(key)
+        try:
+            version = cache.get(version_key)
+            if version is None:
+                cache.add(version_key, uuid.uuid4().hex, timeout=None)
+                version = cache.get(version_key)
+            return version
+        except Exception as e:
+            logger.warning(
+                f"Local cache version unavailable: {e}",
+                extra={'namespace': self.namespace, 'key': str(key)}
+            )
+            return None
+
+    def get(self, key: Hashable) -> Any:
+        """
+        获取缓存值
+
+        ⚠️ 版本号不可用（None）时直接调用 loader，不写入本地缓存
+        """
+        version = self._current_version(key)
+
+        if version is not None:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                return entry[1]
+
+        value = self.loader(key)
+
+        if version is not None:
+            with self._lock:
+                self._entries[key] = (version, value)
+
+        return value
+
+    def version(self, key: Hashable):
+        """
+        当前共享版本号（可用于派生缓存 Key：定义变更后派生缓存自然失效）
+
+        Returns:
+            版本号 / None（共享缓存不可用）
+        """
+        return self._current_version(key)
+
+    def invalidate(self, key: Hashable) -> None:
+        """
+        失效缓存（所有进程）
+
+        ⭐ 更换共享版本号，并清除本进程条目
+        """
+        version_key = self._version_key(key)
+        try:
+            cache.set(version_key, uuid.uuid4().hex, timeout=None)
+        except Exception as e:
+            logger.warning(
+                f"Local cache invalidation failed: {e}",
+                extra={'namespace': self.namespace, 'key': str(key)}
+            )
+
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear_local(self) -> None:
+        """清空本进程缓存（测试用）"""
+        with self._lock:
+            self._entries.clear()
+
+
+class LocalLRUCache:
+    """
+    进程内 LRU 缓存（线程安全）
+
+    Args:
+        max_entries: 条目数上限（超出时淘汰最久未使用的条目）
+        default_ttl: 默认存活秒数（set 未指定 expires_at 时使用）
+    """
+
+    def __init__(self, max_entries: int, default_ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries: "OrderedDict[Hashable, Tuple[Optional[float], Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """读取（已过期视为未命中并删除）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, expires_at: Optional[float] = None) -> None:
+        """
+        写入
+
+        Args:
+            expires_at: 过期时间（Unix 时间戳）；None 时按 default_ttl
+        """
+        if expires_at is None and self.default_ttl is not None:
+            expires_at = time.time() + self.default_ttl
+
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """清空（测试用）"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,64 @@
+"""
+Redis 工具
+
+⭐ 核心原则：
+- 复用 django_redis 连接池（CACHES['default']）
+- 非 Redis 缓存后端（LocMem / Dummy，测试环境）返回 None，由调用方降级
+- Key规范：posx:{env}:{namespace}:{...}
+
+使用示例：
+>>> client = get_redis_client()
+>>> if client is not None:
+>>>     client.rpush(redis_key('commissions', 'pending'), order_id)
+"""
+import logging
+from typing import Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Key 前缀规范
+REDIS_KEY_PREFIX = 'posx'
+
+
+def redis_key(*parts) -> str:
+    """
+    生成 Redis Key
+
+    格式：posx:{env}:{part1}:{part2}...
+
+    Examples:
+        >>> redis_key('commissions', 'pending')
+        'posx:prod:commissions:pending'
+    """
+    env = getattr(settings, 'ENV', 'dev')
+    return ':'.join([REDIS_KEY_PREFIX, env] + [str(part) for part in parts])
+
+
+def get_redis_client(alias: str = 'default') -> Optional[object]:
+    """
+    获取原生 Redis 客户端
+
+    ⚠️ 缓存后端不是 django_redis 时返回 None（调用方需降级处理）
+
+    Args:
+        alias: CACHES 别名
+
+    Returns:
+        redis.Redis 或 None
+    """
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection(alias)
+    except ImportError:
+        return None
+    except NotImplementedError:
+        # 非 django_redis 后端（LocMemCache 等）
+        return None
+    except Exception as e:
+        logger.warning(
+            f"Redis connection unavailable: {e}",
+            extra={'alias': alias}
+        )
+        return None
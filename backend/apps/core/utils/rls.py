@@ -0,0 +1,89 @@
+"""
+RLS 站点上下文（app.current_site_id）
+
+⭐ 核心原则：
+- 不再单独执行 SET LOCAL（每个请求少一次往返；事务外 SET LOCAL 本身也不生效）
+- 通过 connection.execute_wrapper 把
+  SELECT set_config('app.current_site_id', '<site_id>', true);
+  拼接到每个事务的第一条语句之前，与该语句同一次往返发送
+- 事务级设置（is_local=true）：
+  - autocommit：每条语句是独立隐式事务 → 每条语句都携带上下文
+  - atomic 块：仅事务第一条语句携带（包括 Django 的 SAVEPOINT 语句），之后整个事务有效
+  - 事务结束自动失效，不会泄漏到连接池中的下一个请求（兼容 pgbouncer transaction pooling）
+
+⚠️ 关键：
+- 依据驱动报告的事务状态判断是否为新事务（IDLE = 下一条语句开启新事务）
+- 进入上下文前已开启的事务（如测试用例事务）：首条语句携带一次
+- SET TRANSACTION / BEGIN 必须是事务首条语句，不拼接（下一条语句再携带）
+- site_id 规范化为 UUID 后内联到 SQL（不改变原语句参数，兼容 params=None / 命名参数）
+- 嵌套上下文：新事务以内层站点为准；不要在已开启的事务中切换站点
+
+使用示例：
+>>> with site_context(site.site_id):
+...     Order.objects.filter(...)   # 受 RLS 隔离
+"""
+import uuid
+from contextlib import contextmanager
+from typing import Union
+
+from django.db import connections
+
+# psycopg2 / psycopg 事务状态：IDLE（不在事务中）/ INERROR（事务已失败）
+PG_TRANSACTION_IDLE = 0
+PG_TRANSACTION_INERROR = 3
+
+SET_CONTEXT_SQL = "SELECT set_config('app.current_site_id', '{site_id}', true); "
+_SET_CONTEXT_HEAD = SET_CONTEXT_SQL.split('{', 1)[0]
+
+# 必须作为事务首条语句执行的命令
+_TRANSACTION_CONTROL_PREFIXES = ('SET TRANSACTION', 'BEGIN', 'START TRANSACTION')
+
+
+class SiteContextWrapper:
+    """
+    execute_wrapper：新事务的第一条语句前拼接 set_config
+
+    Args:
+        site_id: 站点ID
+    """
+
+    def __init__(self, site_id: Union[uuid.UUID, str]):
+        self.site_id = str(uuid.UUID(str(site_id)))
+        self.prefix = SET_CONTEXT_SQL.format(site_id=self.site_id)
+        self._pinned = False
+
+    def _needs_context(self, raw_connection) -> bool:
+        status = raw_connection.info.transaction_status
+        if status == PG_TRANSACTION_IDLE:
+            return True
+        if status == PG_TRANSACTION_INERROR:
+            return False
+        return not self._pinned
+
+    def __call__(self, execute, sql, params, many, context):
+        raw_connection = context['connection'].connection
+
+        if (
+            raw_connection is not None
+            and isinstance(sql, str)
+            and self._needs_context(raw_connection)
+            and not sql.lstrip().upper().startswith(_TRANSACTION_CONTROL_PREFIXES)
+        ):
+            self._pinned = True
+            if sql.startswith(_SET_CONTEXT_HEAD):
+                # 外层上下文已拼接：内层覆盖
+                sql = sql[len(self.prefix):]
+            sql = self.prefix + sql
+
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def site_context(site_id: Union[uuid.UUID, str], using: str = 'default'):
+    """
+    在上下文内的所有查询上设置 RLS 站点（无额外往返）
+
+    ⚠️ 仅覆盖 using 指定的数据库连接
+    """
+    with connections[using].execute_wrapper(SiteContextWrapper(site_id)):
+        yield
@@ -165,15 +165,27 @@ class PromoCodeAdmin(admin.ModelAdmin):
             )
     valid_status.short_description = 'Validity'
     
+    def _invalidate_selected(self, queryset):
+        """批量 update 不触发信号：提交后逐个失效定义缓存"""
+        from django.db import transaction
+        from .services.promo_service import invalidate_promo_code
+        
+        promos = list(queryset.values_list('site_id', 'code'))
+        transaction.on_commit(
+            lambda: [invalidate_promo_code(site_id, code) for site_id, code in promos]
+        )
+    
     def deactivate_promo_codes(self, request, queryset):
         """批量停用促销码"""
         count = queryset.update(is_active=False)
+        self._invalidate_selected(queryset)
         self.message_user(request, f"成功停用 {count} 个促销码")
     deactivate_promo_codes.short_description = "停用选中的促销码"
     
     def activate_promo_codes(self, request, queryset):
         """批量激活促销码"""
         count = queryset.update(is_active=True)
+        self._invalidate_selected(queryset)
         self.message_user(request, f"成功激活 {count} 个促销码")
     activate_promo_codes.short_description = "激活选中的促销码"
 
@@ -5,6 +5,10 @@ class OrdersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.orders'
     verbose_name = 'Orders'
+    
+    def ready(self):
+        """Import signals when app is ready"""
+        import apps.orders.signals  # noqa: F401
 
 
 
@@ -0,0 +1,26 @@
+"""
+超时订单扫描索引
+
+⭐ 部分索引 (expires_at) WHERE status = 'pending'：
+- 批量取消按 expires_at 顺序扫描 pending 订单
+- 已支付 / 已取消订单不进入索引
+"""
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_enable_promo_codes_rls'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(
+                condition=models.Q(status='pending'),
+                fields=['expires_at'],
+                name='ord_pending_expires_idx'
+            ),
+        ),
+    ]
@@ -0,0 +1,37 @@
+"""
+订单支付创建发件箱
+
+⭐ 两阶段下单：
+- 订单 + 发件箱记录同一事务提交
+- 事务提交后创建 Stripe PaymentIntent（事务时长不再依赖 Stripe 延迟）
+- 失败 / 中断由 recover_payment_outbox 任务重试或补偿取消
+"""
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_order_pending_expires_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderPaymentOutbox',
+            fields=[
+                ('order', models.OneToOneField(help_text='订单', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='payment_outbox', serialize=False, to='orders.order')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('created', 'Created'), ('failed', 'Failed')], default='pending', help_text='PaymentIntent 创建状态', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0, help_text='已尝试次数')),
+                ('last_error', models.TextField(blank=True, default='', help_text='最近一次失败原因')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Order Payment Outbox',
+                'verbose_name_plural': 'Order Payment Outbox',
+                'db_table': 'order_payment_outbox',
+                'indexes': [models.Index(condition=models.Q(('status', 'pending')), fields=['updated_at'], name='payment_outbox_pending_idx')],
+            },
+        ),
+    ]
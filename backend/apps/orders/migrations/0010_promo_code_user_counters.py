@@ -0,0 +1,54 @@
+"""
+促销码每用户原子计数器
+
+⭐ 新增 promo_code_user_counters：
+- (promo_code, user) 唯一，下单时 INSERT ... ON CONFLICT 条件自增
+- 按现有 promo_code_usages 回填
+"""
+import uuid
+from django.db import migrations, models
+import django.core.validators
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('orders', '0009_order_payment_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PromoCodeUserCounter',
+            fields=[
+                ('counter_id', models.UUIDField(default=uuid.uuid4, editable=False, help_text='计数器ID', primary_key=True, serialize=False)),
+                ('uses', models.IntegerField(default=0, help_text='已使用次数', validators=[django.core.validators.MinValueValidator(0)])),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('promo_code', models.ForeignKey(help_text='促销码', on_delete=django.db.models.deletion.CASCADE, related_name='user_counters', to='orders.promocode')),
+                ('user', models.ForeignKey(help_text='用户', on_delete=django.db.models.deletion.CASCADE, related_name='promo_counters', to='users.user')),
+            ],
+            options={
+                'verbose_name': 'Promo Code User Counter',
+                'verbose_name_plural': 'Promo Code User Counters',
+                'db_table': 'promo_code_user_counters',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='promocodeusercounter',
+            constraint=models.UniqueConstraint(fields=('promo_code', 'user'), name='uq_promo_code_user_counter'),
+        ),
+        
+        # 回填（⚠️ promo_code_usages 启用了 FORCE RLS：须以可绕过 RLS 的角色执行迁移，
+        #   否则回填为空，由 reconcile_promo_counters 任务补齐）
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO promo_code_user_counters (counter_id, promo_code_id, user_id, uses, updated_at)
+                SELECT gen_random_uuid(), promo_code_id, user_id, COUNT(*), NOW()
+                FROM promo_code_usages
+                GROUP BY promo_code_id, user_id
+                ON CONFLICT (promo_code_id, user_id) DO NOTHING;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
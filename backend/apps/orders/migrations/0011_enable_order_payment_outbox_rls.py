@@ -0,0 +1,57 @@
+# Generated manually for Payment Outbox RLS
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    为支付发件箱表启用 RLS (Row Level Security)
+    
+    ⚠️ 重要：
+    - 没有直接的 site_id，通过 order 关联站点隔离（与 promo_code_usages 一致）
+    - Admin 角色可以查看所有站点数据（使用 admin 连接）
+    - recover_payment_outbox（跨站点）须以可绕过 RLS 的连接执行（与 orders 相同）
+    """
+
+    dependencies = [
+        ('orders', '0010_promo_code_user_counters'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                -- ========== OrderPaymentOutbox 表 RLS ==========
+                
+                -- 1. 启用 RLS（强制执行）
+                ALTER TABLE order_payment_outbox ENABLE ROW LEVEL SECURITY;
+                ALTER TABLE order_payment_outbox FORCE ROW LEVEL SECURITY;
+                
+                -- 2. 创建策略：通过 order 关联站点隔离
+                CREATE POLICY rls_order_payment_outbox_site_isolation ON order_payment_outbox
+                    FOR ALL
+                    USING (
+                        order_id IN (
+                            SELECT order_id FROM orders
+                            WHERE site_id = current_setting('app.current_site_id', true)::uuid
+                        )
+                    )
+                    WITH CHECK (
+                        order_id IN (
+                            SELECT order_id FROM orders
+                            WHERE site_id = current_setting('app.current_site_id', true)::uuid
+                        )
+                    );
+                
+                -- 3. 创建策略：Admin 只读
+                CREATE POLICY rls_order_payment_outbox_admin_read ON order_payment_outbox
+                    FOR SELECT
+                    USING (current_user = 'posx_admin');
+            """,
+            reverse_sql="""
+                -- 回滚：禁用 RLS 并删除策略
+                DROP POLICY IF EXISTS rls_order_payment_outbox_admin_read ON order_payment_outbox;
+                DROP POLICY IF EXISTS rls_order_payment_outbox_site_isolation ON order_payment_outbox;
+                ALTER TABLE order_payment_outbox DISABLE ROW LEVEL SECURITY;
+            """
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated manually for Promo Code User Counter RLS
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    为促销码每用户计数器表启用 RLS (Row Level Security)
+    
+    ⚠️ 重要：
+    - 没有直接的 site_id，通过 promo_code 关联站点隔离
+    - Admin 角色可以查看所有站点数据（使用 admin 连接）
+    - reconcile_promo_counters（跨站点）须以可绕过 RLS 的连接执行（与 promo_code_usages 相同）
+    """
+
+    dependencies = [
+        ('orders', '0011_enable_order_payment_outbox_rls'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                -- ========== PromoCodeUserCounter 表 RLS ==========
+                
+                -- 1. 启用 RLS（强制执行）
+                ALTER TABLE promo_code_user_counters ENABLE ROW LEVEL SECURITY;
+                ALTER TABLE promo_code_user_counters FORCE ROW LEVEL SECURITY;
+                
+                -- 2. 创建策略：通过 promo_code 关联站点隔离
+                CREATE POLICY rls_promo_code_user_counters_site_isolation ON promo_code_user_counters
+                    FOR ALL
+                    USING (
+                        promo_code_id IN (
+                            SELECT promo_id FROM promo_codes
+                            WHERE site_id = current_setting('app.current_site_id', true)::uuid
+                        )
+                    )
+                    WITH CHECK (
+                        promo_code_id IN (
+                            SELECT promo_id FROM promo_codes
+                            WHERE site_id = current_setting('app.current_site_id', true)::uuid
+                        )
+                    );
+                
+                -- 3. 创建策略：Admin 只读
+                CREATE POLICY rls_promo_code_user_counters_admin_read ON promo_code_user_counters
+                    FOR SELECT
+                    USING (current_user = 'posx_admin');
+            """,
+            reverse_sql="""
+                -- 回滚：禁用 RLS 并删除策略
+                DROP POLICY IF EXISTS rls_promo_code_user_counters_admin_read ON promo_code_user_counters;
+                DROP POLICY IF EXISTS rls_promo_code_user_counters_site_isolation ON promo_code_user_counters;
+                ALTER TABLE promo_code_user_counters DISABLE ROW LEVEL SECURITY;
+            """
+        ),
+    ]
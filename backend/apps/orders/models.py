@@ -157,6 +157,11 @@ class Order(models.Model):
             models.Index(fields=['referrer']),
             models.Index(fields=['status', 'created_at']),
             models.Index(fields=['disputed']),
+            models.Index(
+                fields=['expires_at'],
+                condition=models.Q(status='pending'),
+                name='ord_pending_expires_idx'
+            ),
         ]
         verbose_name = 'Order'
         verbose_name_plural = 'Orders'
@@ -481,3 +486,112 @@ class PromoCodeUsage(models.Model):
 
 
 
+
+
+class PromoCodeUserCounter(models.Model):
+    """
+    促销码每用户使用计数（原子计数器）
+    
+    ⭐ 下单时单条 INSERT ... ON CONFLICT DO UPDATE ... WHERE uses < uses_per_user 原子占用，
+      替代 PromoCodeUsage COUNT(*) 校验（并发下不会超出每用户上限）
+    ⭐ PromoCodeUsage 仍为审计记录；漂移由 reconcile_promo_counters 按使用记录修复
+    """
+    counter_id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False,
+        help_text="计数器ID"
+    )
+    promo_code = models.ForeignKey(
+        PromoCode,
+        on_delete=models.CASCADE,
+        related_name='user_counters',
+        help_text="促销码"
+    )
+    user = models.ForeignKey(
+        'users.User',
+        on_delete=models.CASCADE,
+        related_name='promo_counters',
+        help_text="用户"
+    )
+    uses = models.IntegerField(
+        default=0,
+        validators=[MinValueValidator(0)],
+        help_text="已使用次数"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'promo_code_user_counters'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['promo_code', 'user'],
+                name='uq_promo_code_user_counter'
+            ),
+        ]
+        verbose_name = 'Promo Code User Counter'
+        verbose_name_plural = 'Promo Code User Counters'
+    
+    def __str__(self):
+        return f"{self.promo_code_id}/{self.user_id}: {self.uses}"
+
+
+class OrderPaymentOutbox(models.Model):
+    """
+    订单支付创建发件箱（两阶段下单）
+    
+    ⭐ 与订单同一事务写入（pending），事务提交后再调用 Stripe：
+    - 成功：写入 stripe_payment_intent_id，标记 created
+    - 失败 / 进程中断：recover_payment_outbox 任务重试
+      （Stripe 幂等键 order-{order_id}，重试不会重复创建 PaymentIntent）
+    - 超过最大尝试次数：取消订单并回补库存，标记 failed
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_CREATED = 'created'
+    STATUS_FAILED = 'failed'
+    
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_CREATED, 'Created'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    
+    order = models.OneToOneField(
+        Order,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='payment_outbox',
+        help_text="订单"
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        help_text="PaymentIntent 创建状态"
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        help_text="已尝试次数"
+    )
+    last_error = models.TextField(
+        blank=True,
+        default='',
+        help_text="最近一次失败原因"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'order_payment_outbox'
+        indexes = [
+            models.Index(
+                fields=['updated_at'],
+                condition=models.Q(status='pending'),
+                name='payment_outbox_pending_idx'
+            ),
+        ]
+        verbose_name = 'Order Payment Outbox'
+        verbose_name_plural = 'Order Payment Outbox'
+    
+    def __str__(self):
+        return f"Order {self.order_id} payment ({self.status})"
@@ -0,0 +1,246 @@
+"""
+超时订单批量取消服务
+
+⭐ 精确到期（到期队列）：
+- 订单提交后写入 Redis 有序集合（score = expires_at）
+- expire_due_orders 每秒弹出已到期订单ID并按ID取消（Lua 原子弹出，多 worker 不重复）
+- expire_pending_orders 按时间扫描作为兜底（Redis 不可用 / 队列丢失 / SKIP LOCKED 跳过）
+
+⭐ 每批固定语句数（替代逐单事务 + 逐单 release_inventory）：
+1. 单条 UPDATE ... RETURNING：取消一页超时订单（FOR UPDATE SKIP LOCKED 选取）
+   并联表返回订单明细的 tier_id / quantity
+2. 按档位汇总回补数量
+3. 单条 UPDATE ... FROM unnest：每个档位一次回补
+   （分片 / 前置层档位交给 release_inventory 各自的回补路径）
+
+⚠️ 关键：
+- SKIP LOCKED：并发 beat 运行 / 用户同时取消的订单互不阻塞、不重复处理
+- 取消与回补在同一事务内提交
+- 档位按 tier_id 排序更新，避免并发批次死锁
+"""
+import logging
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List
+
+from django.db import connection, transaction
+
+from apps.core.utils.redis import get_redis_client, redis_key
+
+logger = logging.getLogger(__name__)
+
+
+CANCEL_ORDERS_SQL = """
+    WITH expired AS (
+        SELECT order_id
+        FROM orders
+        WHERE status = 'pending'
+          AND {filter}
+        ORDER BY expires_at
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    ),
+    cancelled AS (
+        UPDATE orders o
+        SET status = 'cancelled',
+            updated_at = NOW()
+        FROM expired
+        WHERE o.order_id = expired.order_id
+        RETURNING o.order_id
+    )
+    SELECT c.order_id, i.tier_id, i.quantity
+    FROM cancelled c
+    LEFT JOIN order_items i ON i.order_id = c.order_id
+"""
+
+CANCEL_EXPIRED_BATCH_SQL = CANCEL_ORDERS_SQL.format(filter='expires_at <= %s')
+CANCEL_EXPIRED_BY_ID_SQL = CANCEL_ORDERS_SQL.format(
+    filter='expires_at <= %s AND order_id = ANY(%s::uuid[])'
+)
+CANCEL_BY_ID_SQL = CANCEL_ORDERS_SQL.format(filter='order_id = ANY(%s::uuid[])')
+
+POP_DUE_LUA = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #ids > 0 then
+    redis.call('ZREM', KEYS[1], unpack(ids))
+end
+return ids
+"""
+
+
+def _expiry_queue_key() -> str:
+    return redis_key('orders', 'expiry_queue')
+
+
+RELEASE_TIERS_SQL = """
+    UPDATE tiers t
+    SET available_units = t.available_units + r.quantity,
+        version = t.version + 1,
+        updated_at = NOW()
+    FROM (
+        SELECT *
+        FROM unnest(%s::uuid[], %s::int[]) AS v(tier_id, quantity)
+        ORDER BY tier_id
+    ) r
+    WHERE t.tier_id = r.tier_id
+      AND t.inventory_shards = 0
+    RETURNING t.tier_id
+"""
+
+
+def _release_tiers(released: Counter) -> None:
+    """按档位回补（普通档位单条 UPDATE，其余走 release_inventory）"""
+    from apps.tiers.services.inventory import release_inventory
+    from apps.tiers.services.reservations import get_front_available
+
+    front_tiers = {tier_id for tier_id in released if get_front_available(tier_id) is not None}
+    bulk = sorted(
+        (str(tier_id), quantity) for tier_id, quantity in released.items()
+        if tier_id not in front_tiers
+    )
+
+    updated = set()
+    if bulk:
+        with connection.cursor() as cursor:
+            cursor.execute(RELEASE_TIERS_SQL, [
+                [tier_id for tier_id, _ in bulk],
+                [quantity for _, quantity in bulk],
+            ])
+            updated = {str(tier_id) for (tier_id,) in cursor.fetchall()}
+
+    for tier_id, quantity in released.items():
+        if str(tier_id) in updated:
+            continue
+        success, error_code = release_inventory(tier_id, quantity)
+        if not success:
+            raise RuntimeError(f"Failed to release inventory for tier {tier_id}: {error_code}")
+
+
+def _cancel_and_release(sql: str, params: list) -> Dict[str, int]:
+    """取消订单并按档位回补（单个事务）"""
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+        cancelled = {order_id for order_id, _, _ in rows}
+        released = Counter()
+        for _, tier_id, quantity in rows:
+            if tier_id is not None:
+                released[tier_id] += quantity
+
+        _release_tiers(released)
+
+    if cancelled:
+        logger.info(
+            f"Expired {len(cancelled)} pending orders, released inventory on {len(released)} tiers",
+            extra={
+                'cancelled': len(cancelled),
+                'released': {str(tier_id): quantity for tier_id, quantity in released.items()}
+            }
+        )
+
+    return {'cancelled': len(cancelled), 'tiers': len(released)}
+
+
+def expire_order_batch(cutoff: datetime, batch_size: int = 500) -> Dict[str, int]:
+    """
+    取消一批超时订单并回补库存（按时间扫描，兜底）
+
+    Returns:
+        {'cancelled': n, 'tiers': m}
+    """
+    return _cancel_and_release(CANCEL_EXPIRED_BATCH_SQL, [cutoff, batch_size])
+
+
+def expire_orders(order_ids: List[uuid.UUID], cutoff: datetime) -> Dict[str, int]:
+    """
+    按ID取消已到期订单（已支付 / 已取消 / 未到期的订单跳过）
+
+    Returns:
+        {'cancelled': n, 'tiers': m}
+    """
+    if not order_ids:
+        return {'cancelled': 0, 'tiers': 0}
+
+    return _cancel_and_release(
+        CANCEL_EXPIRED_BY_ID_SQL,
+        [cutoff, [str(order_id) for order_id in order_ids], len(order_ids)]
+    )
+
+
+def cancel_pending_orders(order_ids: List[uuid.UUID]) -> Dict[str, int]:
+    """
+    按ID取消 pending 订单并回补库存（不检查到期时间，用于下单补偿）
+
+    Returns:
+        {'cancelled': n, 'tiers': m}
+    """
+    if not order_ids:
+        return {'cancelled': 0, 'tiers': 0}
+
+    return _cancel_and_release(
+        CANCEL_BY_ID_SQL,
+        [[str(order_id) for order_id in order_ids], len(order_ids)]
+    )
+
+
+def cancel_unreserved_orders(order_ids: List[uuid.UUID]) -> int:
+    """
+    按ID取消 pending 订单，不回补库存（库存从未扣减：前置层预留未能确认）
+
+    Returns:
+        int: 取消的订单数
+    """
+    if not order_ids:
+        return 0
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(CANCEL_BY_ID_SQL, [[str(order_id) for order_id in order_ids], len(order_ids)])
+        return len({order_id for order_id, _, _ in cursor.fetchall()})
+
+
+def schedule_order_expiry(order_id: uuid.UUID, expires_at: datetime) -> bool:
+    """
+    订单加入到期队列（订单事务提交后调用）
+
+    Returns:
+        bool: False=Redis 不可用（由兜底扫描处理）
+    """
+    client = get_redis_client()
+    if client is None:
+        return False
+
+    try:
+        client.zadd(_expiry_queue_key(), {str(order_id): expires_at.timestamp()})
+        return True
+    except Exception as e:
+        logger.warning(
+            f"Failed to schedule order expiry: {e}",
+            extra={'order_id': str(order_id)}
+        )
+        return False
+
+
+def expire_due_orders(now: datetime, limit: int = 500) -> Dict[str, int]:
+    """
+    弹出到期队列中已到期的订单并取消
+
+    ⚠️ 弹出后取消失败的订单不回队列，由兜底扫描处理
+
+    Returns:
+        {'due': n, 'cancelled': m, 'tiers': k}
+    """
+    client = get_redis_client()
+    if client is None:
+        return {'due': 0, 'cancelled': 0, 'tiers': 0}
+
+    due = client.eval(POP_DUE_LUA, 1, _expiry_queue_key(), now.timestamp(), limit)
+    order_ids = [
+        order_id.decode() if isinstance(order_id, bytes) else order_id
+        for order_id in due
+    ]
+
+    result = expire_orders(order_ids, now)
+    return {'due': len(order_ids), **result}
@@ -0,0 +1,165 @@
+"""
+下单幂等结果缓存
+
+⭐ 键：site_id + idempotency_key
+- 结果缓存：完整创建结果（Order + client_secret + buyer），TTL 内重放一次缓存命中返回，
+  不查询数据库、不调用 Stripe
+- 进行中锁（SET NX EX + 随机令牌）：并发重试等待首个请求的结果，而不是并发创建
+  释放时比较令牌再删除（Lua 原子执行）：锁过期后被其他请求取得时不会误删
+
+⚠️ 关键：
+- 缓存含 client_secret：仅返回给同一买家，其他买家复用同一键视为冲突
+- 首个请求失败（锁释放且无结果）：等待方接手重新执行
+- 缓存过期后的重放由 create_order 的数据库幂等检查兜底（client_secret 为空）
+"""
+import logging
+import time
+import uuid
+from typing import TYPE_CHECKING, Callable, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.core.utils.redis import get_redis_client, redis_key
+
+if TYPE_CHECKING:
+    from apps.orders.models import Order
+
+logger = logging.getLogger(__name__)
+
+# 进行中锁过期时间（秒），须大于一次下单（含 Stripe 调用）的最长耗时
+IDEMPOTENCY_LOCK_TTL = 30
+# 等待方轮询间隔（秒）
+IDEMPOTENCY_POLL_INTERVAL = 0.05
+
+# 令牌一致才删除锁
+RELEASE_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def _result_key(site_id, idempotency_key: str) -> str:
+    return f'orders:idempotency:{site_id}:{idempotency_key}'
+
+
+def _lock_key(site_id, idempotency_key: str) -> str:
+    return redis_key('orders', 'idempotency', site_id, idempotency_key, 'lock')
+
+
+def _acquire_lock(lock_key: str, token: str) -> bool:
+    """获取进行中锁（非 Redis 缓存后端时回退 cache.add）"""
+    client = get_redis_client()
+    if client is None:
+        return cache.add(lock_key, token, timeout=IDEMPOTENCY_LOCK_TTL)
+    return bool(client.set(lock_key, token, nx=True, ex=IDEMPOTENCY_LOCK_TTL))
+
+
+def _release_lock(lock_key: str, token: str) -> None:
+    """
+    释放进行中锁（仅当仍由本请求持有）
+
+    ⚠️ 非 Redis 缓存后端（开发 / 测试）比较与删除不是原子操作
+    """
+    client = get_redis_client()
+    if client is None:
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+        return
+    client.register_script(RELEASE_LOCK_LUA)(keys=[lock_key], args=[token])
+
+
+def _buyer_id(user) -> Optional[str]:
+    return str(user.user_id) if user is not None else None
+
+
+def get_cached_create_result(site_id: uuid.UUID, idempotency_key: str, user) -> Optional[Tuple['Order', str]]:
+    """
+    读取缓存的创建结果
+
+    Returns:
+        (order, client_secret) / None（未命中）
+
+    Raises:
+        IdempotencyConflictError: 幂等键已被其他买家使用
+    """
+    from apps.orders.services.order_service import IdempotencyConflictError
+
+    cached = cache.get(_result_key(site_id, idempotency_key))
+    if cached is None:
+        return None
+
+    if cached['buyer_id'] != _buyer_id(user):
+        logger.warning(
+            "Idempotency key reused by a different buyer",
+            extra={'site_id': str(site_id), 'idempotency_key': idempotency_key}
+        )
+        raise IdempotencyConflictError("Idempotency key already used by another request")
+
+    return cached['order'], cached['client_secret']
+
+
+def cache_create_result(site_id: uuid.UUID, idempotency_key: str, user, order, client_secret: str) -> None:
+    """缓存创建结果（TTL = ORDER_IDEMPOTENCY_TTL）"""
+    cache.set(
+        _result_key(site_id, idempotency_key),
+        {'order': order, 'client_secret': client_secret, 'buyer_id': _buyer_id(user)},
+        timeout=getattr(settings, 'ORDER_IDEMPOTENCY_TTL', 900)
+    )
+
+
+def run_idempotent_create(
+    site_id: uuid.UUID,
+    idempotency_key: str,
+    user,
+    create: Callable[[], Tuple['Order', str]]
+) -> Tuple['Order', str]:
+    """
+    幂等执行下单
+
+    流程：缓存命中直接返回 → 获取进行中锁 → 执行 create 并缓存结果
+    锁被占用时轮询等待结果（最长 ORDER_IDEMPOTENCY_WAIT_SECONDS）
+
+    Raises:
+        IdempotencyConflictError: 等待超时 / 幂等键被其他买家使用
+    """
+    from apps.orders.services.order_service import IdempotencyConflictError
+
+    lock_key = _lock_key(site_id, idempotency_key)
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + getattr(settings, 'ORDER_IDEMPOTENCY_WAIT_SECONDS', 10)
+
+    while True:
+        cached = get_cached_create_result(site_id, idempotency_key, user)
+        if cached is not None:
+            logger.info(
+                "Idempotent request served from cache",
+                extra={'order_id': str(cached[0].order_id), 'idempotency_key': idempotency_key}
+            )
+            return cached
+
+        if _acquire_lock(lock_key, token):
+            break
+
+        if time.monotonic() >= deadline:
+            logger.warning(
+                "Timed out waiting for in-flight order request",
+                extra={'site_id': str(site_id), 'idempotency_key': idempotency_key}
+            )
+            raise IdempotencyConflictError("Order request with this idempotency key is still in progress")
+
+        time.sleep(IDEMPOTENCY_POLL_INTERVAL)
+
+    try:
+        # 持锁后再查一次：等待期间首个请求可能刚写入结果
+        cached = get_cached_create_result(site_id, idempotency_key, user)
+        if cached is not None:
+            return cached
+
+        order, client_secret = create()
+        cache_create_result(site_id, idempotency_key, user, order, client_secret)
+        return order, client_secret
+    finally:
+        _release_lock(lock_key, token)
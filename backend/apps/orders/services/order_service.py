@@ -3,10 +3,10 @@
 
 ⭐ 核心功能：
 1. 幂等性检查（site_id + idempotency_key）
-2. 库存乐观锁
+2. 库存扣减（条件 UPDATE ... RETURNING；前置层已装载档位：事务前 Redis 预留，售罄快速失败）
 3. 创建Order + OrderItem
 4. 创建OrderCommissionPolicySnapshot（Phase B）
-5. 创建Stripe PaymentIntent
+5. 创建Stripe PaymentIntent（事务提交后，见 payment_outbox.py）
 
 使用示例：
 >>> order, client_secret = create_order(
@@ -46,6 +46,11 @@ class InventoryError(OrderServiceError):
     pass
 
 
+class IdempotencyConflictError(OrderServiceError):
+    """幂等冲突（同一幂等键的请求仍在处理 / 被其他买家使用）"""
+    pass
+
+
 def create_order(
     site_id: uuid.UUID,
     tier_id: uuid.UUID,
@@ -59,6 +64,10 @@ def create_order(
     """
     创建订单（幂等）
     
+    ⭐ 提供 idempotency_key 时：
+    - 结果缓存命中直接返回（含 client_secret，无数据库 / Stripe 调用）
+    - 并发重试等待首个请求结果（services/idempotency.py）
+    
     ⚠️ 事务内操作：
     1. 幂等性检查
     2. 校验tier和数量
@@ -69,7 +78,7 @@ def create_order(
     7. 创建Order + OrderItem
     8. 记录 Promo Code 使用
     9. 创建OrderCommissionPolicySnapshot
-    10. 创建Stripe PaymentIntent
+    10. 写入支付发件箱；事务提交后创建Stripe PaymentIntent
     
     Args:
         site_id: 站点ID
@@ -99,20 +108,54 @@ def create_order(
         ...     idempotency_key='test-key-123'
         ... )
     """
-    from apps.orders.models import Order, OrderItem, PromoCode, PromoCodeUsage
+    from .idempotency import run_idempotent_create
+    
+    def create():
+        return _create_order(
+            site_id=site_id,
+            tier_id=tier_id,
+            quantity=quantity,
+            wallet_address=wallet_address,
+            referral_code=referral_code,
+            promo_code=promo_code,
+            idempotency_key=idempotency_key,
+            user=user
+        )
+    
+    if not idempotency_key:
+        return create()
+    
+    return run_idempotent_create(site_id, idempotency_key, user, create)
+
+
+def _create_order(
+    site_id: uuid.UUID,
+    tier_id: uuid.UUID,
+    quantity: int,
+    wallet_address: str,
+    referral_code: Optional[str] = None,
+    promo_code: Optional[str] = None,
+    idempotency_key: Optional[str] = None,
+    user = None
+) -> Tuple['Order', str]:
+    """创建订单（create_order 的实现，幂等缓存 / 进行中锁由调用方处理）"""
+    from apps.orders.models import Order, OrderItem, OrderPaymentOutbox, PromoCodeUsage
     from apps.tiers.models import Tier
     from apps.users.models import User
-    from apps.tiers.services.inventory import lock_inventory
+    from apps.tiers.services.inventory import reserve_tier_units
+    from apps.tiers.services.reservations import (
+        RESERVE_SOLD_OUT, confirm_reservation, reservation_guard, reserve_inventory
+    )
     from apps.orders_snapshots.services import OrderSnapshotService
-    from .stripe_service import create_payment_intent, create_mock_payment_intent
-    from .promo_service import validate_promo_code
+    from .payment_outbox import create_order_payment, fail_unreserved_order
+    from .promo_service import claim_promo_usage, validate_promo_code
+    from .expiry import schedule_order_expiry
     from apps.users.utils.wallet import normalize_address
-    from django.db.models import F
     
-    # 1. 幂等性检查
+    # 1. 幂等性检查（结果缓存过期后的兜底）
     if idempotency_key:
         existing_order = Order.objects.filter(
-            site__site_id=site_id,
+            site_id=site_id,
             idempotency_key=idempotency_key
         ).first()
         
@@ -124,6 +167,18 @@ def create_order(
                     'idempotency_key': idempotency_key
                 }
             )
+            outbox_status = OrderPaymentOutbox.objects.filter(
+                order_id=existing_order.order_id
+            ).values_list('status', flat=True).first()
+            
+            if outbox_status == OrderPaymentOutbox.STATUS_FAILED:
+                raise OrderServiceError("Failed to create payment: order already cancelled")
+            
+            if outbox_status == OrderPaymentOutbox.STATUS_PENDING and existing_order.status == 'pending':
+                # 阶段二未完成：继续创建 PaymentIntent（Stripe 幂等键保证同一订单只有一个）
+                existing_tier_id = existing_order.items.values_list('tier_id', flat=True).first()
+                return existing_order, create_order_payment(existing_order, existing_tier_id)
+            
             # 注意：模型中没有stripe_client_secret字段
             # 需要重新生成或从Stripe获取
             # 简化处理：返回空字符串，前端可以重新请求
@@ -152,23 +207,42 @@ def create_order(
             logger.warning(f"Invalid referral code: {referral_code}")
             # 不阻止订单创建，只是没有推荐人
     
-    # 开始事务
-    with transaction.atomic():
-        # 5. 锁定库存（乐观锁）⭐
-        success, error_code = lock_inventory(tier_id, quantity)
-        
-        if not success:
-            logger.warning(
-                f"Failed to lock inventory: {error_code}",
-                extra={'tier_id': str(tier_id), 'quantity': quantity}
-            )
-            raise InventoryError(error_code)
-        
-        # 6. 获取tier信息
-        try:
-            tier = Tier.objects.get(tier_id=tier_id)
-        except Tier.DoesNotExist:
-            raise ValidationError(f"Tier not found: {tier_id}")
+    # 5. 前置层预留（档位已装载时）：售罄直接失败，不开启数据库事务 ⭐
+    reserve_status, reservation_id = reserve_inventory(tier_id, quantity)
+    if reserve_status == RESERVE_SOLD_OUT:
+        logger.warning(
+            "Inventory front sold out",
+            extra={'tier_id': str(tier_id), 'quantity': quantity}
+        )
+        raise InventoryError('INVENTORY.INSUFFICIENT')
+    
+    # 开始事务（失败时取消预留）
+    with reservation_guard(reservation_id, tier_id, quantity), transaction.atomic():
+        if reservation_id is not None:
+            # 6. 获取tier信息（前置层不校验档位状态：停售档位在此拒绝，预留随事务失败取消）
+            try:
+                tier = Tier.objects.get(tier_id=tier_id)
+            except Tier.DoesNotExist:
+                raise ValidationError(f"Tier not found: {tier_id}")
+            
+            if not tier.is_active:
+                logger.warning(
+                    "Reserved tier is inactive",
+                    extra={'tier_id': str(tier_id), 'quantity': quantity}
+                )
+                raise InventoryError('TIER.INACTIVE')
+        else:
+            # 5-6. 扣减库存并取回档位（单条 UPDATE ... RETURNING）⭐
+            tier, error_code = reserve_tier_units(tier_id, quantity)
+            
+            if tier is None:
+                logger.warning(
+                    f"Failed to lock inventory: {error_code}",
+                    extra={'tier_id': str(tier_id), 'quantity': quantity}
+                )
+                if error_code == 'TIER.NOT_FOUND':
+                    raise ValidationError(f"Tier not found: {tier_id}")
+                raise InventoryError(error_code)
         
         # 7. 计算金额（改进：支持促销价和 Promo Code）
         # 7.1 获取当前有效价格（促销价或原价）
@@ -187,7 +261,8 @@ def create_order(
                     site_id=site_id,
                     user=user,
                     tier=tier,
-                    order_amount=list_price_total
+                    order_amount=list_price_total,
+                    check_user_limit=False  # 由 claim_promo_usage 原子校验
                 )
                 
                 if validation_result['valid']:
@@ -260,6 +335,11 @@ def create_order(
             expires_at=expires_at
         )
         
+        # 10.5 提交后加入到期队列（到期即取消并回补库存）
+        transaction.on_commit(
+            lambda: schedule_order_expiry(order.order_id, expires_at)
+        )
+        
         # 11. 创建OrderItem
         OrderItem.objects.create(
             order=order,
@@ -271,6 +351,15 @@ def create_order(
         
         # 11.5 记录 Promo Code 使用（如果应用了）⭐
         if promo_code_instance:
+            # 原子占用使用次数（并发下不超过每用户 / 总次数上限）
+            claim_error = claim_promo_usage(promo_code_instance, user)
+            if claim_error:
+                logger.warning(
+                    f"Promo code claim failed: {promo_code}, error: {claim_error}",
+                    extra={'promo_code': promo_code, 'error_code': claim_error}
+                )
+                raise ValidationError(claim_error)
+            
             try:
                 PromoCodeUsage.objects.create(
                     promo_code=promo_code_instance,
@@ -280,11 +369,6 @@ def create_order(
                     bonus_tokens_applied=promo_bonus_tokens
                 )
                 
-                # 更新促销码使用次数（使用 F 表达式避免竞态条件）
-                PromoCode.objects.filter(promo_id=promo_code_instance.promo_id).update(
-                    current_uses=F('current_uses') + 1
-                )
-                
                 logger.info(
                     f"Promo code usage recorded: {promo_code}",
                     extra={
@@ -324,42 +408,17 @@ def create_order(
             # 快照创建失败应回滚整个事务
             raise OrderServiceError(f"Failed to create commission snapshot: {e}") from e
         
-        # 13. 创建Stripe PaymentIntent（或Mock）
-        mock_stripe = getattr(settings, 'MOCK_STRIPE', False)
-        
-        try:
-            if mock_stripe:
-                # Mock模式（开发测试）
-                client_secret = create_mock_payment_intent(order.order_id, final_price)
-                payment_intent_id = f"pi_mock_{order.order_id}"
-            else:
-                # 真实Stripe
-                intent = create_payment_intent(
-                    amount=final_price,
-                    metadata={
-                        'order_id': str(order.order_id),
-                        'site_id': str(site_id),
-                        'tier_id': str(tier_id)
-                    },
-                    idempotency_key=idempotency_key
-                )
-                client_secret = intent.client_secret
-                payment_intent_id = intent.id
-            
-            # 更新订单（Stripe信息）
-            order.stripe_payment_intent_id = payment_intent_id
-            # 注意：模型中缺少stripe_client_secret字段
-            # 暂时存储到metadata或直接返回，不保存到DB
-            order.save(update_fields=['stripe_payment_intent_id'])
-            
-        except Exception as e:
-            logger.error(
-                f"Failed to create PaymentIntent: {e}",
-                exc_info=True,
-                extra={'order_id': str(order.order_id)}
-            )
-            # PaymentIntent创建失败应回滚整个事务
-            raise OrderServiceError(f"Failed to create payment: {e}") from e
+        # 13. 支付发件箱（事务提交后创建 PaymentIntent）⭐
+        OrderPaymentOutbox.objects.create(order=order)
+    
+    # 13.5 提交后确认预留（结算 worker 写回 tiers）
+    #      未能确认（预留过期且计数器不足 / 前置层故障）：库存未扣减，取消订单且不回补
+    if reservation_id is not None and not confirm_reservation(reservation_id, tier_id, quantity):
+        fail_unreserved_order(order.order_id, 'Inventory reservation could not be confirmed')
+        raise InventoryError('INVENTORY.INSUFFICIENT')
+    
+    # 14. 阶段二：事务外创建 Stripe PaymentIntent（失败时订单保持 pending，同一幂等键可重试）
+    client_secret = create_order_payment(order, tier_id)
     
     # 事务成功提交
     logger.info(
@@ -0,0 +1,225 @@
+"""
+两阶段下单：事务提交后创建 PaymentIntent
+
+⭐ 阶段一（数据库事务）：库存扣减 + Order / OrderItem / 快照 + OrderPaymentOutbox(pending)
+⭐ 阶段二（事务外）：调用 Stripe → 单个短事务写入 stripe_payment_intent_id，发件箱标记 created
+   事务时长与 Stripe 延迟无关，慢请求不再占用数据库连接
+
+⚠️ 失败恢复（有界重试，ORDER_PAYMENT_MAX_ATTEMPTS）：
+- 阶段二调用失败：订单保持 pending，客户端收到错误；以同一幂等键重试时
+  create_order 的幂等检查找到该订单并重新执行阶段二
+- 进程在两阶段之间中断 / 客户端未重试：recover_payment_outbox 重试超时仍为 pending 的发件箱
+- 尝试次数用尽（或订单已不是 pending）：取消订单并回补库存，发件箱标记 failed
+- 前置层预留未能确认（库存未扣减）：取消订单（不回补），发件箱标记 failed，不进入阶段二
+- Stripe 幂等键 order-{order_id}：同一订单重复调用只会得到同一个 PaymentIntent
+"""
+import logging
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from typing import Dict, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def _max_attempts() -> int:
+    return getattr(settings, 'ORDER_PAYMENT_MAX_ATTEMPTS', 3)
+
+
+def _create_intent(order_id: uuid.UUID, amount: Decimal, site_id, tier_id) -> Tuple[str, str]:
+    """
+    创建 PaymentIntent（或 Mock）
+
+    Returns:
+        (payment_intent_id, client_secret)
+    """
+    from .stripe_service import create_payment_intent, create_mock_payment_intent
+
+    if getattr(settings, 'MOCK_STRIPE', False):
+        # Mock模式（开发测试）
+        return f"pi_mock_{order_id}", create_mock_payment_intent(order_id, amount)
+
+    intent = create_payment_intent(
+        amount=amount,
+        metadata={
+            'order_id': str(order_id),
+            'site_id': str(site_id),
+            'tier_id': str(tier_id)
+        },
+        idempotency_key=f"order-{order_id}"
+    )
+    return intent.id, intent.client_secret
+
+
+def create_order_payment(order, tier_id: uuid.UUID) -> str:
+    """
+    阶段二：为已提交的订单创建 PaymentIntent（也用于幂等重试时继续阶段二）
+
+    ⚠️ 不得在事务内调用（Stripe 请求期间不持有数据库连接上的事务）
+
+    Returns:
+        str: client_secret
+
+    Raises:
+        OrderServiceError: 创建失败（未用尽尝试次数时订单保持 pending，可重试）
+    """
+    from apps.orders.models import OrderPaymentOutbox
+    from apps.orders.services.order_service import OrderServiceError
+
+    with transaction.atomic():
+        outbox = OrderPaymentOutbox.objects.select_for_update().get(order_id=order.order_id)
+        if outbox.status == OrderPaymentOutbox.STATUS_PENDING:
+            outbox.attempts += 1
+            outbox.save(update_fields=['attempts', 'updated_at'])
+
+    if outbox.status == OrderPaymentOutbox.STATUS_FAILED:
+        raise OrderServiceError("Failed to create payment: order already cancelled")
+
+    return _attempt_payment(order, tier_id, outbox.attempts)
+
+
+def _attempt_payment(order, tier_id: uuid.UUID, attempts: int) -> str:
+    """调用 Stripe 并记录结果（attempts：含本次的已尝试次数）"""
+    from apps.orders.models import Order, OrderPaymentOutbox
+    from apps.orders.services.order_service import OrderServiceError
+
+    try:
+        payment_intent_id, client_secret = _create_intent(
+            order.order_id, order.final_price_usd, order.site_id, tier_id
+        )
+    except Exception as e:
+        logger.error(
+            f"Failed to create PaymentIntent: {e}",
+            exc_info=True,
+            extra={'order_id': str(order.order_id), 'attempts': attempts}
+        )
+        if attempts >= _max_attempts():
+            _fail_orders([order.order_id], str(e))
+        else:
+            OrderPaymentOutbox.objects.filter(
+                order_id=order.order_id,
+                status=OrderPaymentOutbox.STATUS_PENDING
+            ).update(last_error=str(e)[:1000])
+        raise OrderServiceError(f"Failed to create payment: {e}") from e
+
+    with transaction.atomic():
+        recorded = OrderPaymentOutbox.objects.filter(
+            order_id=order.order_id,
+            status=OrderPaymentOutbox.STATUS_PENDING
+        ).update(status=OrderPaymentOutbox.STATUS_CREATED, updated_at=timezone.now())
+        if recorded:
+            Order.objects.filter(order_id=order.order_id).update(
+                stripe_payment_intent_id=payment_intent_id,
+                updated_at=timezone.now()
+            )
+            status = OrderPaymentOutbox.STATUS_CREATED
+        else:
+            status = OrderPaymentOutbox.objects.filter(
+                order_id=order.order_id
+            ).values_list('status', flat=True).first()
+
+    if status != OrderPaymentOutbox.STATUS_CREATED:
+        # 恢复任务已判定失败并取消订单
+        logger.error(
+            "PaymentIntent created after order was recovered as failed",
+            extra={'order_id': str(order.order_id), 'payment_intent_id': payment_intent_id}
+        )
+        raise OrderServiceError("Failed to create payment: order already cancelled")
+
+    # 未记录：并发的重试已记录同一 PaymentIntent（Stripe 幂等键）
+    order.stripe_payment_intent_id = payment_intent_id
+    return client_secret
+
+
+def _fail_orders(order_ids, error: str) -> None:
+    """补偿：取消 pending 订单并回补库存，发件箱标记 failed"""
+    from apps.orders.models import OrderPaymentOutbox
+    from apps.orders.services.expiry import cancel_pending_orders
+
+    with transaction.atomic():
+        OrderPaymentOutbox.objects.filter(
+            order_id__in=order_ids,
+            status=OrderPaymentOutbox.STATUS_PENDING
+        ).update(status=OrderPaymentOutbox.STATUS_FAILED, last_error=error[:1000])
+        cancel_pending_orders(order_ids)
+
+
+def fail_unreserved_order(order_id: uuid.UUID, error: str) -> None:
+    """补偿：库存未扣减的订单（前置层预留未确认）取消且不回补，发件箱标记 failed"""
+    from apps.orders.models import OrderPaymentOutbox
+    from apps.orders.services.expiry import cancel_unreserved_orders
+
+    with transaction.atomic():
+        OrderPaymentOutbox.objects.filter(
+            order_id=order_id,
+            status=OrderPaymentOutbox.STATUS_PENDING
+        ).update(status=OrderPaymentOutbox.STATUS_FAILED, last_error=error[:1000])
+        cancel_unreserved_orders([order_id])
+
+
+def recover_payment_outbox(limit: int = 100) -> Dict[str, int]:
+    """
+    恢复中断的两阶段下单（超时仍为 pending 的发件箱）
+
+    ⭐ SKIP LOCKED 选取并刷新 updated_at：并发恢复任务互不阻塞、不重复重试
+    ⭐ 未用尽尝试次数：事务外重新创建 PaymentIntent；
+      已用尽 / 订单已取消或过期：取消订单并回补库存，发件箱标记 failed
+
+    Returns:
+        {'retried': 重试成功数, 'failed': 补偿取消数}
+    """
+    from apps.orders.models import OrderPaymentOutbox
+    from apps.orders.services.order_service import OrderServiceError
+
+    now = timezone.now()
+    stale_before = now - timedelta(
+        seconds=getattr(settings, 'ORDER_PAYMENT_RECOVERY_SECONDS', 300)
+    )
+
+    with transaction.atomic():
+        outboxes = list(
+            OrderPaymentOutbox.objects.select_for_update(skip_locked=True, of=('self',)).filter(
+                status=OrderPaymentOutbox.STATUS_PENDING,
+                updated_at__lt=stale_before
+            ).select_related('order').order_by('updated_at')[:limit]
+        )
+
+        exhausted = [
+            outbox.order_id for outbox in outboxes
+            if outbox.attempts >= _max_attempts() or outbox.order.status != 'pending'
+        ]
+        retries = [outbox for outbox in outboxes if outbox.order_id not in exhausted]
+
+        if exhausted:
+            _fail_orders(exhausted, 'PaymentIntent creation interrupted')
+        if retries:
+            OrderPaymentOutbox.objects.filter(
+                order_id__in=[outbox.order_id for outbox in retries]
+            ).update(attempts=F('attempts') + 1, updated_at=now)
+
+    retried = 0
+    for outbox in retries:
+        tier_id = outbox.order.items.values_list('tier_id', flat=True).first()
+        try:
+            _attempt_payment(outbox.order, tier_id, outbox.attempts + 1)
+            retried += 1
+        except OrderServiceError:
+            # 已记录失败原因；用尽次数时已取消订单
+            pass
+
+    if outboxes:
+        logger.warning(
+            f"Recovered {len(outboxes)} orders with interrupted payment creation",
+            extra={
+                'retried': retried,
+                'failed': len(exhausted),
+                'order_ids': [str(outbox.order_id) for outbox in outboxes]
+            }
+        )
+
+    return {'retried': retried, 'failed': len(exhausted)}
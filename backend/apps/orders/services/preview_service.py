@@ -0,0 +1,224 @@
+"""
+订单预览服务
+
+⭐ 结账页每次输入都会请求预览，结果缓存（Django cache，短 TTL）：
+- Key = 站点 + 档位 + 档位定义版本 + 数量 + 促销码 + 促销码定义版本 + 用户次数档位
+- 档位 / 促销码定义读取进程内缓存（tier_cache / promo_service），
+  管理端修改时更换版本号 → 旧预览 Key 不再命中
+- 用户次数档位：'ok' / 'limit'（是否已达每用户上限），不同用户共享同一预览结果
+- TTL 不跨越价格边界（档位促销窗口、促销码有效期），边界后重新计算
+
+⚠️ 库存变更不影响预览（预览不含库存），因此不以 Tier.version 作为版本
+⚠️ 共享缓存不可用时每次计算（不返回过期数据）
+"""
+import logging
+import math
+import uuid
+from decimal import Decimal
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from apps.orders.services.promo_service import (
+    get_promo_definition,
+    get_promo_definition_version,
+    get_user_promo_uses,
+    validate_promo_code,
+)
+from apps.tiers.services.tier_cache import get_tier_definition, get_tier_definition_version
+
+logger = logging.getLogger(__name__)
+
+# 预览缓存 Key 前缀
+PREVIEW_KEY_PREFIX = 'posx:order_preview'
+
+
+def _user_bucket(promo, site_id: uuid.UUID, user) -> str:
+    """用户次数档位（仅影响促销码是否可用）"""
+    if promo is None or promo.site_id != site_id or not promo.is_active:
+        return '-'
+    return 'limit' if get_user_promo_uses(promo, user) >= promo.uses_per_user else 'ok'
+
+
+def _cache_ttl(tier, promo, now) -> int:
+    """缓存秒数：不超过下一个价格边界"""
+    ttl = getattr(settings, 'ORDER_PREVIEW_CACHE_TTL', 30)
+
+    boundaries = []
+    if tier.promotional_price_usd:
+        boundaries += [tier.promotion_valid_from, tier.promotion_valid_until]
+    if promo is not None:
+        boundaries += [promo.valid_from, promo.valid_until]
+
+    for boundary in boundaries:
+        if boundary is not None and boundary > now:
+            ttl = min(ttl, math.ceil((boundary - now).total_seconds()))
+
+    return max(ttl, 1)
+
+
+def build_order_preview(tier, quantity: int, promo_code: Optional[str], user) -> Dict:
+    """
+    计算订单预览（价格、折扣、代币）
+
+    Returns:
+        Dict: 预览响应数据（仅含字符串 / 布尔，可直接缓存）
+    """
+    # 计算价格
+    unit_price = tier.get_current_price()
+    subtotal = unit_price * quantity
+
+    # 计算代币
+    base_tokens = tier.tokens_per_unit * quantity
+    tier_bonus_tokens = tier.bonus_tokens_per_unit * quantity
+
+    # 应用 Promo Code（如果提供）
+    discount = Decimal('0')
+    promo_bonus_tokens = Decimal('0')
+    promo_info = None
+
+    if promo_code:
+        validation_result = validate_promo_code(
+            code=promo_code,
+            site_id=tier.site_id,
+            user=user,
+            tier=tier,
+            order_amount=subtotal
+        )
+
+        if validation_result['valid']:
+            discount = validation_result['discount_amount']
+            promo_bonus_tokens = validation_result['bonus_tokens']
+
+            # 构建 Promo Code 信息
+            promo_obj = validation_result['promo']
+            description_parts = []
+
+            if promo_obj.discount_type == promo_obj.DISCOUNT_TYPE_PERCENTAGE:
+                description_parts.append(f"{promo_obj.discount_value}%折扣")
+            elif promo_obj.discount_type == promo_obj.DISCOUNT_TYPE_FIXED:
+                description_parts.append(f"${discount}折扣")
+
+            if promo_bonus_tokens > 0:
+                description_parts.append(f"+{promo_bonus_tokens}代币")
+
+            promo_info = {
+                'code': promo_obj.code,
+                'name': promo_obj.name,
+                'description': ' + '.join(description_parts) if description_parts else promo_obj.description,
+                'applied': True
+            }
+        else:
+            # Promo Code 无效
+            promo_info = {
+                'code': promo_code,
+                'applied': False,
+                'error': validation_result.get('error'),
+                'error_code': validation_result.get('error_code')
+            }
+
+    # 计算最终价格
+    final_price = subtotal - discount
+    if final_price < Decimal('0'):
+        final_price = Decimal('0')
+
+    # 计算总代币
+    total_tokens = base_tokens + tier_bonus_tokens + promo_bonus_tokens
+
+    # Tier 促销信息
+    if tier.is_promotion_active():
+        original_price = tier.list_price_usd
+        discount_pct = Decimal('0')
+        if original_price > 0:
+            discount_pct = ((original_price - unit_price) / original_price) * 100
+
+        tier_promotion = {
+            'active': True,
+            'original_price': str(original_price),
+            'promotional_price': str(unit_price),
+            'discount_percentage': str(discount_pct.quantize(Decimal('0.01'))),
+            'ends_at': tier.promotion_valid_until.isoformat() if tier.promotion_valid_until else None
+        }
+    else:
+        tier_promotion = {'active': False}
+
+    preview = {
+        'tier_id': str(tier.tier_id),
+        'tier_name': tier.name,
+        'quantity': quantity,
+        'pricing': {
+            'unit_price': str(unit_price),
+            'subtotal': str(subtotal),
+            'discount': str(discount),
+            'final_price': str(final_price)
+        },
+        'tokens': {
+            'base_tokens': str(base_tokens),
+            'tier_bonus': str(tier_bonus_tokens),
+            'promo_bonus': str(promo_bonus_tokens),
+            'total_tokens': str(total_tokens)
+        },
+        'tier_promotion': tier_promotion
+    }
+
+    if promo_info:
+        preview['promo_code'] = promo_info
+
+    return preview
+
+
+def get_order_preview(
+    site_id: uuid.UUID,
+    user,
+    tier_id: uuid.UUID,
+    quantity: int,
+    promo_code: Optional[str] = None
+) -> Optional[Dict]:
+    """
+    订单预览（缓存）
+
+    Returns:
+        Dict: 预览响应数据
+        None: 档位不存在或不属于该站点
+    """
+    # ⚠️ 先读版本号再读定义：读取期间发生失效时，结果写入旧版本 Key（不会被命中）
+    code = promo_code.upper().strip() if promo_code else ''
+    tier_version = get_tier_definition_version(site_id, tier_id)
+    promo_version = get_promo_definition_version(site_id, code) if code else '-'
+
+    tier = get_tier_definition(site_id, tier_id)
+    if tier is None:
+        return None
+
+    promo = None
+    if code:
+        definition = get_promo_definition(site_id, code)
+        promo = definition[0] if definition else None
+
+    if tier_version is None or promo_version is None:
+        return build_order_preview(tier, quantity, code or None, user)
+
+    cache_key = (
+        f"{PREVIEW_KEY_PREFIX}:{site_id}:{tier_id}:{tier_version}:{quantity}:"
+        f"{code}:{promo_version}:{_user_bucket(promo, site_id, user)}"
+    )
+
+    try:
+        cached = cache.get(cache_key)
+    except Exception as e:
+        logger.warning(f"Order preview cache unavailable: {e}", extra={'tier_id': str(tier_id)})
+        return build_order_preview(tier, quantity, code or None, user)
+
+    if cached is not None:
+        return cached
+
+    preview = build_order_preview(tier, quantity, code or None, user)
+
+    try:
+        cache.set(cache_key, preview, timeout=_cache_ttl(tier, promo, timezone.now()))
+    except Exception as e:
+        logger.warning(f"Order preview cache write failed: {e}", extra={'tier_id': str(tier_id)})
+
+    return preview
@@ -7,6 +7,13 @@ Promo Code 验证服务
 3. 计算额外代币奖励
 4. 检查使用限制
 
+⭐ 活动期间的性能：
+- 促销码定义（含适用档位ID）进程内缓存，按 站点 + 促销码 版本化失效
+  （促销码保存 / 删除 / 适用档位变更由 orders/signals.py 提交后失效，总次数用尽时 invalidate_promo_code）
+- 使用次数为原子计数器：下单时 claim_promo_usage 条件自增
+  （每用户 PromoCodeUserCounter + 全局 PromoCode.current_uses），并发不会超限
+- 漂移由 reconcile_promo_counters 按 PromoCodeUsage 修复
+
 使用示例：
 >>> result = validate_promo_code(
 ...     code='SUMMER2025',
@@ -20,12 +27,18 @@ Promo Code 验证服务
 ...     bonus = result['bonus_tokens']
 """
 import logging
-from typing import Dict, Optional
+from typing import TYPE_CHECKING, Dict, FrozenSet, Optional, Tuple
 from decimal import Decimal, ROUND_HALF_UP
+from django.db import connection, transaction
 from django.utils import timezone
 from django.db.models import Q
 import uuid
 
+from apps.core.utils.local_cache import VersionedLocalCache
+
+if TYPE_CHECKING:
+    from apps.orders.models import PromoCode
+
 logger = logging.getLogger(__name__)
 
 
@@ -71,22 +84,216 @@ def quantize_tokens(tokens: Decimal) -> Decimal:
     return tokens.quantize(Decimal('0.000001'), rounding=ROUND_HALF_UP)
 
 
+def _promo_cache_key(site_id, code: str) -> str:
+    return f"{site_id}:{code.upper().strip()}"
+
+
+def _load_promo(key: str) -> Optional[Tuple['PromoCode', FrozenSet[uuid.UUID]]]:
+    """
+    加载促销码定义（不存在时返回 None，同样缓存）
+
+    ⚠️ 按 code 全局唯一查询：其他站点的促销码也会缓存（用于站点不匹配提示）
+    """
+    from apps.orders.models import PromoCode
+
+    _, code = key.split(':', 1)
+    promo = PromoCode.objects.filter(code=code).first()
+    if promo is None:
+        return None
+
+    tier_ids = frozenset(promo.applicable_tiers.values_list('tier_id', flat=True))
+    return promo, tier_ids
+
+
+_promo_cache = VersionedLocalCache('promo_codes', loader=_load_promo)
+
+
+def get_promo_definition(site_id: uuid.UUID, code: str) -> Optional[Tuple['PromoCode', FrozenSet[uuid.UUID]]]:
+    """
+    读取促销码定义（缓存）
+
+    Returns:
+        (promo, applicable_tier_ids) / None（不存在）
+        applicable_tier_ids 为空 = 适用全部档位
+    """
+    return _promo_cache.get(_promo_cache_key(site_id, code))
+
+
+def get_promo_definition_version(site_id: uuid.UUID, code: str) -> Optional[str]:
+    """促销码定义版本号（派生缓存 Key 用；共享缓存不可用时为 None）"""
+    return _promo_cache.version(_promo_cache_key(site_id, code))
+
+
+def invalidate_promo_code(site_id: uuid.UUID, code: str) -> None:
+    """促销码定义变更后调用（orders/signals.py 提交后调用，总次数用尽）"""
+    _promo_cache.invalidate(_promo_cache_key(site_id, code))
+
+
+CLAIM_USER_USE_SQL = """
+    INSERT INTO promo_code_user_counters (counter_id, promo_code_id, user_id, uses, updated_at)
+    VALUES (gen_random_uuid(), %s, %s, 1, NOW())
+    ON CONFLICT (promo_code_id, user_id) DO UPDATE
+    SET uses = promo_code_user_counters.uses + 1,
+        updated_at = NOW()
+    WHERE promo_code_user_counters.uses < %s
+    RETURNING uses
+"""
+
+CLAIM_GLOBAL_USE_SQL = """
+    UPDATE promo_codes
+    SET current_uses = current_uses + 1
+    WHERE promo_id = %s
+      AND (max_uses IS NULL OR current_uses < max_uses)
+    RETURNING current_uses, max_uses
+"""
+
+
+def claim_promo_usage(promo, user) -> Optional[str]:
+    """
+    原子占用一次使用次数（下单事务内调用）
+
+    ⭐ 两条条件写入：先每用户计数（冷行），后全局计数（热点行，持锁时间最短）
+    ⚠️ 失败时调用方须回滚事务（每用户计数已自增）
+
+    Returns:
+        None: 成功
+        'PROMO_CODE_USER_LIMIT_EXCEEDED' / 'PROMO_CODE_EXHAUSTED'
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(CLAIM_USER_USE_SQL, [str(promo.promo_id), str(user.user_id), promo.uses_per_user])
+        if cursor.fetchone() is None:
+            return 'PROMO_CODE_USER_LIMIT_EXCEEDED'
+
+        cursor.execute(CLAIM_GLOBAL_USE_SQL, [str(promo.promo_id)])
+        row = cursor.fetchone()
+
+    if row is None or (row[1] is not None and row[0] >= row[1]):
+        # 总次数用尽：缓存中的 current_uses 失效，后续校验直接拒绝
+        invalidate_promo_code(promo.site_id, promo.code)
+
+    if row is None:
+        return 'PROMO_CODE_EXHAUSTED'
+    return None
+
+
+def get_user_promo_uses(promo, user) -> int:
+    """用户已使用次数（计数器单行读取）"""
+    from apps.orders.models import PromoCodeUserCounter
+
+    return PromoCodeUserCounter.objects.filter(
+        promo_code_id=promo.promo_id, user=user
+    ).values_list('uses', flat=True).first() or 0
+
+
+# ⚠️ 先锁定再计数：持锁期间下单无法占用次数，计数与计数器一致
+LOCK_PROMO_CODES_SQL = """
+    SELECT promo_id FROM promo_codes ORDER BY promo_id FOR UPDATE
+"""
+
+RECONCILE_GLOBAL_USES_SQL = """
+    UPDATE promo_codes p
+    SET current_uses = u.total
+    FROM (
+        SELECT p2.promo_id, COUNT(pu.usage_id) AS total
+        FROM promo_codes p2
+        LEFT JOIN promo_code_usages pu ON pu.promo_code_id = p2.promo_id
+        GROUP BY p2.promo_id
+    ) u
+    WHERE p.promo_id = u.promo_id
+      AND p.current_uses <> u.total
+    RETURNING p.site_id, p.code
+"""
+
+LOCK_USER_COUNTERS_SQL = """
+    SELECT counter_id FROM promo_code_user_counters ORDER BY counter_id FOR UPDATE
+"""
+
+RECONCILE_USER_USES_SQL = """
+    INSERT INTO promo_code_user_counters (counter_id, promo_code_id, user_id, uses, updated_at)
+    SELECT gen_random_uuid(), promo_code_id, user_id, COUNT(*), NOW()
+    FROM promo_code_usages
+    GROUP BY promo_code_id, user_id
+    ON CONFLICT (promo_code_id, user_id) DO UPDATE
+    SET uses = EXCLUDED.uses,
+        updated_at = NOW()
+    WHERE promo_code_user_counters.uses <> EXCLUDED.uses
+"""
+
+# 使用记录已不存在（订单删除级联）的计数器归零
+RESET_ORPHAN_USER_USES_SQL = """
+    UPDATE promo_code_user_counters c
+    SET uses = 0,
+        updated_at = NOW()
+    WHERE c.uses <> 0
+      AND NOT EXISTS (
+          SELECT 1 FROM promo_code_usages pu
+          WHERE pu.promo_code_id = c.promo_code_id
+            AND pu.user_id = c.user_id
+      )
+"""
+
+
+def reconcile_promo_counters() -> Dict[str, int]:
+    """
+    按 PromoCodeUsage 校准计数器（集合化 SQL）
+
+    ⭐ 每类计数器一个事务：先 FOR UPDATE 锁定计数行，再计数并修正
+    （READ COMMITTED 下计数语句在取得锁之后取快照，不会抹掉对账期间提交的占用）
+    ⭐ 全局与每用户分两个事务：下单先锁每用户计数、后锁全局计数，
+      同时持有两类锁会与进行中的下单互相等待
+
+    ⚠️ 持锁期间该类促销码下单等待（低频兜底任务）
+    ⚠️ promo_code_usages 启用 FORCE RLS：须以可读取全部站点的连接执行
+
+    Returns:
+        {'global': 修正的促销码数, 'user': 修正的用户计数器数}
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(LOCK_PROMO_CODES_SQL)
+            cursor.execute(RECONCILE_GLOBAL_USES_SQL)
+            drifted = cursor.fetchall()
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(LOCK_USER_COUNTERS_SQL)
+            cursor.execute(RECONCILE_USER_USES_SQL)
+            user_fixed = cursor.rowcount
+            cursor.execute(RESET_ORPHAN_USER_USES_SQL)
+            user_fixed += cursor.rowcount
+
+    for site_id, code in drifted:
+        invalidate_promo_code(site_id, code)
+
+    if drifted or user_fixed:
+        logger.warning(
+            f"Promo counters reconciled: global={len(drifted)}, user={user_fixed}",
+            extra={'global': len(drifted), 'user': user_fixed}
+        )
+
+    return {'global': len(drifted), 'user': user_fixed}
+
+
 def validate_promo_code(
     code: str,
     site_id: uuid.UUID,
     user,
     tier,
-    order_amount: Decimal
+    order_amount: Decimal,
+    check_user_limit: bool = True
 ) -> Dict:
     """
     验证 Promo Code
     
+    ⭐ 定义读取走缓存；每用户次数读取计数器单行
+    
     Args:
         code: 促销码
         site_id: 站点ID
         user: 用户实例
         tier: Tier 实例
         order_amount: 订单金额（应用折扣前）
+        check_user_limit: 是否检查每用户次数（下单时由 claim_promo_usage 原子校验，可跳过）
     
     Returns:
         Dict: {
@@ -101,17 +308,14 @@ def validate_promo_code(
     Raises:
         PromoCodeError: 验证失败时抛出具体异常
     """
-    from apps.orders.models import PromoCode, PromoCodeUsage
+    from apps.orders.models import PromoCode
     
     # 统一code为大写
     code = code.upper().strip()
     
-    # 1. 检查代码是否存在
-    try:
-        promo = PromoCode.objects.select_related('site').prefetch_related('applicable_tiers').get(
-            code=code
-        )
-    except PromoCode.DoesNotExist:
+    # 1. 检查代码是否存在（缓存）
+    definition = get_promo_definition(site_id, code)
+    if definition is None:
         logger.warning(
             f"Promo code not found: {code}",
             extra={'code': code, 'site_id': str(site_id)}
@@ -125,13 +329,15 @@ def validate_promo_code(
             'bonus_tokens': Decimal('0'),
         }
     
+    promo, applicable_tier_ids = definition
+    
     # 2. 检查站点匹配
-    if promo.site.site_id != site_id:
+    if promo.site_id != site_id:
         logger.warning(
             f"Promo code site mismatch: {code}",
             extra={
                 'code': code,
-                'promo_site_id': str(promo.site.site_id),
+                'promo_site_id': str(promo.site_id),
                 'request_site_id': str(site_id)
             }
         )
@@ -204,11 +410,8 @@ def validate_promo_code(
             'bonus_tokens': Decimal('0'),
         }
     
-    # 6. 检查用户使用次数限制
-    user_usage_count = PromoCodeUsage.objects.filter(
-        promo_code=promo,
-        user=user
-    ).count()
+    # 6. 检查用户使用次数限制（计数器）
+    user_usage_count = get_user_promo_uses(promo, user) if check_user_limit else 0
     
     if user_usage_count >= promo.uses_per_user:
         logger.warning(
@@ -249,10 +452,9 @@ def validate_promo_code(
         }
     
     # 8. 检查适用 Tier
-    applicable_tiers = promo.applicable_tiers.all()
-    if applicable_tiers.exists():
+    if applicable_tier_ids:
         # 如果配置了适用 Tier，则必须匹配
-        if tier not in applicable_tiers:
+        if tier.tier_id not in applicable_tier_ids:
             logger.warning(
                 f"Promo code not applicable to tier: {code}",
                 extra={
@@ -0,0 +1,63 @@
+"""
+Orders 信号处理
+
+⭐ 促销码变更（PromoCodeAdminViewSet / Django Admin / 脚本）→ 事务提交后失效进程内促销码定义缓存
+"""
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from apps.orders.models import PromoCode
+
+
+def _invalidate_on_commit(site_id, *codes):
+    """提交后失效（避免其他进程在提交前读到旧数据并缓存为新版本）"""
+    from apps.orders.services.promo_service import invalidate_promo_code
+
+    def invalidate():
+        for code in set(codes):
+            if code:
+                invalidate_promo_code(site_id, code)
+
+    transaction.on_commit(invalidate)
+
+
+@receiver(pre_save, sender=PromoCode)
+def remember_previous_promo_code(sender, instance, **kwargs):
+    """记录修改前的促销码（改名后旧 Key 同样失效）"""
+    instance._previous_code = None
+    if not instance._state.adding:
+        instance._previous_code = PromoCode.objects.filter(
+            pk=instance.pk
+        ).values_list('code', flat=True).first()
+
+
+@receiver(post_save, sender=PromoCode)
+def invalidate_promo_code_on_save(sender, instance, **kwargs):
+    """促销码创建 / 修改后失效定义缓存（创建时清除“不存在”缓存）"""
+    _invalidate_on_commit(instance.site_id, instance.code, getattr(instance, '_previous_code', None))
+
+
+@receiver(post_delete, sender=PromoCode)
+def invalidate_promo_code_on_delete(sender, instance, **kwargs):
+    """促销码删除后失效定义缓存"""
+    _invalidate_on_commit(instance.site_id, instance.code)
+
+
+@receiver(m2m_changed, sender=PromoCode.applicable_tiers.through)
+def invalidate_promo_code_on_tiers_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """适用档位变更后失效定义缓存（缓存含适用档位ID）"""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            _invalidate_on_commit(instance.site_id, instance.code)
+        return
+
+    # 从档位一侧修改：失效涉及的促销码（clear 在清除前读取关联）
+    if action in ('post_add', 'post_remove'):
+        promos = PromoCode.objects.filter(pk__in=pk_set or [])
+    elif action == 'pre_clear':
+        promos = PromoCode.objects.filter(applicable_tiers=instance)
+    else:
+        return
+    for site_id, code in promos.values_list('site_id', 'code'):
+        _invalidate_on_commit(site_id, code)
@@ -2,25 +2,28 @@
 订单定时任务
 
 ⭐ 功能：
-- 自动取消超时订单（15分钟未支付）
-- 回补库存
-- 分页处理避免大事务
+- 自动取消超时订单（15分钟未支付）：到期队列每秒精确取消 + 每5分钟兜底扫描
+- 回补库存（每批每档位一次 UPDATE）
+- 分批处理避免大事务
 
 Celery配置：
 # backend/config/celery.py
 from celery.schedules import crontab
 
 app.conf.beat_schedule = {
+    'expire-due-orders': {
+        'task': 'apps.orders.tasks.expire_due_orders',
+        'schedule': 1.0,  # 每秒（到期队列）
+    },
     'expire-pending-orders': {
         'task': 'apps.orders.tasks.expire_pending_orders',
-        'schedule': crontab(minute='*/5'),  # 每5分钟运行一次
+        'schedule': crontab(minute='*/5'),  # 每5分钟运行一次（兜底）
     },
 }
 """
 import logging
 from datetime import timedelta
 from django.utils import timezone
-from django.db import transaction
 from celery import shared_task
 
 logger = logging.getLogger(__name__)
@@ -32,11 +35,11 @@ def expire_pending_orders(self):
     自动取消超时订单
     
     ⚠️ 设计：
-    - 每5分钟运行一次
-    - 分页处理（避免大事务）
-    - 查询 pending 且 expires_at <= now 的订单
-    - 状态改为 cancelled
-    - 回补库存
+    - 每5分钟运行一次（兜底：到期队列 expire_due_orders 负责精确取消）
+    - 分批处理（ORDER_EXPIRY_BATCH_SIZE，避免大事务）
+    - 每批：单条 UPDATE ... RETURNING 取消（SKIP LOCKED）+ 每档位一次回补
+      （见 services/expiry.py）
+    - 并发运行的 beat 任务各取不同订单，不会互相阻塞
     
     Returns:
         dict: {
@@ -45,15 +48,13 @@ def expire_pending_orders(self):
             'failed': int
         }
     """
-    from apps.orders.models import Order
-    from apps.tiers.services.inventory import release_inventory
+    from django.conf import settings
+    from apps.orders.services.expiry import expire_order_batch
     
-    # 分页大小
-    page_size = 100
+    batch_size = getattr(settings, 'ORDER_EXPIRY_BATCH_SIZE', 500)
     
     # 统计
     processed = 0
-    succeeded = 0
     failed = 0
     
     # 当前时间
@@ -62,76 +63,27 @@ def expire_pending_orders(self):
     logger.info(f"Starting expire_pending_orders task, cutoff={cutoff}")
     
     while True:
-        # 查询超时订单（分页）
-        expired_orders = Order.objects.filter(
-            status='pending',
-            expires_at__lte=cutoff
-        ).select_related('tier')[:page_size]
-        
-        # 转为列表（避免重复查询）
-        expired_orders_list = list(expired_orders)
-        
-        if not expired_orders_list:
-            logger.info(f"No more expired orders to process")
+        try:
+            batch = expire_order_batch(cutoff, batch_size)
+        except Exception as e:
+            # 整批回滚（订单仍为 pending），下次运行重试
+            logger.error(
+                f"Error expiring order batch: {e}",
+                exc_info=True,
+                extra={'cutoff': cutoff.isoformat()}
+            )
+            failed += 1
             break
         
-        logger.info(f"Found {len(expired_orders_list)} expired orders")
+        processed += batch['cancelled']
         
-        # 逐个处理
-        for order in expired_orders_list:
-            processed += 1
-            
-            try:
-                with transaction.atomic():
-                    # 更新订单状态
-                    order.status = 'cancelled'
-                    order.cancelled_reason = 'TIMEOUT'
-                    order.cancelled_at = timezone.now()
-                    order.save(update_fields=['status', 'cancelled_reason', 'cancelled_at', 'updated_at'])
-                    
-                    # 回补库存
-                    success, error_code = release_inventory(
-                        order.tier_id,
-                        order.quantity
-                    )
-                    
-                    if success:
-                        logger.info(
-                            f"Expired order cancelled and inventory released: {order.order_id}",
-                            extra={
-                                'order_id': str(order.order_id),
-                                'tier_id': str(order.tier_id),
-                                'quantity': order.quantity
-                            }
-                        )
-                        succeeded += 1
-                    else:
-                        logger.error(
-                            f"Failed to release inventory for expired order: {error_code}",
-                            extra={
-                                'order_id': str(order.order_id),
-                                'error_code': error_code
-                            }
-                        )
-                        # 订单已取消，但库存回补失败
-                        # 记录到监控，需要人工介入
-                        failed += 1
-                        
-            except Exception as e:
-                logger.error(
-                    f"Error processing expired order {order.order_id}: {e}",
-                    exc_info=True,
-                    extra={'order_id': str(order.order_id)}
-                )
-                failed += 1
-        
-        # 如果本批次少于page_size，说明已处理完
-        if len(expired_orders_list) < page_size:
+        # 如果本批次少于batch_size，说明已处理完
+        if batch['cancelled'] < batch_size:
             break
     
     result = {
         'processed': processed,
-        'succeeded': succeeded,
+        'succeeded': processed,
         'failed': failed
     }
     
@@ -143,6 +95,69 @@ def expire_pending_orders(self):
     return result
 
 
+@shared_task
+def expire_due_orders():
+    """
+    取消到期队列中已到期的订单
+    
+    触发时间：每秒
+    
+    ⭐ 订单在 expires_at 后 1 秒内取消并回补库存
+    ⚠️ Redis 不可用时空转，由 expire_pending_orders 兜底
+    """
+    from django.conf import settings
+    from apps.orders.services.expiry import expire_due_orders as expire_due
+    
+    batch_size = getattr(settings, 'ORDER_EXPIRY_BATCH_SIZE', 500)
+    now = timezone.now()
+    
+    total = {'due': 0, 'cancelled': 0, 'tiers': 0}
+    while True:
+        result = expire_due(now, batch_size)
+        for key in total:
+            total[key] += result[key]
+        if result['due'] < batch_size:
+            break
+    
+    if total['due']:
+        logger.info(
+            f"Expired {total['cancelled']}/{total['due']} due orders",
+            extra=total
+        )
+    
+    return total
+
+
+@shared_task
+def recover_payment_outbox():
+    """
+    恢复中断的两阶段下单
+    
+    触发时间：每分钟
+    
+    ⭐ 订单已提交但 PaymentIntent 未记录（失败 / 进程中断）超过 ORDER_PAYMENT_RECOVERY_SECONDS：
+      重试创建；尝试次数用尽时取消订单并回补库存
+    """
+    from apps.orders.services.payment_outbox import recover_payment_outbox as recover
+    
+    return recover()
+
+
+@shared_task
+def reconcile_promo_counters():
+    """
+    校准促销码使用计数器
+    
+    触发时间：每天凌晨 4:15
+    
+    ⭐ 按 PromoCodeUsage 修正 PromoCode.current_uses 与 PromoCodeUserCounter
+    ⭐ 先锁定计数行再计数；无使用记录的每用户计数器归零
+    """
+    from apps.orders.services.promo_service import reconcile_promo_counters as reconcile
+    
+    return reconcile()
+
+
 @shared_task
 def check_order_payment_status(order_id: str):
     """
@@ -9,7 +9,7 @@
 5. 取消订单
 6. 验证库存回补
 """
-from django.test import TestCase, TransactionTestCase
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.utils import timezone
 from datetime import timedelta
 from rest_framework.test import APIClient
@@ -179,6 +179,398 @@ class OrderE2ETestCase(TransactionTestCase):
         self.tier.refresh_from_db()
         self.assertEqual(self.tier.available_units, 100)
     
+    def test_bulk_expiry_releases_once_per_tier(self):
+        """测试批量取消：每档位汇总回补，未过期订单不受影响"""
+        from apps.orders.services.expiry import expire_order_batch
+        
+        def make_order(quantity, expires_delta):
+            order = Order.objects.create(
+                site=self.site,
+                buyer=self.user,
+                wallet_address=self.wallet.address,
+                list_price_usd=Decimal('100.00'),
+                discount_usd=Decimal('0'),
+                final_price_usd=Decimal('100.00'),
+                status='pending',
+                expires_at=timezone.now() + expires_delta
+            )
+            OrderItem.objects.create(
+                order=order,
+                tier=self.tier,
+                quantity=quantity,
+                unit_price_usd=Decimal('100.00'),
+                token_amount=Decimal('1000.00')
+            )
+            return order
+        
+        expired = [make_order(2, timedelta(minutes=-5)) for _ in range(3)]
+        active = make_order(1, timedelta(minutes=5))
+        Tier.objects.filter(tier_id=self.tier.tier_id).update(available_units=93)
+        
+        result = expire_order_batch(timezone.now(), batch_size=2)
+        self.assertEqual(result, {'cancelled': 2, 'tiers': 1})
+        
+        result = expire_order_batch(timezone.now(), batch_size=2)
+        self.assertEqual(result, {'cancelled': 1, 'tiers': 1})
+        
+        self.assertEqual(
+            Order.objects.filter(order_id__in=[o.order_id for o in expired], status='cancelled').count(),
+            3
+        )
+        active.refresh_from_db()
+        self.assertEqual(active.status, 'pending')
+        
+        self.tier.refresh_from_db()
+        self.assertEqual(self.tier.available_units, 99)
+        self.assertEqual(self.tier.version, 2)
+    
+    def test_expire_orders_by_id_skips_unexpired(self):
+        """测试到期队列按ID取消：未到期 / 已支付订单跳过"""
+        from apps.orders.services.expiry import expire_orders
+        
+        orders = []
+        for status_, delta in [('pending', -1), ('pending', 5), ('paid', -1)]:
+            order = Order.objects.create(
+                site=self.site,
+                buyer=self.user,
+                wallet_address=self.wallet.address,
+                list_price_usd=Decimal('100.00'),
+                discount_usd=Decimal('0'),
+                final_price_usd=Decimal('100.00'),
+                status=status_,
+                expires_at=timezone.now() + timedelta(minutes=delta)
+            )
+            OrderItem.objects.create(
+                order=order,
+                tier=self.tier,
+                quantity=1,
+                unit_price_usd=Decimal('100.00'),
+                token_amount=Decimal('1000.00')
+            )
+            orders.append(order)
+        
+        result = expire_orders([order.order_id for order in orders], timezone.now())
+        self.assertEqual(result, {'cancelled': 1, 'tiers': 1})
+        
+        statuses = [Order.objects.get(order_id=order.order_id).status for order in orders]
+        self.assertEqual(statuses, ['cancelled', 'pending', 'paid'])
+    
+    def test_payment_failure_keeps_order_for_retry(self):
+        """测试两阶段下单：PaymentIntent 创建失败后同一幂等键重试继续支付，用尽次数后取消并回补"""
+        from unittest.mock import patch
+        from apps.orders.models import OrderPaymentOutbox
+        from apps.orders.services.order_service import OrderServiceError, _create_order
+        
+        def create():
+            return _create_order(
+                site_id=self.site.site_id,
+                tier_id=self.tier.tier_id,
+                quantity=2,
+                wallet_address=self.wallet.address,
+                idempotency_key='retry-key',
+                user=self.user
+            )
+        
+        with patch(
+            'apps.orders.services.payment_outbox._create_intent',
+            side_effect=RuntimeError('stripe timeout')
+        ):
+            with self.assertRaises(OrderServiceError):
+                create()
+        
+        order = Order.objects.get(site=self.site, buyer=self.user)
+        self.assertEqual(order.status, 'pending')
+        self.assertEqual(order.payment_outbox.status, OrderPaymentOutbox.STATUS_PENDING)
+        
+        # 同一幂等键重试：返回同一订单并完成阶段二
+        with patch(
+            'apps.orders.services.payment_outbox._create_intent',
+            return_value=('pi_retry', 'secret_retry')
+        ):
+            retried, client_secret = create()
+        
+        self.assertEqual(retried.order_id, order.order_id)
+        self.assertEqual(client_secret, 'secret_retry')
+        order.refresh_from_db()
+        self.assertEqual(order.stripe_payment_intent_id, 'pi_retry')
+        self.assertEqual(order.payment_outbox.status, OrderPaymentOutbox.STATUS_CREATED)
+        self.assertEqual(order.payment_outbox.attempts, 2)
+        
+        self.tier.refresh_from_db()
+        self.assertEqual(self.tier.available_units, 98)
+    
+    @override_settings(ORDER_PAYMENT_MAX_ATTEMPTS=1)
+    def test_payment_failure_exhausted_cancels_order(self):
+        """测试尝试次数用尽：取消订单并回补库存，幂等重放不再返回已取消订单"""
+        from unittest.mock import patch
+        from apps.orders.models import OrderPaymentOutbox
+        from apps.orders.services.order_service import OrderServiceError, _create_order
+        
+        def create():
+            return _create_order(
+                site_id=self.site.site_id,
+                tier_id=self.tier.tier_id,
+                quantity=2,
+                wallet_address=self.wallet.address,
+                idempotency_key='exhausted-key',
+                user=self.user
+            )
+        
+        with patch(
+            'apps.orders.services.payment_outbox._create_intent',
+            side_effect=RuntimeError('stripe timeout')
+        ):
+            with self.assertRaises(OrderServiceError):
+                create()
+        
+        order = Order.objects.get(site=self.site, buyer=self.user)
+        self.assertEqual(order.status, 'cancelled')
+        self.assertEqual(order.payment_outbox.status, OrderPaymentOutbox.STATUS_FAILED)
+        
+        with self.assertRaises(OrderServiceError):
+            create()
+        
+        self.tier.refresh_from_db()
+        self.assertEqual(self.tier.available_units, 100)
+    
+    def _create_interrupted_order(self, attempts):
+        from apps.orders.models import OrderPaymentOutbox
+        
+        order = Order.objects.create(
+            site=self.site,
+            buyer=self.user,
+            wallet_address=self.wallet.address,
+            list_price_usd=Decimal('100.00'),
+            discount_usd=Decimal('0'),
+            final_price_usd=Decimal('100.00'),
+            status='pending',
+            expires_at=timezone.now() + timedelta(minutes=15)
+        )
+        OrderItem.objects.create(
+            order=order,
+            tier=self.tier,
+            quantity=1,
+            unit_price_usd=Decimal('100.00'),
+            token_amount=Decimal('1000.00')
+        )
+        OrderPaymentOutbox.objects.create(order=order)
+        OrderPaymentOutbox.objects.filter(order=order).update(
+            attempts=attempts,
+            updated_at=timezone.now() - timedelta(hours=1)
+        )
+        Tier.objects.filter(tier_id=self.tier.tier_id).update(available_units=99)
+        return order
+    
+    def test_recover_interrupted_payment_creation(self):
+        """测试恢复任务重试两阶段之间中断的订单"""
+        from unittest.mock import patch
+        from apps.orders.services.payment_outbox import recover_payment_outbox
+        
+        order = self._create_interrupted_order(attempts=1)
+        
+        with patch(
+            'apps.orders.services.payment_outbox._create_intent',
+            return_value=('pi_recovered', 'secret')
+        ):
+            self.assertEqual(recover_payment_outbox(), {'retried': 1, 'failed': 0})
+        
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'pending')
+        self.assertEqual(order.stripe_payment_intent_id, 'pi_recovered')
+    
+    @override_settings(ORDER_PAYMENT_MAX_ATTEMPTS=3)
+    def test_recover_cancels_exhausted_payment_creation(self):
+        """测试恢复任务：尝试次数用尽时取消订单并回补库存"""
+        from apps.orders.services.payment_outbox import recover_payment_outbox
+        
+        order = self._create_interrupted_order(attempts=3)
+        
+        self.assertEqual(recover_payment_outbox(), {'retried': 0, 'failed': 1})
+        
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'cancelled')
+        self.tier.refresh_from_db()
+        self.assertEqual(self.tier.available_units, 100)
+    
+    @override_settings(INVENTORY_FRONT_BACKEND='memory')
+    def test_front_rejects_inactive_tier(self):
+        """测试前置层已装载的停售档位：拒绝下单并归还预留"""
+        from apps.orders.services.order_service import InventoryError, _create_order
+        from apps.tiers.services.reservations import (
+            get_front_available, prime_inventory_front, reset_inventory_front
+        )
+        
+        reset_inventory_front()
+        self.addCleanup(reset_inventory_front)
+        prime_inventory_front(self.tier.tier_id)
+        Tier.objects.filter(tier_id=self.tier.tier_id).update(is_active=False)
+        
+        with self.assertRaisesMessage(InventoryError, 'TIER.INACTIVE'):
+            _create_order(
+                site_id=self.site.site_id,
+                tier_id=self.tier.tier_id,
+                quantity=1,
+                wallet_address=self.wallet.address,
+                user=self.user
+            )
+        
+        self.assertFalse(Order.objects.filter(buyer=self.user).exists())
+        self.assertEqual(get_front_available(self.tier.tier_id), 100)
+    
+    @override_settings(INVENTORY_FRONT_BACKEND='memory')
+    def test_unconfirmed_reservation_cancels_order(self):
+        """测试预留未能确认：订单取消且不回补库存，不进入支付阶段"""
+        from unittest.mock import patch
+        from apps.orders.models import OrderPaymentOutbox
+        from apps.orders.services.order_service import InventoryError, _create_order
+        from apps.tiers.services.reservations import (
+            get_inventory_front, prime_inventory_front, reset_inventory_front
+        )
+        
+        reset_inventory_front()
+        self.addCleanup(reset_inventory_front)
+        prime_inventory_front(self.tier.tier_id)
+        
+        with patch.object(get_inventory_front(), 'confirm', return_value=False), \
+                patch('apps.orders.services.payment_outbox._create_intent') as create_intent:
+            with self.assertRaisesMessage(InventoryError, 'INVENTORY.INSUFFICIENT'):
+                _create_order(
+                    site_id=self.site.site_id,
+                    tier_id=self.tier.tier_id,
+                    quantity=2,
+                    wallet_address=self.wallet.address,
+                    idempotency_key='unconfirmed-key',
+                    user=self.user
+                )
+        
+        create_intent.assert_not_called()
+        order = Order.objects.get(site=self.site, buyer=self.user)
+        self.assertEqual(order.status, 'cancelled')
+        self.assertEqual(order.payment_outbox.status, OrderPaymentOutbox.STATUS_FAILED)
+        self.tier.refresh_from_db()
+        self.assertEqual(self.tier.available_units, 100)
+    
+    def test_promo_claim_enforces_limits_atomically(self):
+        """测试促销码原子计数：每用户上限 / 总次数上限，用尽后缓存失效"""
+        from apps.orders.models import PromoCode, PromoCodeUserCounter
+        from apps.orders.services.promo_service import claim_promo_usage, validate_promo_code
+        
+        promo = PromoCode.objects.create(
+            site=self.site,
+            code='LAUNCH10',
+            name='Launch',
+            discount_type=PromoCode.DISCOUNT_TYPE_PERCENTAGE,
+            discount_value=Decimal('10'),
+            max_uses=1,
+            uses_per_user=1,
+            valid_from=timezone.now() - timedelta(days=1),
+            valid_until=timezone.now() + timedelta(days=1)
+        )
+        other_user = User.objects.create(referral_code='NA-OTHER1', is_active=True)
+        
+        result = validate_promo_code('launch10', self.site.site_id, self.user, self.tier, Decimal('100'))
+        self.assertTrue(result['valid'])
+        self.assertEqual(result['discount_amount'], Decimal('10.00'))
+        
+        self.assertIsNone(claim_promo_usage(promo, self.user))
+        self.assertEqual(claim_promo_usage(promo, self.user), 'PROMO_CODE_USER_LIMIT_EXCEEDED')
+        self.assertEqual(claim_promo_usage(promo, other_user), 'PROMO_CODE_EXHAUSTED')
+        
+        self.assertEqual(PromoCodeUserCounter.objects.get(promo_code=promo, user=self.user).uses, 1)
+        promo.refresh_from_db()
+        self.assertEqual(promo.current_uses, 1)
+        
+        result = validate_promo_code('LAUNCH10', self.site.site_id, other_user, self.tier, Decimal('100'))
+        self.assertEqual(result['error_code'], 'PROMO_CODE_EXHAUSTED')
+    
+    def test_promo_cache_invalidated_on_model_save(self):
+        """测试促销码直接保存（Django Admin / 脚本）后定义缓存失效"""
+        from apps.orders.models import PromoCode
+        from apps.orders.services.promo_service import validate_promo_code
+        
+        promo = PromoCode.objects.create(
+            site=self.site,
+            code='ADMIN10',
+            name='Admin',
+            discount_type=PromoCode.DISCOUNT_TYPE_PERCENTAGE,
+            discount_value=Decimal('10'),
+            valid_from=timezone.now() - timedelta(days=1),
+            valid_until=timezone.now() + timedelta(days=1)
+        )
+        result = validate_promo_code('ADMIN10', self.site.site_id, self.user, self.tier, Decimal('100'))
+        self.assertTrue(result['valid'])
+        
+        promo.is_active = False
+        promo.save()
+        result = validate_promo_code('ADMIN10', self.site.site_id, self.user, self.tier, Decimal('100'))
+        self.assertEqual(result['error_code'], 'PROMO_CODE_INACTIVE')
+        
+        promo.applicable_tiers.add(self.tier)
+        promo.delete()
+        result = validate_promo_code('ADMIN10', self.site.site_id, self.user, self.tier, Decimal('100'))
+        self.assertEqual(result['error_code'], 'PROMO_CODE_NOT_FOUND')
+    
+    def test_reconcile_promo_counters_resets_orphaned_uses(self):
+        """测试促销码对账：无使用记录的计数器归零"""
+        from apps.orders.models import PromoCode, PromoCodeUserCounter
+        from apps.orders.services.promo_service import claim_promo_usage, reconcile_promo_counters
+        
+        promo = PromoCode.objects.create(
+            site=self.site,
+            code='RECON10',
+            name='Reconcile',
+            discount_type=PromoCode.DISCOUNT_TYPE_PERCENTAGE,
+            discount_value=Decimal('10'),
+            max_uses=5,
+            uses_per_user=2,
+            valid_from=timezone.now() - timedelta(days=1),
+            valid_until=timezone.now() + timedelta(days=1)
+        )
+        
+        # 占用后订单未写入使用记录（如订单已删除）
+        self.assertIsNone(claim_promo_usage(promo, self.user))
+        
+        result = reconcile_promo_counters()
+        
+        self.assertEqual(result, {'global': 1, 'user': 1})
+        promo.refresh_from_db()
+        self.assertEqual(promo.current_uses, 0)
+        self.assertEqual(PromoCodeUserCounter.objects.get(promo_code=promo, user=self.user).uses, 0)
+        
+        # 无漂移时不写入
+        self.assertEqual(reconcile_promo_counters(), {'global': 0, 'user': 0})
+    
+    def test_order_preview_cached_until_tier_definition_changes(self):
+        """测试订单预览缓存：库存变更仍命中，改价后失效"""
+        from django.db.models import F
+        from apps.orders.services.preview_service import get_order_preview
+        from apps.tiers.services.tier_cache import invalidate_tier_definition
+        
+        preview = get_order_preview(self.site.site_id, self.user, self.tier.tier_id, 2)
+        self.assertEqual(preview['pricing']['subtotal'], str(self.tier.list_price_usd * 2))
+        
+        # 库存变更（Tier.version 递增）不影响缓存，命中时零查询
+        Tier.objects.filter(tier_id=self.tier.tier_id).update(
+            available_units=F('available_units') - 1, version=F('version') + 1
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(get_order_preview(self.site.site_id, self.user, self.tier.tier_id, 2), preview)
+        
+        # 改价 + 失效：重新计算
+        Tier.objects.filter(tier_id=self.tier.tier_id).update(list_price_usd=Decimal('200.00'))
+        invalidate_tier_definition(self.site.site_id, self.tier.tier_id)
+        preview = get_order_preview(self.site.site_id, self.user, self.tier.tier_id, 2)
+        self.assertEqual(preview['pricing']['subtotal'], '400.00')
+        
+        # 其他站点不可见
+        other_site = Site.objects.create(code='OTHER', name='Other', domain='other.posx.test', is_active=True)
+        self.assertIsNone(get_order_preview(other_site.site_id, self.user, self.tier.tier_id, 2))
+        
+        # 其他站点的未命中不影响本站
+        invalidate_tier_definition(self.site.site_id, self.tier.tier_id)
+        self.assertIsNone(get_order_preview(other_site.site_id, self.user, self.tier.tier_id, 3))
+        self.assertIsNotNone(get_order_preview(self.site.site_id, self.user, self.tier.tier_id, 3))
+    
     def test_commission_snapshot_created(self):
         """测试佣金快照创建"""
         from apps.orders.services.order_service import create_order
@@ -202,3 +594,72 @@ class OrderE2ETestCase(TransactionTestCase):
         self.assertEqual(snapshot.plan_version, 1)
 
 
+
+
+class OrderIdempotencyCacheTestCase(TestCase):
+    """下单幂等结果缓存测试（不依赖数据库）"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        from types import SimpleNamespace
+        import uuid
+        
+        cache.clear()
+        self.site_id = uuid.uuid4()
+        self.buyer = SimpleNamespace(user_id=uuid.uuid4())
+        self.calls = 0
+    
+    def _create(self):
+        self.calls += 1
+        return Order(order_id=f'00000000-0000-0000-0000-00000000000{self.calls}', status='pending'), f'secret_{self.calls}'
+    
+    def test_replay_returns_cached_client_secret(self):
+        """测试重放命中缓存（含 client_secret），不再执行创建"""
+        from apps.orders.services.idempotency import run_idempotent_create
+        
+        first = run_idempotent_create(self.site_id, 'key-1', self.buyer, self._create)
+        second = run_idempotent_create(self.site_id, 'key-1', self.buyer, self._create)
+        
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(second[1], 'secret_1')
+        self.assertEqual(str(second[0].order_id), str(first[0].order_id))
+    
+    def test_other_buyer_conflicts(self):
+        """测试其他买家复用幂等键"""
+        from types import SimpleNamespace
+        import uuid
+        from apps.orders.services.idempotency import run_idempotent_create
+        from apps.orders.services.order_service import IdempotencyConflictError
+        
+        run_idempotent_create(self.site_id, 'key-2', self.buyer, self._create)
+        
+        with self.assertRaises(IdempotencyConflictError):
+            run_idempotent_create(
+                self.site_id, 'key-2', SimpleNamespace(user_id=uuid.uuid4()), self._create
+            )
+    
+    def test_in_flight_request_times_out(self):
+        """测试首个请求进行中：等待超时返回冲突"""
+        from django.test import override_settings
+        from apps.orders.services.idempotency import _acquire_lock, _lock_key, run_idempotent_create
+        from apps.orders.services.order_service import IdempotencyConflictError
+        
+        _acquire_lock(_lock_key(self.site_id, 'key-3'), 'first-request')
+        
+        with override_settings(ORDER_IDEMPOTENCY_WAIT_SECONDS=0):
+            with self.assertRaises(IdempotencyConflictError):
+                run_idempotent_create(self.site_id, 'key-3', self.buyer, self._create)
+        self.assertEqual(self.calls, 0)
+    
+    def test_release_keeps_lock_taken_by_other_request(self):
+        """测试锁过期后被其他请求取得：原持有者释放时不删除"""
+        from apps.orders.services.idempotency import _acquire_lock, _lock_key, _release_lock
+        
+        lock_key = _lock_key(self.site_id, 'key-4')
+        self.assertTrue(_acquire_lock(lock_key, 'second-request'))
+        
+        _release_lock(lock_key, 'expired-request')
+        self.assertFalse(_acquire_lock(lock_key, 'third-request'))
+        
+        _release_lock(lock_key, 'second-request')
+        self.assertTrue(_acquire_lock(lock_key, 'third-request'))
@@ -26,7 +26,7 @@ from .serializers import (
     OrderListSerializer,
     OrderCancelRequestSerializer,
 )
-from .services.order_service import create_order, cancel_order
+from .services.order_service import create_order, cancel_order, IdempotencyConflictError
 
 logger = logging.getLogger(__name__)
 
@@ -170,7 +170,10 @@ class OrderViewSet(viewsets.ReadOnlyModelViewSet):
             # 根据错误类型返回适当的响应
             error_message = str(e)
             
-            if 'INVENTORY' in error_message:
+            if isinstance(e, IdempotencyConflictError):
+                error_code = 'ORDERS.IDEMPOTENCY_CONFLICT'
+                http_status = status.HTTP_409_CONFLICT
+            elif 'INVENTORY' in error_message:
                 error_code = 'INVENTORY.CONFLICT'
                 http_status = status.HTTP_409_CONFLICT
             elif 'TIER' in error_message:
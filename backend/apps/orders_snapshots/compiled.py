@@ -0,0 +1,238 @@
+"""
+佣金计划编译
+
+⭐ 核心功能：
+- 快照写入时规范化 + 校验 tiers_json（格式错误在下单时失败，而非在 Celery 重试中）
+- 佣金计算使用编译后的计划对象（__slots__，Decimal 预解析）
+- 编译结果按快照层级内容（规范化配置哈希）进程内缓存
+  ⚠️ 不能只按 plan_version：tiers_bulk 等接口追加层级不递增版本，同一版本的快照内容可能不同
+
+规范化格式（tiers_normalized）：
+[
+    {"level": 1, "rate_percent": "12.00", "min_sales": "0", "hold_days": 7, "diff_cap_percent": null},
+    ...
+]
+"""
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 默认锁定天数（与历史 tiers_json 缺省值一致）
+DEFAULT_HOLD_DAYS = 7
+
+# 编译缓存容量
+COMPILED_PLAN_CACHE_SIZE = 256
+
+
+class PlanValidationError(ValueError):
+    """佣金计划层级配置无效"""
+    pass
+
+
+def _parse_decimal(value, field: str, level: int) -> Decimal:
+    try:
+        result = Decimal(str(value))
+    except (InvalidOperation, TypeError, ValueError):
+        raise PlanValidationError(f"L{level} {field} is not a valid decimal: {value!r}")
+    if not result.is_finite():
+        raise PlanValidationError(f"L{level} {field} is not a valid decimal: {value!r}")
+    return result
+
+
+def normalize_tiers(tiers_json) -> List[dict]:
+    """
+    规范化并校验层级配置
+
+    规则：
+    - 按 level 排序，level 必须为 1..N 连续（缺省时按位置）
+    - rate_percent 必填，0 ~ 100
+    - min_sales 兼容 min_order_amount，缺省 0，不能为负
+    - hold_days 缺省 7，非负整数
+    - diff_cap_percent 可选，0 ~ 100
+
+    Args:
+        tiers_json: 原始层级配置（list of dict）
+
+    Returns:
+        List[dict]: 规范化层级配置（JSON 可序列化）
+
+    Raises:
+        PlanValidationError: 配置无效
+    """
+    if not isinstance(tiers_json, list):
+        raise PlanValidationError("tiers_json must be a list")
+
+    for index, tier in enumerate(tiers_json):
+        if not isinstance(tier, dict):
+            raise PlanValidationError(f"Tier #{index + 1} must be an object")
+
+    ordered = sorted(
+        enumerate(tiers_json),
+        key=lambda item: (item[1].get('level', item[0] + 1), item[0])
+    )
+
+    normalized = []
+    for position, (_, tier) in enumerate(ordered, start=1):
+        level = tier.get('level', position)
+        if isinstance(level, bool) or not isinstance(level, int) or level != position:
+            raise PlanValidationError(
+                f"Tier levels must be contiguous from 1, got {level!r} at position {position}"
+            )
+
+        if tier.get('rate_percent') in (None, ''):
+            raise PlanValidationError(f"L{level} rate_percent is required")
+        rate_percent = _parse_decimal(tier['rate_percent'], 'rate_percent', level)
+        if rate_percent < 0 or rate_percent > 100:
+            raise PlanValidationError(f"L{level} rate_percent must be between 0 and 100")
+
+        min_sales = _parse_decimal(
+            tier.get('min_sales') or tier.get('min_order_amount') or '0',
+            'min_sales',
+            level
+        )
+        if min_sales < 0:
+            raise PlanValidationError(f"L{level} min_sales must not be negative")
+
+        hold_days = tier.get('hold_days', DEFAULT_HOLD_DAYS)
+        if hold_days is None:
+            hold_days = DEFAULT_HOLD_DAYS
+        if isinstance(hold_days, bool) or not isinstance(hold_days, int) or hold_days < 0:
+            raise PlanValidationError(f"L{level} hold_days must be a non-negative integer")
+
+        diff_cap_percent = tier.get('diff_cap_percent')
+        if diff_cap_percent in (None, ''):
+            diff_cap_percent = None
+        else:
+            diff_cap_percent = _parse_decimal(diff_cap_percent, 'diff_cap_percent', level)
+            if diff_cap_percent < 0 or diff_cap_percent > 100:
+                raise PlanValidationError(f"L{level} diff_cap_percent must be between 0 and 100")
+
+        normalized.append({
+            'level': level,
+            'rate_percent': str(rate_percent),
+            'min_sales': str(min_sales),
+            'hold_days': hold_days,
+            'diff_cap_percent': str(diff_cap_percent) if diff_cap_percent is not None else None,
+        })
+
+    return normalized
+
+
+class CompiledTier:
+    """编译后的单级配置"""
+
+    __slots__ = (
+        'level',
+        'rate_percent',
+        'rate_fraction',
+        'min_sales',
+        'hold_days',
+        'hold_delta',
+        'diff_cap_percent',
+    )
+
+    def __init__(self, normalized: dict):
+        self.level = normalized['level']
+        self.rate_percent = Decimal(normalized['rate_percent'])
+        self.rate_fraction = self.rate_percent / Decimal('100')
+        self.min_sales = Decimal(normalized['min_sales'])
+        self.hold_days = normalized['hold_days']
+        self.hold_delta = timedelta(days=self.hold_days)
+        self.diff_cap_percent = (
+            Decimal(normalized['diff_cap_percent'])
+            if normalized['diff_cap_percent'] is not None else None
+        )
+
+
+class CompiledPlan:
+    """编译后的佣金计划（只读，可跨订单共享）"""
+
+    __slots__ = ('plan_id', 'plan_version', 'plan_mode', 'tiers')
+
+    def __init__(self, plan_id, plan_version: int, plan_mode: str, normalized_tiers: List[dict]):
+        self.plan_id = plan_id
+        self.plan_version = plan_version
+        self.plan_mode = plan_mode
+        self.tiers: Tuple[CompiledTier, ...] = tuple(
+            CompiledTier(tier) for tier in normalized_tiers
+        )
+
+    @property
+    def max_levels(self) -> int:
+        return len(self.tiers)
+
+    def tier(self, level: int) -> Optional[CompiledTier]:
+        """获取层级配置（超出配置层级返回 None）"""
+        if 1 <= level <= len(self.tiers):
+            return self.tiers[level - 1]
+        return None
+
+
+_compiled_plans: "OrderedDict[tuple, CompiledPlan]" = OrderedDict()
+_compiled_plans_lock = threading.Lock()
+
+
+def _tiers_digest(snapshot) -> str:
+    """快照层级内容哈希（规范化配置优先，历史快照使用原始 tiers_json）"""
+    if snapshot.tiers_normalized is not None:
+        source = ('normalized', snapshot.tiers_normalized)
+    else:
+        source = ('raw', snapshot.tiers_json)
+    body = json.dumps(source, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def compile_snapshot(snapshot) -> CompiledPlan:
+    """
+    获取快照对应的编译计划
+
+    ⭐ 按 (plan_id, plan_version, plan_mode, 层级内容哈希) 缓存（LRU）：同一版本内容不同不会复用
+    ⭐ 优先使用 tiers_normalized；历史快照回退规范化 tiers_json
+
+    Args:
+        snapshot: OrderCommissionPolicySnapshot 实例
+
+    Returns:
+        CompiledPlan
+
+    Raises:
+        PlanValidationError: 历史快照 tiers_json 无效
+    """
+    cache_key = (snapshot.plan_id, snapshot.plan_version, snapshot.plan_mode, _tiers_digest(snapshot))
+
+    with _compiled_plans_lock:
+        plan = _compiled_plans.get(cache_key)
+        if plan is not None:
+            _compiled_plans.move_to_end(cache_key)
+            return plan
+
+    normalized = snapshot.tiers_normalized
+    if normalized is None:
+        normalized = normalize_tiers(snapshot.tiers_json)
+
+    plan = CompiledPlan(
+        plan_id=snapshot.plan_id,
+        plan_version=snapshot.plan_version,
+        plan_mode=snapshot.plan_mode,
+        normalized_tiers=normalized
+    )
+
+    with _compiled_plans_lock:
+        _compiled_plans[cache_key] = plan
+        while len(_compiled_plans) > COMPILED_PLAN_CACHE_SIZE:
+            _compiled_plans.popitem(last=False)
+
+    return plan
+
+
+def clear_compiled_plans() -> None:
+    """清空编译缓存（测试用）"""
+    with _compiled_plans_lock:
+        _compiled_plans.clear()
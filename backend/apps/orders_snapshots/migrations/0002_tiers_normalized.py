@@ -0,0 +1,20 @@
+"""
+快照规范化层级配置
+写入快照时保存已校验的 tiers_normalized，佣金计算不再逐级解析 tiers_json
+"""
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders_snapshots', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ordercommissionpolicysnapshot',
+            name='tiers_normalized',
+            field=models.JSONField(blank=True, help_text='规范化层级配置（已校验，佣金计算使用）', null=True),
+        ),
+    ]
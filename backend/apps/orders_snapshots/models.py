@@ -32,6 +32,8 @@ class OrderCommissionPolicySnapshot(models.Model):
           {"level": 2, "rate_percent": "5.00", "hold_days": 7, ...},
           ...
       ]
+    - tiers_normalized: 规范化 + 校验后的层级配置（写入时生成，见 compiled.normalize_tiers）
+      历史快照为空，计算时回退规范化 tiers_json
     """
     
     snapshot_id = models.UUIDField(
@@ -66,6 +68,11 @@ class OrderCommissionPolicySnapshot(models.Model):
     tiers_json = models.JSONField(
         help_text="层级配置（JSONB 格式）"
     )
+    tiers_normalized = models.JSONField(
+        null=True,
+        blank=True,
+        help_text="规范化层级配置（已校验，佣金计算使用）"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -9,6 +9,7 @@ from typing import Optional
 from django.utils import timezone
 from django.db.models import Q
 from apps.commission_plans.models import CommissionPlan
+from .compiled import PlanValidationError, normalize_tiers
 from .models import OrderCommissionPolicySnapshot
 import uuid
 
@@ -24,7 +25,8 @@ class OrderSnapshotService:
         流程：
         1. 查询当前生效的佣金计划（按 effective_from/to 和 is_active）
         2. 序列化计划和层级配置为 JSONB
-        3. 创建快照记录
+        3. 规范化 + 校验层级配置（tiers_normalized）
+        4. 创建快照记录
         
         Args:
             order_id: 订单ID
@@ -32,6 +34,9 @@ class OrderSnapshotService:
         
         Returns:
             OrderCommissionPolicySnapshot 实例或 None
+        
+        Raises:
+            PlanValidationError: 计划层级配置无效（下单失败，而非佣金任务失败）
         """
         # 查询当前生效的计划
         now = timezone.now()
@@ -61,6 +66,9 @@ class OrderSnapshotService:
                     'hold_days': tier.hold_days,
                 })
             
+            # ⭐ 规范化 + 校验（格式错误在此失败）
+            tiers_normalized = normalize_tiers(tiers_data)
+            
             # 创建快照
             snapshot = OrderCommissionPolicySnapshot.objects.create(
                 order_id=order_id,
@@ -70,10 +78,14 @@ class OrderSnapshotService:
                 plan_mode=plan.mode,
                 diff_reward_enabled=plan.diff_reward_enabled,
                 tiers_json=tiers_data,
+                tiers_normalized=tiers_normalized,
             )
             
             return snapshot
             
+        except PlanValidationError:
+            raise
+        
         except Exception as e:
             # 记录错误（可用日志）
             print(f"Failed to create snapshot for order {order_id}: {e}")
@@ -0,0 +1,122 @@
+"""
+Compiled Commission Plan Tests
+
+测试范围：
+1. tiers_json 规范化 + 校验
+2. 编译计划（__slots__ 层级对象）
+3. 按快照层级内容缓存
+"""
+import pytest
+from datetime import timedelta
+from decimal import Decimal
+from uuid import uuid4
+
+from apps.orders_snapshots.compiled import (
+    CompiledTier,
+    PlanValidationError,
+    clear_compiled_plans,
+    compile_snapshot,
+    normalize_tiers,
+)
+from apps.orders_snapshots.models import OrderCommissionPolicySnapshot
+
+
+def _snapshot(tiers_json, plan_id=None, plan_version=1, tiers_normalized=None):
+    return OrderCommissionPolicySnapshot(
+        order_id=uuid4(),
+        plan_id=plan_id or uuid4(),
+        plan_name='Compiled Plan',
+        plan_version=plan_version,
+        plan_mode='level',
+        tiers_json=tiers_json,
+        tiers_normalized=tiers_normalized,
+    )
+
+
+class TestNormalizeTiers:
+    """测试层级配置规范化"""
+
+    def test_defaults_and_field_compatibility(self):
+        """min_order_amount 兼容、hold_days 默认、按 level 排序"""
+        normalized = normalize_tiers([
+            {'level': 2, 'rate_percent': '4.00', 'min_order_amount': '500.00'},
+            {'level': 1, 'rate_percent': '12.00', 'min_sales': '0', 'hold_days': 14},
+        ])
+
+        assert normalized == [
+            {'level': 1, 'rate_percent': '12.00', 'min_sales': '0', 'hold_days': 14, 'diff_cap_percent': None},
+            {'level': 2, 'rate_percent': '4.00', 'min_sales': '500.00', 'hold_days': 7, 'diff_cap_percent': None},
+        ]
+
+    @pytest.mark.parametrize('tiers', [
+        [{'level': 1}],
+        [{'level': 1, 'rate_percent': 'abc'}],
+        [{'level': 1, 'rate_percent': '120'}],
+        [{'level': 1, 'rate_percent': '5', 'min_sales': '-1'}],
+        [{'level': 1, 'rate_percent': '5', 'hold_days': '7'}],
+        [{'level': 1, 'rate_percent': '5'}, {'level': 3, 'rate_percent': '2'}],
+        [{'level': 1, 'rate_percent': '5', 'diff_cap_percent': 'NaN'}],
+        {'level': 1, 'rate_percent': '5'},
+    ])
+    def test_invalid_tiers_rejected(self, tiers):
+        with pytest.raises(PlanValidationError):
+            normalize_tiers(tiers)
+
+
+class TestCompileSnapshot:
+    """测试编译计划"""
+
+    def setup_method(self):
+        clear_compiled_plans()
+
+    def test_compiled_tiers(self):
+        plan = compile_snapshot(_snapshot([
+            {'level': 1, 'rate_percent': '12.00', 'hold_days': 3, 'diff_cap_percent': '8'},
+        ]))
+
+        tier = plan.tier(1)
+        assert isinstance(tier, CompiledTier)
+        assert not hasattr(tier, '__dict__')
+        assert tier.rate_fraction == Decimal('0.12')
+        assert tier.hold_delta == timedelta(days=3)
+        assert tier.diff_cap_percent == Decimal('8')
+        assert plan.tier(2) is None
+        assert plan.max_levels == 1
+
+    def test_cached_by_plan_version(self):
+        plan_id = uuid4()
+        tiers = [{'level': 1, 'rate_percent': '12.00'}]
+
+        first = compile_snapshot(_snapshot(tiers, plan_id=plan_id, plan_version=1))
+        again = compile_snapshot(_snapshot(tiers, plan_id=plan_id, plan_version=1))
+        bumped = compile_snapshot(_snapshot(
+            [{'level': 1, 'rate_percent': '10.00'}], plan_id=plan_id, plan_version=2
+        ))
+
+        assert again is first
+        assert bumped is not first
+        assert bumped.tier(1).rate_percent == Decimal('10.00')
+
+    def test_same_version_different_tiers_not_shared(self):
+        """同一版本追加层级（tiers_bulk 不递增版本）不复用旧编译结果"""
+        plan_id = uuid4()
+
+        first = compile_snapshot(_snapshot(
+            [{'level': 1, 'rate_percent': '12.00'}], plan_id=plan_id, plan_version=1
+        ))
+        extended = compile_snapshot(_snapshot(
+            [{'level': 1, 'rate_percent': '12.00'}, {'level': 2, 'rate_percent': '4.00'}],
+            plan_id=plan_id,
+            plan_version=1
+        ))
+
+        assert first.max_levels == 1
+        assert extended.max_levels == 2
+
+    def test_prefers_normalized_tiers(self):
+        plan = compile_snapshot(_snapshot(
+            tiers_json=[{'level': 1, 'rate_percent': 'legacy'}],
+            tiers_normalized=normalize_tiers([{'level': 1, 'rate_percent': '5'}]),
+        ))
+
+        assert plan.tier(1).rate_percent == Decimal('5')
@@ -8,3 +8,7 @@ class SitesConfig(AppConfig):
 
 
 
+    
+    def ready(self):
+        """Import signals when app is ready"""
+        import apps.sites.signals  # noqa: F401
@@ -0,0 +1,58 @@
+"""
+站点注册表（进程内缓存）
+
+⭐ SiteContextMiddleware 每个请求解析站点，不再查询数据库：
+- 全部激活站点一次加载，按 code / domain 建索引（VersionedLocalCache 单 Key）
+- 未知 code / 域名直接返回 None（负缓存：注册表即全集，无需逐个记录）
+- 站点保存 / 删除后（signals.py）invalidate_site_registry，
+  其他进程下次请求时发现版本变化并重新加载
+- Worker 启动时预热（中间件初始化调用 warm_site_registry）
+
+⚠️ 返回的 Site 实例在线程间共享，只读使用
+"""
+import logging
+from typing import Dict
+
+from apps.core.utils.local_cache import VersionedLocalCache
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_KEY = 'active'
+
+
+def _load_registry(key: str) -> Dict[str, Dict]:
+    """加载全部激活站点：{'by_code': {...}, 'by_domain': {...}}"""
+    from apps.sites.models import Site
+
+    sites = list(Site.objects.filter(is_active=True))
+    return {
+        'by_code': {site.code: site for site in sites},
+        'by_domain': {site.domain.lower(): site for site in sites},
+    }
+
+
+_registry_cache = VersionedLocalCache('site_registry', loader=_load_registry)
+
+
+def get_site_by_code(code: str):
+    """按站点代码解析激活站点（不存在 / 未激活返回 None）"""
+    return _registry_cache.get(REGISTRY_KEY)['by_code'].get(code)
+
+
+def get_site_by_domain(domain: str):
+    """按域名解析激活站点（不存在 / 未激活返回 None）"""
+    return _registry_cache.get(REGISTRY_KEY)['by_domain'].get(domain.lower())
+
+
+def invalidate_site_registry() -> None:
+    """站点变更后调用（所有进程重新加载）"""
+    _registry_cache.invalidate(REGISTRY_KEY)
+
+
+def warm_site_registry() -> None:
+    """预热注册表（启动时；数据库未就绪时跳过，首个请求再加载）"""
+    try:
+        registry = _registry_cache.get(REGISTRY_KEY)
+        logger.info(f"Site registry loaded: {len(registry['by_code'])} sites")
+    except Exception as e:
+        logger.warning(f"Site registry warm-up skipped: {e}")
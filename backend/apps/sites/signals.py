@@ -0,0 +1,24 @@
+"""
+Site 信号处理
+
+⭐ 站点变更（SiteViewSet / Django Admin / 脚本）→ 事务提交后失效进程内站点注册表
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.sites.models import Site
+
+
+@receiver([post_save, post_delete], sender=Site)
+def invalidate_site_registry_on_change(sender, instance, **kwargs):
+    """
+    站点变更后失效注册表
+    
+    ⭐ 立即失效（本连接后续请求可见新站点）+ 提交后再次失效
+      （避免其他进程在提交前读到旧数据并缓存为新版本）
+    """
+    from apps.sites.services.site_registry import invalidate_site_registry
+    
+    invalidate_site_registry()
+    transaction.on_commit(invalidate_site_registry)
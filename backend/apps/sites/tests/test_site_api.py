@@ -156,3 +156,32 @@ class TestSiteAPI:
         assert 'agents' in response.data
         assert 'commissions' in response.data
 
+
+
+@pytest.mark.django_db
+class TestSiteRegistry:
+    """测试站点注册表（进程内缓存 + 负缓存 + 变更失效）"""
+    
+    def test_resolve_without_queries(self, site, django_assert_num_queries):
+        """测试已加载注册表后解析站点不查询数据库"""
+        from apps.sites.services.site_registry import get_site_by_code, get_site_by_domain
+        
+        assert get_site_by_code(site.code).site_id == site.site_id
+        
+        with django_assert_num_queries(0):
+            assert get_site_by_domain(site.domain.upper()).site_id == site.site_id
+            assert get_site_by_code('UNKNOWN') is None
+            assert get_site_by_domain('unknown.example.com') is None
+    
+    def test_registry_invalidated_on_site_change(self, site):
+        """测试停用 / 新建站点后注册表失效"""
+        from apps.sites.services.site_registry import get_site_by_code
+        
+        assert get_site_by_code(site.code) is not None
+        
+        site.is_active = False
+        site.save(update_fields=['is_active'])
+        assert get_site_by_code(site.code) is None
+        
+        Site.objects.create(code='NEW', name='New Site', domain='new.example.com', is_active=True)
+        assert get_site_by_code('NEW') is not None
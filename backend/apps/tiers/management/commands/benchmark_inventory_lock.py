@@ -0,0 +1,124 @@
+"""
+库存锁定争用压测
+
+⭐ 临时站点 + 档位，N 个并发买家线程持续锁定 1 单位直至售罄，
+  输出 orders/sec 与锁定延迟分位数，结束后删除临时数据
+
+⚠️ 直接写数据库：仅在本地 / 压测环境执行
+
+用法：
+    python manage.py benchmark_inventory_lock --buyers 32 --units 5000
+    python manage.py benchmark_inventory_lock --buyers 64 --units 5000 --shards 16
+"""
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from apps.sites.models import Site
+from apps.tiers.models import Tier
+from apps.tiers.services.inventory import reserve_tier_units
+from apps.tiers.services.inventory_shards import MAX_INVENTORY_SHARDS, enable_inventory_sharding
+
+
+class Command(BaseCommand):
+    help = '库存锁定争用压测（N 个并发买家，输出 orders/sec）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=32, help='并发买家数')
+        parser.add_argument('--units', type=int, default=2000, help='档位库存（售罄即结束）')
+        parser.add_argument(
+            '--shards',
+            type=int,
+            default=0,
+            help=f'库存分片数（0=不分片，最大 {MAX_INVENTORY_SHARDS}）'
+        )
+
+    def handle(self, *args, **options):
+        buyers = options['buyers']
+        units = options['units']
+        shards = options['shards']
+
+        if buyers < 1 or units < 1:
+            raise CommandError("--buyers and --units must be >= 1")
+
+        suffix = uuid.uuid4().hex[:8]
+        site = Site.objects.create(
+            code=f'BM{suffix[:4].upper()}',
+            name=f'Inventory benchmark {suffix}',
+            domain=f'benchmark-{suffix}.posx.test',
+            is_active=True
+        )
+
+        try:
+            tier = Tier.objects.create(
+                site=site,
+                name='Benchmark Tier',
+                list_price_usd=Decimal('1.00'),
+                tokens_per_unit=Decimal('1.00'),
+                total_units=units,
+                sold_units=0,
+                available_units=units,
+                is_active=True
+            )
+            if shards:
+                try:
+                    enable_inventory_sharding(tier.tier_id, shards)
+                except ValueError as e:
+                    raise CommandError(str(e))
+
+            latencies, elapsed, errors = self._run(tier.tier_id, buyers)
+        finally:
+            site.delete()
+
+        sold = len(latencies)
+        latencies_ms = sorted(latency * 1000 for latency in latencies)
+
+        self.stdout.write(f"buyers={buyers} units={units} shards={shards}")
+        self.stdout.write(f"sold={sold} errors={errors} elapsed={elapsed:.2f}s")
+        self.stdout.write(self.style.SUCCESS(f"✅ {sold / elapsed:.1f} orders/sec"))
+        if latencies_ms:
+            self.stdout.write(
+                f"latency p50={statistics.median(latencies_ms):.2f}ms "
+                f"p99={latencies_ms[max(int(len(latencies_ms) * 0.99) - 1, 0)]:.2f}ms "
+                f"max={latencies_ms[-1]:.2f}ms"
+            )
+
+    def _run(self, tier_id, buyers: int):
+        """并发买家循环锁定 1 单位直至售罄"""
+        latencies = []
+        errors = [0]
+        mutex = threading.Lock()
+        start_gate = threading.Barrier(buyers)
+
+        def buyer():
+            try:
+                start_gate.wait()
+                while True:
+                    started = time.perf_counter()
+                    try:
+                        tier, error_code = reserve_tier_units(tier_id, 1)
+                    except Exception:
+                        # 重试耗尽：该买家退出
+                        with mutex:
+                            errors[0] += 1
+                        return
+                    if tier is None:
+                        return
+                    with mutex:
+                        latencies.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=buyers) as executor:
+            for future in [executor.submit(buyer) for _ in range(buyers)]:
+                future.result()
+        elapsed = time.perf_counter() - started
+
+        return latencies, elapsed, errors[0]
@@ -0,0 +1,58 @@
+"""
+装载 / 卸载档位到库存预留前置层
+
+⭐ 限时抢购开售前装载（以 DB 可用库存为准），活动结束 / 停售前卸载
+
+用法：
+    python manage.py inventory_front prime <tier_id>
+    python manage.py inventory_front drain <tier_id>
+    python manage.py inventory_front settle
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.tiers.models import Tier
+from apps.tiers.services.reservations import (
+    drain_inventory_front,
+    prime_inventory_front,
+    settle_inventory_front,
+)
+
+
+class Command(BaseCommand):
+    help = '装载 / 卸载 / 结算档位库存预留前置层'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['prime', 'drain', 'settle'], help='操作')
+        parser.add_argument('tier_id', nargs='?', help='档位ID（prime / drain 必填）')
+
+    def handle(self, *args, **options):
+        action = options['action']
+        tier_id = options['tier_id']
+
+        if action == 'settle':
+            result = settle_inventory_front(wait=getattr(settings, 'INVENTORY_SETTLEMENT_LOCK_WAIT', 30))
+            if result.get('skipped'):
+                raise CommandError("Inventory settlement is already running")
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ Settled {result['settled']} entries, expired {result['expired']} reservations, "
+                f"drift corrected on {len(result['drift'])} tiers"
+            ))
+            return
+
+        if not tier_id:
+            raise CommandError(f"tier_id is required for {action}")
+        if not Tier.objects.filter(tier_id=tier_id).exists():
+            raise CommandError(f"Tier not found: {tier_id}")
+
+        if action == 'drain':
+            drain_inventory_front(tier_id)
+            self.stdout.write(self.style.SUCCESS(f"✅ Tier {tier_id} drained from inventory front"))
+            return
+
+        try:
+            stock = prime_inventory_front(tier_id)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f"✅ Tier {tier_id} primed, stock={stock}"))
@@ -0,0 +1,53 @@
+"""
+开启 / 调整 / 关闭档位库存分片
+
+⭐ 开售前为热门档位开启分片，售罄或活动结束后关闭
+
+用法：
+    python manage.py shard_tier_inventory <tier_id> --shards 16
+    python manage.py shard_tier_inventory <tier_id> --shards 0   # 关闭
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.tiers.models import Tier
+from apps.tiers.services.inventory_shards import (
+    MAX_INVENTORY_SHARDS,
+    disable_inventory_sharding,
+    enable_inventory_sharding,
+)
+
+
+class Command(BaseCommand):
+    help = '开启 / 调整 / 关闭档位库存分片计数器'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tier_id', help='档位ID')
+        parser.add_argument(
+            '--shards',
+            type=int,
+            required=True,
+            help=f'分片数（0=关闭，最大 {MAX_INVENTORY_SHARDS}）'
+        )
+
+    def handle(self, *args, **options):
+        tier_id = options['tier_id']
+        shards = options['shards']
+
+        if not Tier.objects.filter(tier_id=tier_id).exists():
+            raise CommandError(f"Tier not found: {tier_id}")
+
+        if shards == 0:
+            available = disable_inventory_sharding(tier_id)
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ Sharding disabled for {tier_id}, available={available}"
+            ))
+            return
+
+        try:
+            available = enable_inventory_sharding(tier_id, shards)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Tier {tier_id} split into {shards} shards, available={available}"
+        ))
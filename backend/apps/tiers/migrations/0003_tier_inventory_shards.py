@@ -0,0 +1,50 @@
+# Generated manually for sharded tier inventory counters
+
+import uuid
+from django.db import migrations, models
+import django.core.validators
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tiers', '0002_add_tier_promotions'),
+    ]
+
+    operations = [
+        # 档位分片数（0=不分片）
+        migrations.AddField(
+            model_name='tier',
+            name='inventory_shards',
+            field=models.PositiveSmallIntegerField(
+                default=0,
+                help_text='库存分片数（0=不分片；>0 时 available_units 为展示快照，以分片合计为准）'
+            ),
+        ),
+        
+        # 库存分片子计数器
+        migrations.CreateModel(
+            name='TierInventoryShard',
+            fields=[
+                ('shard_id', models.UUIDField(default=uuid.uuid4, editable=False, help_text='分片ID', primary_key=True, serialize=False)),
+                ('shard_index', models.PositiveSmallIntegerField(help_text='分片序号（0 起）')),
+                ('available_units', models.IntegerField(default=0, help_text='分片可用库存', validators=[django.core.validators.MinValueValidator(0)])),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('tier', models.ForeignKey(help_text='所属档位', on_delete=django.db.models.deletion.CASCADE, related_name='inventory_shard_rows', to='tiers.tier')),
+            ],
+            options={
+                'verbose_name': 'Tier Inventory Shard',
+                'verbose_name_plural': 'Tier Inventory Shards',
+                'db_table': 'tier_inventory_shards',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='tierinventoryshard',
+            constraint=models.UniqueConstraint(fields=('tier', 'shard_index'), name='uq_tier_inventory_shard_index'),
+        ),
+        migrations.AddConstraint(
+            model_name='tierinventoryshard',
+            constraint=models.CheckConstraint(check=models.Q(('available_units__gte', 0)), name='chk_tier_inventory_shard_non_negative'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated manually for the inventory reservation front settlement log
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tiers', '0003_tier_inventory_shards'),
+    ]
+
+    operations = [
+        # 前置层结算记录（entry_id 去重，恰好一次写入 tiers）
+        migrations.CreateModel(
+            name='InventorySettlement',
+            fields=[
+                ('entry_id', models.UUIDField(help_text='结算记录ID（前置层生成）', primary_key=True, serialize=False)),
+                ('delta', models.IntegerField(help_text='库存变动（负数=扣减，正数=回补）')),
+                ('settled_at', models.DateTimeField(default=django.utils.timezone.now, help_text='结算时间')),
+                ('tier', models.ForeignKey(help_text='所属档位', on_delete=django.db.models.deletion.CASCADE, related_name='inventory_settlements', to='tiers.tier')),
+            ],
+            options={
+                'verbose_name': 'Inventory Settlement',
+                'verbose_name_plural': 'Inventory Settlements',
+                'db_table': 'inventory_settlements',
+                'indexes': [models.Index(fields=['settled_at'], name='inventory_settlement_time_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated manually for Tier Inventory Shard RLS
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    为库存分片表启用 RLS (Row Level Security)
+    
+    ⚠️ 重要：
+    - 没有直接的 site_id，通过 tier 关联站点隔离（与 tiers 表策略一致）
+    - Admin 角色可以查看所有站点数据（使用 admin 连接）
+    """
+
+    dependencies = [
+        ('tiers', '0004_inventory_settlements'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                -- ========== TierInventoryShard 表 RLS ==========
+                
+                -- 1. 启用 RLS（强制执行）
+                ALTER TABLE tier_inventory_shards ENABLE ROW LEVEL SECURITY;
+                ALTER TABLE tier_inventory_shards FORCE ROW LEVEL SECURITY;
+                
+                -- 2. 创建策略：通过 tier 关联站点隔离
+                CREATE POLICY rls_tier_inventory_shards_site_isolation ON tier_inventory_shards
+                    FOR ALL
+                    USING (
+                        tier_id IN (
+                            SELECT tier_id FROM tiers
+                            WHERE site_id = current_setting('app.current_site_id', true)::uuid
+                        )
+                    )
+                    WITH CHECK (
+                        tier_id IN (
+                            SELECT tier_id FROM tiers
+                            WHERE site_id = current_setting('app.current_site_id', true)::uuid
+                        )
+                    );
+                
+                -- 3. 创建策略：Admin 只读
+                CREATE POLICY rls_tier_inventory_shards_admin_read ON tier_inventory_shards
+                    FOR SELECT
+                    USING (current_user = 'posx_admin');
+            """,
+            reverse_sql="""
+                -- 回滚：禁用 RLS 并删除策略
+                DROP POLICY IF EXISTS rls_tier_inventory_shards_admin_read ON tier_inventory_shards;
+                DROP POLICY IF EXISTS rls_tier_inventory_shards_site_isolation ON tier_inventory_shards;
+                ALTER TABLE tier_inventory_shards DISABLE ROW LEVEL SECURITY;
+            """
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated manually for Inventory Settlement RLS
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    为库存结算表启用 RLS (Row Level Security)
+    
+    ⚠️ 重要：
+    - 没有直接的 site_id，通过 tier 关联站点隔离（与 tiers 表策略一致）
+    - Admin 角色可以查看所有站点数据（使用 admin 连接）
+    - 前置层结算（跨站点）须以可绕过 RLS 的连接执行（与写入 tiers 相同）
+    """
+
+    dependencies = [
+        ('tiers', '0005_enable_tier_inventory_shards_rls'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                -- ========== InventorySettlement 表 RLS ==========
+                
+                -- 1. 启用 RLS（强制执行）
+                ALTER TABLE inventory_settlements ENABLE ROW LEVEL SECURITY;
+                ALTER TABLE inventory_settlements FORCE ROW LEVEL SECURITY;
+                
+                -- 2. 创建策略：通过 tier 关联站点隔离
+                CREATE POLICY rls_inventory_settlements_site_isolation ON inventory_settlements
+                    FOR ALL
+                    USING (
+                        tier_id IN (
+                            SELECT tier_id FROM tiers
+                            WHERE site_id = current_setting('app.current_site_id', true)::uuid
+                        )
+                    )
+                    WITH CHECK (
+                        tier_id IN (
+                            SELECT tier_id FROM tiers
+                            WHERE site_id = current_setting('app.current_site_id', true)::uuid
+                        )
+                    );
+                
+                -- 3. 创建策略：Admin 只读
+                CREATE POLICY rls_inventory_settlements_admin_read ON inventory_settlements
+                    FOR SELECT
+                    USING (current_user = 'posx_admin');
+            """,
+            reverse_sql="""
+                -- 回滚：禁用 RLS 并删除策略
+                DROP POLICY IF EXISTS rls_inventory_settlements_admin_read ON inventory_settlements;
+                DROP POLICY IF EXISTS rls_inventory_settlements_site_isolation ON inventory_settlements;
+                ALTER TABLE inventory_settlements DISABLE ROW LEVEL SECURITY;
+            """
+        ),
+    ]
@@ -28,6 +28,11 @@ class Tier(models.Model):
     库存计算：
     - available_units = total_units - sold_units
     
+    分片库存（热门档位开售）：
+    - inventory_shards > 0 时可用库存拆分到 TierInventoryShard 子计数器
+    - 锁定 / 回补只更新单个分片行，不再锁 Tier 行
+    - available_units 由定时任务同步为分片合计（展示用）
+    
     促销功能：
     - promotional_price_usd: 促销价（时间范围内生效）
     - bonus_tokens_per_unit: 额外赠送代币
@@ -85,6 +90,10 @@ class Tier(models.Model):
         default=0,
         help_text="乐观锁版本号"
     )
+    inventory_shards = models.PositiveSmallIntegerField(
+        default=0,
+        help_text="库存分片数（0=不分片；>0 时 available_units 为展示快照，以分片合计为准）"
+    )
     is_active = models.BooleanField(
         default=True,
         db_index=True,
@@ -161,4 +170,90 @@ class Tier(models.Model):
         return self.tokens_per_unit + self.bonus_tokens_per_unit
 
 
+class TierInventoryShard(models.Model):
+    """
+    档位库存分片（子计数器）
+    
+    ⭐ 档位可用库存 = 全部分片 available_units 之和
+    ⭐ 锁定：随机挑选库存充足且未被锁定的分片（FOR UPDATE SKIP LOCKED）
+    ⭐ 单个分片不足时锁定全部分片合并分配并重新均分
+    
+    ⚠️ CHECK available_units >= 0：任何路径都不可能超卖
+    """
+    shard_id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False,
+        help_text="分片ID"
+    )
+    tier = models.ForeignKey(
+        Tier,
+        on_delete=models.CASCADE,
+        related_name='inventory_shard_rows',
+        help_text="所属档位"
+    )
+    shard_index = models.PositiveSmallIntegerField(
+        help_text="分片序号（0 起）"
+    )
+    available_units = models.IntegerField(
+        default=0,
+        validators=[MinValueValidator(0)],
+        help_text="分片可用库存"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'tier_inventory_shards'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['tier', 'shard_index'],
+                name='uq_tier_inventory_shard_index'
+            ),
+            models.CheckConstraint(
+                check=models.Q(available_units__gte=0),
+                name='chk_tier_inventory_shard_non_negative'
+            ),
+        ]
+        verbose_name = 'Tier Inventory Shard'
+        verbose_name_plural = 'Tier Inventory Shards'
+    
+    def __str__(self):
+        return f"{self.tier_id}#{self.shard_index}: {self.available_units}"
+
 
+class InventorySettlement(models.Model):
+    """
+    库存前置层结算记录（恰好一次写入 tiers）
+    
+    ⭐ entry_id 由前置层生成；INSERT ... ON CONFLICT DO NOTHING 去重，
+      worker 重放同一批次不会重复扣减 / 回补
+    ⭐ delta：-quantity（订单确认）/ +quantity（取消 / 超时 / 退款回补）
+    """
+    entry_id = models.UUIDField(
+        primary_key=True,
+        help_text="结算记录ID（前置层生成）"
+    )
+    tier = models.ForeignKey(
+        Tier,
+        on_delete=models.CASCADE,
+        related_name='inventory_settlements',
+        help_text="所属档位"
+    )
+    delta = models.IntegerField(
+        help_text="库存变动（负数=扣减，正数=回补）"
+    )
+    settled_at = models.DateTimeField(
+        default=timezone.now,
+        help_text="结算时间"
+    )
+    
+    class Meta:
+        db_table = 'inventory_settlements'
+        indexes = [
+            models.Index(fields=['settled_at'], name='inventory_settlement_time_idx'),
+        ]
+        verbose_name = 'Inventory Settlement'
+        verbose_name_plural = 'Inventory Settlements'
+    
+    def __str__(self):
+        return f"{self.tier_id}: {self.delta:+d}"
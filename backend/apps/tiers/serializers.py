@@ -201,3 +201,41 @@ class TierListSerializer(serializers.ModelSerializer):
         return obj.is_promotion_active()
 
 
+
+
+class TierCatalogSerializer(serializers.ModelSerializer):
+    """档位目录序列化器（静态字段，不含库存）- 可被 CDN / 浏览器缓存"""
+    
+    current_price = serializers.SerializerMethodField()
+    total_tokens = serializers.SerializerMethodField()
+    is_on_sale = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Tier
+        fields = [
+            'tier_id',
+            'name',
+            'description',
+            'list_price_usd',
+            'current_price',
+            'promotional_price_usd',
+            'promotion_valid_from',
+            'promotion_valid_until',
+            'is_on_sale',
+            'tokens_per_unit',
+            'bonus_tokens_per_unit',
+            'total_tokens',
+            'display_order',
+        ]
+    
+    def get_current_price(self, obj):
+        """当前有效价格"""
+        return str(obj.get_current_price())
+    
+    def get_total_tokens(self, obj):
+        """总代币数"""
+        return str(obj.get_total_tokens_per_unit())
+    
+    def get_is_on_sale(self, obj):
+        """是否促销中"""
+        return obj.is_promotion_active()
@@ -0,0 +1,143 @@
+"""
+公开档位目录 / 实时库存
+
+⭐ 目录（静态字段，不含库存）：
+- 按站点进程内缓存（VersionedLocalCache），管理端修改档位时 invalidate_tier_catalog
+- 强 ETag = 目录 JSON 的 SHA-256：CDN / 浏览器以 If-None-Match 协商，未变更返回 304
+- 当前价格随促销窗口变化：缓存记录下一个价格边界（valid_until），到期后重建
+
+⭐ 实时库存（get_tier_availability）：
+- 单条查询 + 前置层计数器覆盖，共享缓存极短 TTL（TIER_AVAILABILITY_MAX_AGE）
+- 分片档位使用 Tier.available_units 展示快照（sync_sharded_inventory 同步）
+"""
+import hashlib
+import json
+import logging
+import uuid
+from typing import Dict, List
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from apps.core.utils.local_cache import VersionedLocalCache
+
+logger = logging.getLogger(__name__)
+
+# 实时库存缓存 Key 前缀
+AVAILABILITY_KEY_PREFIX = 'posx:tier_availability'
+
+
+def _next_price_boundary(tiers, now):
+    """下一个促销窗口边界（无则 None）"""
+    boundaries = [
+        boundary
+        for tier in tiers if tier.promotional_price_usd
+        for boundary in (tier.promotion_valid_from, tier.promotion_valid_until)
+        if boundary is not None and boundary > now
+    ]
+    return min(boundaries) if boundaries else None
+
+
+def _load_catalog(key: str) -> Dict:
+    """构建站点目录：{'tiers': [...], 'etag': '"..."', 'valid_until': datetime|None}"""
+    from apps.tiers.models import Tier
+    from apps.tiers.serializers import TierCatalogSerializer
+
+    tiers = list(Tier.objects.filter(site_id=key, is_active=True).order_by('display_order', 'created_at'))
+    data = json.loads(json.dumps(TierCatalogSerializer(tiers, many=True).data, cls=DjangoJSONEncoder))
+    body = json.dumps(data, sort_keys=True, separators=(',', ':'))
+
+    return {
+        'tiers': data,
+        'etag': f'"{hashlib.sha256(body.encode()).hexdigest()[:32]}"',
+        'valid_until': _next_price_boundary(tiers, timezone.now()),
+    }
+
+
+_catalog_cache = VersionedLocalCache('tier_catalog', loader=_load_catalog)
+
+
+def get_tier_catalog(site_id: uuid.UUID) -> Dict:
+    """
+    站点档位目录（缓存）
+
+    Returns:
+        {'tiers': [...], 'etag': str, 'valid_until': datetime|None}
+    """
+    key = str(site_id)
+    catalog = _catalog_cache.get(key)
+
+    valid_until = catalog['valid_until']
+    if valid_until is not None and timezone.now() >= valid_until:
+        # 跨越促销窗口边界：当前价格已变化
+        _catalog_cache.invalidate(key)
+        catalog = _catalog_cache.get(key)
+
+    return catalog
+
+
+def catalog_max_age(catalog: Dict) -> int:
+    """目录 Cache-Control max-age（不超过下一个价格边界）"""
+    max_age = getattr(settings, 'TIER_CATALOG_MAX_AGE', 60)
+    valid_until = catalog['valid_until']
+    if valid_until is not None:
+        max_age = min(max_age, int((valid_until - timezone.now()).total_seconds()))
+    return max(max_age, 0)
+
+
+def invalidate_tier_catalog(site_id: uuid.UUID) -> None:
+    """档位定义变更后调用（创建 / 更新 / 停用 / 激活）"""
+    _catalog_cache.invalidate(str(site_id))
+
+
+def _load_availability(site_id: uuid.UUID) -> List[Dict]:
+    from apps.tiers.models import Tier
+    from apps.tiers.services.reservations import get_front_available
+
+    rows = Tier.objects.filter(site_id=site_id, is_active=True).order_by(
+        'display_order', 'created_at'
+    ).values_list('tier_id', 'available_units')
+
+    availability = []
+    for tier_id, available_units in rows:
+        front_available = get_front_available(tier_id)
+        if front_available is not None:
+            available_units = front_available
+        availability.append({
+            'tier_id': str(tier_id),
+            'available_units': available_units,
+            'is_sold_out': available_units <= 0,
+        })
+    return availability
+
+
+def get_tier_availability(site_id: uuid.UUID) -> List[Dict]:
+    """
+    站点实时库存（共享缓存 TIER_AVAILABILITY_MAX_AGE 秒）
+
+    Returns:
+        [{'tier_id': str, 'available_units': int, 'is_sold_out': bool}, ...]
+    """
+    ttl = getattr(settings, 'TIER_AVAILABILITY_MAX_AGE', 2)
+    cache_key = f"{AVAILABILITY_KEY_PREFIX}:{site_id}"
+
+    try:
+        availability = cache.get(cache_key) if ttl > 0 else None
+    except Exception as e:
+        logger.warning(f"Tier availability cache unavailable: {e}", extra={'site_id': str(site_id)})
+        return _load_availability(site_id)
+
+    if availability is None:
+        availability = _load_availability(site_id)
+        if ttl > 0:
+            try:
+                cache.set(cache_key, availability, timeout=ttl)
+            except Exception as e:
+                logger.warning(
+                    f"Tier availability cache write failed: {e}",
+                    extra={'site_id': str(site_id)}
+                )
+
+    return availability
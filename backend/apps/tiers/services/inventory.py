@@ -1,24 +1,30 @@
 """
-库存服务（乐观锁）
+库存服务
 
 ⭐ 并发安全：
-- 乐观锁（version字段）
-- SQL UPDATE返回affected_rows校验
-- 失败返回409 INVENTORY.CONFLICT
+- 锁定：单条条件 UPDATE ... WHERE available_units >= n RETURNING *
+  （扣减 + 读取档位一次往返，锁竞争错误有界退避重试）
+- 回补：乐观锁（version字段），失败返回409 INVENTORY.CONFLICT
 - 支持锁定和回补操作
+- 热门档位可开启分片计数器（inventory_shards > 0，见 inventory_shards.py）：
+  锁定 / 回补只更新单个分片行，不再锁 Tier 行
+- 限时抢购档位可装载到预留前置层（见 reservations.py）：
+  下单在 Redis 预留，回补写入前置层，由结算 worker 批量写回 tiers
 
 使用示例：
->>> success, error = lock_inventory(tier_id, quantity=10)
->>> if not success:
+>>> tier, error = reserve_tier_units(tier_id, quantity=10)
+>>> if tier is None:
 ...     return Response({'code': error}, status=409)
 >>> # 订单创建成功
 >>> # 如果取消：
 >>> release_inventory(tier_id, quantity=10)
 """
 import logging
+import random
+import time
 from typing import Tuple
 from decimal import Decimal
-from django.db import transaction
+from django.db import OperationalError, transaction
 from django.db.models import F
 from django.utils import timezone
 from django.conf import settings
@@ -32,111 +38,145 @@ class InventoryError(Exception):
     pass
 
 
-def lock_inventory(tier_id: uuid.UUID, quantity: int) -> Tuple[bool, str]:
+def _available_units(tier) -> int:
+    """可用库存（前置层装载时为计数器，分片模式为分片合计）"""
+    from apps.tiers.services.reservations import get_front_available
+    
+    front_available = get_front_available(tier.tier_id)
+    if front_available is not None:
+        return front_available
+    if tier.inventory_shards:
+        from apps.tiers.services.inventory_shards import get_sharded_available
+        return get_sharded_available(tier.tier_id)
+    return tier.available_units
+
+
+RESERVE_UNITS_SQL = """
+    UPDATE tiers
+    SET available_units = available_units - %s,
+        version = version + 1,
+        updated_at = NOW()
+    WHERE tier_id = %s
+      AND is_active
+      AND inventory_shards = 0
+      AND available_units >= %s
+    RETURNING *
+"""
+
+# 可重试的锁竞争错误：serialization_failure / deadlock_detected / lock_not_available
+RETRYABLE_PGCODES = {'40001', '40P01', '55P03'}
+
+
+def _is_retryable(error: OperationalError) -> bool:
+    return getattr(error.__cause__, 'pgcode', None) in RETRYABLE_PGCODES
+
+
+def reserve_tier_units(tier_id: uuid.UUID, quantity: int):
     """
-    锁定库存（乐观锁）
+    扣减库存并返回扣减后的档位（单条条件 UPDATE ... RETURNING）
     
-    ⚠️ 并发安全：
-    - 使用 version 乐观锁
-    - 检查 affected_rows
-    - 失败返回 INVENTORY.CONFLICT（409）
+    ⭐ 一次往返完成：库存校验 + 扣减 + 读取定价所需档位数据
+      （行锁仅在 UPDATE 期间由 PostgreSQL 持有，无需 SELECT FOR UPDATE / version 校验）
+    ⭐ 锁竞争错误（死锁 / 锁超时）按有界指数退避重试（savepoint 内执行，可在外层事务中调用）
+    ⚠️ 未命中时再查询一次诊断原因（冷路径）；分片档位转分片锁定
     
     Args:
         tier_id: 档位ID
         quantity: 锁定数量
     
     Returns:
-        Tuple[bool, str]: (success, error_code)
-            - (True, ''): 成功
-            - (False, 'TIER.NOT_FOUND'): 档位不存在
-            - (False, 'TIER.INACTIVE'): 档位未激活
-            - (False, 'INVENTORY.INSUFFICIENT'): 库存不足
-            - (False, 'INVENTORY.CONFLICT'): 并发冲突
-    
-    Examples:
-        >>> success, error = lock_inventory(tier_id, 10)
-        >>> if not success:
-        ...     if error == 'INVENTORY.CONFLICT':
-        ...         return Response(status=409)
-        ...     else:
-        ...         return Response(status=400)
+        Tuple[Optional[Tier], str]: (tier, '') / (None, error_code)
+            error_code 同 lock_inventory
     """
     from apps.tiers.models import Tier
     
-    # 参数校验
     if quantity <= 0:
         logger.warning(f"Invalid quantity: {quantity}")
-        return False, 'INVENTORY.INVALID_QUANTITY'
+        return None, 'INVENTORY.INVALID_QUANTITY'
     
-    # 硬上限检查（防止恶意大单）
     max_quantity = getattr(settings, 'MAX_QUANTITY_PER_ORDER', 1000)
     if quantity > max_quantity:
         logger.warning(
             f"Quantity exceeds limit: {quantity} > {max_quantity}",
             extra={'tier_id': str(tier_id)}
         )
-        return False, 'INVENTORY.QUANTITY_EXCEEDED'
+        return None, 'INVENTORY.QUANTITY_EXCEEDED'
     
-    try:
-        with transaction.atomic():
-            # 获取当前档位（FOR UPDATE）
-            try:
-                tier = Tier.objects.select_for_update().get(tier_id=tier_id)
-            except Tier.DoesNotExist:
-                logger.warning(f"Tier not found: {tier_id}")
-                return False, 'TIER.NOT_FOUND'
-            
-            # 检查激活状态
-            if not tier.is_active:
-                logger.warning(
-                    f"Tier inactive: {tier_id}",
-                    extra={'tier_id': str(tier_id)}
-                )
-                return False, 'TIER.INACTIVE'
-            
-            # 检查库存是否充足
-            if tier.available_units < quantity:
-                logger.warning(
-                    f"Insufficient inventory: need={quantity}, available={tier.available_units}",
-                    extra={'tier_id': str(tier_id)}
-                )
-                return False, 'INVENTORY.INSUFFICIENT'
-            
-            # 记录当前version
-            current_version = tier.version
-            
-            # 乐观锁更新（关键！）
-            affected = Tier.objects.filter(
-                tier_id=tier_id,
-                version=current_version,  # ⭐ 乐观锁条件
-                available_units__gte=quantity  # ⭐ 双重检查
-            ).update(
-                available_units=F('available_units') - quantity,
-                version=F('version') + 1,
-                updated_at=timezone.now()
-            )
-            
-            # 检查affected_rows（兜底校验）
-            if affected == 0:
-                # 并发冲突：version已变或库存已不足
-                logger.warning(
-                    f"Inventory lock conflict: tier_id={tier_id}, version={current_version}",
-                    extra={'tier_id': str(tier_id), 'quantity': quantity}
-                )
-                return False, 'INVENTORY.CONFLICT'
-            
+    max_retries = getattr(settings, 'INVENTORY_LOCK_MAX_RETRIES', 3)
+    backoff_ms = getattr(settings, 'INVENTORY_LOCK_BACKOFF_MS', 10)
+    
+    for attempt in range(max_retries + 1):
+        try:
+            with transaction.atomic():
+                tiers = list(Tier.objects.raw(RESERVE_UNITS_SQL, [quantity, str(tier_id), quantity]))
+            break
+        except OperationalError as e:
+            if not _is_retryable(e) or attempt == max_retries:
+                raise
+            delay = backoff_ms * (2 ** attempt) * random.uniform(0.5, 1.0) / 1000
             logger.info(
-                f"Inventory locked: tier_id={tier_id}, quantity={quantity}, "
-                f"available={tier.available_units} -> {tier.available_units - quantity}",
-                extra={
-                    'tier_id': str(tier_id),
-                    'quantity': quantity,
-                    'version': current_version
-                }
+                f"Inventory lock contention, retrying in {delay:.3f}s",
+                extra={'tier_id': str(tier_id), 'attempt': attempt + 1}
             )
-            
-            return True, ''
-            
+            time.sleep(delay)
+    
+    if tiers:
+        tier = tiers[0]
+        logger.info(
+            f"Inventory locked: tier_id={tier_id}, quantity={quantity}, "
+            f"available={tier.available_units + quantity} -> {tier.available_units}",
+            extra={'tier_id': str(tier_id), 'quantity': quantity, 'version': tier.version}
+        )
+        return tier, ''
+    
+    # 未命中：诊断原因
+    tier = Tier.objects.filter(tier_id=tier_id).first()
+    if tier is None:
+        logger.warning(f"Tier not found: {tier_id}")
+        return None, 'TIER.NOT_FOUND'
+    if not tier.is_active:
+        logger.warning(f"Tier inactive: {tier_id}", extra={'tier_id': str(tier_id)})
+        return None, 'TIER.INACTIVE'
+    if tier.inventory_shards:
+        from apps.tiers.services.inventory_shards import lock_sharded_inventory
+        result = lock_sharded_inventory(tier_id, quantity)
+        if result is None:
+            # 并发关闭分片：按普通模式重试一次
+            return reserve_tier_units(tier_id, quantity)
+        success, error_code = result
+        return (tier, '') if success else (None, error_code)
+    
+    logger.warning(
+        f"Insufficient inventory: need={quantity}, available={tier.available_units}",
+        extra={'tier_id': str(tier_id)}
+    )
+    return None, 'INVENTORY.INSUFFICIENT'
+
+
+def lock_inventory(tier_id: uuid.UUID, quantity: int) -> Tuple[bool, str]:
+    """
+    锁定库存（单条条件 UPDATE，见 reserve_tier_units）
+    
+    Args:
+        tier_id: 档位ID
+        quantity: 锁定数量
+    
+    Returns:
+        Tuple[bool, str]: (success, error_code)
+            - (True, ''): 成功
+            - (False, 'TIER.NOT_FOUND'): 档位不存在
+            - (False, 'TIER.INACTIVE'): 档位未激活
+            - (False, 'INVENTORY.INSUFFICIENT'): 库存不足
+            - (False, 'INVENTORY.QUANTITY_EXCEEDED'): 超过单笔上限
+    
+    Examples:
+        >>> success, error = lock_inventory(tier_id, 10)
+        >>> if not success:
+        ...     return Response({'code': error}, status=400)
+    """
+    try:
+        tier, error_code = reserve_tier_units(tier_id, quantity)
+        return tier is not None, error_code
     except Exception as e:
         logger.error(
             f"Error locking inventory: {e}",
@@ -172,47 +212,31 @@ def release_inventory(tier_id: uuid.UUID, quantity: int) -> Tuple[bool, str]:
         return False, 'INVENTORY.INVALID_QUANTITY'
     
     try:
-        with transaction.atomic():
-            # 获取当前档位
-            try:
-                tier = Tier.objects.select_for_update().get(tier_id=tier_id)
-            except Tier.DoesNotExist:
-                logger.warning(f"Tier not found: {tier_id}")
-                return False, 'TIER.NOT_FOUND'
-            
-            current_version = tier.version
-            
-            # 回补库存（同样用乐观锁）
-            affected = Tier.objects.filter(
-                tier_id=tier_id,
-                version=current_version
-            ).update(
-                available_units=F('available_units') + quantity,
-                version=F('version') + 1,
-                updated_at=timezone.now()
-            )
-            
-            if affected == 0:
-                # 并发冲突
-                logger.warning(
-                    f"Inventory release conflict: tier_id={tier_id}, version={current_version}",
-                    extra={'tier_id': str(tier_id), 'quantity': quantity}
-                )
-                # 回补时冲突不是致命错误，可以重试
-                return False, 'INVENTORY.CONFLICT'
-            
+        # 前置层已装载：提交后回补到计数器（结算 worker 写回 tiers）
+        from apps.tiers.services.reservations import get_front_available
+        if get_front_available(tier_id) is not None:
+            transaction.on_commit(lambda: _release_front_or_db(tier_id, quantity))
             logger.info(
-                f"Inventory released: tier_id={tier_id}, quantity={quantity}, "
-                f"available={tier.available_units} -> {tier.available_units + quantity}",
-                extra={
-                    'tier_id': str(tier_id),
-                    'quantity': quantity,
-                    'version': current_version
-                }
+                f"Inventory release queued to front: tier_id={tier_id}, quantity={quantity}",
+                extra={'tier_id': str(tier_id), 'quantity': quantity}
             )
-            
             return True, ''
-            
+        
+        # 分片模式：回补到随机分片
+        shard_count = Tier.objects.filter(tier_id=tier_id).values_list(
+            'inventory_shards', flat=True
+        ).first()
+        if shard_count:
+            from apps.tiers.services.inventory_shards import release_sharded_inventory
+            if release_sharded_inventory(tier_id, quantity, shard_count):
+                logger.info(
+                    f"Sharded inventory released: tier_id={tier_id}, quantity={quantity}",
+                    extra={'tier_id': str(tier_id), 'quantity': quantity}
+                )
+                return True, ''
+        
+        return _release_db_inventory(tier_id, quantity)
+    
     except Exception as e:
         logger.error(
             f"Error releasing inventory: {e}",
@@ -222,6 +246,75 @@ def release_inventory(tier_id: uuid.UUID, quantity: int) -> Tuple[bool, str]:
         raise InventoryError(f"Failed to release inventory: {e}") from e
 
 
+def _release_front_or_db(tier_id: uuid.UUID, quantity: int) -> None:
+    """
+    提交后回补到前置层；档位已卸载 / 前置层故障时回补到 DB
+    
+    ⚠️ 前置层仍装载时直接写 DB 也安全：结算队列清空后 reconcile 按 DB 校准计数器
+    """
+    from apps.tiers.services.reservations import release_to_front
+    
+    if release_to_front(tier_id, quantity):
+        return
+    
+    try:
+        success, error_code = _release_db_inventory(tier_id, quantity)
+    except Exception as e:
+        success, error_code = False, str(e)
+    
+    if not success:
+        logger.critical(
+            f"Inventory release lost after commit: tier_id={tier_id}, quantity={quantity}",
+            extra={'tier_id': str(tier_id), 'quantity': quantity, 'error': error_code}
+        )
+
+
+def _release_db_inventory(tier_id: uuid.UUID, quantity: int) -> Tuple[bool, str]:
+    """回补 tiers.available_units（version 乐观锁）"""
+    from apps.tiers.models import Tier
+    
+    with transaction.atomic():
+        # 获取当前档位
+        try:
+            tier = Tier.objects.select_for_update().get(tier_id=tier_id)
+        except Tier.DoesNotExist:
+            logger.warning(f"Tier not found: {tier_id}")
+            return False, 'TIER.NOT_FOUND'
+        
+        current_version = tier.version
+        
+        # 回补库存（同样用乐观锁）
+        affected = Tier.objects.filter(
+            tier_id=tier_id,
+            version=current_version
+        ).update(
+            available_units=F('available_units') + quantity,
+            version=F('version') + 1,
+            updated_at=timezone.now()
+        )
+        
+        if affected == 0:
+            # 并发冲突
+            logger.warning(
+                f"Inventory release conflict: tier_id={tier_id}, version={current_version}",
+                extra={'tier_id': str(tier_id), 'quantity': quantity}
+            )
+            # 回补时冲突不是致命错误，可以重试
+            return False, 'INVENTORY.CONFLICT'
+        
+        logger.info(
+            f"Inventory released: tier_id={tier_id}, quantity={quantity}, "
+            f"available={tier.available_units} -> {tier.available_units + quantity}",
+            extra={
+                'tier_id': str(tier_id),
+                'quantity': quantity,
+                'version': current_version
+            }
+        )
+        
+        return True, ''
+
+
 def check_inventory_available(tier_id: uuid.UUID, quantity: int) -> bool:
     """
     检查库存是否充足（不锁定）
@@ -241,7 +334,7 @@ def check_inventory_available(tier_id: uuid.UUID, quantity: int) -> bool:
     
     try:
         tier = Tier.objects.get(tier_id=tier_id)
-        return tier.is_active and tier.available_units >= quantity
+        return tier.is_active and _available_units(tier) >= quantity
     except Tier.DoesNotExist:
         return False
 
@@ -259,7 +352,8 @@ def get_inventory_status(tier_id: uuid.UUID) -> dict:
             'available_units': int,
             'sold_units': int,
             'is_sold_out': bool,
-            'is_active': bool
+            'is_active': bool,
+            'shards': int  # 0=不分片
         }
     """
     from apps.tiers.models import Tier
@@ -267,15 +361,17 @@ def get_inventory_status(tier_id: uuid.UUID) -> dict:
     try:
         tier = Tier.objects.get(tier_id=tier_id)
         
-        sold_units = tier.total_units - tier.available_units
+        available_units = _available_units(tier)
+        sold_units = tier.total_units - available_units
         
         return {
             'total_units': tier.total_units,
-            'available_units': tier.available_units,
+            'available_units': available_units,
             'sold_units': sold_units,
-            'is_sold_out': tier.available_units == 0,
+            'is_sold_out': available_units == 0,
             'is_active': tier.is_active,
-            'version': tier.version
+            'version': tier.version,
+            'shards': tier.inventory_shards
         }
     except Tier.DoesNotExist:
         return None
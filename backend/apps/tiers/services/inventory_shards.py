@@ -0,0 +1,325 @@
+"""
+分片库存计数器（热门档位开售）
+
+⭐ 可用库存拆分到 N 个 TierInventoryShard 行：
+- 锁定：随机挑选库存充足且未被其他事务锁定的分片，单条 UPDATE 扣减
+  （FOR UPDATE SKIP LOCKED：并发请求落到不同分片，不排队）
+- 单个分片不足 / 全部分片忙：按 shard_index 顺序锁定全部分片，
+  合并分配后重新均分（rebalance）
+- 回补：随机分片 +quantity
+- 查询：SUM(分片)
+
+⚠️ 关键：
+- 分片 CHECK available_units >= 0 + 条件扣减：不可能超卖
+- 开启 / 关闭分片持有 Tier 行锁，并在一个事务内迁移库存
+- Tier.available_units 在分片模式下为展示快照（sync_sharded_inventory 同步）
+"""
+import logging
+import random
+import uuid
+from typing import Optional, Tuple
+
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# 单档位分片数上限
+MAX_INVENTORY_SHARDS = 64
+
+
+PICK_AND_DECREMENT_SQL = """
+    WITH picked AS (
+        SELECT shard_id
+        FROM tier_inventory_shards
+        WHERE tier_id = %s
+          AND available_units >= %s
+        ORDER BY random()
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE tier_inventory_shards s
+    SET available_units = s.available_units - %s,
+        updated_at = NOW()
+    FROM picked
+    WHERE s.shard_id = picked.shard_id
+    RETURNING s.shard_index, s.available_units
+"""
+
+
+def split_units(total: int, shard_count: int) -> list:
+    """
+    均分库存（余数分给前几个分片）
+
+    Examples:
+        >>> split_units(10, 3)
+        [4, 3, 3]
+    """
+    base, remainder = divmod(total, shard_count)
+    return [base + (1 if index < remainder else 0) for index in range(shard_count)]
+
+
+def _rewrite_shards(tier_id, units: list) -> None:
+    """按序号覆盖分片库存（调用方须已锁定全部分片）"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            UPDATE tier_inventory_shards s
+            SET available_units = v.units, updated_at = NOW()
+            FROM unnest(%s::int[], %s::int[]) AS v(shard_index, units)
+            WHERE s.tier_id = %s
+              AND s.shard_index = v.shard_index
+            """,
+            [list(range(len(units))), units, str(tier_id)]
+        )
+
+
+def lock_sharded_inventory(tier_id: uuid.UUID, quantity: int) -> Optional[Tuple[bool, str]]:
+    """
+    分片模式锁定库存
+
+    Returns:
+        (True, '') / (False, 'INVENTORY.INSUFFICIENT')
+        None：档位已无分片（并发关闭分片），调用方回退普通模式
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            # 快路径：随机未锁定且充足的分片
+            cursor.execute(PICK_AND_DECREMENT_SQL, [str(tier_id), quantity, quantity])
+            row = cursor.fetchone()
+            if row:
+                logger.debug(
+                    f"Sharded inventory locked: tier_id={tier_id}, shard={row[0]}, quantity={quantity}",
+                    extra={'tier_id': str(tier_id), 'shard_index': row[0], 'remaining': row[1]}
+                )
+                return True, ''
+
+            # 慢路径：锁定全部分片（固定顺序，避免死锁）
+            cursor.execute(
+                """
+                SELECT available_units
+                FROM tier_inventory_shards
+                WHERE tier_id = %s
+                ORDER BY shard_index
+                FOR UPDATE
+                """,
+                [str(tier_id)]
+            )
+            shards = [units for (units,) in cursor.fetchall()]
+
+        if not shards:
+            return None
+
+        total = sum(shards)
+        if total < quantity:
+            logger.warning(
+                f"Insufficient sharded inventory: need={quantity}, available={total}",
+                extra={'tier_id': str(tier_id), 'shards': len(shards)}
+            )
+            return False, 'INVENTORY.INSUFFICIENT'
+
+        _rewrite_shards(tier_id, split_units(total - quantity, len(shards)))
+
+        logger.info(
+            f"Sharded inventory rebalanced: tier_id={tier_id}, quantity={quantity}, "
+            f"available={total} -> {total - quantity}",
+            extra={'tier_id': str(tier_id), 'shards': len(shards), 'quantity': quantity}
+        )
+        return True, ''
+
+
+def release_sharded_inventory(tier_id: uuid.UUID, quantity: int, shard_count: int) -> bool:
+    """
+    分片模式回补库存（随机分片）
+
+    Returns:
+        bool: False=档位已无分片（调用方回退普通模式）
+    """
+    from apps.tiers.models import TierInventoryShard
+
+    shard_index = random.randrange(shard_count)
+    affected = TierInventoryShard.objects.filter(
+        tier_id=tier_id, shard_index=shard_index
+    ).update(
+        available_units=F('available_units') + quantity,
+        updated_at=timezone.now()
+    )
+    if affected:
+        return True
+
+    # 分片数变更中：回补到任一分片
+    shard = TierInventoryShard.objects.filter(tier_id=tier_id).order_by('shard_index').first()
+    if shard is None:
+        return False
+
+    TierInventoryShard.objects.filter(shard_id=shard.shard_id).update(
+        available_units=F('available_units') + quantity,
+        updated_at=timezone.now()
+    )
+    return True
+
+
+def get_sharded_available(tier_id: uuid.UUID) -> int:
+    """分片合计可用库存"""
+    from apps.tiers.models import TierInventoryShard
+
+    return TierInventoryShard.objects.filter(tier_id=tier_id).aggregate(
+        total=Sum('available_units')
+    )['total'] or 0
+
+
+def adjust_sharded_inventory(tier_id: uuid.UUID, adjustment: int) -> int:
+    """
+    调整分片库存（管理员补货 / 减库存），调整后重新均分
+
+    ⚠️ 须在持有 Tier 行锁的事务内调用
+
+    Returns:
+        int: 调整后可用库存
+
+    Raises:
+        InventoryError: 调整后可用库存为负
+    """
+    from apps.tiers.services.inventory import InventoryError
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT available_units
+            FROM tier_inventory_shards
+            WHERE tier_id = %s
+            ORDER BY shard_index
+            FOR UPDATE
+            """,
+            [str(tier_id)]
+        )
+        shards = [units for (units,) in cursor.fetchall()]
+
+    new_total = sum(shards) + adjustment
+    if new_total < 0:
+        raise InventoryError(
+            f"Adjustment {adjustment} exceeds available sharded inventory {sum(shards)}"
+        )
+
+    _rewrite_shards(tier_id, split_units(new_total, len(shards)))
+    return new_total
+
+
+@transaction.atomic
+def enable_inventory_sharding(tier_id: uuid.UUID, shard_count: int) -> int:
+    """
+    开启 / 调整库存分片（当前可用库存均分到 shard_count 个分片）
+
+    Returns:
+        int: 迁移的可用库存
+    """
+    from apps.tiers.models import Tier, TierInventoryShard
+
+    if not 1 <= shard_count <= MAX_INVENTORY_SHARDS:
+        raise ValueError(f"shard_count must be between 1 and {MAX_INVENTORY_SHARDS}")
+
+    from apps.tiers.services.reservations import get_front_available
+    if get_front_available(tier_id) is not None:
+        raise ValueError(f"Tier {tier_id} is primed in the inventory front; drain it first")
+
+    tier = Tier.objects.select_for_update().get(tier_id=tier_id)
+    available = _collapse_shards(tier)
+
+    TierInventoryShard.objects.bulk_create([
+        TierInventoryShard(tier_id=tier_id, shard_index=index, available_units=units)
+        for index, units in enumerate(split_units(available, shard_count))
+    ])
+    Tier.objects.filter(tier_id=tier_id).update(
+        inventory_shards=shard_count,
+        available_units=available,
+        version=F('version') + 1,
+        updated_at=timezone.now()
+    )
+
+    logger.info(
+        f"Inventory sharding enabled: tier_id={tier_id}, shards={shard_count}",
+        extra={'tier_id': str(tier_id), 'shards': shard_count, 'available': available}
+    )
+    return available
+
+
+@transaction.atomic
+def disable_inventory_sharding(tier_id: uuid.UUID) -> int:
+    """
+    关闭库存分片（分片合计写回 Tier.available_units）
+
+    Returns:
+        int: 写回的可用库存
+    """
+    from apps.tiers.models import Tier
+
+    tier = Tier.objects.select_for_update().get(tier_id=tier_id)
+    available = _collapse_shards(tier)
+
+    Tier.objects.filter(tier_id=tier_id).update(
+        inventory_shards=0,
+        available_units=available,
+        version=F('version') + 1,
+        updated_at=timezone.now()
+    )
+
+    logger.info(
+        f"Inventory sharding disabled: tier_id={tier_id}",
+        extra={'tier_id': str(tier_id), 'available': available}
+    )
+    return available
+
+
+def _collapse_shards(tier) -> int:
+    """锁定并删除全部分片，返回当前可用库存（无分片时为 Tier.available_units）"""
+    from apps.tiers.models import TierInventoryShard
+
+    if not tier.inventory_shards:
+        return tier.available_units
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT COALESCE(SUM(available_units), 0)
+            FROM (
+                SELECT available_units
+                FROM tier_inventory_shards
+                WHERE tier_id = %s
+                ORDER BY shard_index
+                FOR UPDATE
+            ) locked
+            """,
+            [str(tier.tier_id)]
+        )
+        available = cursor.fetchone()[0]
+
+    TierInventoryShard.objects.filter(tier_id=tier.tier_id).delete()
+    return available
+
+
+SYNC_SNAPSHOT_SQL = """
+    UPDATE tiers t
+    SET available_units = s.total,
+        updated_at = NOW()
+    FROM (
+        SELECT tier_id, SUM(available_units) AS total
+        FROM tier_inventory_shards
+        GROUP BY tier_id
+    ) s
+    WHERE t.tier_id = s.tier_id
+      AND t.inventory_shards > 0
+      AND t.available_units <> s.total
+"""
+
+
+def sync_sharded_inventory() -> int:
+    """
+    同步分片档位的 available_units 展示快照（单条 SQL）
+
+    Returns:
+        int: 更新的档位数
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(SYNC_SNAPSHOT_SQL)
+        return cursor.rowcount
@@ -0,0 +1,693 @@
+"""
+库存预留前置层（限时抢购）
+
+⭐ 流程：
+1. prime：档位开售前把 DB 可用库存装载到前置层（Redis 计数器）
+2. reserve：原子脚本扣减计数器 + 创建带过期时间的预留（亚毫秒，不开 DB 事务）
+   售罄直接失败，create_order 不再进入数据库
+3. confirm：订单事务提交后确认预留 → 追加结算记录（-quantity）
+            未能确认时下单方取消订单（不回补），不进入支付阶段
+   cancel：订单事务失败 → 归还计数器
+   release：订单取消 / 超时 / 退款 → 归还计数器 + 追加结算记录（+quantity）
+            档位已卸载 / 前置层故障时回退 DB 回补（release_inventory）
+4. 结算 worker（settle_inventory_front）：
+   - 回收过期预留（归还计数器）
+   - 批量把结算记录写入 tiers（InventorySettlement 按 entry_id 去重，恰好一次）
+   - 结算队列清空后按 DB 校准计数器（计数器 = DB 可用 - 未确认预留）
+   - cache.add 互斥：定时任务 / 装载 / 卸载 / 管理命令的结算串行执行
+     （并发 peek 同一批后各自 ack 会裁掉未结算的记录）
+
+⚠️ 关键：
+- 前置层开启时该档位的全部库存变动都经过计数器（release_inventory 自动分流）
+- 不支持分片库存档位（二者都是热点档位方案，择一使用）
+- 预留脚本不校验档位状态：下单时拒绝停售档位，停售时卸载（drain_if_primed）
+- Redis 不可用时 reserve 返回 not_primed，调用方回退 lock_inventory
+- InMemoryReservationBackend 仅用于单进程开发 / 测试
+
+配置：
+- INVENTORY_FRONT_BACKEND: 'off'（默认）| 'redis' | 'memory'
+- INVENTORY_RESERVATION_TTL: 预留过期秒数
+- INVENTORY_SETTLEMENT_BATCH_SIZE: 单批结算条数
+- INVENTORY_SETTLEMENT_LOCK_WAIT: 装载 / 卸载等待结算互斥的秒数
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from apps.core.utils.redis import get_redis_client, redis_key
+
+logger = logging.getLogger(__name__)
+
+RESERVE_OK = 'ok'
+RESERVE_SOLD_OUT = 'sold_out'
+RESERVE_NOT_PRIMED = 'not_primed'
+
+SETTLEMENT_LOCK_KEY = 'tiers:settle_inventory_front:lock'
+SETTLEMENT_LOCK_TIMEOUT = 300
+
+
+def _settlement_entry(tier_id, delta: int) -> str:
+    return json.dumps({'id': str(uuid.uuid4()), 'tier': str(tier_id), 'delta': delta})
+
+
+# ============================================
+# Redis 后端（Lua 原子脚本）
+# ============================================
+
+RESERVE_LUA = """
+local stock = redis.call('GET', KEYS[1])
+if not stock then return -1 end
+if tonumber(stock) < tonumber(ARGV[1]) then return 0 end
+redis.call('DECRBY', KEYS[1], ARGV[1])
+redis.call('INCRBY', KEYS[2], ARGV[1])
+redis.call('HSET', KEYS[3], ARGV[2], ARGV[3])
+redis.call('ZADD', KEYS[4], ARGV[4], ARGV[2])
+return 1
+"""
+
+CONFIRM_LUA = """
+if redis.call('HDEL', KEYS[3], ARGV[1]) == 1 then
+    redis.call('ZREM', KEYS[4], ARGV[1])
+    redis.call('DECRBY', KEYS[2], ARGV[2])
+else
+    local stock = tonumber(redis.call('GET', KEYS[1]) or '-1')
+    if stock < tonumber(ARGV[2]) then return 0 end
+    redis.call('DECRBY', KEYS[1], ARGV[2])
+end
+redis.call('RPUSH', KEYS[5], ARGV[3])
+return 1
+"""
+
+CANCEL_LUA = """
+if redis.call('HDEL', KEYS[3], ARGV[1]) == 0 then return 0 end
+redis.call('ZREM', KEYS[4], ARGV[1])
+redis.call('DECRBY', KEYS[2], ARGV[2])
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('INCRBY', KEYS[1], ARGV[2])
+end
+return 1
+"""
+
+RELEASE_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+redis.call('INCRBY', KEYS[1], ARGV[1])
+redis.call('RPUSH', KEYS[2], ARGV[2])
+return 1
+"""
+
+SWEEP_LUA = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, id in ipairs(ids) do
+    local payload = redis.call('HGET', KEYS[1], id)
+    redis.call('ZREM', KEYS[2], id)
+    if payload then
+        redis.call('HDEL', KEYS[1], id)
+        local sep = string.find(payload, ':')
+        local tier = string.sub(payload, 1, sep - 1)
+        local qty = string.sub(payload, sep + 1)
+        redis.call('DECRBY', ARGV[3] .. ':held:' .. tier, qty)
+        local stock_key = ARGV[3] .. ':stock:' .. tier
+        if redis.call('EXISTS', stock_key) == 1 then
+            redis.call('INCRBY', stock_key, qty)
+        end
+    end
+end
+return #ids
+"""
+
+RECONCILE_LUA = """
+if redis.call('LLEN', KEYS[3]) > 0 then return nil end
+local stock = redis.call('GET', KEYS[1])
+if not stock then return nil end
+local expected = tonumber(ARGV[1]) - tonumber(redis.call('GET', KEYS[2]) or '0')
+if expected < 0 then expected = 0 end
+local drift = tonumber(stock) - expected
+if drift ~= 0 then redis.call('SET', KEYS[1], expected) end
+return drift
+"""
+
+
+class RedisReservationBackend:
+    """
+    Redis 预留后端
+
+    ⚠️ 过期回收脚本在 Lua 内拼接档位 key（单实例 / 主从部署；不支持 Redis Cluster）
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.prefix = redis_key('inventory')
+        self.reservations_key = f"{self.prefix}:reservations"
+        self.expiry_key = f"{self.prefix}:reservation_expiry"
+        self.settlements_key = f"{self.prefix}:settlements"
+        self.primed_key = f"{self.prefix}:primed"
+
+        self._reserve = client.register_script(RESERVE_LUA)
+        self._confirm = client.register_script(CONFIRM_LUA)
+        self._cancel = client.register_script(CANCEL_LUA)
+        self._release = client.register_script(RELEASE_LUA)
+        self._sweep = client.register_script(SWEEP_LUA)
+        self._reconcile = client.register_script(RECONCILE_LUA)
+
+    def _stock(self, tier_id) -> str:
+        return f"{self.prefix}:stock:{tier_id}"
+
+    def _held(self, tier_id) -> str:
+        return f"{self.prefix}:held:{tier_id}"
+
+    def prime(self, tier_id, available: int) -> int:
+        held = int(self.client.get(self._held(tier_id)) or 0)
+        stock = max(available - held, 0)
+        pipe = self.client.pipeline()
+        pipe.set(self._stock(tier_id), stock)
+        pipe.sadd(self.primed_key, str(tier_id))
+        pipe.execute()
+        return stock
+
+    def drain(self, tier_id) -> None:
+        pipe = self.client.pipeline()
+        pipe.delete(self._stock(tier_id))
+        pipe.srem(self.primed_key, str(tier_id))
+        pipe.execute()
+
+    def primed_tiers(self) -> List[str]:
+        return [member.decode() if isinstance(member, bytes) else member
+                for member in self.client.smembers(self.primed_key)]
+
+    def available(self, tier_id) -> Optional[int]:
+        value = self.client.get(self._stock(tier_id))
+        return None if value is None else int(value)
+
+    def reserve(self, tier_id, quantity: int, ttl: int) -> Tuple[str, Optional[str]]:
+        reservation_id = str(uuid.uuid4())
+        result = self._reserve(
+            keys=[self._stock(tier_id), self._held(tier_id), self.reservations_key, self.expiry_key],
+            args=[quantity, reservation_id, f"{tier_id}:{quantity}", time.time() + ttl]
+        )
+        if result == -1:
+            return RESERVE_NOT_PRIMED, None
+        if result == 0:
+            return RESERVE_SOLD_OUT, None
+        return RESERVE_OK, reservation_id
+
+    def confirm(self, reservation_id: str, tier_id, quantity: int) -> bool:
+        return bool(self._confirm(
+            keys=[
+                self._stock(tier_id), self._held(tier_id), self.reservations_key,
+                self.expiry_key, self.settlements_key
+            ],
+            args=[reservation_id, quantity, _settlement_entry(tier_id, -quantity)]
+        ))
+
+    def cancel(self, reservation_id: str, tier_id, quantity: int) -> bool:
+        return bool(self._cancel(
+            keys=[self._stock(tier_id), self._held(tier_id), self.reservations_key, self.expiry_key],
+            args=[reservation_id, quantity]
+        ))
+
+    def release(self, tier_id, quantity: int) -> bool:
+        return bool(self._release(
+            keys=[self._stock(tier_id), self.settlements_key],
+            args=[quantity, _settlement_entry(tier_id, quantity)]
+        ))
+
+    def sweep(self, now: float, limit: int) -> int:
+        return self._sweep(
+            keys=[self.reservations_key, self.expiry_key],
+            args=[now, limit, self.prefix]
+        )
+
+    def peek_settlements(self, limit: int) -> List[dict]:
+        return [json.loads(raw) for raw in self.client.lrange(self.settlements_key, 0, limit - 1)]
+
+    def ack_settlements(self, count: int) -> None:
+        self.client.ltrim(self.settlements_key, count, -1)
+
+    def reconcile(self, tier_id, db_available: int) -> Optional[int]:
+        return self._reconcile(
+            keys=[self._stock(tier_id), self._held(tier_id), self.settlements_key],
+            args=[db_available]
+        )
+
+
+# ============================================
+# 进程内后端（开发 / 测试）
+# ============================================
+
+class InMemoryReservationBackend:
+    """
+    进程内预留后端（语义与 Redis 脚本一致）
+
+    ⚠️ 仅单进程有效：多 worker 部署必须使用 Redis
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stock = {}
+        self.held = {}
+        self.reservations = {}  # reservation_id -> (tier_id, quantity, expires_at)
+        self.settlements = []
+
+    def prime(self, tier_id, available: int) -> int:
+        with self._lock:
+            tier_id = str(tier_id)
+            self.stock[tier_id] = max(available - self.held.get(tier_id, 0), 0)
+            return self.stock[tier_id]
+
+    def drain(self, tier_id) -> None:
+        with self._lock:
+            self.stock.pop(str(tier_id), None)
+
+    def primed_tiers(self) -> List[str]:
+        return list(self.stock)
+
+    def available(self, tier_id) -> Optional[int]:
+        return self.stock.get(str(tier_id))
+
+    def reserve(self, tier_id, quantity: int, ttl: int) -> Tuple[str, Optional[str]]:
+        with self._lock:
+            tier_id = str(tier_id)
+            if tier_id not in self.stock:
+                return RESERVE_NOT_PRIMED, None
+            if self.stock[tier_id] < quantity:
+                return RESERVE_SOLD_OUT, None
+            reservation_id = str(uuid.uuid4())
+            self.stock[tier_id] -= quantity
+            self.held[tier_id] = self.held.get(tier_id, 0) + quantity
+            self.reservations[reservation_id] = (tier_id, quantity, time.time() + ttl)
+            return RESERVE_OK, reservation_id
+
+    def confirm(self, reservation_id: str, tier_id, quantity: int) -> bool:
+        with self._lock:
+            tier_id = str(tier_id)
+            if self.reservations.pop(reservation_id, None) is not None:
+                self.held[tier_id] -= quantity
+            else:
+                if self.stock.get(tier_id, -1) < quantity:
+                    return False
+                self.stock[tier_id] -= quantity
+            self.settlements.append(json.loads(_settlement_entry(tier_id, -quantity)))
+            return True
+
+    def cancel(self, reservation_id: str, tier_id, quantity: int) -> bool:
+        with self._lock:
+            tier_id = str(tier_id)
+            if self.reservations.pop(reservation_id, None) is None:
+                return False
+            self.held[tier_id] -= quantity
+            if tier_id in self.stock:
+                self.stock[tier_id] += quantity
+            return True
+
+    def release(self, tier_id, quantity: int) -> bool:
+        with self._lock:
+            tier_id = str(tier_id)
+            if tier_id not in self.stock:
+                return False
+            self.stock[tier_id] += quantity
+            self.settlements.append(json.loads(_settlement_entry(tier_id, quantity)))
+            return True
+
+    def sweep(self, now: float, limit: int) -> int:
+        with self._lock:
+            expired = [
+                reservation_id for reservation_id, (_, _, expires_at) in self.reservations.items()
+                if expires_at <= now
+            ][:limit]
+            for reservation_id in expired:
+                tier_id, quantity, _ = self.reservations.pop(reservation_id)
+                self.held[tier_id] -= quantity
+                if tier_id in self.stock:
+                    self.stock[tier_id] += quantity
+            return len(expired)
+
+    def peek_settlements(self, limit: int) -> List[dict]:
+        with self._lock:
+            return list(self.settlements[:limit])
+
+    def ack_settlements(self, count: int) -> None:
+        with self._lock:
+            del self.settlements[:count]
+
+    def reconcile(self, tier_id, db_available: int) -> Optional[int]:
+        with self._lock:
+            tier_id = str(tier_id)
+            if self.settlements or tier_id not in self.stock:
+                return None
+            expected = max(db_available - self.held.get(tier_id, 0), 0)
+            drift = self.stock[tier_id] - expected
+            self.stock[tier_id] = expected
+            return drift
+
+
+_memory_backend = None
+_redis_backend = None
+
+
+def get_inventory_front():
+    """
+    获取预留前置层后端
+
+    Returns:
+        RedisReservationBackend / InMemoryReservationBackend，未启用或 Redis 不可用时 None
+    """
+    global _memory_backend, _redis_backend
+
+    backend = getattr(settings, 'INVENTORY_FRONT_BACKEND', 'off')
+
+    if backend == 'memory':
+        if _memory_backend is None:
+            _memory_backend = InMemoryReservationBackend()
+        return _memory_backend
+
+    if backend == 'redis':
+        if _redis_backend is None:
+            client = get_redis_client()
+            if client is None:
+                return None
+            _redis_backend = RedisReservationBackend(client)
+        return _redis_backend
+
+    return None
+
+
+def reset_inventory_front() -> None:
+    """重置进程内后端（测试用）"""
+    global _memory_backend, _redis_backend
+    _memory_backend = None
+    _redis_backend = None
+
+
+# ============================================
+# 业务接口
+# ============================================
+
+def reserve_inventory(tier_id: uuid.UUID, quantity: int) -> Tuple[str, Optional[str]]:
+    """
+    预留库存（前置层）
+
+    Returns:
+        (RESERVE_OK, reservation_id) / (RESERVE_SOLD_OUT, None) / (RESERVE_NOT_PRIMED, None)
+    """
+    front = get_inventory_front()
+    if front is None:
+        return RESERVE_NOT_PRIMED, None
+
+    ttl = getattr(settings, 'INVENTORY_RESERVATION_TTL', 300)
+    try:
+        return front.reserve(tier_id, quantity, ttl)
+    except Exception as e:
+        # 前置层故障：回退 DB 路径
+        logger.warning(
+            f"Inventory front reserve failed: {e}",
+            extra={'tier_id': str(tier_id), 'quantity': quantity}
+        )
+        return RESERVE_NOT_PRIMED, None
+
+
+def confirm_reservation(reservation_id: str, tier_id: uuid.UUID, quantity: int) -> bool:
+    """
+    确认预留（订单事务提交后调用）
+
+    ⚠️ 预留已过期且计数器不足 / 前置层故障时返回 False：订单已创建但库存未扣减，
+      调用方须取消订单且不回补（payment_outbox.fail_unreserved_order）
+    ⚠️ 不抛出异常：由调用方根据返回值补偿
+    """
+    front = get_inventory_front()
+    try:
+        confirmed = front is not None and front.confirm(reservation_id, tier_id, quantity)
+    except Exception as e:
+        logger.error(
+            f"Inventory reservation confirm failed: {e}",
+            exc_info=True,
+            extra={'reservation_id': reservation_id, 'tier_id': str(tier_id)}
+        )
+        confirmed = False
+    if not confirmed:
+        logger.critical(
+            f"Inventory reservation could not be confirmed: {reservation_id}",
+            extra={'reservation_id': reservation_id, 'tier_id': str(tier_id), 'quantity': quantity}
+        )
+    return confirmed
+
+
+def cancel_reservation(reservation_id: str, tier_id: uuid.UUID, quantity: int) -> bool:
+    """取消预留（订单事务失败时调用），归还计数器"""
+    front = get_inventory_front()
+    if front is None:
+        return False
+    try:
+        return front.cancel(reservation_id, tier_id, quantity)
+    except Exception as e:
+        # 预留到期后由结算 worker 回收
+        logger.warning(
+            f"Inventory reservation cancel failed: {e}",
+            extra={'reservation_id': reservation_id, 'tier_id': str(tier_id)}
+        )
+        return False
+
+
+def get_front_available(tier_id: uuid.UUID) -> Optional[int]:
+    """前置层计数器（档位未装载 / 前置层不可用时 None）"""
+    front = get_inventory_front()
+    if front is None:
+        return None
+    try:
+        return front.available(tier_id)
+    except Exception as e:
+        logger.warning(f"Inventory front read failed: {e}", extra={'tier_id': str(tier_id)})
+        return None
+
+
+@contextmanager
+def reservation_guard(reservation_id: Optional[str], tier_id: uuid.UUID, quantity: int):
+    """
+    订单事务失败时取消预留
+
+    使用示例：
+    >>> with reservation_guard(reservation_id, tier_id, quantity), transaction.atomic():
+    ...     order = Order.objects.create(...)
+    >>> if not confirm_reservation(reservation_id, tier_id, quantity):
+    ...     fail_unreserved_order(order.order_id, 'not confirmed')
+    """
+    try:
+        yield
+    except BaseException:
+        if reservation_id is not None:
+            cancel_reservation(reservation_id, tier_id, quantity)
+        raise
+
+
+def release_to_front(tier_id: uuid.UUID, quantity: int) -> bool:
+    """
+    回补库存到前置层（档位已装载时）
+
+    Returns:
+        bool: False=档位未装载 / 前置层不可用（调用方走 DB 路径）
+    """
+    front = get_inventory_front()
+    if front is None:
+        return False
+    try:
+        return front.release(tier_id, quantity)
+    except Exception as e:
+        logger.warning(
+            f"Inventory front release failed: {e}",
+            extra={'tier_id': str(tier_id), 'quantity': quantity}
+        )
+        return False
+
+
+APPLY_SETTLEMENTS_SQL = """
+    WITH inserted AS (
+        INSERT INTO inventory_settlements (entry_id, tier_id, delta, settled_at)
+        SELECT e.entry_id, e.tier_id, e.delta, NOW()
+        FROM unnest(%s::uuid[], %s::uuid[], %s::int[]) AS e(entry_id, tier_id, delta)
+        ON CONFLICT (entry_id) DO NOTHING
+        RETURNING tier_id, delta
+    )
+    UPDATE tiers t
+    SET available_units = GREATEST(t.available_units + s.delta, 0),
+        version = t.version + 1,
+        updated_at = NOW()
+    FROM (
+        SELECT tier_id, SUM(delta) AS delta
+        FROM inserted
+        GROUP BY tier_id
+    ) s
+    WHERE t.tier_id = s.tier_id
+"""
+
+
+def apply_settlements(entries: List[dict]) -> int:
+    """
+    结算记录写入 tiers（单条 SQL，按 entry_id 去重）
+
+    ⭐ 同一批次重放（worker 在确认前崩溃）不会重复扣减
+
+    Returns:
+        int: 更新的档位数
+    """
+    if not entries:
+        return 0
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(APPLY_SETTLEMENTS_SQL, [
+            [entry['id'] for entry in entries],
+            [entry['tier'] for entry in entries],
+            [entry['delta'] for entry in entries],
+        ])
+        return cursor.rowcount
+
+
+@contextmanager
+def _settlement_lock(wait: float):
+    """
+    结算互斥（cache.add + token，仅删除自己持有的锁）
+
+    Yields:
+        bool: 是否取得锁（wait 秒内未取得时 False）
+    """
+    from django.core.cache import cache
+
+    token = str(uuid.uuid4())
+    deadline = time.monotonic() + wait
+    acquired = cache.add(SETTLEMENT_LOCK_KEY, token, timeout=SETTLEMENT_LOCK_TIMEOUT)
+    while not acquired and time.monotonic() < deadline:
+        time.sleep(0.05)
+        acquired = cache.add(SETTLEMENT_LOCK_KEY, token, timeout=SETTLEMENT_LOCK_TIMEOUT)
+
+    try:
+        yield acquired
+    finally:
+        if acquired and cache.get(SETTLEMENT_LOCK_KEY) == token:
+            cache.delete(SETTLEMENT_LOCK_KEY)
+
+
+def settle_inventory_front(max_batches: int = 20, wait: float = 0) -> dict:
+    """
+    结算 worker 主体
+
+    1. 回收过期预留
+    2. 批量结算（peek → 写 DB → ack）
+    3. 结算队列清空后按 DB 校准已装载档位
+
+    ⚠️ 全部调用方经同一互斥串行：另一结算进行中时等待 wait 秒，仍未取得返回 skipped
+
+    Returns:
+        {'expired': n, 'settled': m, 'drift': {tier_id: drift}}
+        {'expired': 0, 'settled': 0, 'drift': {}, 'skipped': True}（另一结算进行中）
+    """
+    with _settlement_lock(wait) as acquired:
+        if not acquired:
+            logger.debug("Inventory settlement already running")
+            return {'expired': 0, 'settled': 0, 'drift': {}, 'skipped': True}
+        return _settle_inventory_front(max_batches)
+
+
+def _settle_inventory_front(max_batches: int) -> dict:
+    """结算主体（调用方持有结算互斥）"""
+    from apps.tiers.models import Tier
+
+    front = get_inventory_front()
+    if front is None:
+        return {'expired': 0, 'settled': 0, 'drift': {}}
+
+    batch_size = getattr(settings, 'INVENTORY_SETTLEMENT_BATCH_SIZE', 500)
+    expired = front.sweep(time.time(), batch_size)
+
+    settled = 0
+    for _ in range(max_batches):
+        entries = front.peek_settlements(batch_size)
+        if not entries:
+            break
+        apply_settlements(entries)
+        front.ack_settlements(len(entries))
+        settled += len(entries)
+
+    drift = {}
+    primed = front.primed_tiers()
+    db_available = dict(
+        Tier.objects.filter(tier_id__in=primed).values_list('tier_id', 'available_units')
+    ) if primed else {}
+    for tier_id, available in db_available.items():
+        delta = front.reconcile(tier_id, available)
+        if delta:
+            drift[str(tier_id)] = delta
+
+    if drift:
+        logger.warning(
+            f"Inventory front drift corrected for {len(drift)} tiers",
+            extra={'drift': drift}
+        )
+
+    return {'expired': expired, 'settled': settled, 'drift': drift}
+
+
+def _settlement_lock_wait() -> float:
+    return getattr(settings, 'INVENTORY_SETTLEMENT_LOCK_WAIT', 30)
+
+
+def prime_inventory_front(tier_id: uuid.UUID) -> int:
+    """
+    装载档位到前置层（先结算队列，再以 DB 可用库存为准）
+
+    Returns:
+        int: 装载后的计数器值
+
+    Raises:
+        ValueError: 前置层未启用 / 分片库存档位
+    """
+    from apps.tiers.models import Tier
+
+    front = get_inventory_front()
+    if front is None:
+        raise ValueError("Inventory front is not enabled (INVENTORY_FRONT_BACKEND)")
+
+    tier = Tier.objects.get(tier_id=tier_id)
+    if tier.inventory_shards:
+        raise ValueError(f"Tier {tier_id} uses sharded inventory; disable sharding first")
+
+    if settle_inventory_front(wait=_settlement_lock_wait()).get('skipped'):
+        raise ValueError("Inventory settlement is still running; retry priming later")
+    tier.refresh_from_db(fields=['available_units'])
+    stock = front.prime(tier_id, tier.available_units)
+
+    logger.info(
+        f"Inventory front primed: tier_id={tier_id}, stock={stock}",
+        extra={'tier_id': str(tier_id), 'stock': stock}
+    )
+    return stock
+
+
+def drain_if_primed(tier_id: uuid.UUID) -> bool:
+    """
+    档位已装载时卸载（停售档位后调用，停止前置层继续售卖）
+
+    Returns:
+        bool: 是否执行了卸载
+    """
+    if get_front_available(tier_id) is None:
+        return False
+    drain_inventory_front(tier_id)
+    return True
+
+
+def drain_inventory_front(tier_id: uuid.UUID) -> None:
+    """卸载档位（之后库存变动回到 DB 路径），卸载后结算剩余队列"""
+    front = get_inventory_front()
+    if front is None:
+        return
+
+    front.drain(tier_id)
+    # 未取得互斥时由进行中的结算 / 下一次定时结算处理剩余队列
+    settle_inventory_front(wait=_settlement_lock_wait())
+
+    logger.info(f"Inventory front drained: tier_id={tier_id}", extra={'tier_id': str(tier_id)})
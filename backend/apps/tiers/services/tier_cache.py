@@ -0,0 +1,54 @@
+"""
+档位定义缓存（定价 / 代币 / 促销窗口）
+
+⭐ 进程内缓存（VersionedLocalCache），按 (site_id, tier_id) 版本化失效：
+- Key 含站点且加载时按站点过滤：其他站点的请求携带本站 tier_id 时缓存的“不存在”
+  只落在请求站点的 Key 上，不会让本站预览返回不存在
+- 管理端修改档位（更新 / 停用 / 激活）时 invalidate_tier_definition
+- 库存变更（锁定 / 回补 / 结算）不失效：Tier.version 随每笔订单递增，
+  用作定价缓存版本会导致开售期间命中率接近 0；改价也不会递增 Tier.version
+
+⚠️ 缓存的 Tier 实例库存字段为加载时快照，不可用于库存判断
+"""
+import logging
+import uuid
+from typing import Optional
+
+from apps.core.utils.local_cache import VersionedLocalCache
+
+logger = logging.getLogger(__name__)
+
+
+def _cache_key(site_id: uuid.UUID, tier_id: uuid.UUID) -> str:
+    return f"{site_id}:{tier_id}"
+
+
+def _load_tier(key: str):
+    """加载站点档位定义（不存在 / 不属于该站点时返回 None，同样缓存）"""
+    from apps.tiers.models import Tier
+
+    site_id, tier_id = key.split(':', 1)
+    return Tier.objects.filter(site_id=site_id, tier_id=tier_id).first()
+
+
+_tier_cache = VersionedLocalCache('tier_definitions', loader=_load_tier)
+
+
+def get_tier_definition(site_id: uuid.UUID, tier_id: uuid.UUID):
+    """
+    读取站点档位定义（缓存）
+
+    Returns:
+        Tier / None（不存在或不属于该站点）
+    """
+    return _tier_cache.get(_cache_key(site_id, tier_id))
+
+
+def get_tier_definition_version(site_id: uuid.UUID, tier_id: uuid.UUID) -> Optional[str]:
+    """档位定义版本号（派生缓存 Key 用；共享缓存不可用时为 None）"""
+    return _tier_cache.version(_cache_key(site_id, tier_id))
+
+
+def invalidate_tier_definition(site_id: uuid.UUID, tier_id: uuid.UUID) -> None:
+    """档位定义变更后调用（价格 / 代币 / 促销窗口 / 激活状态）"""
+    _tier_cache.invalidate(_cache_key(site_id, tier_id))
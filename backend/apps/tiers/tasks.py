@@ -0,0 +1,54 @@
+"""
+Tier Celery 任务
+
+定时任务：
+- 分片库存档位展示快照同步
+- 库存前置层预留结算
+"""
+from celery import shared_task
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def sync_sharded_inventory():
+    """
+    同步分片档位的 Tier.available_units（分片合计）
+    
+    触发时间：每分钟
+    
+    ⭐ 单条 UPDATE ... FROM (GROUP BY)，仅写入有变化的档位
+    ⚠️ 快照仅用于列表展示；锁定 / 库存查询始终以分片为准
+    """
+    from apps.tiers.services.inventory_shards import sync_sharded_inventory as sync
+    
+    updated = sync()
+    
+    if updated:
+        logger.debug(f"Synced {updated} sharded tier snapshots", extra={'updated': updated})
+    
+    return {'updated': updated}
+
+
+@shared_task
+def settle_inventory_reservations():
+    """
+    库存前置层结算
+    
+    触发时间：每分钟
+    
+    ⭐ 回收过期预留 → 批量写回 tiers（entry_id 去重）→ 按 DB 校准计数器
+    ⚠️ 互斥由 settle_inventory_front 持有：另一结算进行中时跳过本次
+    """
+    from apps.tiers.services.reservations import settle_inventory_front
+    
+    result = settle_inventory_front()
+    
+    if result['settled'] or result['expired']:
+        logger.info(
+            f"Inventory front settled {result['settled']} entries, expired {result['expired']} reservations",
+            extra=result
+        )
+    
+    return result
@@ -310,3 +310,45 @@ class TestTierAdminAPI:
         for tier in response.data['results']:
             assert tier['site_code'] == site.code
 
+
+
+@pytest.mark.django_db
+class TestTierCatalogAPI:
+    """测试公开档位目录（ETag / 失效）与实时库存"""
+    
+    def test_catalog_revalidates_with_etag(self, api_client, site, tier):
+        """测试目录 ETag 协商：未变更返回 304，不含库存字段"""
+        api_client.defaults['HTTP_X_SITE_CODE'] = site.code
+        
+        response = api_client.get('/api/v1/tiers/catalog/')
+        assert response.status_code == status.HTTP_200_OK
+        assert 'public' in response['Cache-Control']
+        assert 'available_units' not in response.data['tiers'][0]
+        etag = response['ETag']
+        
+        response = api_client.get('/api/v1/tiers/catalog/', HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response['ETag'] == etag
+    
+    def test_catalog_etag_changes_after_admin_update(self, api_client, admin_user, site, tier):
+        """测试管理端改价后目录 ETag 变化"""
+        api_client.defaults['HTTP_X_SITE_CODE'] = site.code
+        etag = api_client.get('/api/v1/tiers/catalog/')['ETag']
+        
+        api_client.force_authenticate(user=admin_user)
+        api_client.patch(f'/api/v1/admin/tiers/{tier.tier_id}/', {'list_price_usd': '1234.00'})
+        api_client.force_authenticate(user=None)
+        
+        response = api_client.get('/api/v1/tiers/catalog/', HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert response['ETag'] != etag
+        assert response.data['tiers'][0]['list_price_usd'] == '1234.00'
+    
+    def test_availability(self, api_client, site, tier):
+        """测试实时库存端点"""
+        api_client.defaults['HTTP_X_SITE_CODE'] = site.code
+        
+        response = api_client.get('/api/v1/tiers/availability/')
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['tiers'][0]['tier_id'] == str(tier.tier_id)
+        assert response.data['tiers'][0]['available_units'] == tier.available_units
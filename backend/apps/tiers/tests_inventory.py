@@ -6,14 +6,29 @@
 - 库存不足拒绝
 - 库存回补
 - version 冲突处理
+- 分片库存（并发不超卖 / 合并分配 / 关闭回写）
+- 预留前置层（进程内后端：预留 / 过期回收 / 结算 / 校准）
 """
-from django.test import TransactionTestCase
+import time
+from unittest import mock
+
+from django.db import transaction
+from django.test import TransactionTestCase, override_settings
 from decimal import Decimal
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from apps.sites.models import Site
-from apps.tiers.models import Tier
-from apps.tiers.services.inventory import lock_inventory, release_inventory, check_inventory_available
+from apps.tiers.models import InventorySettlement, Tier, TierInventoryShard
+from apps.tiers.services.inventory import (
+    lock_inventory, release_inventory, check_inventory_available, get_inventory_status,
+    reserve_tier_units
+)
+from apps.tiers.services.inventory_shards import enable_inventory_sharding, disable_inventory_sharding
+from apps.tiers.services.reservations import (
+    RESERVE_NOT_PRIMED, RESERVE_OK, RESERVE_SOLD_OUT,
+    apply_settlements, cancel_reservation, confirm_reservation, get_inventory_front,
+    prime_inventory_front, reserve_inventory, reset_inventory_front, settle_inventory_front,
+)
 
 
 class InventoryServiceTestCase(TransactionTestCase):
@@ -52,6 +67,24 @@ class InventoryServiceTestCase(TransactionTestCase):
         self.assertEqual(self.tier.available_units, 5)
         self.assertEqual(self.tier.version, 1)
     
+    def test_reserve_tier_units_returns_tier(self):
+        """测试单条 UPDATE ... RETURNING 返回扣减后的档位"""
+        tier, error = reserve_tier_units(self.tier.tier_id, 4)
+        
+        self.assertEqual(error, '')
+        self.assertEqual(tier.tier_id, self.tier.tier_id)
+        self.assertEqual(tier.available_units, 6)
+        self.assertEqual(tier.version, 1)
+        self.assertEqual(tier.list_price_usd, Decimal('100.00'))
+    
+    def test_reserve_tier_units_inactive(self):
+        """测试未激活档位不扣减"""
+        Tier.objects.filter(tier_id=self.tier.tier_id).update(is_active=False)
+        
+        tier, error = reserve_tier_units(self.tier.tier_id, 1)
+        self.assertIsNone(tier)
+        self.assertEqual(error, 'TIER.INACTIVE')
+    
     def test_lock_inventory_insufficient(self):
         """测试库存不足"""
         success, error = lock_inventory(self.tier.tier_id, 15)
@@ -119,3 +152,225 @@ class InventoryServiceTestCase(TransactionTestCase):
         self.assertFalse(available)
 
 
+class ShardedInventoryTestCase(TransactionTestCase):
+    """分片库存测试（需要真实数据库事务）"""
+    
+    def setUp(self):
+        """测试前置：10 单位库存拆分为 4 个分片"""
+        self.site = Site.objects.create(
+            code='SH',
+            name='Sharded',
+            domain='sharded.posx.test',
+            is_active=True
+        )
+        
+        self.tier = Tier.objects.create(
+            site=self.site,
+            name='Hot Tier',
+            list_price_usd=Decimal('100.00'),
+            tokens_per_unit=Decimal('1000.00'),
+            total_units=10,
+            sold_units=0,
+            available_units=10,
+            version=0,
+            is_active=True
+        )
+        enable_inventory_sharding(self.tier.tier_id, 4)
+    
+    def _shards(self):
+        return list(
+            TierInventoryShard.objects.filter(tier=self.tier)
+            .order_by('shard_index').values_list('available_units', flat=True)
+        )
+    
+    def test_enable_splits_available_units(self):
+        """测试开启分片均分库存"""
+        self.assertEqual(self._shards(), [3, 3, 2, 2])
+        self.assertEqual(get_inventory_status(self.tier.tier_id)['available_units'], 10)
+    
+    def test_lock_rebalances_when_shard_dry(self):
+        """测试单分片不足时合并分配并重新均分"""
+        success, error = lock_inventory(self.tier.tier_id, 7)
+        
+        self.assertTrue(success)
+        self.assertEqual(sum(self._shards()), 3)
+        self.assertEqual(self._shards(), [1, 1, 1, 0])
+        
+        success, error = lock_inventory(self.tier.tier_id, 4)
+        self.assertFalse(success)
+        self.assertEqual(error, 'INVENTORY.INSUFFICIENT')
+    
+    def test_concurrent_lock_never_oversells(self):
+        """测试并发锁定（20 个线程抢 10 个单位）"""
+        num_threads = 20
+        
+        def try_lock():
+            try:
+                return lock_inventory(self.tier.tier_id, 1)
+            except Exception as e:
+                return False, str(e)
+        
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            futures = [executor.submit(try_lock) for _ in range(num_threads)]
+            results = [future.result() for future in as_completed(futures)]
+        
+        success_count = sum(1 for success, _ in results if success)
+        
+        self.assertEqual(success_count, 10)
+        self.assertEqual(self._shards(), [0, 0, 0, 0])
+        
+        # 分片模式不写 Tier 行
+        self.tier.refresh_from_db()
+        self.assertEqual(self.tier.version, 1)  # 仅开启分片时 +1
+    
+    def test_release_and_disable(self):
+        """测试回补与关闭分片"""
+        lock_inventory(self.tier.tier_id, 5)
+        release_inventory(self.tier.tier_id, 2)
+        
+        self.assertTrue(check_inventory_available(self.tier.tier_id, 7))
+        self.assertFalse(check_inventory_available(self.tier.tier_id, 8))
+        
+        self.assertEqual(disable_inventory_sharding(self.tier.tier_id), 7)
+        self.tier.refresh_from_db()
+        self.assertEqual(self.tier.inventory_shards, 0)
+        self.assertEqual(self.tier.available_units, 7)
+        self.assertFalse(TierInventoryShard.objects.filter(tier=self.tier).exists())
+
+
+@override_settings(INVENTORY_FRONT_BACKEND='memory', INVENTORY_RESERVATION_TTL=300)
+class InventoryFrontTestCase(TransactionTestCase):
+    """库存预留前置层测试（进程内后端）"""
+    
+    def setUp(self):
+        """测试前置：10 单位库存装载到前置层"""
+        reset_inventory_front()
+        self.site = Site.objects.create(
+            code='FR',
+            name='Front',
+            domain='front.posx.test',
+            is_active=True
+        )
+        
+        self.tier = Tier.objects.create(
+            site=self.site,
+            name='Flash Tier',
+            list_price_usd=Decimal('100.00'),
+            tokens_per_unit=Decimal('1000.00'),
+            total_units=10,
+            sold_units=0,
+            available_units=10,
+            version=0,
+            is_active=True
+        )
+        prime_inventory_front(self.tier.tier_id)
+        self.front = get_inventory_front()
+    
+    def tearDown(self):
+        reset_inventory_front()
+    
+    def test_reserve_until_sold_out(self):
+        """测试预留扣减计数器，售罄快速失败"""
+        status, reservation_id = reserve_inventory(self.tier.tier_id, 6)
+        self.assertEqual(status, RESERVE_OK)
+        self.assertIsNotNone(reservation_id)
+        
+        status, reservation_id = reserve_inventory(self.tier.tier_id, 5)
+        self.assertEqual(status, RESERVE_SOLD_OUT)
+        self.assertIsNone(reservation_id)
+        self.assertEqual(get_inventory_status(self.tier.tier_id)['available_units'], 4)
+    
+    def test_unprimed_tier_falls_back(self):
+        """测试未装载档位回退 DB 路径"""
+        self.front.drain(self.tier.tier_id)
+        status, _ = reserve_inventory(self.tier.tier_id, 1)
+        self.assertEqual(status, RESERVE_NOT_PRIMED)
+    
+    def test_confirm_settles_to_tier(self):
+        """测试确认后结算写回 tiers（重放不重复扣减）"""
+        _, reservation_id = reserve_inventory(self.tier.tier_id, 3)
+        self.assertTrue(confirm_reservation(reservation_id, self.tier.tier_id, 3))
+        
+        entries = self.front.peek_settlements(10)
+        result = settle_inventory_front()
+        self.assertEqual(result['settled'], 1)
+        self.assertEqual(result['drift'], {})
+        
+        apply_settlements(entries)  # 重放
+        self.tier.refresh_from_db()
+        self.assertEqual(self.tier.available_units, 7)
+        self.assertEqual(InventorySettlement.objects.filter(tier=self.tier).count(), 1)
+    
+    def test_cancel_and_expire_return_stock(self):
+        """测试取消 / 过期回收归还计数器"""
+        _, first = reserve_inventory(self.tier.tier_id, 4)
+        self.assertTrue(cancel_reservation(first, self.tier.tier_id, 4))
+        self.assertEqual(self.front.available(self.tier.tier_id), 10)
+        
+        self.front.reserve(self.tier.tier_id, 4, ttl=0)
+        self.assertEqual(self.front.sweep(time.time() + 1, 100), 1)
+        self.assertEqual(self.front.available(self.tier.tier_id), 10)
+    
+    def test_release_goes_through_front(self):
+        """测试已装载档位的回补写入前置层"""
+        _, reservation_id = reserve_inventory(self.tier.tier_id, 5)
+        confirm_reservation(reservation_id, self.tier.tier_id, 5)
+        
+        success, _ = release_inventory(self.tier.tier_id, 2)
+        self.assertTrue(success)
+        self.assertEqual(self.front.available(self.tier.tier_id), 7)
+        
+        settle_inventory_front()
+        self.tier.refresh_from_db()
+        self.assertEqual(self.tier.available_units, 7)
+    
+    def test_release_after_drain_falls_back_to_db(self):
+        """测试回补提交前档位被卸载：提交后回补到 DB，不丢失库存"""
+        _, reservation_id = reserve_inventory(self.tier.tier_id, 5)
+        confirm_reservation(reservation_id, self.tier.tier_id, 5)
+        settle_inventory_front()
+        
+        with transaction.atomic():
+            success, _ = release_inventory(self.tier.tier_id, 2)
+            self.assertTrue(success)
+            self.front.drain(self.tier.tier_id)
+        
+        self.tier.refresh_from_db()
+        self.assertEqual(self.tier.available_units, 7)
+    
+    def test_confirm_front_error_does_not_raise(self):
+        """测试确认时前置层故障：不抛出异常，返回 False 由下单方补偿"""
+        _, reservation_id = reserve_inventory(self.tier.tier_id, 1)
+        
+        with mock.patch.object(self.front, 'confirm', side_effect=ConnectionError('redis down')):
+            self.assertFalse(confirm_reservation(reservation_id, self.tier.tier_id, 1))
+    
+    def test_concurrent_settle_is_skipped(self):
+        """测试结算互斥：另一结算持锁时跳过，不裁剪结算队列"""
+        from django.core.cache import cache
+        from apps.tiers.services.reservations import SETTLEMENT_LOCK_KEY
+        
+        _, reservation_id = reserve_inventory(self.tier.tier_id, 3)
+        confirm_reservation(reservation_id, self.tier.tier_id, 3)
+        
+        cache.add(SETTLEMENT_LOCK_KEY, 'other-worker', timeout=60)
+        try:
+            result = settle_inventory_front()
+            self.assertTrue(result['skipped'])
+            self.assertEqual(len(self.front.peek_settlements(10)), 1)
+            with self.assertRaises(ValueError):
+                with self.settings(INVENTORY_SETTLEMENT_LOCK_WAIT=0):
+                    prime_inventory_front(self.tier.tier_id)
+        finally:
+            cache.delete(SETTLEMENT_LOCK_KEY)
+        
+        self.assertEqual(settle_inventory_front()['settled'], 1)
+    
+    def test_reconcile_corrects_drift(self):
+        """测试结算队列清空后按 DB 校准计数器"""
+        reserve_inventory(self.tier.tier_id, 2)  # 未确认预留
+        Tier.objects.filter(tier_id=self.tier.tier_id).update(available_units=8)
+        
+        result = settle_inventory_front()
+        self.assertEqual(result['drift'], {str(self.tier.tier_id): 2})
+        self.assertEqual(self.front.available(self.tier.tier_id), 6)
@@ -6,6 +6,10 @@
 - GET /api/v1/tiers/ - 产品列表
 - GET /api/v1/tiers/{id}/ - 产品详情
 
+公开端点（AllowAny，可被 CDN 缓存）：
+- GET /api/v1/tiers/catalog/ - 产品目录（ETag + Cache-Control，不含库存）
+- GET /api/v1/tiers/availability/ - 实时库存
+
 管理端点（IsAdminUser）：
 - POST /api/v1/admin/tiers/ - 创建产品
 - PUT /api/v1/admin/tiers/{id}/ - 更新产品
@@ -4,22 +4,48 @@
 ⭐ 端点：
 - GET /api/v1/tiers/ - 列表（分页 + 过滤）
 - GET /api/v1/tiers/{id}/ - 详情
+- GET /api/v1/tiers/catalog/ - 公开目录（不含库存，ETag + Cache-Control）
+- GET /api/v1/tiers/availability/ - 实时库存（极短 max-age）
 
 ⭐ 权限：
-- 所有端点：IsAuthenticated
+- 列表 / 详情：IsAuthenticated
+- 目录 / 实时库存：公开（同站点所有用户一致，可被 CDN 缓存）
 - 站点隔离：自动通过request.site过滤
 """
 import logging
-from rest_framework import viewsets
-from rest_framework.permissions import IsAuthenticated
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.response import Response
+from django.conf import settings
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from decimal import Decimal
 
 from .models import Tier
 from .serializers import TierSerializer, TierListSerializer
+from .services.catalog import catalog_max_age, get_tier_availability, get_tier_catalog
 
 logger = logging.getLogger(__name__)
 
 
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match 是否命中（忽略弱校验前缀 W/）"""
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(',')]
+    return '*' in candidates or etag in [
+        value[2:] if value.startswith('W/') else value for value in candidates
+    ]
+
+
+def _public_cache(response, max_age: int):
+    """公开缓存头（按站点区分：X-Site-Code / Host）"""
+    patch_cache_control(response, public=True, max_age=max_age)
+    patch_vary_headers(response, ['X-Site-Code', 'Host'])
+    return response
+
+
 class TierViewSet(viewsets.ReadOnlyModelViewSet):
     """
     档位视图集（只读）
@@ -93,5 +119,43 @@ class TierViewSet(viewsets.ReadOnlyModelViewSet):
         if self.action == 'list':
             return TierListSerializer
         return TierSerializer
-
-
+    
+    @action(detail=False, methods=['get'], permission_classes=[AllowAny], authentication_classes=[])
+    def catalog(self, request):
+        """
+        公开档位目录（不含库存）
+        
+        GET /api/v1/tiers/catalog/
+        
+        ⭐ 进程内缓存，命中时不查询数据库；If-None-Match 命中返回 304
+        ⚠️ 库存请使用 /api/v1/tiers/availability/
+        """
+        catalog = get_tier_catalog(request.site.site_id)
+        etag = catalog['etag']
+        
+        if _etag_matches(request.META.get('HTTP_IF_NONE_MATCH', ''), etag):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response({'site_code': request.site.code, 'tiers': catalog['tiers']})
+        
+        response['ETag'] = etag
+        return _public_cache(response, catalog_max_age(catalog))
+    
+    @action(detail=False, methods=['get'], permission_classes=[AllowAny], authentication_classes=[])
+    def availability(self, request):
+        """
+        实时库存
+        
+        GET /api/v1/tiers/availability/
+        
+        Response: 200
+        {
+            "as_of": "2025-11-30T12:00:00Z",
+            "tiers": [{"tier_id": "uuid", "available_units": 8523, "is_sold_out": false}]
+        }
+        """
+        response = Response({
+            'as_of': timezone.now().isoformat(),
+            'tiers': get_tier_availability(request.site.site_id)
+        })
+        return _public_cache(response, getattr(settings, 'TIER_AVAILABILITY_MAX_AGE', 2))
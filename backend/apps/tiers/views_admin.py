@@ -18,9 +18,13 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAdminUser
 from django.db import transaction
 from django.db.models import F
+from django.utils import timezone
 from decimal import Decimal
 
 from .models import Tier
+from .services.catalog import invalidate_tier_catalog
+from .services.reservations import drain_if_primed
+from .services.tier_cache import invalidate_tier_definition
 from .serializers_admin import (
     TierCreateSerializer,
     TierUpdateSerializer,
@@ -110,6 +114,7 @@ class TierAdminViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         """创建产品（记录日志）"""
         tier = serializer.save()
+        invalidate_tier_catalog(tier.site_id)
         
         logger.info(
             f"Created tier: {tier.name}",
@@ -126,6 +131,11 @@ class TierAdminViewSet(viewsets.ModelViewSet):
     def perform_update(self, serializer):
         """更新产品（记录日志）"""
         tier = serializer.save()
+        invalidate_tier_definition(tier.site_id, tier.tier_id)
+        invalidate_tier_catalog(tier.site_id)
+        if not tier.is_active:
+            # 停售：卸载前置层（提交后执行）
+            transaction.on_commit(lambda: drain_if_primed(tier.tier_id))
         
         logger.info(
             f"Updated tier: {tier.name}",
@@ -140,6 +150,9 @@ class TierAdminViewSet(viewsets.ModelViewSet):
         """软删除产品（设置 is_active=False）"""
         instance.is_active = False
         instance.save(update_fields=['is_active', 'updated_at'])
+        invalidate_tier_definition(instance.site_id, instance.tier_id)
+        invalidate_tier_catalog(instance.site_id)
+        transaction.on_commit(lambda: drain_if_primed(instance.tier_id))
         
         logger.warning(
             f"Deactivated tier: {instance.name}",
@@ -181,10 +194,31 @@ class TierAdminViewSet(viewsets.ModelViewSet):
             old_total = tier.total_units
             old_available = tier.available_units
             
-            # 更新库存
-            tier.total_units += adjustment
-            tier.available_units += adjustment
-            tier.save(update_fields=['total_units', 'available_units', 'updated_at'])
+            if tier.inventory_shards:
+                # 分片库存：调整分片合计并重新均分
+                from apps.tiers.services.inventory import InventoryError
+                from apps.tiers.services.inventory_shards import adjust_sharded_inventory
+                
+                try:
+                    available = adjust_sharded_inventory(tier.tier_id, adjustment)
+                except InventoryError as e:
+                    return Response({
+                        'code': 'INVENTORY.INSUFFICIENT',
+                        'message': str(e)
+                    }, status=status.HTTP_400_BAD_REQUEST)
+                
+                tier.total_units += adjustment
+                tier.available_units = available
+                Tier.objects.filter(tier_id=tier.tier_id).update(
+                    total_units=tier.total_units,
+                    available_units=available,
+                    updated_at=timezone.now()
+                )
+            else:
+                # 更新库存
+                tier.total_units += adjustment
+                tier.available_units += adjustment
+                tier.save(update_fields=['total_units', 'available_units', 'updated_at'])
         
         logger.info(
             f"Adjusted tier inventory: {tier.name}",
@@ -225,6 +259,8 @@ class TierAdminViewSet(viewsets.ModelViewSet):
         tier = self.get_object()
         tier.is_active = True
         tier.save(update_fields=['is_active', 'updated_at'])
+        invalidate_tier_definition(tier.site_id, tier.tier_id)
+        invalidate_tier_catalog(tier.site_id)
         
         logger.info(
             f"Activated tier: {tier.name}",
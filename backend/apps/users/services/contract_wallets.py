@@ -0,0 +1,215 @@
+"""
+合约钱包识别（EIP-1271 前置检查）
+
+⭐ 地址分类缓存：
+- 进程内 LRU（L1）→ 共享缓存（L2，get_many 一次往返）→ 链上查询
+- 合约地址（有 code）缓存 SIWE_CONTRACT_CACHE_TTL；
+  EOA 缓存 SIWE_EOA_CACHE_TTL（较短：反事实部署的智能钱包之后可能出现 code）
+- 同一钱包重复登录在 TTL 内不访问 RPC
+
+⭐ 批量查询：
+- 未命中的地址按 SIWE_RPC_BATCH_SIZE 分批，一次 JSON-RPC batch（eth_getCode）
+
+⭐ 可插拔 Provider（SIWE_CONTRACT_WALLET_PROVIDER）：
+- 空：配置了 SIWE_RPC_URL 时使用 JsonRpcCodeProvider，否则 NullCodeProvider（全部视为 EOA）
+- 点分路径：自定义 Provider（须继承 CodeProvider，否则创建时抛出 ImproperlyConfigured）
+
+⚠️ RPC 失败：未命中的地址视为 EOA（不缓存），不阻断登录
+"""
+import logging
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from apps.core.utils.local_cache import LocalLRUCache
+
+logger = logging.getLogger(__name__)
+
+# 共享缓存 Key 前缀
+CACHE_KEY_PREFIX = 'posx:contract_wallet'
+
+# 共享缓存中的分类值（避免 False 与未命中混淆）
+CONTRACT = 'contract'
+EOA = 'eoa'
+
+
+class CodeProvider(ABC):
+    """
+    Provider 接口
+
+    has_code(addresses) -> {address: bool}（地址为小写 0x 形式；True=有合约 code）
+    """
+
+    @abstractmethod
+    def has_code(self, addresses: List[str]) -> Dict[str, bool]:
+        ...
+
+
+class NullCodeProvider(CodeProvider):
+    """未配置 RPC：全部视为 EOA"""
+
+    def has_code(self, addresses: List[str]) -> Dict[str, bool]:
+        return {address: False for address in addresses}
+
+
+class JsonRpcCodeProvider(CodeProvider):
+    """
+    JSON-RPC Provider（单次 HTTP 请求批量 eth_getCode）
+
+    Raises:
+        requests.RequestException / ValueError: RPC 不可用或响应异常
+    """
+
+    def __init__(self, rpc_url: str, timeout: float = 5):
+        self.rpc_url = rpc_url
+        self.timeout = timeout
+
+    def has_code(self, addresses: List[str]) -> Dict[str, bool]:
+        batch = [
+            {'jsonrpc': '2.0', 'id': index, 'method': 'eth_getCode', 'params': [address, 'latest']}
+            for index, address in enumerate(addresses)
+        ]
+        response = requests.post(self.rpc_url, json=batch, timeout=self.timeout)
+        response.raise_for_status()
+
+        results = {}
+        for item in response.json():
+            if 'error' in item:
+                raise ValueError(f"eth_getCode failed: {item['error']}")
+            code = item.get('result') or '0x'
+            results[addresses[item['id']]] = code not in ('0x', '0x0')
+        return results
+
+
+_provider = None
+# L1 存活时间短于 L2：共享缓存中的分类过期后各进程随之刷新
+_local = LocalLRUCache(max_entries=10000, default_ttl=300)
+
+
+def get_code_provider() -> CodeProvider:
+    """
+    获取 Provider（按配置创建，进程内复用）
+
+    Raises:
+        ImproperlyConfigured: 自定义 Provider 未继承 CodeProvider
+        TypeError: 自定义 Provider 未实现 has_code
+    """
+    global _provider
+
+    if _provider is None:
+        provider_path = getattr(settings, 'SIWE_CONTRACT_WALLET_PROVIDER', '')
+        rpc_url = getattr(settings, 'SIWE_RPC_URL', '')
+        if provider_path:
+            provider_class = import_string(provider_path)
+            if not (isinstance(provider_class, type) and issubclass(provider_class, CodeProvider)):
+                raise ImproperlyConfigured(
+                    f"SIWE_CONTRACT_WALLET_PROVIDER must be a CodeProvider subclass: {provider_path}"
+                )
+            _provider = provider_class()
+        elif rpc_url:
+            _provider = JsonRpcCodeProvider(rpc_url)
+        else:
+            _provider = NullCodeProvider()
+    return _provider
+
+
+def reset_contract_wallet_cache() -> None:
+    """重置 Provider 与进程内缓存（测试 / 配置变更用）"""
+    global _provider
+    _provider = None
+    _local.clear()
+
+
+def _cache_key(address: str) -> str:
+    return f"{CACHE_KEY_PREFIX}:{settings.SIWE_CHAIN_ID}:{address}"
+
+
+def _lookup_chain(addresses: List[str]) -> Dict[str, bool]:
+    """链上查询（分批；失败的批次不返回结果）"""
+    provider = get_code_provider()
+    batch_size = getattr(settings, 'SIWE_RPC_BATCH_SIZE', 100)
+
+    results = {}
+    for start in range(0, len(addresses), batch_size):
+        batch = addresses[start:start + batch_size]
+        try:
+            results.update(provider.has_code(batch))
+        except Exception as e:
+            logger.warning(
+                f"Contract wallet lookup failed: {e}",
+                extra={'addresses': len(batch)}
+            )
+    return results
+
+
+def classify_addresses(addresses: Iterable[str]) -> Dict[str, bool]:
+    """
+    批量识别合约钱包
+
+    Args:
+        addresses: 钱包地址（大小写不敏感）
+
+    Returns:
+        {原始地址: True=合约 / False=EOA}
+    """
+    normalized = {address: address.lower() for address in addresses}
+    classified: Dict[str, bool] = {}
+
+    # L1：进程内
+    missing = []
+    for address in set(normalized.values()):
+        value = _local.get(address)
+        if value is None:
+            missing.append(address)
+        else:
+            classified[address] = value
+
+    # L2：共享缓存（一次往返）
+    if missing:
+        try:
+            shared = cache.get_many([_cache_key(address) for address in missing])
+        except Exception as e:
+            logger.warning(f"Contract wallet cache unavailable: {e}")
+            shared = {}
+
+        still_missing = []
+        for address in missing:
+            value = shared.get(_cache_key(address))
+            if value is None:
+                still_missing.append(address)
+                continue
+            classified[address] = value == CONTRACT
+            _local.set(address, classified[address])
+
+        # 链上：批量查询并回填两级缓存
+        if still_missing:
+            looked_up = _lookup_chain(still_missing)
+            contract_ttl = getattr(settings, 'SIWE_CONTRACT_CACHE_TTL', 30 * 86400)
+            eoa_ttl = getattr(settings, 'SIWE_EOA_CACHE_TTL', 86400)
+
+            for is_contract, ttl in ((True, contract_ttl), (False, eoa_ttl)):
+                group = {
+                    _cache_key(address): CONTRACT if is_contract else EOA
+                    for address, value in looked_up.items() if value is is_contract
+                }
+                if not group:
+                    continue
+                try:
+                    cache.set_many(group, timeout=ttl)
+                except Exception as e:
+                    logger.warning(f"Contract wallet cache write failed: {e}")
+
+            for address in still_missing:
+                if address in looked_up:
+                    classified[address] = looked_up[address]
+                    _local.set(address, looked_up[address])
+                else:
+                    # RPC 失败：视为 EOA，不缓存
+                    classified[address] = False
+
+    return {original: classified[address] for original, address in normalized.items()}
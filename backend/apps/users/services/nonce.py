@@ -3,11 +3,16 @@ Nonce 服务
 
 ⭐ 安全特性：
 - Redis SET NX EX 保证原子性
-- 5分钟 TTL（可配置）
-- 一次性消费（用后即删）
+- 5分钟 TTL（可配置，过期由 Redis 自动清理）
+- 一次性消费（用后即删）：GET + DEL 在一个 Lua 脚本内执行，并发登录只有一个成功
 - Key规范：posx:{site}:{env}:nonce:{nonce}
 - 防止重放攻击
 
+⭐ 存储后端（get_nonce_store）：
+- RedisNonceStore：复用 django_redis 连接池，签发 / 消费各一次往返
+- InMemoryNonceStore：非 Redis 缓存后端（测试 / 本地）时使用，线程安全
+  ⚠️ 仅单进程有效
+
 使用示例：
 >>> nonce, expires_in = generate_nonce('NA', 'prod')
 >>> # 用户签名后提交
@@ -17,9 +22,12 @@ Nonce 服务
 """
 import secrets
 import logging
-from typing import Tuple, Optional
+import threading
+import time
+from typing import Dict, Optional, Tuple
 from django.conf import settings
-from django.core.cache import cache
+
+from apps.core.utils.redis import get_redis_client
 
 logger = logging.getLogger(__name__)
 
@@ -30,6 +38,92 @@ NONCE_TTL = getattr(settings, 'NONCE_TTL_SECONDS', 300)  # 5分钟
 NONCE_KEY_PREFIX = 'posx'
 
 
+# 原子 GETDEL（兼容 Redis < 6.2）
+CONSUME_LUA = """
+local value = redis.call('GET', KEYS[1])
+if value then
+    redis.call('DEL', KEYS[1])
+end
+return value
+"""
+
+
+class RedisNonceStore:
+    """Redis 存储（签发 SET NX EX / 消费 Lua GETDEL，各一次往返）"""
+    
+    def __init__(self, client):
+        self.client = client
+        self._consume = client.register_script(CONSUME_LUA)
+    
+    def issue(self, key: str, value: str, ttl: int) -> bool:
+        return bool(self.client.set(key, value, ex=ttl, nx=True))
+    
+    def consume(self, key: str) -> Optional[str]:
+        value = self._consume(keys=[key])
+        return value.decode() if isinstance(value, bytes) else value
+    
+    def exists(self, key: str) -> bool:
+        return bool(self.client.exists(key))
+
+
+class InMemoryNonceStore:
+    """进程内存储（语义与 Redis 一致：NX / TTL / 原子消费）"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[str, float]] = {}
+    
+    def _purge(self, now: float) -> None:
+        expired = [key for key, (_, expires_at) in self._entries.items() if expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+    
+    def issue(self, key: str, value: str, ttl: int) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            if key in self._entries:
+                return False
+            self._entries[key] = (value, now + ttl)
+            return True
+    
+    def consume(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        return entry[0]
+    
+    def exists(self, key: str) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[1] > time.monotonic()
+
+
+_store = None
+
+
+def get_nonce_store():
+    """
+    获取 Nonce 存储
+    
+    Returns:
+        RedisNonceStore（django_redis 可用）/ InMemoryNonceStore
+    """
+    global _store
+    
+    if _store is None:
+        client = get_redis_client()
+        _store = RedisNonceStore(client) if client is not None else InMemoryNonceStore()
+    return _store
+
+
+def reset_nonce_store() -> None:
+    """重置存储（测试用）"""
+    global _store
+    _store = None
+
+
 def _get_nonce_key(nonce: str, site_code: str, env: str) -> str:
     """
     生成 Redis Key
@@ -71,18 +165,17 @@ def generate_nonce(site_code: str, env: str = 'prod') -> Tuple[str, int]:
         >>> nonce, expires_in = generate_nonce('NA')
         >>> print(f"Nonce: {nonce}, 过期时间: {expires_in}秒")
     """
-    # 生成32字节的URL安全随机字符串
-    nonce = secrets.token_urlsafe(32)
-    
-    # 构造 Redis Key
-    key = _get_nonce_key(nonce, site_code, env)
+    store = get_nonce_store()
     
-    # 存储到 Redis（SET NX EX）
     # 值为时间戳（便于调试）
     from django.utils import timezone
     timestamp = timezone.now().isoformat()
     
-    cache.set(key, timestamp, timeout=NONCE_TTL)
+    # 生成32字节的URL安全随机字符串，SET NX EX 写入（碰撞时重新生成）
+    while True:
+        nonce = secrets.token_urlsafe(32)
+        if store.issue(_get_nonce_key(nonce, site_code, env), timestamp, NONCE_TTL):
+            break
     
     logger.debug(
         f"Generated nonce for site={site_code}, env={env}, expires_in={NONCE_TTL}s",
@@ -116,10 +209,8 @@ def consume_nonce(nonce: str, site_code: str, env: str = 'prod') -> bool:
     """
     key = _get_nonce_key(nonce, site_code, env)
     
-    # 原子获取并删除
-    # Django cache 不支持 GETDEL，用 get + delete 模拟
-    # ⚠️ 生产环境建议用 Redis 客户端直接调用 GETDEL
-    value = cache.get(key)
+    # 原子获取并删除（一次往返）
+    value = get_nonce_store().consume(key)
     
     if value is None:
         logger.warning(
@@ -128,9 +219,6 @@ def consume_nonce(nonce: str, site_code: str, env: str = 'prod') -> bool:
         )
         return False
     
-    # 删除 nonce
-    cache.delete(key)
-    
     logger.info(
         f"Consumed nonce: site={site_code}, env={env}",
         extra={'nonce': nonce[:8] + '...', 'site_code': site_code}
@@ -154,23 +242,4 @@ def check_nonce_exists(nonce: str, site_code: str, env: str = 'prod') -> bool:
         bool: True=存在, False=不存在/已过期
     """
     key = _get_nonce_key(nonce, site_code, env)
-    return cache.get(key) is not None
-
-
-def clear_expired_nonces(site_code: Optional[str] = None, env: Optional[str] = None):
-    """
-    清理过期 Nonce（可选）
-    
-    ⚠️ Redis 会自动清理过期 Key，通常不需要手动调用
-    
-    Args:
-        site_code: 站点代码（None=所有站点）
-        env: 环境（None=所有环境）
-    """
-    # Redis TTL 会自动清理，此函数预留用于统计或调试
-    logger.info(
-        f"Nonce auto-expiration handled by Redis TTL",
-        extra={'site_code': site_code, 'env': env}
-    )
-
-
+    return get_nonce_store().exists(key)
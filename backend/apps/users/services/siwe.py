@@ -304,8 +304,8 @@ def is_contract_wallet(address: str) -> bool:
     """
     检查是否为合约钱包（EIP-1271）
     
-    ⚠️ Phase C 暂不支持，返回 False
-    Phase D 实现：查询链上 code
+    ⭐ 地址分类缓存 + 批量链上查询（见 contract_wallets.py）
+    ⚠️ 合约钱包签名验证（EIP-1271）仍未支持，识别后由调用方拒绝
     
     Args:
         address: 钱包地址
@@ -313,8 +313,6 @@ def is_contract_wallet(address: str) -> bool:
     Returns:
         bool: True=合约钱包, False=EOA钱包
     """
-    # Phase C: 暂不支持合约钱包
-    # Phase D: 使用 web3.eth.get_code(address) 检查
-    return False
-
-
+    from .contract_wallets import classify_addresses
+    
+    return classify_addresses([address])[address]
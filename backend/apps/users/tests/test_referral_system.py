@@ -0,0 +1,134 @@
+"""
+Referral Chain Tests
+
+测试范围：
+1. 单查询解析推荐链路
+2. 环路检测（抛异常 / 截断）
+3. 同一结果返回 AgentProfile / AgentStats
+"""
+import pytest
+from decimal import Decimal
+
+from apps.agents.models import AgentProfile, AgentStats
+from apps.commissions.tasks import get_referral_chain as get_commission_referral_chain
+from apps.sites.models import Site
+from apps.users.models import User
+from apps.users.utils.referral_chain import (
+    CircularReferralError,
+    get_referral_chain,
+    resolve_referral_chain,
+)
+
+
+def _create_chain(length):
+    """创建 root <- u1 <- u2 ... 推荐链，返回 [root, u1, ..., buyer]"""
+    users = []
+    referrer = None
+    for i in range(length):
+        user = User.objects.create(
+            email=f'chain_{i}@test.com',
+            referral_code=f'CHAIN-{i}',
+            referrer=referrer,
+            is_active=True
+        )
+        users.append(user)
+        referrer = user
+    return users
+
+
+@pytest.mark.django_db
+class TestResolveReferralChain:
+    """测试单查询推荐链解析"""
+
+    def test_chain_order_and_levels(self):
+        """推荐链按层级从近到远返回"""
+        users = _create_chain(4)
+        buyer = users[-1]
+
+        chain = get_referral_chain(buyer, max_levels=10)
+
+        assert [item['level'] for item in chain] == [1, 2, 3]
+        assert [item['agent'].user_id for item in chain] == [
+            users[2].user_id, users[1].user_id, users[0].user_id
+        ]
+
+    def test_max_levels_limit(self):
+        """超过 max_levels 的上级不返回"""
+        users = _create_chain(5)
+
+        chain = get_referral_chain(users[-1], max_levels=2)
+
+        assert len(chain) == 2
+        assert chain[-1]['agent'].user_id == users[2].user_id
+
+    def test_single_query(self, django_assert_num_queries):
+        """10 级推荐链只需一次查询"""
+        users = _create_chain(11)
+        buyer = users[-1]
+
+        with django_assert_num_queries(1):
+            chain = get_referral_chain(buyer, max_levels=10)
+            # 访问 profile / stats 不应触发额外查询
+            [(item['profile'], item['stats']) for item in chain]
+
+        assert len(chain) == 10
+
+    def test_profile_and_stats_attached(self):
+        """同一结果返回 AgentProfile 和 AgentStats（按站点过滤）"""
+        site = Site.objects.create(
+            code='REF',
+            name='Referral Site',
+            domain='ref.local',
+            is_active=True
+        )
+        users = _create_chain(3)
+        agent = users[1]
+
+        AgentProfile.objects.create(
+            user=agent,
+            site=site,
+            agent_level=AgentProfile.LEVEL_GOLD
+        )
+        AgentStats.objects.create(
+            site_id=site.site_id,
+            agent=agent.user_id,
+            total_sales=Decimal('500.00'),
+            direct_customers=1,
+            total_customers=1,
+            total_commissions=Decimal('0')
+        )
+
+        resolved = resolve_referral_chain(
+            users[-1].user_id,
+            max_levels=2,
+            site_id=site.site_id,
+            include_self=True
+        )
+
+        assert resolved['self']['agent'].user_id == users[-1].user_id
+        assert resolved['self']['profile'] is None
+
+        level1, level2 = resolved['chain']
+        assert level1['profile'].agent_level == AgentProfile.LEVEL_GOLD
+        assert level1['stats'].total_sales == Decimal('500.00')
+        assert level2['profile'] is None
+        assert level2['stats'] is None
+
+    def test_circular_referral_raises(self):
+        """环路：users 工具抛出 CircularReferralError"""
+        user_a, user_b = _create_chain(2)
+        User.objects.filter(user_id=user_a.user_id).update(referrer=user_b)
+
+        with pytest.raises(CircularReferralError):
+            get_referral_chain(user_b, max_levels=10)
+
+    def test_circular_referral_truncated_for_commissions(self):
+        """环路：佣金任务记录日志并截断，不抛异常"""
+        user_a, user_b, user_c = _create_chain(3)
+        User.objects.filter(user_id=user_a.user_id).update(referrer=user_c)
+
+        chain = get_commission_referral_chain(user_c, max_levels=10)
+
+        assert [item['agent'].user_id for item in chain] == [
+            user_b.user_id, user_a.user_id
+        ]
@@ -6,11 +6,14 @@ SIWE 认证测试
 - Nonce 重放攻击
 - SIWE 消息验证
 - 域名/链/URI 校验
+- 合约钱包识别（缓存 + 批量）
 """
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from django.conf import settings
 
 from apps.sites.models import Site
+from .services.contract_wallets import CodeProvider
 from .services.nonce import generate_nonce, consume_nonce, check_nonce_exists
 
 
@@ -63,6 +66,32 @@ class NonceServiceTestCase(TestCase):
         consumed = consume_nonce(nonce, 'NA', 'prod')
         self.assertTrue(consumed)
 
+    
+    def test_concurrent_consume_succeeds_once(self):
+        """测试并发消费同一nonce只有一个成功（原子 GETDEL）"""
+        from concurrent.futures import ThreadPoolExecutor
+        
+        nonce, _ = generate_nonce('NA', 'test')
+        
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: consume_nonce(nonce, 'NA', 'test'), range(16)))
+        
+        self.assertEqual(results.count(True), 1)
+    
+    def test_in_memory_store_honors_ttl(self):
+        """测试进程内存储：NX 不覆盖、过期后不可消费"""
+        from .services.nonce import InMemoryNonceStore
+        
+        store = InMemoryNonceStore()
+        self.assertTrue(store.issue('k', 'v1', ttl=60))
+        self.assertFalse(store.issue('k', 'v2', ttl=60))
+        self.assertEqual(store.consume('k'), 'v1')
+        self.assertIsNone(store.consume('k'))
+        
+        store.issue('expired', 'v', ttl=0)
+        self.assertFalse(store.exists('expired'))
+        self.assertIsNone(store.consume('expired'))
+
 
 class SIWEVerificationTestCase(TestCase):
     """SIWE 验证测试（需要Mock）"""
@@ -93,6 +122,81 @@ class SIWEVerificationTestCase(TestCase):
         pass
 
 
+class StubCodeProvider(CodeProvider):
+    """合约钱包识别桩：以 CONTRACTS 中的地址为合约，记录调用批次"""
+    
+    CONTRACTS = {'0x00000000000000000000000000000000000000c1'}
+    calls = []
+    
+    def has_code(self, addresses):
+        StubCodeProvider.calls.append(list(addresses))
+        return {address: address in self.CONTRACTS for address in addresses}
+
+
+@override_settings(
+    SIWE_CONTRACT_WALLET_PROVIDER='apps.users.tests_siwe.StubCodeProvider',
+    SIWE_RPC_BATCH_SIZE=2,
+)
+class ContractWalletTestCase(TestCase):
+    """合约钱包识别测试"""
+    
+    def setUp(self):
+        from .services.contract_wallets import reset_contract_wallet_cache
+        
+        reset_contract_wallet_cache()
+        cache.clear()
+        StubCodeProvider.calls = []
+        self.addCleanup(reset_contract_wallet_cache)
+    
+    def test_batch_lookup_and_cache(self):
+        """测试未命中地址分批查询，重复登录不再访问链上"""
+        from .services.contract_wallets import classify_addresses, reset_contract_wallet_cache
+        
+        contract = '0x00000000000000000000000000000000000000C1'
+        eoas = [f'0x{index:040x}' for index in range(1, 4)]
+        
+        result = classify_addresses([contract] + eoas)
+        self.assertTrue(result[contract])
+        self.assertFalse(any(result[address] for address in eoas))
+        self.assertEqual(sorted(len(batch) for batch in StubCodeProvider.calls), [2, 2])
+        
+        # 进程内缓存命中
+        self.assertTrue(classify_addresses([contract.lower()])[contract.lower()])
+        self.assertEqual(len(StubCodeProvider.calls), 2)
+        
+        # 进程内缓存清空后由共享缓存命中
+        reset_contract_wallet_cache()
+        classify_addresses([contract] + eoas)
+        self.assertEqual(len(StubCodeProvider.calls), 2)
+    
+    def test_is_contract_wallet(self):
+        """测试 SIWE 登录入口使用缓存识别"""
+        from .services.siwe import is_contract_wallet
+        
+        self.assertTrue(is_contract_wallet('0x00000000000000000000000000000000000000c1'))
+        self.assertFalse(is_contract_wallet('0xab5801a7d398351b8be11c439e05c5b3259aec9b'))
+        self.assertFalse(is_contract_wallet('0xab5801a7d398351b8be11c439e05c5b3259aec9b'))
+        self.assertEqual(len(StubCodeProvider.calls), 2)
+    
+    @override_settings(SIWE_CONTRACT_WALLET_PROVIDER='', SIWE_RPC_URL='')
+    def test_no_rpc_treats_all_as_eoa(self):
+        """测试未配置 RPC：全部视为 EOA"""
+        from .services.contract_wallets import classify_addresses
+        
+        result = classify_addresses(['0x00000000000000000000000000000000000000c1'])
+        self.assertEqual(result, {'0x00000000000000000000000000000000000000c1': False})
+        self.assertEqual(StubCodeProvider.calls, [])
+    
+    @override_settings(SIWE_CONTRACT_WALLET_PROVIDER='apps.sites.models.Site')
+    def test_misconfigured_provider_raises(self):
+        """测试自定义 Provider 未继承 CodeProvider：报错而非静默视为 EOA"""
+        from django.core.exceptions import ImproperlyConfigured
+        from .services.contract_wallets import classify_addresses
+        
+        with self.assertRaises(ImproperlyConfigured):
+            classify_addresses(['0x00000000000000000000000000000000000000c1'])
+
+
 class WalletUtilsTestCase(TestCase):
     """钱包工具测试"""
     
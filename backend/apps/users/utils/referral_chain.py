@@ -4,14 +4,16 @@
 ⭐ Phase D: 环路检测防护
 
 功能：
-- 递归查询推荐链路
-- 环路检测（visited set）
+- 单条递归 CTE 查询整条推荐链路（一次往返）
+- 环路检测（path 数组）
 - 限制最大层级（防无限递归）
-- 可选Redis缓存（未来优化）
+- 同一查询返回 AgentProfile / AgentStats / 主钱包
 """
 import logging
-from typing import List, Dict, Optional
+import uuid
+from typing import Dict, Iterable, List, Optional, Set
 from decimal import Decimal
+from django.db import connection
 from apps.users.models import User
 
 logger = logging.getLogger(__name__)
@@ -22,6 +24,206 @@ class CircularReferralError(Exception):
     pass
 
 
+def _select_columns(model, alias: str) -> List[str]:
+    """生成 "alias.column AS alias__column" 列表（按 concrete_fields 顺序）"""
+    return [
+        f'{alias}."{field.column}" AS "{alias}__{field.column}"'
+        for field in model._meta.concrete_fields
+    ]
+
+
+def _instance_from_row(model, values: tuple):
+    """根据列值构造模型实例（主键为空时返回 None）"""
+    fields = model._meta.concrete_fields
+    pk_index = [f.attname for f in fields].index(model._meta.pk.attname)
+    if values[pk_index] is None:
+        return None
+    return model.from_db(connection.alias, [f.attname for f in fields], values)
+
+
+def resolve_referral_chains(
+    user_ids: Iterable[uuid.UUID],
+    max_levels: int = 10,
+    site_id: Optional[uuid.UUID] = None,
+    include_self: bool = False
+) -> Dict[uuid.UUID, Dict]:
+    """
+    单查询批量解析多个用户的推荐链路（递归 CTE）
+    
+    ⭐ 一次往返返回每个起始用户的：
+    - 每一级推荐人的 User
+    - 对应的 AgentProfile / AgentStats（按 site_id 过滤，缺失为 None）
+    - 主钱包地址
+    
+    ⭐ 环路检测：
+    - CTE 携带 path 数组（含起始用户），遇到已访问节点即停止递归
+    - 环路节点本身不返回，仅设置 cycle_detected
+    
+    Args:
+        user_ids: 起始用户ID列表（买家）
+        max_levels: 最大层级
+        site_id: 站点ID（用于过滤 AgentProfile / AgentStats）
+        include_self: 是否同时返回起始用户（level=0）
+    
+    Returns:
+        {
+            user_id: {
+                'self': {...} 或 None（include_self=True 时返回 level=0 节点）,
+                'chain': [{'agent': User, 'level': 1, 'profile': ..., 'stats': ...}, ...],
+                'cycle_detected': bool,
+                'cycle_user_id': UUID 或 None
+            },
+            ...
+        }
+        （不存在的用户不出现在结果中）
+    """
+    from apps.agents.models import AgentProfile, AgentStats
+    
+    root_ids = list({str(user_id) for user_id in user_ids})
+    if not root_ids:
+        return {}
+    
+    site_filter_profile = ''
+    site_filter_stats = ''
+    params = [root_ids, max_levels]
+    if site_id is not None:
+        site_filter_profile = ' AND ap.site_id = %s'
+        site_filter_stats = ' AND ast.site_id = %s'
+        params.extend([str(site_id), str(site_id)])
+    
+    columns = (
+        _select_columns(User, 'u')
+        + _select_columns(AgentProfile, 'ap')
+        + _select_columns(AgentStats, 'ast')
+    )
+    
+    query = f"""
+        WITH RECURSIVE chain AS (
+            SELECT
+                u.user_id AS root_id,
+                u.user_id,
+                u.referrer_id,
+                0 AS level,
+                ARRAY[u.user_id] AS path,
+                false AS is_cycle
+            FROM users u
+            WHERE u.user_id = ANY(%s::uuid[])
+            
+            UNION ALL
+            
+            SELECT
+                c.root_id,
+                u.user_id,
+                u.referrer_id,
+                c.level + 1,
+                c.path || u.user_id,
+                u.user_id = ANY(c.path)
+            FROM chain c
+            INNER JOIN users u ON u.user_id = c.referrer_id
+            WHERE c.level < %s
+              AND NOT c.is_cycle
+        )
+        SELECT
+            c.root_id,
+            c.level,
+            c.is_cycle,
+            w.address,
+            {', '.join(columns)}
+        FROM chain c
+        INNER JOIN users u ON u.user_id = c.user_id
+        LEFT JOIN wallets w ON w.user_id = c.user_id AND w.is_primary = true
+        LEFT JOIN agent_profiles ap ON ap.user_id = c.user_id{site_filter_profile}
+        LEFT JOIN agent_stats ast ON ast.agent = c.user_id{site_filter_stats}
+        ORDER BY c.root_id, c.level
+    """
+    
+    with connection.cursor() as cursor:
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+    
+    user_width = len(User._meta.concrete_fields)
+    profile_width = len(AgentProfile._meta.concrete_fields)
+    
+    results: Dict[uuid.UUID, Dict] = {}
+    seen_levels: Set[tuple] = set()
+    
+    for row in rows:
+        root_id, level, is_cycle, wallet_address = row[0], row[1], row[2], row[3]
+        values = row[4:]
+        
+        if not isinstance(root_id, uuid.UUID):
+            root_id = uuid.UUID(str(root_id))
+        
+        result = results.setdefault(root_id, {
+            'self': None,
+            'chain': [],
+            'cycle_detected': False,
+            'cycle_user_id': None,
+        })
+        
+        user = _instance_from_row(User, values[:user_width])
+        
+        if is_cycle:
+            result['cycle_detected'] = True
+            result['cycle_user_id'] = user.user_id
+            continue
+        
+        # 同一用户可能有多个主钱包记录（数据异常），只取第一条
+        if (root_id, level) in seen_levels:
+            continue
+        seen_levels.add((root_id, level))
+        
+        node = {
+            'agent': user,
+            'level': level,
+            'user_id': user.user_id,
+            'wallet_address': wallet_address,
+            'referral_code': user.referral_code,
+            'profile': _instance_from_row(
+                AgentProfile, values[user_width:user_width + profile_width]
+            ),
+            'stats': _instance_from_row(
+                AgentStats, values[user_width + profile_width:]
+            ),
+        }
+        
+        if level == 0:
+            if include_self:
+                result['self'] = node
+            continue
+        
+        result['chain'].append(node)
+    
+    return results
+
+
+def resolve_referral_chain(
+    user_id: uuid.UUID,
+    max_levels: int = 10,
+    site_id: Optional[uuid.UUID] = None,
+    include_self: bool = False
+) -> Dict:
+    """
+    单查询解析单个用户的推荐链路
+    
+    见 resolve_referral_chains；用户不存在时返回空链路
+    """
+    results = resolve_referral_chains(
+        [user_id],
+        max_levels=max_levels,
+        site_id=site_id,
+        include_self=include_self
+    )
+    if not isinstance(user_id, uuid.UUID):
+        user_id = uuid.UUID(str(user_id))
+    return results.get(user_id, {
+        'self': None,
+        'chain': [],
+        'cycle_detected': False,
+        'cycle_user_id': None,
+    })
+
+
 def get_referral_chain(
     user: User,
     max_levels: int = 10,
@@ -30,10 +232,8 @@ def get_referral_chain(
     """
     获取推荐链路（含环路检测）
     
-    ⭐ Phase D 修正：
-    - 使用 visited set 防止环路
-    - 限制最大层级
-    - 检测到环路时记录ERROR日志并抛出异常
+    ⭐ 单条递归 CTE 查询（见 resolve_referral_chain），不再逐级懒加载 referrer
+    ⭐ 检测到环路时记录ERROR日志并抛出异常
     
     Args:
         user: 起始用户
@@ -43,8 +243,8 @@ def get_referral_chain(
     Returns:
         List[Dict]: 推荐链路
             [
-                {'agent': User对象, 'level': 1},
-                {'agent': User对象, 'level': 2},
+                {'agent': User对象, 'level': 1, 'profile': ..., 'stats': ...},
+                {'agent': User对象, 'level': 2, 'profile': ..., 'stats': ...},
                 ...
             ]
     
@@ -53,52 +253,28 @@ def get_referral_chain(
     
     Examples:
         >>> chain = get_referral_chain(buyer_user, max_levels=2)
-        >>> # [{'agent': referrer1, 'level': 1}, {'agent': referrer2, 'level': 2}]
+        >>> # [{'agent': referrer1, 'level': 1, ...}, {'agent': referrer2, 'level': 2, ...}]
     """
-    chain = []
-    visited = set() if check_circular else None
-    current_user = user
-    
-    for level in range(1, max_levels + 1):
-        # 检查是否有上级推荐人
-        if not current_user.referrer:
-            break
-        
-        # ⭐ 环路检测
-        if check_circular and visited is not None:
-            if current_user.referrer.user_id in visited:
-                # 检测到环路！
-                error_msg = (
-                    f"Circular referral detected: "
-                    f"user={current_user.user_id} → "
-                    f"referrer={current_user.referrer.user_id} "
-                    f"(already visited)"
-                )
-                logger.error(
-                    error_msg,
-                    extra={
-                        'user_id': str(current_user.user_id),
-                        'referrer_id': str(current_user.referrer.user_id),
-                        'visited_count': len(visited),
-                        'chain_length': len(chain)
-                    }
-                )
-                raise CircularReferralError(error_msg)
-            
-            # 标记已访问 ⭐
-            visited.add(current_user.referrer.user_id)
-        
-        # 添加到链路
-        chain.append({
-            'agent': current_user.referrer,
-            'level': level,
-            'user_id': current_user.referrer.user_id,
-            'wallet_address': current_user.referrer.wallet_address,
-            'referral_code': current_user.referrer.referral_code
-        })
-        
-        # 移动到下一层
-        current_user = current_user.referrer
+    resolved = resolve_referral_chain(user.user_id, max_levels=max_levels)
+    chain = resolved['chain']
+    
+    # ⭐ 环路检测
+    if check_circular and resolved['cycle_detected']:
+        error_msg = (
+            f"Circular referral detected: "
+            f"user={user.user_id} → "
+            f"referrer={resolved['cycle_user_id']} "
+            f"(already visited)"
+        )
+        logger.error(
+            error_msg,
+            extra={
+                'user_id': str(user.user_id),
+                'referrer_id': str(resolved['cycle_user_id']),
+                'chain_length': len(chain)
+            }
+        )
+        raise CircularReferralError(error_msg)
     
     logger.debug(
         f"Referral chain retrieved: {len(chain)} levels",
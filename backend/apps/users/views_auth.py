@@ -174,6 +174,11 @@ def wallet_auth(request):
                 is_active=True
             )
             
+            # 加入代理树（推荐关系）
+            if referrer:
+                from apps.agents.services.tree_paths import add_referral_to_tree
+                add_referral_to_tree(site.site_id, user)
+            
             # 创建钱包
             wallet = Wallet.objects.create(
                 user=user,
@@ -122,9 +122,14 @@ def handle_payment_succeeded(event):
             )
             return
         
-        # 触发佣金计算任务
-        from apps.commissions.tasks import calculate_commission_for_order
-        calculate_commission_for_order.delay(str(order.order_id))
+        # ⭐ 增量更新 referrer 统计（同一事务，F() 原子更新）
+        from apps.agents.services.stats import record_order_paid
+        record_order_paid(order)
+        
+        # 触发佣金计算任务（合并窗口内批量计算，提交后入队）
+        from apps.commissions.tasks import enqueue_commission_calculation
+        order_id = str(order.order_id)
+        transaction.on_commit(lambda: enqueue_commission_calculation(order_id))
         
         log_webhook_event(
             event=event,
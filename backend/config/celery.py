@@ -23,30 +23,65 @@ app.autodiscover_tasks()
 # ⭐ Phase D: 统一使用 beat_schedule，不使用 @periodic_task
 # ============================================
 app.conf.beat_schedule = {
-    # 超时订单自动取消（每5分钟运行一次）
+    # 超时订单自动取消（到期队列每秒 + 每5分钟兜底扫描）
+    'expire-due-orders': {
+        'task': 'apps.orders.tasks.expire_due_orders',
+        'schedule': 1.0,  # 每秒：到期队列精确取消
+        'options': {'expires': 5},
+    },
     'expire-pending-orders': {
         'task': 'apps.orders.tasks.expire_pending_orders',
-        'schedule': crontab(minute='*/5'),  # 每5分钟
+        'schedule': crontab(minute='*/5'),  # 每5分钟（兜底扫描）
+    },
+    # 促销码使用计数器校准（每天凌晨4:15）
+    'reconcile-promo-counters': {
+        'task': 'apps.orders.tasks.reconcile_promo_counters',
+        'schedule': crontab(hour=4, minute=15),
+    },
+    # 两阶段下单：补偿中断的 PaymentIntent 创建（每分钟）
+    'recover-payment-outbox': {
+        'task': 'apps.orders.tasks.recover_payment_outbox',
+        'schedule': crontab(),
     },
     # Phase D: 释放锁定佣金（每小时整点运行）
     'release-held-commissions': {
         'task': 'apps.commissions.tasks.release_held_commissions',
         'schedule': crontab(minute=0),  # 每小时整点
     },
+    # 批量佣金计算队列兜底 flush（每分钟运行）
+    'flush-commission-queue': {
+        'task': 'apps.commissions.tasks.flush_commission_queue',
+        'schedule': crontab(),  # 每分钟
+    },
+    # 分片库存档位：同步 available_units 展示快照（每分钟）
+    'sync-sharded-inventory': {
+        'task': 'apps.tiers.tasks.sync_sharded_inventory',
+        'schedule': crontab(),
+    },
+    # 库存前置层：回收过期预留 + 批量结算到 tiers + 校准计数器（每分钟）
+    'settle-inventory-reservations': {
+        'task': 'apps.tiers.tasks.settle_inventory_reservations',
+        'schedule': crontab(),
+    },
     # Phase D: 清理过期幂等键（每天凌晨3点运行）
     'cleanup-idempotency-keys': {
         'task': 'apps.webhooks.tasks.cleanup_old_idempotency_keys',
         'schedule': crontab(hour=3, minute=0),  # 每天凌晨3点
     },
+    # 月度余额检查点（每月1号凌晨1:30，早于对账单生成）
+    'checkpoint-agent-balances': {
+        'task': 'apps.agents.tasks.checkpoint_agent_balances',
+        'schedule': crontab(day_of_month=1, hour=1, minute=30),
+    },
     # Phase F: 生成月度对账单（每月1号凌晨2点运行）
     'generate-monthly-statements': {
         'task': 'apps.agents.tasks.generate_monthly_statements',
         'schedule': crontab(day_of_month=1, hour=2, minute=0),  # 每月1号凌晨2点
     },
-    # Phase F: 更新 Agent 统计（每小时运行）
+    # Phase F: Agent 统计对账（日常由事件增量维护，每天凌晨4:30兜底）
     'update-agent-stats': {
         'task': 'apps.agents.tasks.update_agent_stats',
-        'schedule': crontab(minute=30),  # 每小时30分
+        'schedule': crontab(hour=4, minute=30),  # 每天凌晨4:30
     },
 }
 
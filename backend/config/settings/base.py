@@ -225,6 +225,12 @@ AUTH0_ALGORITHMS = ['RS256']
 # JWKS Caching（核心检查点 #6 相关）
 AUTH0_JWKS_CACHE_TTL = 3600  # 1 hour
 AUTH0_JWT_LEEWAY = 10  # 10 seconds tolerance
+# 未知 kid 强制刷新 JWKS 的最小间隔（秒）
+AUTH0_JWKS_REFRESH_COOLDOWN = env.int('AUTH0_JWKS_REFRESH_COOLDOWN', default=60)
+# 进程内认证缓存：已验证 token 摘要（按 exp 过期）/ 用户行（按 auth0_sub，秒）
+AUTH_TOKEN_CACHE_SIZE = env.int('AUTH_TOKEN_CACHE_SIZE', default=10000)
+AUTH_USER_CACHE_SIZE = env.int('AUTH_USER_CACHE_SIZE', default=10000)
+AUTH_USER_CACHE_TTL = env.int('AUTH_USER_CACHE_TTL', default=60)
 
 # ⚠️ 启动时校验 Auth0 配置（见 apps/core/apps.py）
 AUTH0_REQUIRED_SETTINGS = ['AUTH0_DOMAIN', 'AUTH0_AUDIENCE', 'AUTH0_ISSUER']
@@ -235,6 +241,13 @@ AUTH0_REQUIRED_SETTINGS = ['AUTH0_DOMAIN', 'AUTH0_AUDIENCE', 'AUTH0_ISSUER']
 SIWE_DOMAIN = env('SIWE_DOMAIN', default='posx.io')
 SIWE_CHAIN_ID = env.int('SIWE_CHAIN_ID', default=1)  # 1=Ethereum Mainnet
 SIWE_URI = env('SIWE_URI', default='https://posx.io')
+# 合约钱包识别：RPC（空=不查询链上，全部视为 EOA）/ 自定义 Provider 点分路径
+SIWE_RPC_URL = env('SIWE_RPC_URL', default='')
+SIWE_CONTRACT_WALLET_PROVIDER = env('SIWE_CONTRACT_WALLET_PROVIDER', default='')
+SIWE_RPC_BATCH_SIZE = env.int('SIWE_RPC_BATCH_SIZE', default=100)
+# 地址分类缓存（秒）：合约 / EOA
+SIWE_CONTRACT_CACHE_TTL = env.int('SIWE_CONTRACT_CACHE_TTL', default=30 * 86400)
+SIWE_EOA_CACHE_TTL = env.int('SIWE_EOA_CACHE_TTL', default=86400)
 
 # ============================================
 # Application Configuration
@@ -250,6 +263,15 @@ IDEMPOTENCY_KEY_RETENTION_HOURS = env.int('IDEMPOTENCY_KEY_RETENTION_HOURS', def
 
 # Order timeout
 ORDER_EXPIRE_MINUTES = env.int('ORDER_EXPIRE_MINUTES', default=15)
+ORDER_EXPIRY_BATCH_SIZE = env.int('ORDER_EXPIRY_BATCH_SIZE', default=500)
+# 下单幂等结果缓存（秒）/ 并发重试等待首个请求结果的最长时间（秒）
+ORDER_IDEMPOTENCY_TTL = env.int('ORDER_IDEMPOTENCY_TTL', default=900)
+ORDER_IDEMPOTENCY_WAIT_SECONDS = env.int('ORDER_IDEMPOTENCY_WAIT_SECONDS', default=10)
+# 两阶段下单：发件箱 pending 超过该秒数视为中断（须大于 Stripe 请求超时）/ PaymentIntent 创建最多尝试次数
+ORDER_PAYMENT_RECOVERY_SECONDS = env.int('ORDER_PAYMENT_RECOVERY_SECONDS', default=300)
+ORDER_PAYMENT_MAX_ATTEMPTS = env.int('ORDER_PAYMENT_MAX_ATTEMPTS', default=3)
+# 订单预览结果缓存（秒）：按档位 / 促销码定义版本化，价格窗口边界前提前过期
+ORDER_PREVIEW_CACHE_TTL = env.int('ORDER_PREVIEW_CACHE_TTL', default=30)
 
 # Order quantity limits
 MAX_QUANTITY_PER_ORDER = env.int('MAX_QUANTITY_PER_ORDER', default=1000)
@@ -257,6 +279,32 @@ MAX_QUANTITY_PER_ORDER = env.int('MAX_QUANTITY_PER_ORDER', default=1000)
 # Commission hold period
 COMMISSION_HOLD_DAYS = env.int('COMMISSION_HOLD_DAYS', default=7)
 
+# Commission batch calculation（webhook 合并窗口与单批上限）
+COMMISSION_BATCH_WINDOW_SECONDS = env.int('COMMISSION_BATCH_WINDOW_SECONDS', default=5)
+COMMISSION_BATCH_SIZE = env.int('COMMISSION_BATCH_SIZE', default=500)
+# 已投递批量任务但未确认的订单超时重新入队（秒）
+COMMISSION_PROCESSING_TIMEOUT_SECONDS = env.int('COMMISSION_PROCESSING_TIMEOUT_SECONDS', default=900)
+
+# Agent customer list（总数缓存软过期，秒）
+AGENT_CUSTOMER_COUNT_TTL = env.int('AGENT_CUSTOMER_COUNT_TTL', default=300)
+
+# Monthly statements（0=单任务生成；N>0=按站点 × 代理ID区间 N 段分发）
+AGENT_STATEMENT_SHARDS = env.int('AGENT_STATEMENT_SHARDS', default=0)
+
+# Inventory lock（锁竞争错误有界指数退避重试）
+INVENTORY_LOCK_MAX_RETRIES = env.int('INVENTORY_LOCK_MAX_RETRIES', default=3)
+INVENTORY_LOCK_BACKOFF_MS = env.int('INVENTORY_LOCK_BACKOFF_MS', default=10)
+
+# Inventory reservation front（off / redis / memory；memory 仅单进程开发测试）
+INVENTORY_FRONT_BACKEND = env('INVENTORY_FRONT_BACKEND', default='off')
+INVENTORY_RESERVATION_TTL = env.int('INVENTORY_RESERVATION_TTL', default=300)
+INVENTORY_SETTLEMENT_BATCH_SIZE = env.int('INVENTORY_SETTLEMENT_BATCH_SIZE', default=500)
+INVENTORY_SETTLEMENT_LOCK_WAIT = env.int('INVENTORY_SETTLEMENT_LOCK_WAIT', default=30)
+
+# 公开档位目录（ETag 协商缓存）/ 实时库存端点的 Cache-Control max-age（秒）
+TIER_CATALOG_MAX_AGE = env.int('TIER_CATALOG_MAX_AGE', default=60)
+TIER_AVAILABILITY_MAX_AGE = env.int('TIER_AVAILABILITY_MAX_AGE', default=2)
+
 # Environment (for Redis keys)
 ENV = env('ENV', default='dev')  # prod, dev, test
 